@@ -0,0 +1,74 @@
+import numpy as np
+import time as time
+
+# Internal imports
+from physo.physym import token as Tok
+from physo.physym import library as Lib
+from physo.physym import vect_programs as VProg
+
+# Local imports
+import feynman_config as fconfig
+
+# ----------------------------------------------- APPEND BENCHMARK -----------------------------------------------------
+# This script is used to measure time per step of VectPrograms.append and memory footprint of VectTokens state arrays
+# when using compact dtypes (see token.USE_COMPACT_DTYPES) vs int64 / float64 arrays with the max_time_step defined in
+# feynman_config.py and a large batch size.
+# ----------------------------------------------------------------------------------------------------------------------
+
+BATCH_SIZE    = int(1e4)
+MAX_TIME_STEP = fconfig.CONFIG["learning_config"]["max_time_step"]
+N_EPOCHS      = 3
+
+if __name__ == '__main__':
+
+    seed = 42
+    np.random.seed(seed)
+
+    # LIBRARY CONFIG
+    args_make_tokens = {
+                    # operations
+                    "op_names"             : "all",
+                    "use_protected_ops"    : True,
+                    # input variables
+                    "input_var_ids"        : {"x" : 0         , "v" : 1          , "t" : 2         },
+                    "input_var_units"      : {"x" : [1, 0, 0] , "v" : [1, -1, 0] , "t" : [0, 1, 0] },
+                    "input_var_complexity" : {"x" : 0.        , "v" : 1.         , "t" : 0.        },
+                    # constants
+                    "constants"            : {"pi" : np.pi     , "1" : 1         },
+                    "constants_units"      : {"pi" : [0, 0, 0] , "1" : [0, 0, 0] },
+                    "constants_complexity" : {"pi" : 0.        , "1" : 1.        },
+                    # free constants
+                    "free_constants"            : {"c"             },
+                    "free_constants_init_val"   : {"c" : 1.        },
+                    "free_constants_units"      : {"c" : [0, 0, 0] },
+                    "free_constants_complexity" : {"c" : 0.        },
+                       }
+    my_lib = Lib.Library(args_make_tokens = args_make_tokens,
+                         superparent_units = [1, -2, 0], superparent_name = "a")
+
+    # Random actions (only terminal tokens when programs would otherwise exceed max_time_step)
+    terminals_idx = np.arange(my_lib.n_choices)[my_lib.arity[:my_lib.n_choices] == 0]
+    def get_actions (programs):
+        actions = np.random.randint(0, my_lib.n_choices, size=BATCH_SIZE)
+        mask_must_end = (programs.n_dummies + programs.curr_step + Tok.MAX_ARITY) >= MAX_TIME_STEP
+        actions[mask_must_end] = np.random.choice(terminals_idx, size=mask_must_end.sum())
+        return actions
+
+    for name, compact in [("int64/float64", False), ("compact", True)]:
+        Tok.USE_COMPACT_DTYPES = compact
+        times = []
+        for epoch in range (N_EPOCHS):
+            # Same random actions for both layouts
+            np.random.seed(epoch)
+            my_programs = VProg.VectPrograms(batch_size=BATCH_SIZE, max_time_step=MAX_TIME_STEP, library=my_lib,
+                                             n_realizations=1)
+            t = 0.
+            for step in range (MAX_TIME_STEP):
+                actions = get_actions(my_programs)
+                t0 = time.perf_counter()
+                my_programs.append(actions)
+                t1 = time.perf_counter()
+                t += t1-t0
+            times.append(t/MAX_TIME_STEP)
+        n_bytes = sum([val.nbytes for val in vars(my_programs.tokens).values() if isinstance(val, np.ndarray)])
+        print("%14s : %f ms per append step, %f MB of VectTokens arrays"%(name, np.mean(times)*1e3, n_bytes/1e6))
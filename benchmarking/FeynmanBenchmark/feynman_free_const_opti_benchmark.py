@@ -0,0 +1,127 @@
+import numpy as np
+import time as time
+import torch as torch
+import sympy as sympy
+import pandas as pd
+
+# Internal imports
+from physo.physym import free_const
+from physo.benchmark.FeynmanDataset import FeynmanProblem as Feyn
+
+# ------------------------------------------- FREE CONST OPTI BENCHMARK ------------------------------------------------
+# This script is used to compare free constant optimizers of free_const.OPTIMIZERS (eg. LBFGS vs LM) on the Feynman
+# problems : each input variable x_i of each problem is scaled by a free constant c_i (ideal value = 1) that has to be
+# recovered starting from a perturbed initial guess, the wall time per converged program being reported.
+# ----------------------------------------------------------------------------------------------------------------------
+
+N_SAMPLES  = 1_000
+N_TRIALS   = 5            # Number of optimizations per Feynman problem (with different initial guesses)
+INIT_NOISE = 0.2          # Relative perturbation of initial guess
+TOL        = 1e-8         # Convergence threshold on loss (targets being normalized)
+
+OPTI_ARGS = {
+    "LBFGS" : {
+            'loss'   : "MSE",
+            'method' : 'LBFGS',
+            'method_args': {
+                        'n_steps' : 15,
+                        'tol'     : TOL,
+                        'lbfgs_func_args' : {
+                            'max_iter'       : 4,
+                            'line_search_fn' : "strong_wolfe",
+                                             },
+                            },
+        },
+    "LM" : {
+            'loss'   : "MSE",
+            'method' : 'LM',
+            'method_args': {
+                        'n_steps' : 15,
+                        'tol'     : TOL,
+                            },
+        },
+}
+
+# Sympy -> torch mapping
+TORCH_MODULE = [{
+    "sqrt" : torch.sqrt, "exp"  : torch.exp , "log"  : torch.log , "Abs"  : torch.abs ,
+    "sin"  : torch.sin , "cos"  : torch.cos , "tan"  : torch.tan , "tanh" : torch.tanh,
+    "asin" : torch.asin, "acos" : torch.acos, "atan" : torch.atan, "cosh" : torch.cosh, "sinh" : torch.sinh,
+    "arcsin" : torch.asin, "arccos" : torch.acos, "arctan" : torch.atan,
+    }, "math"]
+
+def make_scaled_problem (pb):
+    """
+    Returns a torch function of (params, X) corresponding to pb's formula where each input variable x_i is replaced by
+    c_i*x_i with c_i = params[i].
+    """
+    consts = sympy.symbols(["c%i"%(i) for i in range(pb.n_vars)])
+    expr   = pb.formula_sympy.subs({s: c*s for s, c in zip(pb.X_sympy_symbols, consts)}, simultaneous=True)
+    # Evaluating numerical sub-expressions (eg. sqrt(2*pi)) so torch functions are only called on tensors
+    expr   = expr.evalf()
+    f      = sympy.lambdify(consts + pb.X_sympy_symbols, expr, TORCH_MODULE)
+    func   = lambda params, X: f(*[params[i] for i in range(pb.n_vars)], *[X[i] for i in range(pb.n_vars)])
+    return func
+
+if __name__ == '__main__':
+
+    seed = 42
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+    DEVICE = 'cpu'
+
+    results = []
+    for i_eq in range (Feyn.N_EQS):
+        pb = Feyn.FeynmanProblem(i_eq)
+        # Data
+        X, y = pb.generate_data_points(n_samples = N_SAMPLES)
+        X = torch.tensor(X).to(DEVICE)
+        y = torch.tensor(y).to(DEVICE)
+        # Checking that ideal constants reproduce target
+        try:
+            func = make_scaled_problem(pb)
+            with torch.no_grad():
+                y_ideal = func(torch.ones(pb.n_vars, dtype=X.dtype), X)
+        except Exception as e:
+            print("Skipping %s: %s"%(pb.eq_name, e))
+            continue
+        if not torch.allclose(y_ideal, y):
+            print("Skipping %s: lambdified expression does not reproduce target"%(pb.eq_name))
+            continue
+        # Normalized target so TOL is comparable across problems
+        y_target   = y_ideal/y_ideal.std()
+        func_scale = 1./y_ideal.std()
+        inits = 1. + INIT_NOISE*(2.*torch.rand(N_TRIALS, pb.n_vars, dtype=X.dtype) - 1.)    # (N_TRIALS, n_vars,)
+        for method, opti_args in OPTI_ARGS.items():
+            for i_trial in range (N_TRIALS):
+                params = inits[i_trial].clone().to(DEVICE)
+                t0 = time.perf_counter()
+                try:
+                    history = free_const.optimize_free_const(func     = lambda params: func_scale*func(params, X),
+                                                             params   = params,
+                                                             y_target = y_target,
+                                                             **opti_args)
+                except RuntimeError as e:
+                    print("%s, %s, trial %i: optimization failed: %s"%(pb.eq_name, method, i_trial, e))
+                    history = []
+                t1 = time.perf_counter()
+                with torch.no_grad():
+                    loss = torch.mean((func_scale*func(params, X) - y_target)**2).item()
+                results.append({"eq_name"   : pb.eq_name,
+                                "method"    : method,
+                                "time"      : t1-t0,
+                                "n_steps"   : len(history),
+                                "loss"      : loss,
+                                "converged" : loss < TOL,
+                                })
+        print("%s done"%(pb.eq_name))
+
+    df = pd.DataFrame(results)
+    df.to_csv("feynman_free_const_opti_benchmark.csv", index=False)
+    for method in OPTI_ARGS:
+        df_m = df[df["method"] == method]
+        n_conv = df_m["converged"].sum()
+        print("%5s : converged %i / %i, total time %f s, time per converged program %f ms, mean n_steps %f"
+              %(method, n_conv, len(df_m), df_m["time"].sum(), 1e3*df_m["time"].sum()/max(n_conv, 1),
+                df_m["n_steps"].mean()))
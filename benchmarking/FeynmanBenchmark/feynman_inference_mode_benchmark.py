@@ -0,0 +1,119 @@
+import numpy as np
+import time as time
+import torch as torch
+
+# Internal imports
+from physo.physym import reward as Reward
+from physo.physym import library as Lib
+from physo.physym import vect_programs as VProg
+
+# Local imports
+import feynman_config as fconfig
+
+# ------------------------------------------- INFERENCE MODE BENCHMARK -------------------------------------------------
+# This script is used to measure time and memory savings per epoch of evaluating rewards in inference mode (see
+# program.Program.evaluate) vs executing programs while recording autograd graphs (free constants requiring gradients
+# after their optimization) with the setup defined in feynman_config.py.
+# Memory is measured as the size of tensors saved for backward (ie. kept alive by recorded autograd graphs until the
+# reward is converted to float).
+# ----------------------------------------------------------------------------------------------------------------------
+
+BATCH_SIZE = fconfig.CONFIG["learning_config"]["batch_size"]
+N_SAMPLES  = fconfig.N_SAMPLES
+N_EPOCHS   = 5
+
+class SavedTensorsCounter:
+    """
+    Counts bytes of tensors saved for backward by autograd while active.
+    """
+    def __init__(self):
+        self.n_bytes = 0
+        self.hooks   = torch.autograd.graph.saved_tensors_hooks(self.pack, self.unpack)
+    def pack (self, tensor):
+        self.n_bytes += tensor.numel()*tensor.element_size()
+        return tensor
+    def unpack (self, tensor):
+        return tensor
+    def __enter__(self):
+        self.hooks.__enter__()
+        return self
+    def __exit__(self, *args):
+        self.hooks.__exit__(*args)
+
+if __name__ == '__main__':
+
+    seed = 42
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+    DEVICE = 'cpu'
+    #if torch.cuda.is_available():
+    #    DEVICE = 'cuda'
+
+    # LIBRARY CONFIG
+    args_make_tokens = {
+                    # operations
+                    "op_names"             : "all",  # or ["mul", "neg", "inv", "sin"]
+                    "use_protected_ops"    : True,
+                    # input variables
+                    "input_var_ids"        : {"x" : 0         },
+                    "input_var_units"      : {"x" : [0, 0, 0] },
+                    "input_var_complexity" : {"x" : 0.        },
+                    # constants
+                    "constants"            : {"pi" : np.pi     , "1" : 1         },
+                    "constants_units"      : {"pi" : [0, 0, 0] , "1" : [0, 0, 0] },
+                    "constants_complexity" : {"pi" : 0.        , "1" : 1.        },
+                    # free constants
+                    "free_constants"            : {"a"             , "b"              },
+                    "free_constants_init_val"   : {"a" : 1.        , "b"  : 1.        },
+                    "free_constants_units"      : {"a" : [0, 0, 0] , "b"  : [0, 0, 0] },
+                    "free_constants_complexity" : {"a" : 0.        , "b"  : 0.        },
+                       }
+    my_lib = Lib.Library(args_make_tokens = args_make_tokens,
+                         superparent_units = [0, 0, 0], superparent_name = "y")
+
+    # TEST PROGRAM
+    batch_size = BATCH_SIZE
+    test_program_str = ["add", "mul", "a", "sin", "mul", "x", "b", "exp", "log", "add", "x", "sub", "1", "1"]
+    test_program_idx = np.array([my_lib.lib_name_to_idx[tok_str] for tok_str in test_program_str])
+    test_program_length = len(test_program_str)
+    test_program_idx = np.tile(test_program_idx, reps=(batch_size,1))
+
+    # BATCH
+    my_programs = VProg.VectPrograms(batch_size=batch_size, max_time_step=test_program_length, library=my_lib)
+    my_programs.set_programs(test_program_idx)
+    # Free constants require gradients as after their optimization
+    my_programs.free_consts.class_values.requires_grad_(True)
+
+    # TEST DATA
+    ideal_params = [1.14, 0.936] # Mock target free constants
+    x = torch.tensor(np.linspace(-10, 10, N_SAMPLES))
+    X = torch.stack((x,), axis=0).to(DEVICE)
+    y_target  = ideal_params[0]*torch.sin(ideal_params[1]*x).to(DEVICE)
+
+    # Rewards of an epoch while recording autograd graphs (previous behavior : prog(X) then float(reward))
+    def run_graph ():
+        rewards = []
+        for i in range (batch_size):
+            prog = my_programs.get_prog(i, skeleton=True)
+            y_pred = prog(X=X)
+            rewards.append(float(Reward.SquashedNRMSE(y_target=y_target, y_pred=y_pred)))
+        return np.array(rewards)
+
+    # Rewards of an epoch in inference mode
+    def run_inference ():
+        rewards = my_programs.batch_exe_reward(X=X, y_target=y_target, reward_function=Reward.SquashedNRMSE,
+                                               vectorized_mode=False)
+        return rewards
+
+    for name, run in [("graph recording", run_graph), ("inference mode", run_inference)]:
+        times, n_bytes = [], []
+        for epoch in range (N_EPOCHS):
+            with SavedTensorsCounter() as counter:
+                t0 = time.perf_counter()
+                rewards = run()
+                t1 = time.perf_counter()
+            times  .append(t1-t0)
+            n_bytes.append(counter.n_bytes)
+        print("%16s : %f s per epoch, %f MB saved for backward per epoch (mean reward = %f)"
+              %(name, np.mean(times), np.mean(n_bytes)/1e6, np.nanmean(rewards)))
@@ -0,0 +1,91 @@
+import numpy as np
+import time as time
+import torch as torch
+
+# Internal imports
+from physo.physym import token as Tok
+from physo.physym import reward as Reward
+from physo.physym import library as Lib
+from physo.physym import vect_programs as VProg
+
+# Local imports
+import feynman_config as fconfig
+
+# --------------------------------------------- MULTI-START BENCHMARK --------------------------------------------------
+# This script is used to measure the cost of multi-start free constants optimization (see free_const_opti_args
+# n_starts) vs single start optimization of the same batch of programs, optimized in a loop (program by program, starts
+# of each program being executed at once, see Program.execute_starts) and all at once (all programs and all their starts,
+# see batch_execute.VectBatchFreeConstOpti) with the max_time_step and free constants optimization arguments defined in
+# feynman_config.py.
+# ----------------------------------------------------------------------------------------------------------------------
+
+BATCH_SIZE    = 64
+N_SAMPLES     = 1_000
+MAX_TIME_STEP = fconfig.CONFIG["learning_config"]["max_time_step"]
+OPTI_ARGS     = fconfig.CONFIG["free_const_opti_args"]
+N_STARTS      = [1, 2, 4, 8]
+N_TRIALS      = 1
+
+if __name__ == '__main__':
+
+    seed = 42
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+    # LIBRARY CONFIG
+    args_make_tokens = {
+                    # operations
+                    "op_names"             : ["mul", "add", "sub", "div", "inv", "n2", "sqrt", "neg", "exp", "log", "sin", "cos"],
+                    "use_protected_ops"    : True,
+                    # input variables
+                    "input_var_ids"        : {"x" : 0         , "v" : 1          },
+                    "input_var_units"      : {"x" : [0, 0, 0] , "v" : [0, 0, 0]  },
+                    "input_var_complexity" : {"x" : 0.        , "v" : 0.         },
+                    # constants (as tensors as in real runs, see physo.task.args_handler)
+                    "constants"            : {"1" : torch.tensor(1.) },
+                    "constants_units"      : {"1" : [0, 0, 0] },
+                    "constants_complexity" : {"1" : 1.        },
+                    # free constants
+                    "free_constants"            : {"a"             , "b"              },
+                    "free_constants_init_val"   : {"a" : 1.        , "b"  : 1.        },
+                    "free_constants_units"      : {"a" : [0, 0, 0] , "b"  : [0, 0, 0] },
+                    "free_constants_complexity" : {"a" : 0.        , "b"  : 0.        },
+                       }
+    my_lib = Lib.Library(args_make_tokens = args_make_tokens,
+                         superparent_units = [0, 0, 0], superparent_name = "y")
+
+    # Random programs (only terminal tokens when programs would otherwise exceed max_time_step)
+    terminals_idx = np.arange(my_lib.n_choices)[my_lib.arity[:my_lib.n_choices] == 0]
+    my_programs = VProg.VectPrograms(batch_size=BATCH_SIZE, max_time_step=MAX_TIME_STEP, library=my_lib,
+                                     n_realizations=1)
+    all_actions = []
+    for step in range (MAX_TIME_STEP):
+        actions = np.random.randint(0, my_lib.n_choices, size=BATCH_SIZE)
+        mask_must_end = (my_programs.n_dummies + my_programs.curr_step + Tok.MAX_ARITY) >= MAX_TIME_STEP
+        actions[mask_must_end] = np.random.choice(terminals_idx, size=mask_must_end.sum())
+        my_programs.append(actions)
+        all_actions.append(actions)
+
+    # DATA
+    X = torch.stack((torch.linspace(0.1, 10., N_SAMPLES), torch.linspace(-2., 2., N_SAMPLES)), axis=0).double()
+    y_target = 1.3*torch.sin(4.2*X[0]) + 0.7*X[1]
+
+    for n_starts, vectorized_mode in [(n_starts, vectorized_mode) for vectorized_mode in [False, True] for n_starts in N_STARTS]:
+        opti_args = dict(OPTI_ARGS, n_starts = n_starts)
+        times, rewards, steps = [], [], []
+        for trial in range (N_TRIALS):
+            progs = VProg.VectPrograms(batch_size=BATCH_SIZE, max_time_step=MAX_TIME_STEP, library=my_lib,
+                                       n_realizations=1)
+            for actions in all_actions:
+                progs.append(actions)
+            torch.manual_seed(trial)
+            t0 = time.perf_counter()
+            progs.batch_optimize_constants(X = X, y_target = y_target, free_const_opti_args = opti_args,
+                                           vectorized_mode = vectorized_mode)
+            t1 = time.perf_counter()
+            R = progs.batch_exe_reward(X = X, y_target = y_target, reward_function = Reward.SquashedNRMSE)  # (batch_size,)
+            times  .append(t1-t0)
+            rewards.append(np.nanmean(R))
+            steps  .append(progs.free_consts.opti_steps.sum())
+        print("%10s, n_starts = %i : %f s per batch, mean reward %f, total opti steps %i"
+              %(["loop", "vectorized"][vectorized_mode], n_starts, np.mean(times), np.mean(rewards), np.mean(steps)))
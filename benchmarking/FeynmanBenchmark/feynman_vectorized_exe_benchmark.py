@@ -0,0 +1,80 @@
+import numpy as np
+import time as time
+import torch as torch
+
+# Internal imports
+from physo.physym import token as Tok
+from physo.physym import reward as Reward
+from physo.physym import library as Lib
+from physo.physym import vect_programs as VProg
+
+# Local imports
+import feynman_config as fconfig
+
+# ------------------------------------------ VECTORIZED EXECUTION BENCHMARK --------------------------------------------
+# This script is used to compare reward evaluation of a batch of random programs executed in a loop (program by
+# program) vs executed all at once (see batch_execute.VectBatchExecutionReward) with the max_time_step defined in
+# feynman_config.py, for a config0 sized batch and several numbers of samples (1e4 being the Feynman setup).
+# ----------------------------------------------------------------------------------------------------------------------
+
+BATCH_SIZE    = 1_000
+MAX_TIME_STEP = fconfig.CONFIG["learning_config"]["max_time_step"]
+N_SAMPLES     = [1_000, fconfig.N_SAMPLES, 100_000]
+N_TRIALS      = 3
+
+if __name__ == '__main__':
+
+    seed = 42
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+    # LIBRARY CONFIG
+    args_make_tokens = {
+                    # operations
+                    "op_names"             : fconfig.OP_NAMES,
+                    "use_protected_ops"    : True,
+                    # input variables
+                    "input_var_ids"        : {"x" : 0         , "v" : 1          },
+                    "input_var_units"      : {"x" : [0, 0, 0] , "v" : [0, 0, 0]  },
+                    "input_var_complexity" : {"x" : 0.        , "v" : 0.         },
+                    # constants (as tensors as in real runs, see physo.task.args_handler)
+                    "constants"            : {"1" : torch.tensor(1.) },
+                    "constants_units"      : {"1" : [0, 0, 0] },
+                    "constants_complexity" : {"1" : 1.        },
+                    # free constants
+                    "free_constants"            : {"a"             , "b"              },
+                    "free_constants_init_val"   : {"a" : 1.        , "b"  : 1.        },
+                    "free_constants_units"      : {"a" : [0, 0, 0] , "b"  : [0, 0, 0] },
+                    "free_constants_complexity" : {"a" : 0.        , "b"  : 0.        },
+                       }
+    my_lib = Lib.Library(args_make_tokens = args_make_tokens,
+                         superparent_units = [0, 0, 0], superparent_name = "y")
+
+    # Random programs (only terminal tokens when programs would otherwise exceed max_time_step)
+    terminals_idx = np.arange(my_lib.n_choices)[my_lib.arity[:my_lib.n_choices] == 0]
+    my_programs = VProg.VectPrograms(batch_size=BATCH_SIZE, max_time_step=MAX_TIME_STEP, library=my_lib,
+                                     n_realizations=1)
+    for step in range (MAX_TIME_STEP):
+        actions = np.random.randint(0, my_lib.n_choices, size=BATCH_SIZE)
+        mask_must_end = (my_programs.n_dummies + my_programs.curr_step + Tok.MAX_ARITY) >= MAX_TIME_STEP
+        actions[mask_must_end] = np.random.choice(terminals_idx, size=mask_must_end.sum())
+        my_programs.append(actions)
+
+    for n_samples in N_SAMPLES:
+        # DATA (float32 as in real runs)
+        X = torch.stack((torch.linspace(0.1, 10., n_samples), torch.linspace(-2., 2., n_samples)), axis=0)
+        y_target = 1.3*torch.sin(4.2*X[0]) + 0.7*X[1]
+        res = {}
+        for vectorized_mode in [False, True]:
+            times = []
+            for trial in range (N_TRIALS):
+                t0 = time.perf_counter()
+                R = my_programs.batch_exe_reward(X = X, y_target = y_target, reward_function = Reward.SquashedNRMSE,
+                                                 vectorized_mode = vectorized_mode)                 # (batch_size,)
+                t1 = time.perf_counter()
+                times.append(t1-t0)
+            res[vectorized_mode] = R
+            print("n_samples = %7i, %10s : %f s per batch (mean reward = %f)"
+                  %(n_samples, ["loop", "vectorized"][vectorized_mode], np.min(times), np.nanmean(R)))
+        print("n_samples = %7i, max reward difference : %e"
+              %(n_samples, np.nanmax(np.abs(res[False] - res[True]))))
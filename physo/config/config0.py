@@ -24,6 +24,16 @@ reward_config = {
                  "keep_lowest_complexity_duplicate" : False,
                  # "parallel_mode" : True,
                  # "n_cpus"        : None,
+                 # Successive halving : evaluating all programs on 1000 samples per dataset first and only the best 10%
+                 # of them on full data (useful for large datasets).
+                 # "successive_halving_n_samples"      : [1000,],
+                 # "successive_halving_keep_fractions" : [0.1,],
+                 # Rewards cache : reusing rewards and optimized free constants of programs already evaluated at
+                 # previous epochs (programs equivalent up to their canonical form sharing results).
+                 # "use_rewards_cache" : True,
+                 # Interval pre-screening : zeroing out programs certainly NaN or infinite on the whole input domain
+                 # without optimizing their free constants.
+                 # "interval_prescreen" : True,
                 }
 
 # ---------- LEARNING CONFIG ----------
@@ -64,6 +74,16 @@ free_const_opti_args = {
                                              },
                             },
         }
+# Levenberg-Marquardt (damped Gauss-Newton) alternative, typically converging in fewer steps on least squares problems
+# free_const_opti_args = {
+#             'loss'   : "MSE",
+#             'method' : 'LM',
+#             'method_args': {
+#                         'n_steps' : 15,
+#                         'tol'     : 1e-8,
+#                         'damping' : 1e-3,
+#                             },
+#         }
 
 # ---------- PRIORS CONFIG ----------
 priors_config  = [
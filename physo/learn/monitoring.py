@@ -103,6 +103,13 @@ class RunLogger:
         self.lengths_of_physical          = []
         self.lengths_of_unphysical        = []
 
+        self.rewards_cache_hit_rate_history = []
+        self.rewards_cache_memory_history   = []
+
+        self.successive_halving_n_evaluated_history = []
+
+        self.n_opti_steps_history = []
+
     def log(self, epoch, batch, model, rewards, keep, notkept, loss_val):
 
         # Epoch specific
@@ -159,6 +166,20 @@ class RunLogger:
         self.lengths_of_physical     .append( self.batch.programs.n_lengths[ self.batch.programs.is_physical] )
         self.lengths_of_unphysical   .append( self.batch.programs.n_lengths[~self.batch.programs.is_physical] )
 
+        # Rewards cache stats (if rewards computer uses one)
+        rewards_cache = getattr(batch.rewards_computer, "rewards_cache", None)
+        if rewards_cache is not None:
+            self.rewards_cache_hit_rate_history .append( rewards_cache.hit_rate )
+            self.rewards_cache_memory_history   .append( rewards_cache.memory   )
+
+        # Number of programs evaluated at each rung (if rewards computer uses successive halving)
+        n_evaluated = getattr(batch.rewards_computer, "successive_halving_n_evaluated", None)
+        if n_evaluated is not None:
+            self.successive_halving_n_evaluated_history .append( n_evaluated )
+
+        # Total number of free constants optimization steps (reduced by early abandonment)
+        self.n_opti_steps_history .append( int(batch.programs.free_consts.opti_steps.sum()) )
+
         self.pareto_logger()
 
         # Saving log
@@ -167,7 +188,7 @@ class RunLogger:
 
     def save_log (self):
 
-        columns = ['epoch', 'reward', 'complexity', 'length', 'is_physical', 'is_elite', 'program', "program_prefix"]
+        columns = ['epoch', 'reward', 'complexity', 'length', 'is_physical', 'is_elite', 'opti_steps', 'program', "program_prefix"]
         # Columns for free const names
         columns += self.batch.programs.free_consts.df().columns.to_list()
 
@@ -188,6 +209,7 @@ class RunLogger:
         df["length"]         = self.batch.programs.n_lengths
         df["is_physical"]    = self.batch.programs.is_physical
         df["is_elite"]       = is_elite
+        df["opti_steps"]     = self.batch.programs.free_consts.opti_steps.cpu().numpy()
         df["program"]        = programs_str
         df["program_prefix"] = self.batch.programs.get_programs_array(detach=True)
 
@@ -401,7 +423,7 @@ class RunVisualiser:
         if self.draw_all_progs_fit:
             for prog in run_logger.programs_epoch[run_logger.notkept]:
                 try:
-                    y_plot =  prog(X_plot).detach().cpu().numpy()
+                    y_plot =  prog.evaluate(X_plot).detach().cpu().numpy()
                     if y_plot.shape == (): y_plot = np.full(n_plot, y_plot)
                     curr_ax.plot(x_plot_cpu, y_plot, color='b', alpha=0.05, linestyle='solid')
                 except:
@@ -410,7 +432,7 @@ class RunVisualiser:
         # Train programs
         for prog in run_logger.programs_epoch[run_logger.keep]:
             try:
-                y_plot =  prog(X_plot).detach().cpu().numpy()
+                y_plot =  prog.evaluate(X_plot).detach().cpu().numpy()
                 if y_plot.shape == (): y_plot = np.full(n_plot, y_plot)
                 curr_ax.plot(x_plot_cpu, y_plot, color='r', alpha=0.05, linestyle='solid')
             except:
@@ -418,7 +440,7 @@ class RunVisualiser:
 
         # Best program of epoch
         try:
-            y_plot = run_logger.best_prog_epoch(X_plot).detach().cpu().numpy()
+            y_plot = run_logger.best_prog_epoch.evaluate(X_plot).detach().cpu().numpy()
             if y_plot.shape == (): y_plot = np.full(n_plot, y_plot)
             curr_ax.plot(x_plot_cpu, y_plot, color='orange', linestyle='solid', linewidth=2)
         except:
@@ -426,7 +448,7 @@ class RunVisualiser:
 
         # Best overall program
         try:
-            y_plot = run_logger.best_prog(X_plot).detach().cpu().numpy()
+            y_plot = run_logger.best_prog.evaluate(X_plot).detach().cpu().numpy()
             if y_plot.shape == (): y_plot = np.full(n_plot, y_plot)
             curr_ax.plot(x_plot_cpu, y_plot, color='k', linestyle='solid', linewidth=2)
         except:
@@ -589,6 +611,8 @@ class RunVisualiser:
         # Number of physical progs
         df["n_physical"] = self.run_logger.n_physical
         df["n_rewarded"] = self.run_logger.n_rewarded
+        # Number of free constants optimization steps
+        df["n_opti_steps"] = self.run_logger.n_opti_steps_history
         # Programs
         df["best_prog_of_epoch"] = np.array(self.run_logger.best_prog_epoch_str_history)
         df["overall_best_prog"]  = np.array(self.run_logger.overall_best_prog_str_history)
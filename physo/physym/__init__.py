@@ -4,6 +4,8 @@ from . import tokenize
 from . import library
 from . import program
 from . import execute
+from . import canonical
+from . import interval
 from . import dimensional_analysis
 from . import free_const
 from . import prior
@@ -39,6 +39,7 @@ class Batch:
                 free_const_opti_args = None,
                 candidate_wrapper    = None,
                 observe_units        = True,
+                dtype                = None,
                 ):
         """
         Parameters
@@ -80,6 +81,10 @@ class Batch:
         observe_units : bool, optional
             Should units be included in "in situ" observation vector (True) or should this information be zeroed out
             (False).
+        dtype : str or torch.dtype or None, optional
+            Execution dtype policy ("float32" or "float64", see functions.DTYPES) : data and free constants are
+            converted to this dtype so programs are executed and their free constants optimized in this dtype. By
+            default, data is kept in its original dtype and free constants are float64.
         """
 
         # Batch
@@ -92,7 +97,8 @@ class Batch:
         self.dataset = dataset.Dataset(multi_X         = multi_X,
                                        multi_y         = multi_y,
                                        multi_y_weights = multi_y_weights,
-                                       library         = self.library)
+                                       library         = self.library,
+                                       dtype           = dtype)
 
         # Programs
         self.programs = VProg.VectPrograms(  batch_size        = self.batch_size,
@@ -102,8 +108,8 @@ class Batch:
                                              n_realizations    = self.dataset.detected_n_realizations,
                                              )
 
-        # Sending free const table to same device as dataset
-        self.programs.free_consts.to(self.dataset.detected_device)
+        # Sending free const table to same device as dataset (and converting it to dtype policy if any)
+        self.programs.free_consts.to(self.dataset.detected_device, dtype = dtype)
 
         # Prior
         self.prior   = prior.make_PriorCollection(programs      = self.programs,
@@ -119,6 +125,18 @@ class Batch:
         # Observations
         self.observe_units = observe_units
 
+    def reset (self):
+        """
+        Resets batch for a new epoch in place : library, dataset and priors (which keep a reference to programs) are
+        kept as is and only programs state arrays are re-initialized (see vect_programs.VectPrograms.reset). This is
+        equivalent to building a new Batch with the same arguments without re-building its static tables.
+        Returns
+        -------
+        self : batch.Batch
+        """
+        self.programs.reset()
+        return self
+
     # ---------------------------- INTERFACE FOR SYMBOLIC REGRESSION ----------------------------
 
     def get_sibling_one_hot (self, step = None):
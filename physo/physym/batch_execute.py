@@ -1,10 +1,16 @@
 import warnings
+import pickle
 
 import numpy as np
 import torch as torch
 import torch.multiprocessing as mp
 
 from tqdm import tqdm
+
+from physo.physym import execute as Exec
+from physo.physym import program as Prog
+from physo.physym import free_const
+from physo.physym import dataset
 SHOW_PROGRESS_BAR = False
 
 def EnforceStartMethod():
@@ -113,6 +119,324 @@ def ParallelExeAvailability(verbose=False):
 
     return recommended_config
 
+# ------------------------------------------------------------------------------------------------------------------
+# ------------------------------------------- PERSISTENT PARALLEL EXECUTOR -----------------------------------------
+# ------------------------------------------------------------------------------------------------------------------
+
+# Dataset and programs context registered in each worker process of a ParallelExecutor pool (see ParallelExecutor).
+WORKER_DATA = {}
+
+# Utils pickable function (non nested definition) registering dataset and programs context in a worker process (pool
+# initializer).
+def init_worker_data(X, y_target, y_weights, programs_context = None):
+    WORKER_DATA["X"]         = X
+    WORKER_DATA["y_target"]  = y_target
+    WORKER_DATA["y_weights"] = y_weights
+    # Subsets of dataset drawn by worker (see get_worker_data)
+    WORKER_DATA["subsets"]   = {}
+    # Each worker builds its own library (and candidate wrapper) once
+    WORKER_DATA["programs_context"] = None if programs_context is None else pickle.loads(programs_context)
+    return None
+
+def get_worker_data(subset_key = None):
+    """
+    Returns dataset registered in worker or a subset of its samples (see ParallelExecutor.register_subset). A subset
+    is drawn once per worker and kept in cache.
+    Parameters
+    ----------
+    subset_key : tuple or None, optional
+        (n_samples_per_dataset, n_samples, seed) arguments of dataset.subset_index. By default, the full dataset is
+        returned.
+    Returns
+    -------
+    X, y_target, y_weights : torch.tensor or float or None
+    """
+    X, y_target, y_weights = WORKER_DATA["X"], WORKER_DATA["y_target"], WORKER_DATA["y_weights"]
+    if subset_key is None:
+        return X, y_target, y_weights
+    subsets = WORKER_DATA["subsets"]
+    if subset_key not in subsets:
+        n_samples_per_dataset, n_samples, seed = subset_key
+        idx, _ = dataset.subset_index(n_samples_per_dataset = n_samples_per_dataset, n_samples = n_samples, seed = seed)
+        idx = torch.tensor(idx)                                                                          # (n_sub_samples,)
+        subsets[subset_key] = (X[:, idx],
+                               y_target [idx] if torch.is_tensor(y_target)  and y_target.dim()  > 0 else y_target,
+                               y_weights[idx] if torch.is_tensor(y_weights) and y_weights.dim() > 0 else y_weights)
+    return subsets[subset_key]
+
+def make_programs_context(progs):
+    """
+    Pickles what is shared by all programs of progs and is necessary to rebuild them from task payloads (library,
+    candidate wrapper, number of realizations and dtype of free constants), see make_task_payload.
+    Parameters
+    ----------
+    progs : vect_programs.VectPrograms
+        Programs in the batch.
+    Returns
+    -------
+    programs_context : bytes
+    """
+    context = {
+        "library"           : progs.library,
+        "candidate_wrapper" : progs.candidate_wrapper,
+        "n_realizations"    : progs.free_consts.n_realizations,
+        "const_dtype"       : progs.free_consts.class_values.detach().cpu().numpy().dtype.str,
+    }
+    programs_context = pickle.dumps(context)
+    return programs_context
+
+def make_task_payload(progs, prog_idx):
+    """
+    Makes compact pickable representation of a program to send to a worker having the programs context of progs
+    registered (see ParallelExecutor). Program length is given by the number of token indices.
+    Parameters
+    ----------
+    progs : vect_programs.VectPrograms
+        Programs in the batch.
+    prog_idx : int
+        Index of program in batch.
+    Returns
+    -------
+    payload : tuple of bytes
+        (tokens_idx, class_values, spe_values) with tokens_idx being the int16 library indices of tokens making up
+        the program and class_values, spe_values the program's values of free constants.
+    """
+    length = progs.n_completed[prog_idx]
+    free_consts = progs.free_consts
+    payload = (
+        progs.tokens.idx[prog_idx, :length].astype(np.int16).tobytes(),
+        free_consts.class_values [prog_idx].detach().cpu().numpy().tobytes(),
+        free_consts.spe_values   [prog_idx].detach().cpu().numpy().tobytes(),
+    )
+    return payload
+
+def load_task_payload(payload):
+    """
+    Rebuilds program from its task payload (see make_task_payload) using programs context registered in worker.
+    Parameters
+    ----------
+    payload : tuple of bytes
+    Returns
+    -------
+    prog : program.Program
+    """
+    context = WORKER_DATA["programs_context"]
+    library = context["library"]
+    (tokens_idx, class_values, spe_values) = payload
+    tokens_idx  = np.frombuffer(tokens_idx, dtype=np.int16)
+    free_consts = free_const.FreeConstantsTable(batch_size=1, library=library, n_realizations=context["n_realizations"])
+    free_consts.class_values = torch.from_numpy(np.frombuffer(class_values, dtype=context["const_dtype"]).copy())\
+                                    .reshape(free_consts.class_values.shape)  # (1, n_class_free_const,)
+    free_consts.spe_values   = torch.from_numpy(np.frombuffer(spe_values,   dtype=context["const_dtype"]).copy())\
+                                    .reshape(free_consts.spe_values.shape)    # (1, n_spe_free_const, n_realizations,)
+    free_consts.dtype = free_consts.class_values.dtype
+    prog = Prog.Program(tokens            = library.lib_tokens[tokens_idx],
+                        library           = library,
+                        candidate_wrapper = context["candidate_wrapper"],
+                        free_consts       = free_consts,
+                        n_realizations    = context["n_realizations"],
+                        )
+    return prog
+
+def share_data(data):
+    """
+    Returns a detached cpu copy of data with its storage in shared memory (data is returned as is if not a tensor).
+    """
+    if torch.is_tensor(data):
+        data = data.detach().cpu().clone().share_memory_()
+    return data
+
+def is_identical_data(data_a, data_b):
+    """
+    Checks in O(1) if data_a and data_b are the same object or tensors viewing the same memory.
+    """
+    if data_a is data_b:
+        is_identical = True
+    elif torch.is_tensor(data_a) and torch.is_tensor(data_b):
+        is_identical = (data_a.device == data_b.device) and (data_a.data_ptr() == data_b.data_ptr()) \
+                       and (data_a.shape == data_b.shape) and (data_a.stride() == data_b.stride()) \
+                       and (data_a.dtype == data_b.dtype)
+    else:
+        is_identical = False
+    return is_identical
+
+def is_same_data(data_a, data_b):
+    """
+    Checks if data_a and data_b are equal (torch.tensor or float or None), identical data being checked first in O(1)
+    (see is_identical_data) before comparing values.
+    """
+    if is_identical_data(data_a, data_b):
+        is_same = True
+    elif torch.is_tensor(data_a) and torch.is_tensor(data_b):
+        is_same = (data_a.shape == data_b.shape) and (data_a.dtype == data_b.dtype) \
+                  and torch.equal(data_a, data_b.detach().cpu())
+    elif torch.is_tensor(data_a) or torch.is_tensor(data_b):
+        is_same = False
+    else:
+        is_same = (data_a == data_b)
+    return is_same
+
+class ParallelExecutor:
+    """
+    Long-lived pool of worker processes used for parallel execution and free constants optimization of programs
+    (see BatchExecution, BatchExecutionReduceGather, BatchExecutionReward and BatchFreeConstOpti).
+    The dataset is copied once in shared memory and registered once per worker when the pool is started along with the
+    programs context (library etc., see make_programs_context), tasks then only carry compact programs payloads (token
+    indices and free constants values, see make_task_payload).
+    The pool is started lazily and only restarted if called with a dataset that is different from the registered one.
+    Data registered as a subset of samples of a dataset (see register_subset) is not sent to workers : the pool having
+    the full dataset registered is used and tasks only carry the key of the subset which workers draw themselves (see
+    get_worker_data).
+    Attributes
+    ----------
+    n_cpus : int
+        Number of worker processes.
+    pool : torch.multiprocessing.Pool or None
+        Pool of worker processes (None if not started).
+    X, y_target, y_weights : torch.tensor or float or None
+        Dataset registered in workers (shared memory copies).
+    data_sources : dict of {str : torch.tensor or float or None}
+        Data ("X", "y_target", "y_weights") as last passed and found equal to the registered dataset, calls with the
+        same tensors (eg. dataset of a persistent batch.Batch) being recognized in O(1).
+    programs_context : bytes or None
+        Programs context registered in workers.
+    subsets : dict of {tuple : dict}
+        Subsets of datasets registered by their key (see register_subset).
+    n_pool_starts : int
+        Number of times the pool was started.
+    """
+    def __init__(self, n_cpus = None):
+        """
+        Parameters
+        ----------
+        n_cpus : int or None
+            Number of worker processes. By default, uses the maximum number of CPUs available.
+        """
+        self.n_cpus = n_cpus if n_cpus is not None else mp.cpu_count()
+        self.pool   = None
+        self.X         = None
+        self.y_target  = None
+        self.y_weights = None
+        self.data_sources = {}
+        self.programs_context = None
+        self.subsets = {}
+        self.n_pool_starts = 0
+
+    def is_registered (self, X, y_target = None, y_weights = None, programs_context = None):
+        """
+        Checks if pool is started with this dataset and programs context registered in workers (y_target, y_weights
+        and programs_context are not checked if None).
+        """
+        is_registered = (self.pool is not None) and self.is_registered_data("X", X)
+        if y_target is not None:
+            is_registered = is_registered and self.is_registered_data("y_target", y_target)
+        if y_weights is not None:
+            is_registered = is_registered and self.is_registered_data("y_weights", y_weights)
+        if programs_context is not None:
+            is_registered = is_registered and (self.programs_context == programs_context)
+        return is_registered
+
+    def is_registered_data (self, name, data):
+        """
+        Checks if data is equal to registered data name ("X", "y_target" or "y_weights"). Checks first in O(1) if data
+        is identical to its source (see data_sources) before comparing values with the registered copy, data found
+        equal becoming the new source.
+        """
+        is_registered = is_identical_data(self.data_sources.get(name), data)
+        if not is_registered:
+            is_registered = is_same_data(getattr(self, name), data)
+            if is_registered:
+                self.data_sources[name] = data
+        return is_registered
+
+    def register_subset (self, subset_key, subset_data, full_data):
+        """
+        Registers data being a subset of samples of a dataset so that parallel calls using it use the pool of workers
+        having the full dataset registered (workers drawing the subset themselves, see get_worker_data) instead of
+        restarting the pool. Subset data is recognized by identity of its tensors (see is_identical_data).
+        Parameters
+        ----------
+        subset_key : tuple
+            (n_samples_per_dataset, n_samples, seed) arguments of dataset.subset_index drawing the subset from the full
+            dataset (n_samples_per_dataset being a tuple of int).
+        subset_data : tuple
+            (X, y_target, y_weights) of subset as passed to parallel calls.
+        full_data : tuple
+            (X, y_target, y_weights) of full dataset.
+        """
+        self.subsets[subset_key] = {"subset_data" : subset_data, "full_data" : full_data}
+        return None
+
+    def find_subset (self, X, y_target = None, y_weights = None):
+        """
+        Returns key of registered subset having this data (y_target and y_weights are not checked if None) or None.
+        """
+        for subset_key, subset in self.subsets.items():
+            sub_X, sub_y_target, sub_y_weights = subset["subset_data"]
+            if is_identical_data(sub_X, X) \
+                    and (y_target  is None or is_identical_data(sub_y_target,  y_target )) \
+                    and (y_weights is None or is_identical_data(sub_y_weights, y_weights)):
+                return subset_key
+        return None
+
+    def get_pool (self, X, y_target = None, y_weights = None, programs_context = None):
+        """
+        Returns pool of workers having dataset and programs context registered, (re)starting pool if necessary.
+        If data is a registered subset (see register_subset), the pool having the full dataset registered is returned
+        along with the key of the subset to pass to workers.
+        Parameters
+        ----------
+        X : torch.tensor of shape (n_dim, n_samples,) of float
+            Values of the input variables of the problem with n_dim = nb of input variables.
+        y_target : torch.tensor of shape (n_samples,) of float or None, optional
+            Values of target output.
+        y_weights : torch.tensor of shape (n_samples,) of float or float or None, optional
+            Weights for each data point.
+        programs_context : bytes or None, optional
+            Programs context (see make_programs_context).
+        Returns
+        -------
+        pool, subset_key : torch.multiprocessing.Pool, tuple or None
+        """
+        subset_key = self.find_subset(X = X, y_target = y_target, y_weights = y_weights)
+        if subset_key is not None:
+            X, y_target, y_weights = self.subsets[subset_key]["full_data"]
+        if not self.is_registered(X = X, y_target = y_target, y_weights = y_weights, programs_context = programs_context):
+            self.close()
+            self.X         = share_data(X)
+            self.y_target  = share_data(y_target)
+            self.y_weights = share_data(y_weights)
+            self.data_sources = {"X" : X, "y_target" : y_target, "y_weights" : y_weights}
+            self.programs_context = programs_context
+            self.pool = mp.Pool(processes   = self.n_cpus,
+                                initializer = init_worker_data,
+                                initargs    = (self.X, self.y_target, self.y_weights, self.programs_context))
+            self.n_pool_starts += 1
+        return self.pool, subset_key
+
+    def close (self):
+        """
+        Closes pool of workers (it will be restarted at next use).
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        return None
+
+    def __getstate__(self):
+        # Pool can not be pickled, exporting configuration only
+        state = self.__dict__.copy()
+        state["pool"] = None
+        state["data_sources"] = {}
+        state["subsets"]      = {}
+        return state
+
+    def __repr__(self):
+        s = "ParallelExecutor : n_cpus = %i, pool started = %s, n_pool_starts = %i" \
+            % (self.n_cpus, self.pool is not None, self.n_pool_starts)
+        return s
+
 # ------------------------------------------------------------------------------------------------------------------
 # ----------------------------------------------- PARALLEL EXECUTION -----------------------------------------------
 # ------------------------------------------------------------------------------------------------------------------
@@ -120,11 +444,18 @@ def ParallelExeAvailability(verbose=False):
 # Utils pickable function (non nested definition) executing a program (for parallelization purposes)
 def task_exe(prog, X, i_realization, n_samples_per_dataset):
     try:
-        res = prog(X=X, i_realization=i_realization, n_samples_per_dataset=n_samples_per_dataset)
+        res = prog.evaluate(X=X, i_realization=i_realization, n_samples_per_dataset=n_samples_per_dataset)
     except:
         res = 0.
     return res
 
+# Utils pickable function (non nested definition) executing a program on dataset registered in worker (for
+# parallelization purposes using ParallelExecutor)
+def task_exe_shared(payload, i_realization, n_samples_per_dataset, subset_key = None):
+    prog = load_task_payload(payload)
+    X, _, _ = get_worker_data(subset_key)
+    return task_exe(prog, X, i_realization, n_samples_per_dataset)
+
 def BatchExecution (progs, X,
                     # Realization related
                     i_realization         = 0,
@@ -134,7 +465,8 @@ def BatchExecution (progs, X,
                     pad_with = np.NaN,
                     # Parallel mode related
                     n_cpus        = 1,
-                    parallel_mode = False):
+                    parallel_mode = False,
+                    executor      = None):
     """
     Executes prog(X) for each prog in progs and returns the results.
     NB: Parallel execution is typically slower because of communication time (parallel_mode = False is recommended).
@@ -162,6 +494,9 @@ def BatchExecution (progs, X,
         Number of CPUs to use when running in parallel mode.
     parallel_mode : bool, optional
         Parallel execution if True, execution in a loop else.
+    executor : batch_execute.ParallelExecutor or None, optional
+        Persistent pool of workers having the dataset registered to use in parallel mode (n_cpus is then ignored). By
+        default, a new pool of processes is opened (and data is sent along each task) at each call.
     Returns
     -------
     y_batch : torch.tensor of shape (progs.batch_size, n_samples,) of float
@@ -179,25 +514,34 @@ def BatchExecution (progs, X,
 
     # ----- Parallel mode -----
     if parallel_mode:
+        # Using persistent pool of executor having dataset registered in its workers
+        if executor is not None:
+            pool, subset_key = executor.get_pool(X = X, programs_context = make_programs_context(progs))
         # Opening a pull of processes
-        # pool = mp.get_context("fork").Pool(processes=n_cpus)
-        # mp.set_start_method("spawn", force=True)
-        pool = mp.Pool(processes=n_cpus)
+        else:
+            # pool = mp.get_context("fork").Pool(processes=n_cpus)
+            # mp.set_start_method("spawn", force=True)
+            pool = mp.Pool(processes=n_cpus)
         results = []
         for i in range(progs.batch_size):
             # Computing y = prog(X) where mask is True
             if mask[i]:
-                # Getting minimum executable skeleton pickable program
-                prog = progs.get_prog(prog_idx=i, skeleton=True)
-                result = pool.apply_async(task_exe, args=(prog, X, i_realization, n_samples_per_dataset))
+                # Compact payload of program (token indices and free consts values) for workers of executor
+                if executor is not None:
+                    result = pool.apply_async(task_exe_shared, args=(make_task_payload(progs, i), i_realization, n_samples_per_dataset, subset_key))
+                # Minimum executable skeleton pickable program
+                else:
+                    prog = progs.get_prog(prog_idx=i, skeleton=True)
+                    result = pool.apply_async(task_exe, args=(prog, X, i_realization, n_samples_per_dataset))
                 results.append(result)
 
         # Waiting for all tasks to complete and collecting the results
         results = [result.get() for result in results]
 
-        # Closing the pool of processes
-        pool.close()
-        pool.join()
+        # Closing the pool of processes (persistent pool of executor is kept open)
+        if executor is None:
+            pool.close()
+            pool.join()
 
     # ----- Non parallel mode -----
     else:
@@ -210,8 +554,8 @@ def BatchExecution (progs, X,
                 results.append(result)
 
     # ----- Results -----
-    # Stacking results
-    results = torch.stack(results)                                                         # (?, n_samples)
+    # Stacking results (results of programs made of constants only being broadcast to all samples)
+    results = torch.stack([torch.as_tensor(result).expand(n_samples) for result in results]) # (?, n_samples)
     # Batch of evaluation results
     y_batch = torch.full((progs.batch_size, n_samples), pad_with, dtype=results.dtype)     # (batch_size, n_samples)
     # Updating y_batch with results
@@ -222,7 +566,7 @@ def BatchExecution (progs, X,
 # Utils pickable function (non nested definition) executing a program (for parallelization purposes)
 def task_exe_wrapper_reduce(prog, X, reduce_wrapper, i_realization, n_samples_per_dataset):
     try:
-        y_pred = prog(X=X, i_realization=i_realization, n_samples_per_dataset=n_samples_per_dataset)
+        y_pred = prog.evaluate(X=X, i_realization=i_realization, n_samples_per_dataset=n_samples_per_dataset)
         res = reduce_wrapper(y_pred)
         # Kills gradients ! Necessary to minimize communications so it won't crash on some systems. (BatchExecution doc for
         # details on this issue)
@@ -231,6 +575,13 @@ def task_exe_wrapper_reduce(prog, X, reduce_wrapper, i_realization, n_samples_pe
         res = 0.
     return res
 
+# Utils pickable function (non nested definition) executing a program on dataset registered in worker (for
+# parallelization purposes using ParallelExecutor)
+def task_exe_wrapper_reduce_shared(payload, reduce_wrapper, i_realization, n_samples_per_dataset, subset_key = None):
+    prog = load_task_payload(payload)
+    X, _, _ = get_worker_data(subset_key)
+    return task_exe_wrapper_reduce(prog, X, reduce_wrapper, i_realization, n_samples_per_dataset)
+
 def BatchExecutionReduceGather (progs, X, reduce_wrapper,
                                 # Realization related
                                 i_realization         = 0,
@@ -240,7 +591,8 @@ def BatchExecutionReduceGather (progs, X, reduce_wrapper,
                                 pad_with = np.NaN,
                                 # Parallel mode related
                                 n_cpus        = 1,
-                                parallel_mode = False
+                                parallel_mode = False,
+                                executor      = None,
                                 ):
     """
     Executes prog(X) for each prog in progs and gathers reduce_wrapper(prog(X)) as a result.
@@ -270,6 +622,9 @@ def BatchExecutionReduceGather (progs, X, reduce_wrapper,
         Number of CPUs to use when running in parallel mode.
     parallel_mode : bool
         Parallel execution if True, execution in a loop else.
+    executor : batch_execute.ParallelExecutor or None, optional
+        Persistent pool of workers having the dataset registered to use in parallel mode (n_cpus is then ignored). By
+        default, a new pool of processes is opened (and data is sent along each task) at each call.
     Returns
     -------
     results : numpy.array of shape (progs.batch_size,) of float
@@ -288,25 +643,34 @@ def BatchExecutionReduceGather (progs, X, reduce_wrapper,
 
     # ----- Parallel mode -----
     if parallel_mode:
+        # Using persistent pool of executor having dataset registered in its workers
+        if executor is not None:
+            pool, subset_key = executor.get_pool(X = X, programs_context = make_programs_context(progs))
         # Opening a pull of processes
-        # pool = mp.get_context("fork").Pool(processes=n_cpus)
-        # mp.set_start_method("spawn", force=True)
-        pool = mp.Pool(processes=n_cpus)
+        else:
+            # pool = mp.get_context("fork").Pool(processes=n_cpus)
+            # mp.set_start_method("spawn", force=True)
+            pool = mp.Pool(processes=n_cpus)
         results = []
         for i in range(progs.batch_size):
             # Computing y = prog(X) where mask is True
             if mask[i]:
-                # Getting minimum executable skeleton pickable program
-                prog = progs.get_prog(i, skeleton=True)
-                result = pool.apply_async(task_exe_wrapper_reduce, args=(prog, X, reduce_wrapper, i_realization, n_samples_per_dataset))
+                # Compact payload of program (token indices and free consts values) for workers of executor
+                if executor is not None:
+                    result = pool.apply_async(task_exe_wrapper_reduce_shared, args=(make_task_payload(progs, i), reduce_wrapper, i_realization, n_samples_per_dataset, subset_key))
+                # Minimum executable skeleton pickable program
+                else:
+                    prog = progs.get_prog(i, skeleton=True)
+                    result = pool.apply_async(task_exe_wrapper_reduce, args=(prog, X, reduce_wrapper, i_realization, n_samples_per_dataset))
                 results.append(result)
 
         # Waiting for all tasks to complete and collecting the results
         results = [result.get() for result in results]
 
-        # Closing the pool of processes
-        pool.close()
-        pool.join()
+        # Closing the pool of processes (persistent pool of executor is kept open)
+        if executor is None:
+            pool.close()
+            pool.join()
 
     # ----- Non parallel mode -----
     else:
@@ -332,13 +696,20 @@ def BatchExecutionReduceGather (progs, X, reduce_wrapper,
 
 # Utils pickable function (non nested definition) executing a program (for parallelization purposes)
 def task_exe_reward(prog, X, y_target, reward_function, y_weights, i_realization, n_samples_per_dataset):
-    y_pred = prog(X=X, i_realization=i_realization, n_samples_per_dataset=n_samples_per_dataset)
+    y_pred = prog.evaluate(X=X, i_realization=i_realization, n_samples_per_dataset=n_samples_per_dataset)
     res = reward_function(y_target=y_target, y_pred=y_pred, y_weights=y_weights)
     # Kills gradients ! Necessary to minimize communications so it won't crash on some systems. (BatchExecution doc for
     # details on this issue)
     res = float(res)
     return res
 
+# Utils pickable function (non nested definition) executing a program on dataset registered in worker (for
+# parallelization purposes using ParallelExecutor)
+def task_exe_reward_shared(payload, reward_function, i_realization, n_samples_per_dataset, subset_key = None):
+    prog = load_task_payload(payload)
+    X, y_target, y_weights = get_worker_data(subset_key)
+    return task_exe_reward(prog, X, y_target, reward_function, y_weights, i_realization, n_samples_per_dataset)
+
 def BatchExecutionReward (progs, X, y_target, reward_function, y_weights = 1.,
                           # Realization related
                           i_realization         = 0,
@@ -348,7 +719,8 @@ def BatchExecutionReward (progs, X, y_target, reward_function, y_weights = 1.,
                           pad_with = np.NaN,
                           # Parallel mode related
                           n_cpus        = 1,
-                          parallel_mode = False
+                          parallel_mode = False,
+                          executor      = None,
                           ):
     """
     Executes prog(X) for each prog in progs and gathers reward_function(y_target, prog(X), y_weights) as a result.
@@ -384,6 +756,9 @@ def BatchExecutionReward (progs, X, y_target, reward_function, y_weights = 1.,
         Number of CPUs to use when running in parallel mode.
     parallel_mode : bool
         Parallel execution if True, execution in a loop else.
+    executor : batch_execute.ParallelExecutor or None, optional
+        Persistent pool of workers having the dataset registered to use in parallel mode (n_cpus is then ignored). By
+        default, a new pool of processes is opened (and data is sent along each task) at each call.
     Returns
     -------
     results : numpy.array of shape (progs.batch_size,) of float
@@ -402,25 +777,35 @@ def BatchExecutionReward (progs, X, y_target, reward_function, y_weights = 1.,
 
     # ----- Parallel mode -----
     if parallel_mode:
+        # Using persistent pool of executor having dataset registered in its workers
+        if executor is not None:
+            pool, subset_key = executor.get_pool(X = X, y_target = y_target, y_weights = y_weights,
+                                                 programs_context = make_programs_context(progs))
         # Opening a pull of processes
-        # pool = mp.get_context("fork").Pool(processes=n_cpus)
-        # mp.set_start_method("spawn", force=True)
-        pool = mp.Pool(processes=n_cpus)
+        else:
+            # pool = mp.get_context("fork").Pool(processes=n_cpus)
+            # mp.set_start_method("spawn", force=True)
+            pool = mp.Pool(processes=n_cpus)
         results = []
         for i in range(progs.batch_size):
             # Computing y = prog(X) where mask is True
             if mask[i]:
-                # Getting minimum executable skeleton pickable program
-                prog = progs.get_prog(i, skeleton=True)
-                result = pool.apply_async(task_exe_reward, args=(prog, X, y_target, reward_function, y_weights, i_realization, n_samples_per_dataset))
+                # Compact payload of program (token indices and free consts values) for workers of executor
+                if executor is not None:
+                    result = pool.apply_async(task_exe_reward_shared, args=(make_task_payload(progs, i), reward_function, i_realization, n_samples_per_dataset, subset_key))
+                # Minimum executable skeleton pickable program
+                else:
+                    prog = progs.get_prog(i, skeleton=True)
+                    result = pool.apply_async(task_exe_reward, args=(prog, X, y_target, reward_function, y_weights, i_realization, n_samples_per_dataset))
                 results.append(result)
 
         # Waiting for all tasks to complete and collecting the results
         results = [result.get() for result in results]
 
-        # Closing the pool of processes
-        pool.close()
-        pool.join()
+        # Closing the pool of processes (persistent pool of executor is kept open)
+        if executor is None:
+            pool.close()
+            pool.join()
 
     # ----- Non parallel mode -----
     else:
@@ -453,6 +838,21 @@ def task_free_const_opti(prog, X, y_target, free_const_opti_args, y_weights, i_r
         warnings.warn("Unable to optimize free constants of prog %s -> r = 0" % (str(prog)))
     return None
 
+# Utils pickable function (non nested definition) optimizing the free consts of a program on dataset registered in
+# worker (for parallelization purposes using ParallelExecutor). Returns optimized free consts values (bytes),
+# is_opti, opti_steps and opti_abandoned to be written back in the batch.
+def task_free_const_opti_shared(payload, free_const_opti_args, i_realization, n_samples_per_dataset, subset_key = None):
+    prog = load_task_payload(payload)
+    X, y_target, y_weights = get_worker_data(subset_key)
+    task_free_const_opti(prog, X, y_target, free_const_opti_args, y_weights, i_realization, n_samples_per_dataset)
+    free_consts = prog.free_consts
+    res = (free_consts.class_values.detach().numpy().tobytes(),
+           free_consts.spe_values  .detach().numpy().tobytes(),
+           bool(free_consts.is_opti[0]),
+           int(free_consts.opti_steps[0]),
+           bool(free_consts.opti_abandoned[0]))
+    return res
+
 def BatchFreeConstOpti (progs, X, y_target, free_const_opti_args=None, y_weights = 1.,
                         # Realization related
                         i_realization         = 0,
@@ -461,7 +861,8 @@ def BatchFreeConstOpti (progs, X, y_target, free_const_opti_args=None, y_weights
                         mask     = None,
                         # Parallel mode related
                         n_cpus        = 1,
-                        parallel_mode = False
+                        parallel_mode = False,
+                        executor      = None,
                         ):
     """
     Optimizes the free constants of each program in progs.
@@ -493,6 +894,9 @@ def BatchFreeConstOpti (progs, X, y_target, free_const_opti_args=None, y_weights
         Number of CPUs to use when running in parallel mode.
     parallel_mode : bool
         Parallel execution if True, execution in a loop else.
+    executor : batch_execute.ParallelExecutor or None, optional
+        Persistent pool of workers having the dataset registered to use in parallel mode (n_cpus is then ignored). By
+        default, a new pool of processes is opened (and data is sent along each task) at each call.
     """
     pb = lambda x: x
     if SHOW_PROGRESS_BAR:
@@ -506,20 +910,47 @@ def BatchFreeConstOpti (progs, X, y_target, free_const_opti_args=None, y_weights
 
     # Parallel mode
     if parallel_mode:
+        # Using persistent pool of executor having dataset registered in its workers
+        if executor is not None:
+            pool, subset_key = executor.get_pool(X = X, y_target = y_target, y_weights = y_weights,
+                                                 programs_context = make_programs_context(progs))
         # Opening a pull of processes
-        # pool = mp.get_context("fork").Pool(processes=n_cpus)
-        # mp.set_start_method("spawn", force=True)
-        pool = mp.Pool(processes=n_cpus)
+        else:
+            # pool = mp.get_context("fork").Pool(processes=n_cpus)
+            # mp.set_start_method("spawn", force=True)
+            pool = mp.Pool(processes=n_cpus)
+        results = []
         for i in range(progs.batch_size):
             # Optimizing free constants of programs where mask is True and only if it actually contains free constants
             # (Else we should not bother optimizing its free constants)
             if mask[i] and progs.n_free_const_occurrences[i]:
-                # Getting minimum executable skeleton pickable program
-                prog = progs.get_prog(i, skeleton=True)
-                pool.apply_async(task_free_const_opti, args=(prog, X, y_target, free_const_opti_args, y_weights, i_realization, n_samples_per_dataset))
+                # Compact payload of program (token indices and free consts values) for workers of executor
+                if executor is not None:
+                    result = pool.apply_async(task_free_const_opti_shared, args=(make_task_payload(progs, i), free_const_opti_args, i_realization, n_samples_per_dataset, subset_key))
+                    results.append((i, result))
+                # Minimum executable skeleton pickable program
+                else:
+                    prog = progs.get_prog(i, skeleton=True)
+                    pool.apply_async(task_free_const_opti, args=(prog, X, y_target, free_const_opti_args, y_weights, i_realization, n_samples_per_dataset))
+        # Waiting for all tasks to complete and writing optimized free consts back (persistent pool of executor is
+        # kept open)
+        if executor is not None:
+            free_consts = progs.free_consts
+            const_dtype = free_consts.class_values.detach().cpu().numpy().dtype
+            with torch.no_grad():
+                for i, result in results:
+                    class_values, spe_values, is_opti, opti_steps, opti_abandoned = result.get()
+                    free_consts.class_values [i] = torch.from_numpy(np.frombuffer(class_values, dtype=const_dtype).copy())\
+                                                        .reshape(free_consts.class_values[i].shape)
+                    free_consts.spe_values   [i] = torch.from_numpy(np.frombuffer(spe_values,   dtype=const_dtype).copy())\
+                                                        .reshape(free_consts.spe_values[i].shape)
+                    free_consts.is_opti      [i] = is_opti
+                    free_consts.opti_steps   [i] = opti_steps
+                    free_consts.opti_abandoned [i] = opti_abandoned
         # Closing the pool of processes
-        pool.close()
-        pool.join()
+        else:
+            pool.close()
+            pool.join()
 
     # Non parallel mode
     else:
@@ -532,3 +963,432 @@ def BatchFreeConstOpti (progs, X, y_target, free_const_opti_args=None, y_weights
                 task_free_const_opti(prog, X = X, y_target = y_target, free_const_opti_args = free_const_opti_args, y_weights=y_weights, i_realization=i_realization, n_samples_per_dataset=n_samples_per_dataset)
 
     return None
+
+
+
+# ------------------------------------------------------------------------------------------------------------------
+# --------------------------------------------- VECTORIZED EXECUTION -----------------------------------------------
+# ------------------------------------------------------------------------------------------------------------------
+
+# Max memory (in bytes) of node values of programs executed at once by the vectorized execution : programs are executed
+# by chunks of programs of similar lengths so node values of a chunk fit in it (see VectBatchExecutionChunks).
+VECTORIZED_EXE_MAX_MEMORY = 1e9
+# Number of samples per block when streaming rewards over samples (see VectBatchExecutionStreamingReward).
+VECTORIZED_EXE_SAMPLES_CHUNK_SIZE = 100_000
+
+def VectBatchExecutionChunks (progs, X,
+                              # Realization related
+                              i_realization         = 0,
+                              n_samples_per_dataset = None,
+                              # Mask
+                              mask       = None,
+                              max_memory = None,
+                              # Samples
+                              samples    = None,
+                              layouts    = None,
+                              ):
+    """
+    Executes programs of progs on X (without candidate wrapper) using vectorized passes over the token arrays of the
+    batch (see execute.ExecuteVectPrograms), by chunks of programs sorted by length so that node values of a chunk
+    (of shape (n_progs_chunk, max_len_chunk, n_samples)) fit in max_memory.
+    Parameters
+    ----------
+    progs : vect_programs.VectPrograms
+        Programs in the batch.
+    X : torch.tensor of shape (n_dim, n_samples,) of float
+        Values of the input variables of the problem with n_dim = nb of input variables.
+    i_realization : int, optional
+        Index of realization to use for dataset specific free constants (0 by default).
+    n_samples_per_dataset : array_like of shape (n_realizations,) of int or None, optional
+        Overrides i_realization if given (see VectBatchExecution).
+    mask : array_like of shape (progs.batch_size) of bool
+        Only programs where mask is True are executed. By default, all programs are executed.
+    max_memory : float or None
+        Max memory (in bytes) of node values of a chunk, a program too large to fit in it being executed alone. By
+        default, VECTORIZED_EXE_MAX_MEMORY is used.
+    samples : slice or None
+        Only samples X[:, samples] are executed (dataset specific free constants of each sample being determined by
+        its index in the full X). By default, all samples are executed.
+    layouts : dict or None
+        Execution layouts of chunks (see execute.VectProgramsLayout) keyed by the indices of programs of chunks,
+        layouts missing from it being added to it so it can be shared across calls executing the same programs (eg.
+        on successive blocks of samples). By default, layouts are built at each call.
+    Yields
+    -------
+    idx : numpy.array of shape (?,) of int
+        Indices in the batch of programs of the chunk.
+    y : torch.tensor of shape (?, n_samples,) of float
+        Returns prog(X) for each program of the chunk (n_samples being the number of executed samples).
+    """
+    if mask is None:
+        mask = np.full(shape=(progs.batch_size), fill_value=True)                           # (batch_size)
+    mask = np.array(mask, dtype=bool)                                                       # (batch_size)
+    if max_memory is None:
+        max_memory = VECTORIZED_EXE_MAX_MEMORY
+    if layouts is None:
+        layouts = {}
+
+    # Free constants values
+    free_consts = progs.free_consts
+    if n_samples_per_dataset is not None:
+        # Index of realization of each sample
+        real_idx = dataset.realization_index(n_samples_per_dataset, device=free_consts.spe_values.device)  # (n_samples,) of int
+    # Executed samples
+    if samples is not None:
+        X = X[:, samples]                                                                   # (n_dim, n_samples,)
+        if n_samples_per_dataset is not None:
+            real_idx = real_idx[samples]                                                    # (n_samples,) of int
+    # Node values dtype (data point-wise spe free constants values may promote the type of the whole computation)
+    dtype = X.dtype
+    if free_consts.n_spe_free_const > 0 and n_samples_per_dataset is not None:
+        dtype = torch.promote_types(dtype, free_consts.spe_values.dtype)
+    # Memory of node values of a program per time step
+    n_samples = X.shape[1]
+    step_memory = n_samples * torch.empty((), dtype=dtype).element_size()
+
+    # Executed programs sorted by length and split in chunks fitting in max_memory
+    idx     = np.where(mask)[0]                                                             # (?,) of int
+    idx     = idx[np.argsort(progs.n_completed[idx], kind="stable")]                        # (?,) of int
+    lengths = progs.n_completed[idx]                                                        # (?,) of int
+    # Chunk of programs idx[i:j] needs (j-i)*lengths[j-1]*step_memory bytes
+    i = 0
+    while i < len(idx):
+        j = i + 1
+        while j < len(idx) and (j + 1 - i)*lengths[j]*step_memory <= max_memory:
+            j += 1
+        chunk   = idx[i:j]                                                                  # (n_chunk,) of int
+        max_len = lengths[j-1]
+        tokens_idx   = progs.tokens.idx          [chunk, :max_len]                          # (n_chunk, max_len)
+        children_pos = progs.tokens.children_pos [chunk, :max_len]                          # (n_chunk, max_len, MAX_NB_CHILDREN)
+        class_vals   = free_consts.class_values  [chunk]                                    # (n_chunk, n_class_free_const,)
+        if free_consts.n_spe_free_const == 0:
+            spe_vals = None
+        elif n_samples_per_dataset is not None:
+            spe_vals = free_consts.spe_values[chunk][:, :, real_idx]                        # (n_chunk, n_spe_free_const, n_samples)
+        else:
+            spe_vals = free_consts.spe_values[chunk][:, :, i_realization]                   # (n_chunk, n_spe_free_const,)
+        key = chunk.tobytes()
+        if key not in layouts:
+            layouts[key] = Exec.VectProgramsLayout(tokens_idx             = tokens_idx,
+                                                   children_pos           = children_pos,
+                                                   library                = progs.library,
+                                                   class_free_consts_vals = class_vals,
+                                                   spe_free_consts_vals   = spe_vals,
+                                                   device                 = X.device)
+        y = Exec.ExecuteVectPrograms(input_var_data         = X,
+                                     tokens_idx             = tokens_idx,
+                                     children_pos           = children_pos,
+                                     library                = progs.library,
+                                     class_free_consts_vals = class_vals,
+                                     spe_free_consts_vals   = spe_vals,
+                                     layout                 = layouts[key],
+                                     )                                                      # (n_chunk, n_samples)
+        yield chunk, y
+        i = j
+
+def VectBatchExecution (progs, X,
+                        # Realization related
+                        i_realization         = 0,
+                        n_samples_per_dataset = None,
+                        # Mask
+                        mask     = None,
+                        pad_with = np.NaN,
+                        ):
+    """
+    Executes all programs of progs on X at once (without candidate wrapper) using vectorized passes over the
+    token arrays of the batch (see execute.ExecuteVectPrograms), programs being executed by chunks fitting in
+    VECTORIZED_EXE_MAX_MEMORY (see VectBatchExecutionChunks).
+    Parameters
+    ----------
+    progs : vect_programs.VectPrograms
+        Programs in the batch.
+    X : torch.tensor of shape (n_dim, n_samples,) of float
+        Values of the input variables of the problem with n_dim = nb of input variables.
+    i_realization : int, optional
+        Index of realization to use for dataset specific free constants (0 by default).
+    n_samples_per_dataset : array_like of shape (n_realizations,) of int or None, optional
+        Overrides i_realization if given. If given assumes that X contains multiple datasets with samples of each
+        dataset following each other and each portion of X corresponding to a dataset should be treated with its
+        corresponding dataset specific free constants values. n_samples_per_dataset is the number of samples for
+        each dataset. Eg. [90, 100, 110] for 3 datasets, this will assume that the first 90 samples of X are for
+        the first dataset, the next 100 for the second and the last 110 for the third.
+    mask : array_like of shape (progs.batch_size) of bool
+        Only programs where mask is True are executed. By default, all programs are executed.
+    pad_with : float
+        Value to pad with where mask is False. (Default = nan).
+    Returns
+    -------
+    results : torch.tensor of shape (progs.batch_size, n_samples,) of float
+        Returns prog(X) for each program in progs. Returns NaNs for programs that are not executed (where mask is
+        False).
+    """
+    # Batch of evaluation results
+    n_samples = X.shape[1]
+    res = torch.full((progs.batch_size, n_samples), pad_with, dtype=X.dtype, device=X.device) # (batch_size, n_samples)
+    for idx, y in VectBatchExecutionChunks(progs = progs, X = X,
+                                           i_realization         = i_realization,
+                                           n_samples_per_dataset = n_samples_per_dataset,
+                                           mask                  = mask,):
+        res = res.to(y.dtype)
+        res[torch.tensor(idx, device=res.device)] = y                                      # (?, n_samples)
+    return res
+
+def VectBatchExecutionReward (progs, X, y_target, reward_function, y_weights = 1.,
+                              # Realization related
+                              i_realization         = 0,
+                              n_samples_per_dataset = None,
+                              # Mask
+                              mask     = None,
+                              pad_with = np.NaN,
+                              ):
+    """
+    Executes all programs of progs on X at once (without candidate wrapper, see VectBatchExecution) and gathers
+    reward_function(y_target, prog(X), y_weights) as a result. Programs are executed by chunks fitting in
+    VECTORIZED_EXE_MAX_MEMORY (see VectBatchExecutionChunks) without tracking gradients.
+    Parameters
+    ----------
+    progs : vect_programs.VectPrograms
+        Programs in the batch.
+    X : torch.tensor of shape (n_dim, n_samples,) of float
+        Values of the input variables of the problem with n_dim = nb of input variables.
+    y_target : torch.tensor of shape (n_samples,) of float
+        Values of target output.
+    reward_function : callable
+        Function that taking y_target (torch.tensor of shape (?,) of float), y_pred (torch.tensor of shape (?,)
+        of float) and y_weights (torch.tensor of shape (?,) of float) as key arguments and returning a float reward of
+        an individual program.
+    y_weights : torch.tensor of shape (?,) of float, optional
+        Weights for each data point.
+    i_realization : int, optional
+        Index of realization to use for dataset specific free constants (0 by default).
+    n_samples_per_dataset : array_like of shape (n_realizations,) of int or None, optional
+        Overrides i_realization if given. If given assumes that X contains multiple datasets with samples of each
+        dataset following each other and each portion of X corresponding to a dataset should be treated with its
+        corresponding dataset specific free constants values. n_samples_per_dataset is the number of samples for
+        each dataset. Eg. [90, 100, 110] for 3 datasets, this will assume that the first 90 samples of X are for
+        the first dataset, the next 100 for the second and the last 110 for the third.
+    mask : array_like of shape (progs.batch_size) of bool
+        Only programs where mask is True are executed. By default, all programs are executed.
+    pad_with : float
+        Value to pad with where mask is False. (Default = nan).
+    Returns
+    -------
+    results : numpy.array of shape (progs.batch_size,) of float
+        Returns reward_function(y_target, prog(X), y_weights) for each program in progs. Returns NaNs for programs
+        that are not executed (where mask is False).
+    """
+    res = np.full((progs.batch_size,), pad_with, dtype=float)                               # (batch_size,)
+    # Rewards do not need gradients (free constants values requiring grad would otherwise build an autograd graph)
+    with torch.no_grad():
+        for idx, y_pred in VectBatchExecutionChunks(progs = progs, X = X,
+                                                    i_realization         = i_realization,
+                                                    n_samples_per_dataset = n_samples_per_dataset,
+                                                    mask                  = mask,):
+            for i, y_pred_i in zip(idx, y_pred):
+                res[i] = float(reward_function(y_target=y_target, y_pred=y_pred_i, y_weights=y_weights))
+    return res
+
+def VectBatchExecutionStreamingReward (progs, X, y_target, reward_stats_function, reward_from_stats_function,
+                                       y_weights = 1.,
+                                       # Realization related
+                                       i_realization         = 0,
+                                       n_samples_per_dataset = None,
+                                       # Mask
+                                       mask     = None,
+                                       pad_with = np.NaN,
+                                       # Samples
+                                       samples_chunk_size = None,
+                                       ):
+    """
+    Executes all programs of progs on X (without candidate wrapper, see VectBatchExecution) by blocks of samples and
+    gathers rewards from sufficient statistics accumulated over blocks so prog(X) is never materialized over all
+    samples : memory use is bounded by the block size instead of n_samples. Programs are executed by chunks fitting in
+    VECTORIZED_EXE_MAX_MEMORY (see VectBatchExecutionChunks) without tracking gradients.
+    Parameters
+    ----------
+    progs : vect_programs.VectPrograms
+        Programs in the batch.
+    X : torch.tensor of shape (n_dim, n_samples,) of float
+        Values of the input variables of the problem with n_dim = nb of input variables.
+    y_target : torch.tensor of shape (n_samples,) of float
+        Values of target output.
+    reward_stats_function : callable
+        Function that taking y_target (torch.tensor of shape (n_block,) of float), y_pred (torch.tensor of shape (?,
+        n_block) of float) and y_weights (torch.tensor of shape (n_block,) of float) of a block of samples as key
+        arguments and returning additive statistics of each program on this block (torch.tensor of shape (?, n_stats)
+        of float).
+    reward_from_stats_function : callable
+        Function that taking stats (torch.tensor of shape (?, n_stats) of float) summed over all blocks, y_target
+        (torch.tensor of shape (n_samples,) of float) and y_weights (torch.tensor of shape (n_samples,) of float) as key
+        arguments and returning the reward of each program (torch.tensor of shape (?,) of float).
+    y_weights : torch.tensor of shape (?,) of float, optional
+        Weights for each data point.
+    i_realization : int, optional
+        Index of realization to use for dataset specific free constants (0 by default).
+    n_samples_per_dataset : array_like of shape (n_realizations,) of int or None, optional
+        Overrides i_realization if given (see VectBatchExecution).
+    mask : array_like of shape (progs.batch_size) of bool
+        Only programs where mask is True are executed. By default, all programs are executed.
+    pad_with : float
+        Value to pad with where mask is False. (Default = nan).
+    samples_chunk_size : int or None
+        Number of samples per block. By default, VECTORIZED_EXE_SAMPLES_CHUNK_SIZE is used.
+    Returns
+    -------
+    results : numpy.array of shape (progs.batch_size,) of float
+        Returns reward of each program in progs. Returns NaNs for programs that are not executed (where mask is False).
+    """
+    if mask is None:
+        mask = np.full(shape=(progs.batch_size), fill_value=True)                           # (batch_size)
+    mask = np.array(mask, dtype=bool)                                                       # (batch_size)
+    if samples_chunk_size is None:
+        samples_chunk_size = VECTORIZED_EXE_SAMPLES_CHUNK_SIZE
+    res = np.full((progs.batch_size,), pad_with, dtype=float)                               # (batch_size,)
+    if not mask.any():
+        return res
+    # Data point-wise weights
+    is_weights_per_sample = torch.is_tensor(y_weights) and y_weights.dim() > 0
+    # Statistics of programs summed over blocks
+    stats = None
+    n_samples = X.shape[1]
+    # Execution layouts of chunks shared across blocks
+    layouts = {}
+    with torch.no_grad():
+        for start in range(0, n_samples, samples_chunk_size):
+            block = slice(start, min(start + samples_chunk_size, n_samples))
+            y_target_block  = y_target[block]                                               # (n_block,)
+            y_weights_block = y_weights[block] if is_weights_per_sample else y_weights      # (n_block,)
+            for idx, y_pred in VectBatchExecutionChunks(progs = progs, X = X,
+                                                        i_realization         = i_realization,
+                                                        n_samples_per_dataset = n_samples_per_dataset,
+                                                        mask                  = mask,
+                                                        samples               = block,
+                                                        layouts               = layouts,):
+                stats_chunk = reward_stats_function(y_target  = y_target_block,
+                                                    y_pred    = y_pred,
+                                                    y_weights = y_weights_block,)         # (n_chunk, n_stats)
+                if stats is None:
+                    stats = torch.zeros((progs.batch_size, stats_chunk.shape[1]), dtype=stats_chunk.dtype,
+                                        device=stats_chunk.device)                          # (batch_size, n_stats)
+                stats[torch.tensor(idx, device=stats.device)] += stats_chunk               # (n_chunk, n_stats)
+        rewards = reward_from_stats_function(stats     = stats[torch.tensor(mask, device=stats.device)],
+                                             y_target  = y_target,
+                                             y_weights = y_weights,)                       # (?,)
+    res[mask] = rewards.cpu().numpy()                                                       # (?,)
+    return res
+
+def VectBatchFreeConstOpti (progs, X, y_target, free_const_opti_args=None, y_weights = 1.,
+                            # Realization related
+                            i_realization         = 0,
+                            n_samples_per_dataset = None,
+                            # Mask
+                            mask     = None,
+                            ):
+    """
+    Optimizes the free constants of all programs of progs at once (without candidate wrapper) : class and spe free
+    constants values of all programs are optimized together as a single set of parameters (see
+    free_const.optimize_free_const_batch) with programs being executed in a single vectorized pass over the token
+    arrays of the batch at each step (see execute.ExecuteVectPrograms). Each program stops on its own when reaching
+    tolerance, only programs still being optimized being executed.
+    Parameters
+    ----------
+    progs : vect_programs.VectPrograms
+        Programs in the batch.
+    X : torch.tensor of shape (n_dim, n_samples,) of float
+        Values of the input variables of the problem with n_dim = nb of input variables.
+    y_target : torch.tensor of shape (n_samples,) of float
+        Values of target output.
+    free_const_opti_args : dict or None, optional
+        Arguments to pass to free_const.optimize_free_const_batch. By default, free_const.DEFAULT_OPTI_ARGS
+        arguments are used.
+    y_weights : torch.tensor of shape (?,) of float, optional
+        Weights for each data point.
+    i_realization : int, optional
+        Index of realization to use for dataset specific free constants (0 by default).
+    n_samples_per_dataset : array_like of shape (n_realizations,) of int or None, optional
+        Overrides i_realization if given. If given assumes that X contains multiple datasets with samples of each
+        dataset following each other and each portion of X corresponding to a dataset should be treated with its
+        corresponding dataset specific free constants values. n_samples_per_dataset is the number of samples for
+        each dataset. Eg. [90, 100, 110] for 3 datasets, this will assume that the first 90 samples of X are for
+        the first dataset, the next 100 for the second and the last 110 for the third.
+    mask : array_like of shape (progs.batch_size) of bool
+        Only programs' constants where mask is True are optimized. By default, all programs' constants are opitmized.
+    """
+    if free_const_opti_args is None:
+        free_const_opti_args = free_const.DEFAULT_OPTI_ARGS
+
+    # mask : should program be optimized ?
+    # By default, all programs of batch are optimized
+    if mask is None:
+        mask = np.full(shape=(progs.batch_size), fill_value=True)                           # (batch_size)
+    # Only optimizing programs that actually contain free constants
+    mask = np.array(mask, dtype=bool) & (progs.n_free_const_occurrences > 0)                # (batch_size)
+    if mask.sum() == 0:
+        return None
+    # ? = mask.sum() # Number of programs to optimize
+    idx = np.where(mask)[0]                                                                 # (?,)
+
+    # Only considering time steps up to the longest optimized program
+    max_len = progs.n_completed[mask].max()
+    tokens_idx   = progs.tokens.idx          [mask, :max_len]                               # (?, max_len)
+    children_pos = progs.tokens.children_pos [mask, :max_len]                               # (?, max_len, MAX_NB_CHILDREN)
+
+    # Free constants values to optimize
+    free_consts = progs.free_consts
+    class_vals  = free_consts.class_values [idx].clone().detach()                           # (?, n_class_free_const,)
+    spe_vals    = free_consts.spe_values   [idx].clone().detach()                           # (?, n_spe_free_const, n_realizations,)
+    # Index of realization of each sample
+    if n_samples_per_dataset is not None:
+        real_idx = dataset.realization_index(n_samples_per_dataset, device=free_consts.spe_values.device)  # (n_samples,) of int
+
+    # Execution layouts of subsets of programs evaluated by the optimizer (only problems still being optimized being
+    # evaluated), built once for all the steps evaluating the same subset
+    layouts = {}
+    def func(params, rows):
+        class_vals, spe_vals = params
+        # Programs are tiled when multiple starts of each are stacked (see free_const.optimize_free_const_batch)
+        progs_rows = rows % len(idx)                                                        # (n_rows,) of int
+        rows       = torch.as_tensor(rows, device=class_vals.device)                        # (n_rows,) of int
+        class_vals = class_vals[rows]                                                       # (n_rows, n_class_free_const,)
+        if free_consts.n_spe_free_const == 0:
+            spe_vals = None
+        elif n_samples_per_dataset is not None:
+            spe_vals = spe_vals[rows][:, :, real_idx]                                       # (n_rows, n_spe_free_const, n_samples)
+        else:
+            spe_vals = spe_vals[rows][:, :, i_realization]                                  # (n_rows, n_spe_free_const,)
+        key = progs_rows.tobytes()
+        if key not in layouts:
+            layouts[key] = Exec.VectProgramsLayout(tokens_idx             = tokens_idx   [progs_rows],
+                                                   children_pos           = children_pos [progs_rows],
+                                                   library                = progs.library,
+                                                   class_free_consts_vals = class_vals,
+                                                   spe_free_consts_vals   = spe_vals,
+                                                   device                 = X.device)
+        y = Exec.ExecuteVectPrograms(input_var_data         = X,
+                                     tokens_idx             = None,
+                                     children_pos           = None,
+                                     library                = progs.library,
+                                     class_free_consts_vals = class_vals,
+                                     spe_free_consts_vals   = spe_vals,
+                                     layout                 = layouts[key],
+                                     )                                                      # (n_rows, n_samples)
+        return y
+
+    history, opti_steps = free_const.optimize_free_const_batch (func      = func,
+                                                                params    = [class_vals, spe_vals],
+                                                                y_target  = y_target,
+                                                                y_weights = y_weights,
+                                                                **free_const_opti_args)
+
+    # Writing optimized values back and logging optimization process
+    with torch.no_grad():
+        free_consts.class_values [idx] = class_vals.detach().to(free_consts.class_values.dtype)
+        free_consts.spe_values   [idx] = spe_vals  .detach().to(free_consts.spe_values.dtype)
+    free_consts.is_opti    [idx] = True
+    free_consts.opti_steps [idx] = torch.tensor(opti_steps, dtype=free_consts.opti_steps.dtype)
+    method_args = free_const_opti_args.get("method_args", None) or \
+                  free_const.OPTIMIZERS_DEFAULT_ARGS.get(free_const_opti_args.get("method", "LBFGS"))
+    free_consts.opti_abandoned [idx] = torch.from_numpy(free_const.was_abandoned(history, method_args = method_args))\
+                                           .to(free_consts.opti_abandoned.device)
+
+    return None
@@ -0,0 +1,183 @@
+import numpy as np
+import torch
+
+from physo.physym import token as Tok
+
+# ------------------------------------------------------------------------------------------------------------------
+# ------------------------------------------------ CANONICAL FORMS -------------------------------------------------
+# ------------------------------------------------------------------------------------------------------------------
+
+# Commutative and associative operations : chains of these operations are flattened and their operands sorted
+# (eg. add(x1, add(x0, c0)) and add(add(c0, x1), x0) have the same canonical form).
+COMMUTATIVE_ASSOCIATIVE_OPS = ["add", "mul"]
+# Involutive operations : op(op(x)) is folded into x (eg. neg(neg(x)) -> x, inv(inv(x)) -> x).
+# Operations -> function they must be computed with to be involutive (eg. protected_inv(protected_inv(x)) being 0 for
+# very small and very large x, inv tokens of protected libraries are not folded).
+INVOLUTIVE_OPS = {
+    "neg" : torch.negative,
+    "inv" : torch.reciprocal,
+}
+
+def Mix64 (h):
+    """
+    Mixes bits of 64-bit integers (splitmix64 finalizer) so close inputs give uncorrelated outputs.
+    Parameters
+    ----------
+    h : numpy.array of shape (?,) of numpy.uint64
+        Integers to mix.
+    Returns
+    -------
+    h : numpy.array of shape (?,) of numpy.uint64
+        Mixed integers.
+    """
+    h = h ^ (h >> np.uint64(30))
+    h = h * np.uint64(0xbf58476d1ce4e5b9)
+    h = h ^ (h >> np.uint64(27))
+    h = h * np.uint64(0x94d049bb133111eb)
+    h = h ^ (h >> np.uint64(31))
+    return h
+
+def Combine64 (h_a, h_b):
+    """
+    Order dependent combination of 64-bit hashes.
+    Parameters
+    ----------
+    h_a, h_b : numpy.array of shape (?,) of numpy.uint64
+        Hashes to combine.
+    Returns
+    -------
+    h : numpy.array of shape (?,) of numpy.uint64
+        Combined hashes.
+    """
+    return Mix64(h_a * np.uint64(0x9e3779b97f4a7c15) + h_b)
+
+def ComputeCanonicalNodes (progs):
+    """
+    Computes canonical hashes of all nodes (ie. of sub-trees starting at each token) of programs in a vectorized
+    bottom-up pass over the token arrays of the batch : children of COMMUTATIVE_ASSOCIATIVE_OPS are combined in an
+    order independent way (flattening their chains) and INVOLUTIVE_OPS applied twice are folded. Equivalent sub-trees
+    (up to these rules) have the same hash.
+    Parameters
+    ----------
+    progs : vect_programs.VectPrograms
+        Programs in the batch.
+    Returns
+    -------
+    nodes_hash, nodes_pos : numpy.array of shape (batch_size, max_time_step,) of numpy.uint64,
+                            numpy.array of shape (batch_size, max_time_step,) of int
+        Canonical hash of each node and position of the node each node is equivalent to after folding of involutive
+        operations (eg. position of x for the first neg token of neg(neg(x)), the position of the node itself else).
+    """
+    lib = progs.library
+    tokens_idx   = progs.tokens.idx                                                          # (batch_size, max_time_step)
+    arity        = progs.tokens.arity                                                        # (batch_size, max_time_step)
+    children_pos = np.clip(progs.tokens.children_pos, 0, progs.max_time_step - 1)            # (batch_size, max_time_step, MAX_NB_CHILDREN)
+    is_ca_lib  = np.isin(lib.lib_name, COMMUTATIVE_ASSOCIATIVE_OPS) & (lib.arity == 2)       # (n_library,) of bool
+    is_inv_lib = np.array([INVOLUTIVE_OPS.get(name, None) is func for name, func in zip(lib.lib_name, lib.lib_function)]) \
+                 & (lib.arity == 1)                                                          # (n_library,) of bool
+
+    batch_size, max_time_step = tokens_idx.shape
+    coords     = np.arange(batch_size)                                                       # (batch_size,)
+    nodes_hash = np.zeros((batch_size, max_time_step), dtype=np.uint64)                      # (batch_size, max_time_step)
+    nodes_pos  = np.tile(np.arange(max_time_step), (batch_size, 1))                          # (batch_size, max_time_step)
+    # Order independent sum of hashes of operands of chains of commutative associative operations
+    nodes_acc  = np.zeros((batch_size, max_time_step), dtype=np.uint64)                      # (batch_size, max_time_step)
+
+    # Children being after their parent, iterating from last to first token
+    for t in range (max_time_step-1, -1, -1):
+        tok     = tokens_idx[:, t]                                                           # (batch_size,)
+        tok_h   = Mix64(tok.astype(np.uint64) + np.uint64(1))                                # (batch_size,)
+        # Children (after folding of involutive operations)
+        c0      = nodes_pos[coords, children_pos[:, t, 0]]                                   # (batch_size,)
+        c1      = nodes_pos[coords, children_pos[:, t, 1]]                                   # (batch_size,)
+        h0, h1  = nodes_hash[coords, c0], nodes_hash[coords, c1]                             # (batch_size,)
+        tok0    = tokens_idx[coords, c0]                                                     # (batch_size,)
+        tok1    = tokens_idx[coords, c1]                                                     # (batch_size,)
+        # Default hashes
+        h = np.where(arity[:, t] == 0, tok_h, Combine64(tok_h, h0))                          # (batch_size,)
+        h = np.where(arity[:, t] == 2, Combine64(h, h1), h)                                  # (batch_size,)
+        # Commutative associative operations : operands of children of the same operation are operands of the chain
+        is_ca  = is_ca_lib[tok]                                                              # (batch_size,)
+        part0  = np.where(tok0 == tok, nodes_acc[coords, c0], Mix64(h0 + np.uint64(1)))      # (batch_size,)
+        part1  = np.where(tok1 == tok, nodes_acc[coords, c1], Mix64(h1 + np.uint64(1)))      # (batch_size,)
+        acc    = part0 + part1                                                               # (batch_size,)
+        nodes_acc[:, t] = np.where(is_ca, acc, nodes_acc[:, t])
+        h = np.where(is_ca, Combine64(tok_h, acc), h)                                        # (batch_size,)
+        # Involutive operations : op(op(x)) is node x
+        is_folded  = is_inv_lib[tok] & (tok0 == tok)                                         # (batch_size,)
+        folded_pos = nodes_pos[coords, children_pos[coords, c0, 0]]                          # (batch_size,)
+        nodes_pos  [:, t] = np.where(is_folded, folded_pos, t)
+        nodes_hash [:, t] = np.where(is_folded, nodes_hash[coords, folded_pos], h)
+    return nodes_hash, nodes_pos
+
+def ComputeCanonicalHashes (progs):
+    """
+    Computes 64-bit canonical hashes of programs (see ComputeCanonicalNodes) : programs equivalent up to the order of
+    operands of commutative operations, the grouping of associative operations and the folding of involutive operations
+    have the same hash (eg. mul(c0, x) and mul(x, c0)).
+    Parameters
+    ----------
+    progs : vect_programs.VectPrograms
+        Programs in the batch.
+    Returns
+    -------
+    hashes : numpy.array of shape (batch_size,) of numpy.uint64
+        Canonical hash of each program.
+    """
+    nodes_hash, nodes_pos = ComputeCanonicalNodes(progs)
+    hashes = nodes_hash[:, 0]                                                                # (batch_size,)
+    return hashes
+
+def ComputeCanonicalTokensIdx (progs, prog_idx, canonical_nodes = None):
+    """
+    Computes canonical token sequence of a program (see ComputeCanonicalNodes) : chains of commutative associative
+    operations are flattened then rebuilt with operands sorted by hash and involutive operations applied twice are
+    removed. The canonical sequence of a program has the same canonical hash as the program itself.
+    Parameters
+    ----------
+    progs : vect_programs.VectPrograms
+        Programs in the batch.
+    prog_idx : int
+        Index of program in batch.
+    canonical_nodes : (numpy.array, numpy.array) or None
+        Result of ComputeCanonicalNodes(progs) if already computed. By default, it is computed.
+    Returns
+    -------
+    tokens_idx : numpy.array of shape (?,) of int
+        Indices in library of tokens of canonical program (in the same order as programs tokens in VectPrograms).
+    """
+    if canonical_nodes is None:
+        canonical_nodes = ComputeCanonicalNodes(progs)
+    nodes_hash, nodes_pos = canonical_nodes[0][prog_idx], canonical_nodes[1][prog_idx]       # (max_time_step,)
+    tokens_idx   = progs.tokens.idx          [prog_idx]                                      # (max_time_step,)
+    arity        = progs.tokens.arity        [prog_idx]                                      # (max_time_step,)
+    children_pos = progs.tokens.children_pos [prog_idx]                                      # (max_time_step, MAX_NB_CHILDREN)
+    is_ca_lib    = np.isin(progs.library.lib_name, COMMUTATIVE_ASSOCIATIVE_OPS) & (progs.library.arity == 2)
+
+    def operands (pos, tok):
+        # Operands of chain of tok operations starting at pos
+        res = []
+        for i in range (Tok.MAX_NB_CHILDREN):
+            child = nodes_pos[children_pos[pos, i]]
+            if tokens_idx[child] == tok:
+                res += operands(child, tok)
+            else:
+                res.append(child)
+        return res
+
+    def emit (pos):
+        pos = nodes_pos[pos]
+        tok = tokens_idx[pos]
+        if is_ca_lib[tok]:
+            ops = sorted(operands(pos, tok), key=lambda p: nodes_hash[p])
+            res = []
+            for op in ops[:-1]:
+                res += [tok] + emit(op)
+            return res + emit(ops[-1])
+        res = [tok]
+        for i in range (arity[pos]):
+            res += emit(children_pos[pos, i])
+        return res
+
+    tokens_idx = np.array(emit(0), dtype=int)                                                # (?,)
+    return tokens_idx
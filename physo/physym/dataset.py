@@ -2,6 +2,7 @@ import torch
 import numpy as np
 # Internal imports
 from physo.physym import token as Tok
+from physo.physym import functions as Func
 
 def flatten_multi_data (multi_data,):
     """
@@ -38,6 +39,69 @@ def unflatten_multi_data (flattened_data, n_samples_per_dataset):
     unflattened_data = list(torch.split(flattened_data, n_samples_per_dataset.tolist(), dim=-1)) # (n_realizations,) of (..., [n_samples depends on dataset],)
     return unflattened_data
 
+# Max number of realization index vectors kept in cache (one per n_samples_per_dataset and device)
+REALIZATION_INDEX_CACHE_SIZE = 32
+REALIZATION_INDEX_CACHE = {}
+
+def realization_index (n_samples_per_dataset, device=None):
+    """
+    Returns the index of the realization of each sample of flattened datasets (see flatten_multi_data).
+    This is computed once per n_samples_per_dataset and device and then retrieved from cache so that values per
+    realization (eg. spe free constants of shape (..., n_realizations)) can be broadcast to flattened data by a single
+    gather (values[..., real_idx]) at each execution.
+    Parameters
+    ----------
+    n_samples_per_dataset : array_like of shape (n_realizations,) of int
+        Number of samples for each dataset (eg. [90, 100, 110] for 3 datasets).
+    device : str or torch.device or None, optional
+        Device of the returned index.
+    Returns
+    -------
+    real_idx : torch.tensor of shape (n_all_samples,) of int
+        Index of realization of each sample.
+    """
+    key = (tuple(int(n) for n in n_samples_per_dataset), str(torch.device(device or "cpu")))
+    real_idx = REALIZATION_INDEX_CACHE.get(key)
+    if real_idx is None:
+        # Created outside of inference mode as it can be used in computations recorded by autograd
+        with torch.inference_mode(False):
+            real_idx = torch.repeat_interleave(torch.arange(len(key[0]), device=device),
+                                               torch.tensor(key[0], dtype=torch.long, device=device))  # (n_all_samples,)
+        if len(REALIZATION_INDEX_CACHE) >= REALIZATION_INDEX_CACHE_SIZE:
+            REALIZATION_INDEX_CACHE.pop(next(iter(REALIZATION_INDEX_CACHE)))
+        REALIZATION_INDEX_CACHE[key] = real_idx
+    return real_idx
+
+def subset_index (n_samples_per_dataset, n_samples = 1000, seed = 0):
+    """
+    Returns the index of a random subset of samples of flattened datasets (see flatten_multi_data) made of (at most)
+    n_samples samples of each dataset. The subset only depends on arguments so the same subset is drawn at each call.
+    Parameters
+    ----------
+    n_samples_per_dataset : array_like of shape (n_realizations,) of int
+        Number of samples for each dataset (eg. [90, 100, 110] for 3 datasets).
+    n_samples : int
+        Max number of samples of each dataset to keep.
+    seed : int
+        Seed of random number generator used to draw samples.
+    Returns
+    -------
+    idx, sub_n_samples_per_dataset : numpy.array of shape (n_sub_samples,) of int,
+                                     numpy.array of shape (n_realizations,) of int
+        Index of samples of subset (samples of each dataset still following each other, in their original order) and
+        number of samples of each dataset in subset.
+    """
+    n_samples_per_dataset = np.array(n_samples_per_dataset, dtype=int)                                   # (n_realizations,)
+    # Start of each dataset in data
+    starts = np.concatenate(([0], np.cumsum(n_samples_per_dataset)[:-1]))                               # (n_realizations,)
+    rng = np.random.default_rng(seed)
+    idx = []
+    for start, n in zip(starts, n_samples_per_dataset):
+        idx.append(start + np.sort(rng.choice(n, size=min(n, n_samples), replace=False)))
+    sub_n_samples_per_dataset = np.array([len(i) for i in idx], dtype=int)                             # (n_realizations,)
+    idx = np.concatenate(idx)                                                                            # (n_sub_samples,)
+    return idx, sub_n_samples_per_dataset
+
 def inspect_Xy (X, y):
     """
     Runs assertions and analyzes shape of a single dataset corresponding to a single realization.
@@ -149,7 +213,7 @@ class Dataset:
     Contains a dataset and runs assertions.
     Converts to torch if necessary.
     """
-    def __init__(self, multi_X, multi_y, multi_y_weights=1., library=None):
+    def __init__(self, multi_X, multi_y, multi_y_weights=1., library=None, dtype=None):
         """
         Parameters
         ----------
@@ -168,6 +232,9 @@ class Dataset:
         library : library.Library or None, optional
             Library of choosable tokens. This is used for assertions, some assertions are not performed if library is
             None.
+        dtype : str or torch.dtype or None, optional
+            Dtype to convert X, y and y_weights to ("float32" or "float64", see functions.DTYPES). By default, data is
+            kept in its original dtype.
         """
         self.library = library
 
@@ -221,6 +288,13 @@ class Dataset:
         # Handling multi_y_weights (must be done before device detection)
         multi_y_weights = inspect_multi_y_weights (multi_y_weights=multi_y_weights, multi_y=multi_y)
 
+        # Dtype conversion
+        dtype = Func.get_dtype(dtype)
+        if dtype is not None:
+            multi_X         = [X        .to(dtype) for X         in multi_X        ]
+            multi_y         = [y        .to(dtype) for y         in multi_y        ]
+            multi_y_weights = [y_weights.to(dtype) for y_weights in multi_y_weights]
+
         # Device detection
         list_of_devices = np.array([X.device for X in multi_X] + [y.device for y in multi_y] + [y_weights.device for y_weights in multi_y_weights])
         assert (list_of_devices[0] == list_of_devices).all(), "All X, y and y_weights datasets must be on the same device."
@@ -237,6 +311,12 @@ class Dataset:
         self.multi_y_flatten         = flatten_multi_data(self.multi_y)          # (n_all_samples,)
         self.multi_y_weights_flatten = flatten_multi_data(self.multi_y_weights)  # (n_all_samples,)
 
+        # Saving the dtype (of X)
+        self.dtype = self.multi_X_flatten.dtype
+
+        # Index of realization of each sample of flattened datasets
+        self.real_idx = realization_index(self.n_samples_per_dataset, device=self.device)  # (n_all_samples,)
+
         return None
 
     @property
@@ -257,6 +337,7 @@ class Dataset:
             self.multi_y[i] = self.multi_y[i].to(device)
         for i in range(self.n_realizations):
             self.multi_y_weights[i] = self.multi_y_weights[i].to(device)
+        self.real_idx = realization_index(self.n_samples_per_dataset, device=device)
         self.device = device
         return None
 
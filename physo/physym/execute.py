@@ -1,4 +1,9 @@
+import collections
+import numpy as np
+import torch as torch
+
 from physo.physym import token as Tok
+from physo.physym import functions as Func
 
 # ------------------------------------------------------------------------------------------------------------------
 # ------------------------------------------------ SINGLE EXECUTION ------------------------------------------------
@@ -125,3 +130,583 @@ def ComputeInfixNotation (program_tokens):
         # Appending last result to stack
         curr_stack.append(res)
     return curr_stack[0]
+
+# ------------------------------------------------------------------------------------------------------------------
+# ----------------------------------------------- COMPILED EXECUTION -----------------------------------------------
+# ------------------------------------------------------------------------------------------------------------------
+
+# Max number of compiled programs kept in cache
+COMPILED_PROGRAMS_CACHE_MAX_SIZE = 10000
+
+# Identity operations removed when compiling programs : op function -> (neutral element, can it be the first operand)
+# (eg. mul(1, x) -> x, add(x, 0) -> x, sub(x, 0) -> x, div(x, 1) -> x).
+IDENTITY_OPS = {
+    torch.add           : (0., True),
+    torch.multiply      : (1., True),
+    torch.subtract      : (0., False),
+    torch.divide        : (1., False),
+    Func.protected_div  : (1., False),
+}
+
+def IsConstantEqual (value, target):
+    """
+    Is a constant value (python scalar or 0-dim tensor) equal to target ?
+    Parameters
+    ----------
+    value : float or torch.tensor of shape () of float
+    target : float
+    Returns
+    -------
+    is_equal : bool
+    """
+    if torch.is_tensor(value):
+        return value.dim() == 0 and bool(value == target)
+    return value == target
+
+def CompileProgram (program_tokens):
+    """
+    Compiles a symbolic function program into a single generated python function (straight line code) computing the
+    same thing as ExecuteProgram but without per-token dispatch and stack manipulation.
+    Sub-trees made only of fixed constants (eg. mul(1, pi)) are folded : they are computed once at compilation and
+    their values are captured by the generated function. Identity operations (see IDENTITY_OPS) are then removed.
+    Parameters
+    ----------
+    program_tokens : list of token.Token
+        Symbolic function program in reverse Polish notation order.
+    Returns
+    -------
+    compiled_program : callable
+        Function taking input_var_data, class_free_consts_vals, spe_free_consts_vals as arguments (see
+        ExecuteProgram for details) and returning y, the result of computation. Generated source code is accessible
+        via compiled_program.source.
+    """
+    # Number of tokens in the program
+    n_tokens = len(program_tokens)
+
+    # Objects referred to in the generated code
+    namespace = {}
+    # Lines of generated code
+    lines = []
+    # Are free constants used ?
+    use_class_free_consts = False
+    use_spe_free_consts   = False
+
+    # Current stack of names of computed results
+    curr_stack = []
+    # Values of computed results that are constants (name -> value)
+    consts = {}
+
+    # De-stacking program (iterating from last token to first)
+    start = n_tokens - 1
+    for i in range (start, -1, -1):
+        token = program_tokens[i]
+        res = "v%i"%(i)
+        # Terminal token
+        if token.arity == 0:
+            # Function type token
+            if token.var_type == Tok.VAR_TYPE_OP:
+                raise ValueError("Function of arity = 0 encountered. Use var_type = %i for fixed constants."%(Tok.VAR_TYPE_FIXED_CONST))
+            # Input variable (eg. x0, x1 etc.)
+            elif token.var_type == Tok.VAR_TYPE_INPUT_VAR:
+                lines.append("%s = input_var_data[%i]"%(res, token.var_id))
+            # Class free constant variable (eg. c0, c1 etc.)
+            elif token.var_type == Tok.VAR_TYPE_CLASS_FREE_CONST:
+                use_class_free_consts = True
+                lines.append("%s = class_free_consts_vals[%i]"%(res, token.var_id))
+            # Spe free constant variable (eg. k0, k1 etc.)
+            elif token.var_type == Tok.VAR_TYPE_SPE_FREE_CONST:
+                use_spe_free_consts = True
+                lines.append("%s = spe_free_consts_vals[%i]"%(res, token.var_id))
+            # Fixed constant (eg. pi, 1 etc.)
+            elif token.var_type == Tok.VAR_TYPE_FIXED_CONST:
+                res = "k%i"%(i)
+                namespace[res] = token.fixed_const
+                consts[res]    = token.fixed_const
+            else:
+                raise NotImplementedError("Token of unknown var_type encountered in CompileProgram.")
+        # Non-terminal token
+        elif token.arity > 0:
+            # Last pending elements are those needed for next computation (in reverse order)
+            args = curr_stack[-token.arity:][::-1]
+            # Removing those pending elements as they were used
+            curr_stack = curr_stack[:-token.arity]
+            # Constant folding
+            if all([arg in consts for arg in args]):
+                res = "k%i"%(i)
+                # Python scalar constants (eg. 1) are converted to tensors as functions expect tensors
+                fold_args = [consts[arg] if torch.is_tensor(consts[arg]) else torch.as_tensor(consts[arg], dtype=torch.float64)
+                             for arg in args]
+                # Folded values are cached with the compiled program, they must remain usable outside inference mode
+                with torch.inference_mode(False):
+                    namespace[res] = token.function(*fold_args)
+                consts[res]    = namespace[res]
+            # Identity operations
+            elif token.arity == 2 and token.function in IDENTITY_OPS:
+                neutral, is_commutative = IDENTITY_OPS[token.function]
+                if args[1] in consts and IsConstantEqual(consts[args[1]], neutral):
+                    res = args[0]
+                elif is_commutative and args[0] in consts and IsConstantEqual(consts[args[0]], neutral):
+                    res = args[1]
+            # Computation
+            if res == "v%i"%(i):
+                namespace["f%i"%(i)] = token.function
+                lines.append("%s = f%i(%s)"%(res, i, ", ".join(args)))
+        # Appending last result to stack
+        curr_stack.append(res)
+
+    # Checks on free constants values (same errors as ExecuteProgram)
+    checks = []
+    if use_class_free_consts:
+        checks += ["if class_free_consts_vals is None:",
+                   "    raise ValueError(\"Class free constant encountered in program evaluation but class free "
+                   "constant values were not given.\")"]
+    if use_spe_free_consts:
+        checks += ["if spe_free_consts_vals is None:",
+                   "    raise ValueError(\"Spe free constant encountered in program evaluation but spe free "
+                   "constant values were not given.\")"]
+
+    body   = checks + lines + ["return %s"%(curr_stack[0])]
+    source = "def compiled_program (input_var_data, class_free_consts_vals=None, spe_free_consts_vals=None):\n" \
+             + "".join(["    %s\n"%(line) for line in body])
+    exec(compile(source, "<compiled program>", "exec"), namespace)
+    compiled_program        = namespace["compiled_program"]
+    compiled_program.source = source
+    return compiled_program
+
+class CompiledProgramsCache:
+    """
+    Least recently used (LRU) cache of compiled programs (see CompileProgram).
+    Programs are identified by the tuple of what their tokens compute (see token_key) rather than by the tokens
+    themselves so that programs generated from different but equivalent libraries (eg. a new library.Library being
+    created at each epoch from the same config) share their compiled versions and entries do not keep tokens of old
+    libraries alive.
+    Attributes
+    ----------
+    max_size : int
+        Max number of compiled programs kept in cache.
+    hits : int
+        Number of times a compiled program was found in cache.
+    misses : int
+        Number of times a program had to be compiled.
+    """
+    def __init__(self, max_size = COMPILED_PROGRAMS_CACHE_MAX_SIZE):
+        """
+        Parameters
+        ----------
+        max_size : int
+            Max number of compiled programs kept in cache.
+        """
+        self.max_size = max_size
+        self.clear()
+
+    def clear (self):
+        """
+        Empties cache and resets stats.
+        """
+        self.cache  = collections.OrderedDict()
+        self.hits   = 0
+        self.misses = 0
+
+    @classmethod
+    def token_key (cls, token):
+        """
+        Hashable key identifying what a token computes in a compiled program.
+        Parameters
+        ----------
+        token : token.Token
+        Returns
+        -------
+        key : tuple
+        """
+        # Fixed constant : its value as a python scalar or a tensor (with dtype and device) is captured by the compiled
+        # program
+        if token.var_type == Tok.VAR_TYPE_FIXED_CONST:
+            if torch.is_tensor(token.fixed_const):
+                fixed_const = (float(token.fixed_const), token.fixed_const.dtype, token.fixed_const.device)
+            else:
+                fixed_const = float(token.fixed_const)
+        else:
+            fixed_const = None
+        # Function : operations tokens functions being module-level objects, they are shared by libraries
+        key = (token.var_type, token.var_id, token.arity, token.function, fixed_const)
+        return key
+
+    def get (self, program_tokens):
+        """
+        Returns compiled version of program, compiling it if not already in cache.
+        Parameters
+        ----------
+        program_tokens : list of token.Token
+            Symbolic function program in reverse Polish notation order.
+        Returns
+        -------
+        compiled_program : callable
+        """
+        key = tuple([self.token_key(token) for token in program_tokens])
+        compiled_program = self.cache.get(key)
+        if compiled_program is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+        else:
+            self.misses += 1
+            compiled_program = CompileProgram(program_tokens)
+            self.cache[key] = compiled_program
+            # Evicting least recently used
+            if len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+        return compiled_program
+
+    def __len__(self):
+        return len(self.cache)
+
+# Cache used by ExecuteCompiledProgram
+COMPILED_PROGRAMS_CACHE = CompiledProgramsCache()
+
+def ExecuteCompiledProgram (input_var_data, program_tokens, class_free_consts_vals=None, spe_free_consts_vals=None):
+    """
+    Executes a symbolic function program using its cached compiled version (see CompileProgram and ExecuteProgram).
+    Parameters
+    ----------
+    input_var_data : torch.tensor of shape (n_dim, ?,) of float
+        Values of the input variables of the problem with n_dim = nb of input variables.
+    program_tokens : list of token.Token
+        Symbolic function program in reverse Polish notation order.
+    class_free_consts_vals : torch.tensor of shape (n_class_free_const,) or of shape (n_class_free_const, ?) of float or None
+        Values of class free constants to use for program execution (see ExecuteProgram).
+    spe_free_consts_vals : torch.tensor of shape (n_spe_free_const,) or of shape (n_spe_free_const, ?) of float or None
+        Values of spe free constants to use for program execution (see ExecuteProgram).
+    Returns
+    -------
+    y : torch.tensor of shape (?,) of float
+        Result of computation.
+    """
+    compiled_program = COMPILED_PROGRAMS_CACHE.get(program_tokens)
+    y = compiled_program(input_var_data, class_free_consts_vals, spe_free_consts_vals)
+    return y
+
+# ------------------------------------------------------------------------------------------------------------------
+# ------------------------------------------------ BATCH EXECUTION -------------------------------------------------
+# ------------------------------------------------------------------------------------------------------------------
+
+class VectProgramsLayout:
+    """
+    Execution layout of a batch of programs for ExecuteVectPrograms, determined once from the token arrays of the
+    batch (and from the kind of free constants values programs are executed with) so that executing programs only
+    runs torch operations. Executions of the same programs (eg. at each step of free constants optimization or on each
+    block of samples) can share it.
+    Programs are de-stacked from last position to first all together, each operation type appearing at a position
+    being applied to all programs having it at this position in a single call (a step). Nodes holding a single value
+    (constants and operations on constants only) are computed in the dtype of the constants involved (eg. float64 free
+    constants) like ExecuteProgram does before being combined with data.
+    Node values are never copied into a table holding all nodes : the result of each step is kept as a source of
+    values and the arguments of a step are gathered from the sources holding them (input_var_data, free constants
+    values, fixed constants values or results of previous steps).
+    Attributes
+    ----------
+    n_progs, n_tokens : int
+        Number of programs and of tokens per program.
+    device : torch.device or None
+        Device of index tensors.
+    steps : list of tuple
+        Steps in execution order : (function, res_dtype, args_gathers) with res_dtype the dtype of the result for
+        operations on single values only (None for operations involving data points) and args_gathers how to gather
+        each argument (see make_gather).
+    is_scalar_src : list of bool
+        Does each source (results of steps following the sources of SRC_* indices) hold single values ?
+    output_gather : tuple
+        How to gather the values of root nodes of programs (see make_gather).
+    """
+    # Sources of node values (results of steps following)
+    SRC_NAN          = 0  # Placeholders (eg. dummies) : NaNs
+    SRC_INPUT        = 1  # Rows of input_var_data
+    SRC_CLASS        = 2  # Class free constants values (flattened to (n_progs*n_class_free_const,) or (n_progs*n_class_free_const, ?))
+    SRC_SPE          = 3  # Spe free constants values (flattened to (n_progs*n_spe_free_const,) or (n_progs*n_spe_free_const, ?))
+    SRC_FIXED        = 4  # Fixed constants values of library tokens
+    N_SRC            = 5
+
+    def __init__(self, tokens_idx, children_pos, library, class_free_consts_vals=None, spe_free_consts_vals=None, device=None):
+        """
+        Parameters
+        ----------
+        tokens_idx : numpy.array of shape (n_progs, n_tokens,) of int
+            Index in the library of tokens making up programs in reverse Polish notation order (eg.
+            VectPrograms.tokens.idx).
+        children_pos : numpy.array of shape (n_progs, n_tokens, token.MAX_NB_CHILDREN) of int
+            Position of children of each token (eg. VectPrograms.tokens.children_pos).
+        library : library.Library
+            Library of tokens that can appear in programs.
+        class_free_consts_vals : torch.tensor of shape (n_progs, n_class_free_const,) or of shape (n_progs, n_class_free_const, ?) of float or None
+            Values of class free constants programs will be executed with, only their dtype and shape are used.
+        spe_free_consts_vals : torch.tensor of shape (n_progs, n_spe_free_const,) or of shape (n_progs, n_spe_free_const, ?) of float or None
+            Values of spe free constants programs will be executed with, only their dtype and shape are used.
+        device : torch.device or None
+            Device programs will be executed on.
+        """
+        (n_progs, n_tokens,) = tokens_idx.shape
+        self.n_progs  = n_progs
+        self.n_tokens = n_tokens
+        self.device   = device
+
+        # Library properties of tokens making up programs
+        var_type = library.var_type [tokens_idx]                                    # (n_progs, n_tokens,) of int
+        var_id   = library.var_id   [tokens_idx]                                    # (n_progs, n_tokens,) of int
+        arity    = library.arity    [tokens_idx]                                    # (n_progs, n_tokens,) of int
+        if ((var_type == Tok.VAR_TYPE_OP) & (arity == 0)).any():
+            raise ValueError("Function of arity = 0 encountered. Use var_type = %i for fixed constants."%(Tok.VAR_TYPE_FIXED_CONST))
+        # Fixed constants values (nan for other tokens) and dtypes (None for python scalars)
+        self.fixed_consts_vals = torch.tensor([float(token.fixed_const) if token.var_type == Tok.VAR_TYPE_FIXED_CONST else np.nan
+                                               for token in library.lib_tokens], dtype=torch.float64, device=device) # (n_library,) of float
+        lib_fixed_const_dtype = [token.fixed_const.dtype if torch.is_tensor(token.fixed_const) else None
+                                 for token in library.lib_tokens]                                       # (n_library,) of object
+
+        # Dtypes single value nodes can be computed in, identified by an integer code (0 for python scalars) so the
+        # dtype of operations on single values only can be resolved for all programs at once using a table of
+        # promoted codes.
+        codes_dtypes = [None, torch.get_default_dtype()]
+        for consts_vals in (class_free_consts_vals, spe_free_consts_vals):
+            if consts_vals is not None:
+                codes_dtypes.append(consts_vals.dtype)
+        codes_dtypes += lib_fixed_const_dtype
+        codes_dtypes = list(dict.fromkeys(codes_dtypes))
+        # Closing set of dtypes under promotion (iterating over dtypes appended along the way)
+        for dtype_a in codes_dtypes:
+            for dtype_b in codes_dtypes:
+                if dtype_a is not None and dtype_b is not None:
+                    res_dtype = torch.promote_types(dtype_a, dtype_b)
+                    if res_dtype not in codes_dtypes:
+                        codes_dtypes.append(res_dtype)
+        n_codes    = len(codes_dtypes)
+        dtype_code = {dt: code for code, dt in enumerate(codes_dtypes)}
+        promoted_code = np.array([[code_a if code_b == 0 else code_b if code_a == 0 else
+                                   dtype_code[torch.promote_types(codes_dtypes[code_a], codes_dtypes[code_b])]
+                                   for code_b in range(n_codes)] for code_a in range(n_codes)])     # (n_codes, n_codes,) of int
+        lib_fixed_const_code = np.array([dtype_code[dt] for dt in lib_fixed_const_dtype])            # (n_library,) of int
+
+        # Where the value of each node is gathered from : source and row in source (placeholders being NaNs)
+        node_src    = np.full((n_progs, n_tokens), self.SRC_NAN)                                     # (n_progs, n_tokens,) of int
+        node_row    = np.zeros((n_progs, n_tokens), dtype=int)                                       # (n_progs, n_tokens,) of int
+        # Single value nodes and code of the dtype they are computed in
+        is_scalar   = np.full((n_progs, n_tokens), False)                                            # (n_progs, n_tokens,) of bool
+        scalar_code = np.zeros((n_progs, n_tokens), dtype=int)                                       # (n_progs, n_tokens,) of int
+        self.is_scalar_src = [False, False,
+                              class_free_consts_vals is not None and class_free_consts_vals.dim() == 2,
+                              spe_free_consts_vals   is not None and spe_free_consts_vals.dim()   == 2,
+                              True]
+        # Number of rows of sources (None if not needed)
+        self.src_sizes = [None]*self.N_SRC
+
+        # Input variables (eg. x0, x1 etc.)
+        is_input = (var_type == Tok.VAR_TYPE_INPUT_VAR)                                              # (n_progs, n_tokens,) of bool
+        node_src [is_input] = self.SRC_INPUT
+        node_row [is_input] = var_id[is_input]
+        # Free constant variables : class (eg. c0, c1 etc.) and spe (eg. k0, k1 etc.)
+        for free_const_var_type, consts_vals, src, name in ((Tok.VAR_TYPE_CLASS_FREE_CONST, class_free_consts_vals, self.SRC_CLASS, "Class"),
+                                                            (Tok.VAR_TYPE_SPE_FREE_CONST,   spe_free_consts_vals,   self.SRC_SPE,   "Spe"  ),):
+            is_const = (var_type == free_const_var_type)                                             # (n_progs, n_tokens,) of bool
+            if not is_const.any():
+                continue
+            if consts_vals is None:
+                raise ValueError("%s free constant encountered in program evaluation but %s free constant values "
+                                 "were not given."%(name, name.lower()))
+            progs, _ = np.where(is_const)                                                            # (?,) of int
+            node_src [is_const] = src
+            node_row [is_const] = progs*consts_vals.shape[1] + var_id[is_const]
+            if self.is_scalar_src[src]:
+                is_scalar   [is_const] = True
+                scalar_code [is_const] = dtype_code[consts_vals.dtype]
+        # Fixed constants (eg. pi, 1 etc.)
+        is_fixed = (var_type == Tok.VAR_TYPE_FIXED_CONST)                                            # (n_progs, n_tokens,) of bool
+        node_src    [is_fixed] = self.SRC_FIXED
+        node_row    [is_fixed] = tokens_idx[is_fixed]
+        is_scalar   [is_fixed] = True
+        scalar_code [is_fixed] = lib_fixed_const_code[tokens_idx[is_fixed]]
+
+        # Non-terminal tokens : one step per type of operation present at each position (and per dtype for operations
+        # on single values only), positions being de-stacked from last to first
+        self.steps = []
+        is_op = (var_type == Tok.VAR_TYPE_OP) & (arity > 0)                                          # (n_progs, n_tokens,) of bool
+        for i in range (n_tokens - 1, -1, -1):
+            for op_idx in np.unique(tokens_idx[is_op[:, i], i]):
+                function = library.lib_function[op_idx]
+                progs    = np.where(is_op[:, i] & (tokens_idx[:, i] == op_idx))[0]                   # (?,) of int
+                children = children_pos[progs, i, :library.arity[op_idx]]                            # (?, arity) of int
+                # Operations on single values only
+                on_scalars = is_scalar[progs[:, None], children].all(axis=1)                         # (?,) of bool
+                # Operations involving data points : arguments are the values of children (in order)
+                progs_data    = progs[~on_scalars]                                                   # (?,) of int
+                children_data = children[~on_scalars]                                                # (?, arity) of int
+                if len(progs_data) > 0:
+                    self.add_step(function, None, progs_data, i, children_data, node_src, node_row)
+                # Operations on single values only : computed in the promoted dtype of children (python scalars only
+                # operations being computed in torch default dtype)
+                progs_scalar    = progs[on_scalars]                                                  # (?,) of int
+                children_scalar = children[on_scalars]                                               # (?, arity) of int
+                res_codes = scalar_code[progs_scalar, children_scalar[:, 0]]                         # (?,) of int
+                for j in range(1, children_scalar.shape[1]):
+                    res_codes = promoted_code[res_codes, scalar_code[progs_scalar, children_scalar[:, j]]] # (?,) of int
+                res_codes[res_codes == 0] = dtype_code[torch.get_default_dtype()]                    # (?,) of int
+                for res_code in np.unique(res_codes):
+                    is_dtype  = res_codes == res_code                                                # (?,) of bool
+                    progs_res = progs_scalar[is_dtype]                                               # (?,) of int
+                    self.add_step(function, codes_dtypes[res_code], progs_res, i, children_scalar[is_dtype],
+                                  node_src, node_row)
+                    is_scalar   [progs_res, i] = True
+                    scalar_code [progs_res, i] = res_code
+        # Values of programs are those of their root nodes
+        self.output_gather = self.make_gather(node_src[:, 0], node_row[:, 0])
+
+    def as_index (self, idx):
+        """
+        Converts numpy array of indices to a torch index tensor on device.
+        """
+        return torch.as_tensor(idx, dtype=torch.long, device=self.device)
+
+    def add_step (self, function, res_dtype, progs, i, children, node_src, node_row):
+        """
+        Adds the step applying function to nodes at position i of programs progs (see steps), its result becoming a
+        new source of node values.
+        Parameters
+        ----------
+        function : callable
+        res_dtype : torch.dtype or None
+            Dtype of result for operations on single values only, None for operations involving data points.
+        progs : numpy.array of shape (?,) of int
+            Programs having this operation at position i.
+        i : int
+            Position.
+        children : numpy.array of shape (?, arity) of int
+            Positions of children (arguments) of nodes.
+        node_src, node_row : numpy.array of shape (n_progs, n_tokens,) of int
+            Source and row in source of values of nodes (updated in place with the nodes computed by this step).
+        """
+        args_gathers = [self.make_gather(node_src[progs, children[:, j]], node_row[progs, children[:, j]])
+                        for j in range(children.shape[1])]
+        self.steps.append((function, res_dtype, args_gathers))
+        node_src [progs, i] = len(self.src_sizes)
+        node_row [progs, i] = np.arange(len(progs))
+        self.src_sizes     .append(len(progs))
+        self.is_scalar_src .append(res_dtype is not None)
+        return None
+
+    def make_gather (self, srcs, rows):
+        """
+        How to gather the values of nodes given where they are.
+        Parameters
+        ----------
+        srcs : numpy.array of shape (?,) of int
+            Source of each node.
+        rows : numpy.array of shape (?,) of int
+            Row of each node in its source.
+        Returns
+        -------
+        gather : tuple
+            (parts, perm) : values are concatenated from parts (list of (source, rows) with rows None to use the
+            whole source as is) and put back in order using perm (None if not needed).
+        """
+        unique_srcs = np.unique(srcs)                                                                # (n_srcs,) of int
+        if len(unique_srcs) == 1:
+            src = unique_srcs[0]
+            # Whole source in order
+            if self.src_sizes[src] == len(rows) and (rows == np.arange(len(rows))).all():
+                return ([(src, None)], None)
+            return ([(src, self.as_index(rows))], None)
+        # Nodes gathered source by source, then put back in order
+        order = np.argsort(srcs, kind="stable")                                                      # (?,) of int
+        parts = [(src, self.as_index(rows[order][srcs[order] == src])) for src in unique_srcs]
+        return (parts, self.as_index(np.argsort(order)))
+
+def ExecuteVectPrograms (input_var_data, tokens_idx, children_pos, library, class_free_consts_vals=None, spe_free_consts_vals=None, layout=None):
+    """
+    Executes a batch of symbolic function programs at once (vectorized version of ExecuteProgram).
+    Programs are de-stacked from last position to first all together, each operation type appearing at a position is
+    applied to all programs having it at this position in a single torch call (see VectProgramsLayout).
+    Nodes holding a single value (constants and operations on constants only) are computed in the dtype of the
+    constants involved (eg. float64 free constants) like ExecuteProgram does before being combined with data.
+    Parameters
+    ----------
+    input_var_data : torch.tensor of shape (n_dim, ?,) of float
+        Values of the input variables of the problem with n_dim = nb of input variables.
+    tokens_idx : numpy.array of shape (n_progs, n_tokens,) of int or None
+        Index in the library of tokens making up programs in reverse Polish notation order (eg. VectPrograms.tokens.idx).
+        Only used to build layout if it is not given.
+    children_pos : numpy.array of shape (n_progs, n_tokens, token.MAX_NB_CHILDREN) of int or None
+        Position of children of each token (eg. VectPrograms.tokens.children_pos). Only used to build layout if it is
+        not given.
+    library : library.Library
+        Library of tokens that can appear in programs.
+    class_free_consts_vals : torch.tensor of shape (n_progs, n_class_free_const,) or of shape (n_progs, n_class_free_const, ?) of float or None
+        Values of class free constants to use for each program. Works with either a single value for each constant or
+        a value for each constant and each data point. Must be given if programs contain class free constants.
+    spe_free_consts_vals : torch.tensor of shape (n_progs, n_spe_free_const,) or of shape (n_progs, n_spe_free_const, ?) of float or None
+        Values of spe free constants to use for each program. Works with either a single value for each constant or
+        a value for each constant and each data point. Must be given if programs contain spe free constants.
+    layout : VectProgramsLayout or None, optional
+        Execution layout of these programs built for free constants values of the same dtypes and shapes (eg. to
+        share it across executions of the same programs). By default, it is built from tokens_idx and children_pos.
+    Returns
+    -------
+    y : torch.tensor of shape (n_progs, ?,) of float
+        Result of computation for each program. Programs containing placeholders (eg. dummies) within their tree
+        result in NaNs.
+    """
+    if layout is None:
+        layout = VectProgramsLayout(tokens_idx             = tokens_idx,
+                                    children_pos           = children_pos,
+                                    library                = library,
+                                    class_free_consts_vals = class_free_consts_vals,
+                                    spe_free_consts_vals   = spe_free_consts_vals,
+                                    device                 = input_var_data.device)
+
+    # Size
+    (n_dim, data_size,) = input_var_data.shape
+    device = input_var_data.device
+
+    # Result type (data point-wise free constants values may promote the type of the whole computation)
+    dtype = input_var_data.dtype
+    for consts_vals in (class_free_consts_vals, spe_free_consts_vals):
+        if consts_vals is not None and consts_vals.dim() == 3:
+            dtype = torch.promote_types(dtype, consts_vals.dtype)
+
+    # Sources of node values (results of steps being appended along the way)
+    sources = [torch.full((1, data_size), np.nan, dtype=dtype, device=device),                      # (1, data_size)
+               input_var_data.to(dtype),                                                            # (n_dim, data_size)
+               None,
+               None,
+               layout.fixed_consts_vals]                                                            # (n_library,)
+    for src, consts_vals in ((VectProgramsLayout.SRC_CLASS, class_free_consts_vals),
+                             (VectProgramsLayout.SRC_SPE,   spe_free_consts_vals),):
+        if consts_vals is not None:
+            sources[src] = consts_vals.to(device).flatten(0, 1)                                     # (n_progs*n_free_const,) or (n_progs*n_free_const, data_size)
+
+    def gather (args_gather, scalar_dtype = None):
+        # Values of nodes gathered from their sources : single values of shape (?,) cast to scalar_dtype if given,
+        # values of shape (?, data_size) (possibly a broadcast view) in dtype else
+        parts, perm = args_gather
+        vals = []
+        for src, rows in parts:
+            val = sources[src] if rows is None else sources[src].index_select(0, rows)              # (?,) or (?, data_size)
+            if scalar_dtype is not None:
+                val = val.to(scalar_dtype)                                                          # (?,)
+            elif src == VectProgramsLayout.SRC_NAN:
+                val = sources[src].expand(len(rows), -1)                                            # (?, data_size)
+            elif layout.is_scalar_src[src]:
+                val = val.to(dtype)[:, None].expand(-1, data_size)                                  # (?, data_size)
+            else:
+                val = val.to(dtype)                                                                 # (?, data_size)
+            vals.append(val)
+        if perm is None:
+            return vals[0]
+        return torch.cat(vals).index_select(0, perm)                                                # (?,) or (?, data_size)
+
+    # Executing steps, results being new sources
+    for function, res_dtype, args_gathers in layout.steps:
+        # Operations involving data points
+        if res_dtype is None:
+            res = function(*[gather(args_gather) for args_gather in args_gathers]).to(dtype)        # (?, data_size)
+        # Operations on single values only
+        else:
+            res = function(*[gather(args_gather, res_dtype) for args_gather in args_gathers]).to(res_dtype) # (?,)
+        sources.append(res)
+
+    y = gather(layout.output_gather).contiguous()                                                   # (n_progs, data_size)
+    return y
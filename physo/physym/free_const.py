@@ -2,6 +2,10 @@ import torch
 import numpy as np
 import pandas as pd
 
+# Internal imports
+from physo.physym import functions as Func
+from physo.physym import dataset
+
 # ------------------------------------------------------------------------------------------------------
 # ---------------------------------------- FREE CONSTANTS TABLE ----------------------------------------
 # ------------------------------------------------------------------------------------------------------
@@ -24,12 +28,17 @@ class FreeConstantsTable:
         Is set of free constants optimized.
     opti_steps : torch.tensor of shape (batch_size,) of int
         Number of iterations necessary to optimize free constant.
+    opti_abandoned : torch.tensor of shape (batch_size,) of bool
+        Was optimization of set of free constants abandoned early (see was_abandoned), values then being only partly
+        optimized.
     class_values : torch.tensor of shape (batch_size, n_class_free_const,)
         Free constants values for each program.
     spe_values : torch.tensor of shape (batch_size, n_spe_free_const, n_realizations,)
         Realization specific free constants values for each program.
+    dtype : torch.dtype
+        Dtype of free constants values.
     """
-    def __init__(self, batch_size, library, n_realizations=1):
+    def __init__(self, batch_size, library, n_realizations=1, dtype=torch.float64):
         """"
         Parameters
         ----------
@@ -40,9 +49,13 @@ class FreeConstantsTable:
         n_realizations : int
             Number of realizations for each program, ie. number of datasets each program has to fit.
             Dataset specific free constants will have different values different for each realization.
+        dtype : str or torch.dtype, optional
+            Dtype of free constants values ("float32" or "float64", see functions.DTYPES), float64 by default. Should
+            match the dtype of data so executions are not promoted to float64.
         """
 
         self.library = library
+        self.dtype   = Func.get_dtype(dtype)
 
         # Shape
         self.batch_size   = batch_size
@@ -54,6 +67,8 @@ class FreeConstantsTable:
         self.is_opti    = torch.full(size=(self.batch_size,), fill_value=False, dtype=bool)    # (batch_size,) of bool
         # Number of iterations necessary to optimize free constant
         self.opti_steps = torch.full(size=(self.batch_size,), fill_value=False, dtype=int )    # (batch_size,) of int
+        # mask : Was optimization abandoned early
+        self.opti_abandoned = torch.full(size=(self.batch_size,), fill_value=False, dtype=bool)  # (batch_size,) of bool
 
         # Class free constants
         self.n_class_free_const = self.library.n_class_free_const  # Number of class free constants
@@ -79,7 +94,7 @@ class FreeConstantsTable:
         # Free constants values for each program as torch tensor for fast computation (sent to device in batch.py)
         # If init_val already contains torch tensors, they are converted by np.tile (if on same device)
         values_array = np.tile(init_val, reps=(self.batch_size, 1))                   # (batch_size, n_class_free_const,) of float
-        self.class_values = torch.tensor(values_array)                                # (batch_size, n_class_free_const,) of float
+        self.class_values = torch.tensor(values_array, dtype=self.dtype)              # (batch_size, n_class_free_const,) of float
         self.class_values = self.class_values                                         # (batch_size, n_class_free_const,) of float
         return None
 
@@ -93,7 +108,22 @@ class FreeConstantsTable:
         # Free constants values for each program as torch tensor for fast computation (sent to device in batch.py)
         # If init_val already contains torch tensors, they are converted by np.tile (if on same device)
         values_array = np.tile(init_val, reps=(self.batch_size, 1, 1))                # (batch_size, n_spe_free_const, n_realizations,) of float
-        self.spe_values = torch.tensor(values_array)                                  # (batch_size, n_spe_free_const, n_realizations,) of float
+        self.spe_values = torch.tensor(values_array, dtype=self.dtype)                # (batch_size, n_spe_free_const, n_realizations,) of float
+        return None
+
+    def reset (self):
+        """
+        Reset free constants values to initial values and optimization logs, keeping device and dtype.
+        New tensors are allocated (rather than filled in place) as programs previously exported via get_const_of_prog
+        hold references to the original ones.
+        """
+        device = self.class_values.device
+        self.is_opti    = torch.full(size=(self.batch_size,), fill_value=False, dtype=bool)    # (batch_size,) of bool
+        self.opti_steps = torch.full(size=(self.batch_size,), fill_value=False, dtype=int )    # (batch_size,) of int
+        self.opti_abandoned = torch.full(size=(self.batch_size,), fill_value=False, dtype=bool)  # (batch_size,) of bool
+        self.reset_class_values()
+        self.reset_spe_values()
+        self.to(device)
         return None
 
     def __repr__(self):
@@ -105,23 +135,27 @@ class FreeConstantsTable:
 
     def detach (self):
         """
-        Detach values from computation graph and copies is_opti and opti_steps to detach them from higher level table
-        if there is one.
+        Detach values from computation graph and copies is_opti, opti_steps and opti_abandoned to detach them from
+        higher level table if there is one.
         """
-        self.class_values = self.class_values.clone().detach()
-        self.spe_values   = self.spe_values  .clone().detach()
-        self.is_opti      = self.is_opti     .clone().detach()
-        self.opti_steps   = self.opti_steps  .clone().detach()
+        self.class_values   = self.class_values  .clone().detach()
+        self.spe_values     = self.spe_values    .clone().detach()
+        self.is_opti        = self.is_opti       .clone().detach()
+        self.opti_steps     = self.opti_steps    .clone().detach()
+        self.opti_abandoned = self.opti_abandoned.clone().detach()
         return self
 
-    def to (self, device):
+    def to (self, device = None, dtype = None):
         """
-        Send all values to device.
+        Send all values to device and converts free constants values to dtype (if given).
         """
-        self.class_values = self.class_values.to(device)
-        self.spe_values   = self.spe_values  .to(device)
-        self.is_opti      = self.is_opti     .to(device)
-        self.opti_steps   = self.opti_steps  .to(device)
+        dtype = Func.get_dtype(dtype)
+        self.class_values = self.class_values.to(device = device, dtype = dtype)
+        self.spe_values   = self.spe_values  .to(device = device, dtype = dtype)
+        self.dtype        = self.class_values.dtype
+        self.is_opti        = self.is_opti       .to(device = device)
+        self.opti_steps     = self.opti_steps    .to(device = device)
+        self.opti_abandoned = self.opti_abandoned.to(device = device)
         return self
 
     def cpu (self):
@@ -135,12 +169,13 @@ class FreeConstantsTable:
         """
         Return a FreeConstantsTable object with values for a single program (batch_size=1).
         """
-        res = FreeConstantsTable (batch_size=1, library=self.library, n_realizations=self.n_realizations)
+        res = FreeConstantsTable (batch_size=1, library=self.library, n_realizations=self.n_realizations, dtype=self.dtype)
         # Returning arrays of (1,...) to have a reference to the original arrays
         res.class_values = self.class_values[prog_idx:prog_idx+1,:]             # (1, n_class_free_const,)
         res.spe_values   = self.spe_values  [prog_idx:prog_idx+1,:,:]           # (1, n_spe_free_const, n_realizations,)
         res.is_opti      = self.is_opti     [prog_idx:prog_idx+1]               # (1,) of bool
         res.opti_steps   = self.opti_steps  [prog_idx:prog_idx+1]               # (1,) of int
+        res.opti_abandoned = self.opti_abandoned[prog_idx:prog_idx+1]           # (1,) of bool
         return res
 
     def flatten_like_data (self, n_samples_per_dataset):
@@ -157,31 +192,16 @@ class FreeConstantsTable:
         class_const_flatten, spe_const_flatten : torch.tensor of shape (batch_size, n_class_free_const, n_all_samples), torch.tensor of shape (batch_size, n_spe_free_const, n_all_samples)
             Flattened free constants values.
         """
-        n_all_samples = n_samples_per_dataset.sum()  # Total number of samples
+        # Index of realization of each sample (computed once per n_samples_per_dataset, see dataset.realization_index)
+        real_idx = dataset.realization_index(n_samples_per_dataset, device=self.spe_values.device)                   # (n_all_samples,)
 
         # ---- Handling spe free constants ----
-        # (Spe free const are different for each dataset/realization)
-        detected_device = self.spe_values.device
-        n_samples_per_dataset_torch = torch.tensor(n_samples_per_dataset).to(detected_device)
-        spe_const_flatten = self.spe_values.repeat_interleave(n_samples_per_dataset_torch, dim=-1)                 # (batch_size, n_spe_free_const, n_all_samples)
-        #Alternative way to do the same thing (new way is now 30% faster).
-        #flattened = []                                                                                            # (n_realizations,) of (batch_size, n_spe_free_const, [n_samples depends on dataset],)
-        #for i_real in range(self.n_realizations):
-        #    flattened.append(
-        #        torch.tile(self.spe_values[:, :, i_real], (n_samples_per_dataset[i_real], 1, 1)).permute(1, 2, 0) # (batch_size, n_spe_free_const, [n_samples depends on dataset],)
-        #    )
-        #spe_const_flatten = torch.cat(flattened, axis=-1)                                                         # (batch_size, n_spe_free_const, n_all_samples)
-
+        # (Spe free const are different for each dataset/realization : gathering values of each sample's realization)
+        spe_const_flatten = self.spe_values[:, :, real_idx]                                                         # (batch_size, n_spe_free_const, n_all_samples)
 
         # ---- Handling class free constants ----
-        # (Class free const are the same for all datasets/realizations)
-        class_const_flatten = self.class_values[:,:,np.newaxis].repeat((1,1,n_all_samples))                        # (batch_size, n_class_free_const, n_all_samples)
-        # Alternative ways to do the same thing (new way is not faster)
-        # class_const_flatten = torch.tile(self.class_values, (n_all_samples, 1,1)).permute(1, 2, 0)
-        # class_const_flatten = self.class_values.repeat((n_all_samples, 1, 1)).permute(1, 2, 0)
-        # class_const_flatten = self.class_values.repeat((n_all_samples, 1, 1)).transpose(0, 1).transpose(1, 2)
-        # class_const_flatten = self.class_values[:,:,np.newaxis].repeat((1,1,n_all_samples))
-        # class_const_flatten = self.class_values.unsqueeze(-1).repeat((1,1,n_all_samples))
+        # (Class free const are the same for all datasets/realizations : broadcast view, no copy)
+        class_const_flatten = self.class_values[:, :, np.newaxis].expand(-1, -1, real_idx.shape[0])                 # (batch_size, n_class_free_const, n_all_samples)
         return class_const_flatten, spe_const_flatten
 
     def df (self):
@@ -245,8 +265,224 @@ LOSSES = {
     "MSE": MSE_loss
 }
 
+def MSE_residuals (func, params, y_target, y_weights = 1.):
+    """
+    Residuals of MSE_loss (MSE_loss = sum of squared residuals) for least squares optimizers.
+    Parameters
+    ----------
+    func : callable
+        Function which's constants should be optimized taking params as argument.
+    params : list of torch.tensor
+        Free constants to optimize.
+    y_target : torch.tensor of shape (?,)
+        Target output of function.
+    y_weights : torch.tensor of shape (?,) of float, optional
+        Weights for each data point. By default, no weights are used.
+    Returns
+    -------
+    residuals : torch.tensor of shape (?,)
+    """
+    # Broadcasting to (?,) in case of constant output (eg. program made of a free constant only)
+    y_pred = torch.broadcast_to(func(params), y_target.shape)
+    n_samples = y_target.shape[-1]
+    residuals = (y_weights / n_samples)**0.5 * (y_pred - y_target)
+    # Broadcasting to (?,) in case of scalar weights
+    residuals = residuals.reshape(-1)
+    return residuals
+
+# Residuals of losses (for least squares optimizers, see LEAST_SQUARES_OPTIMIZERS)
+RESIDUALS = {
+    "MSE": MSE_residuals
+}
+
+def solve_linear_least_squares (A, y_target, y_weights = 1., ridge = 1e-12):
+    """
+    Closed-form weighted least squares solve of coefs minimizing MSE_loss of A @ coefs wrt y_target.
+    Differentiable wrt A and y_target (so it can be used within an iteratively optimized objective).
+    Solved via the (n_coefs, n_coefs) normal equations with a small relative ridge so rank deficient problems (eg.
+    collinear or null columns) still have a (min norm like) solution.
+    Parameters
+    ----------
+    A : torch.tensor of shape (?, n_coefs,)
+        Design matrix, each column being the contribution of a linearly appearing coefficient.
+    y_target : torch.tensor of shape (?,)
+        Target output.
+    y_weights : torch.tensor of shape (?,) of float, optional
+        Weights for each data point. By default, no weights are used.
+    ridge : float, optional
+        Ridge relative to the diagonal of the normal equations.
+    Returns
+    -------
+    coefs : torch.tensor of shape (n_coefs,)
+    """
+    Aw    = A * (y_weights * torch.ones_like(y_target))[:, None]       # (?, n_coefs,)
+    AtWA  = Aw.T @ A                                                    # (n_coefs, n_coefs,)
+    AtWy  = Aw.T @ y_target                                             # (n_coefs,)
+    # Ridge relative to diagonal (using 1 for null columns)
+    diag  = torch.diagonal(AtWA)                                        # (n_coefs,)
+    diag  = torch.where(diag > 0., diag, torch.ones_like(diag))         # (n_coefs,)
+    coefs = torch.linalg.solve(AtWA + ridge*torch.diag(diag), AtWy)     # (n_coefs,)
+    return coefs
+
+def MSE_batch_loss (func, params, y_target, y_weights = 1., rows = None):
+    """
+    Batched version of MSE_loss: loss of each of the n_progs functions computed at once.
+    Parameters
+    ----------
+    func : callable
+        Function which's constants should be optimized taking params and rows as arguments and returning a
+        torch.tensor of shape (n_rows, ?,) (outputs of functions rows).
+    params : list of torch.tensor
+        Free constants to optimize (first dimension being n_progs).
+    y_target : torch.tensor of shape (?,)
+        Target output of function.
+    y_weights : torch.tensor of shape (?,) of float, optional
+        Weights for each data point. By default, no weights are used.
+    rows : numpy.array of shape (n_rows,) of int or None, optional
+        Indices of functions to compute the loss of. By default, the loss of all functions is computed.
+    Returns
+    -------
+    loss : torch.tensor of shape (n_rows,) of float
+        Value of error to be minimized for each function.
+    """
+    if rows is None:
+        rows = np.arange(params[0].shape[0])
+    err = y_weights * (func(params, rows) - y_target)**2  # (n_rows, ?,)
+    loss = torch.mean(err, dim=-1)                        # (n_rows,)
+    return loss
+
+BATCH_LOSSES = {
+    "MSE": MSE_batch_loss
+}
+
+def MSE_realizations_loss (func, params, y_target, y_weights = 1., n_samples_per_dataset = None):
+    """
+    Per realization version of MSE_loss: loss of a function on each of the n_realizations datasets (flattened
+    together) computed at once.
+    Parameters
+    ----------
+    func : callable
+        Function which's constants should be optimized taking params as argument and returning a torch.tensor of shape
+        (?,) (? being the total number of samples of all datasets).
+    params : list of torch.tensor
+        Free constants to optimize (first dimension being n_realizations).
+    y_target : torch.tensor of shape (?,)
+        Target output of function.
+    y_weights : torch.tensor of shape (?,) of float, optional
+        Weights for each data point. By default, no weights are used.
+    n_samples_per_dataset : array_like of shape (n_realizations,) of int
+        Number of samples for each dataset (eg. [90, 100, 110] for 3 datasets).
+    Returns
+    -------
+    loss : torch.tensor of shape (n_realizations,) of float
+        Value of error to be minimized on each dataset.
+    """
+    err      = y_weights * (func(params) - y_target)**2                                # (?,)
+    real_idx = dataset.realization_index(n_samples_per_dataset, device=err.device)     # (?,)
+    n_realizations = len(n_samples_per_dataset)
+    sum_err  = torch.zeros(n_realizations, dtype=err.dtype, device=err.device).index_add_(0, real_idx, err)  # (n_realizations,)
+    loss     = sum_err / torch.as_tensor(n_samples_per_dataset, dtype=err.dtype, device=err.device)         # (n_realizations,)
+    return loss
+
+REALIZATIONS_LOSSES = {
+    "MSE": MSE_realizations_loss
+}
+
 # ------------ Optimizer for free constant optimization ------------
 
+# --- EARLY ABANDONMENT ---
+
+# Optimizations are never abandoned before this number of steps (first steps not being representative of convergence)
+EARLY_ABANDON_MIN_STEPS = 3
+
+def is_abandoned (history, n_steps, stall_steps = None, stall_rtol = 1e-3, abandon_loss = None):
+    """
+    Should optimization be abandoned given its loss history (most candidates being wrong, their loss plateaus far above
+    tolerance) ?
+    It is abandoned (after at least EARLY_ABANDON_MIN_STEPS steps) if :
+    - Stalling : relative loss improvement over the last stall_steps steps is < stall_rtol.
+    - Racing : the best loss it can reach within the n_steps budget is > abandon_loss, this projected loss assuming
+    that the loss keeps decreasing at each remaining step by the best factor observed over the last
+    EARLY_ABANDON_MIN_STEPS steps.
+    Parameters
+    ----------
+    history : array_like of shape (?, ...) of float
+        Loss history so far (NaNs for problems already stopped).
+    n_steps : int
+        Max number of optimization steps.
+    stall_steps : int or None, optional
+        Number of steps over which stalling is checked. Not checked if None.
+    stall_rtol : float, optional
+        Relative loss improvement under which optimization is considered stalling.
+    abandon_loss : float or None, optional
+        Loss that needs to be reached (eg. corresponding to the reward of the worst elite program of previous epoch).
+        Not checked if None.
+    Returns
+    -------
+    is_abandoned : numpy.array of shape (...) of bool
+        Should optimization be abandoned for each problem.
+    """
+    history = np.asarray(history, dtype=float)                                            # (?, ...)
+    n = history.shape[0]
+    res = np.full(history.shape[1:], False)                                               # (...)
+    if n < EARLY_ABANDON_MIN_STEPS:
+        return res
+    with np.errstate(invalid="ignore", divide="ignore"):
+        # Stalling
+        if stall_steps is not None and n > stall_steps:
+            old, new = history[-1-stall_steps], history[-1]                               # (...)
+            res |= (old - new) < stall_rtol*np.abs(old)
+        # Racing
+        if abandon_loss is not None:
+            recent     = history[-EARLY_ABANDON_MIN_STEPS:]                               # (EARLY_ABANDON_MIN_STEPS, ...)
+            ratios     = np.clip(recent[1:]/recent[:-1], 0., 1.)                          # (EARLY_ABANDON_MIN_STEPS-1, ...)
+            best_ratio = np.fmin.reduce(ratios, axis=0)                                   # (...)
+            projected  = history[-1]*best_ratio**(n_steps - n)                            # (...)
+            res |= projected > abandon_loss
+    return res
+
+def was_abandoned (history, method_args = None):
+    """
+    Was optimization stopped early by early abandonment (see is_abandoned) rather than by reaching tolerance, having a
+    non-finite loss or using its whole n_steps budget ? This is determined afterwards from its loss history, the
+    criteria of is_abandoned being evaluated on the history of each problem up to its last step.
+    Parameters
+    ----------
+    history : array_like of shape (?, ...) of float
+        Loss history (NaNs for problems already stopped).
+    method_args : dict or None, optional
+        Arguments of the optimizer (n_steps, tol, stall_steps, stall_rtol and abandon_loss being used with the defaults
+        of LBFGS_optimizer). By default, optimization is never abandoned.
+    Returns
+    -------
+    was_abandoned : numpy.array of shape (...) of bool
+        Was optimization of each problem abandoned.
+    """
+    history = np.asarray(history, dtype=float)                                            # (?, ...)
+    shape   = history.shape[1:]
+    if method_args is None or history.shape[0] == 0:
+        return np.full(shape, False)
+    history = history.reshape(history.shape[0], -1)                                       # (?, n_problems)
+    res     = np.full(history.shape[1], False)                                            # (n_problems,)
+    n_steps      = method_args.get("n_steps", 10)
+    tol          = method_args.get("tol", 1e-6)
+    stall_steps  = method_args.get("stall_steps", None)
+    stall_rtol   = method_args.get("stall_rtol", 1e-3)
+    abandon_loss = method_args.get("abandon_loss", None)
+    if stall_steps is None and abandon_loss is None:
+        return res.reshape(shape)
+    # Number of steps done by each problem (up to its last non-NaN loss)
+    is_valid = ~np.isnan(history)                                                         # (?, n_problems)
+    n_done   = np.where(is_valid.any(axis=0), history.shape[0] - np.argmax(is_valid[::-1], axis=0), 0)  # (n_problems,)
+    for n in np.unique(n_done):
+        if n == 0 or n >= n_steps:
+            continue
+        is_n = (n_done == n)                                                              # (n_problems,)
+        last = history[n-1, is_n]                                                         # (n_n,)
+        res[is_n] = is_abandoned(history[:n, is_n], n_steps=n_steps, stall_steps=stall_steps,
+                                 stall_rtol=stall_rtol, abandon_loss=abandon_loss) & np.isfinite(last) & ~(last < tol)
+    return res.reshape(shape)
+
 # --- LBFGS ---
 
 DEFAULT_LBFGS_OPTI_ARGS = {
@@ -258,7 +494,7 @@ DEFAULT_LBFGS_OPTI_ARGS = {
                          },
 }
 
-def LBFGS_optimizer (params, f, n_steps=10, tol=1e-6, lbfgs_func_args={}):
+def LBFGS_optimizer (params, f, n_steps=10, tol=1e-6, lbfgs_func_args={}, stall_steps=None, stall_rtol=1e-3, abandon_loss=None):
     """
     Params optimizer (wrapper around torch.optim.LBFGS).
     See: https://pytorch.org/docs/stable/generated/torch.optim.LBFGS.html
@@ -274,6 +510,8 @@ def LBFGS_optimizer (params, f, n_steps=10, tol=1e-6, lbfgs_func_args={}):
         Error tolerance, early stops if error < tol.
     lbfgs_func_args : dict
         Arguments to pass to torch.optim.LBFGS
+    stall_steps, stall_rtol, abandon_loss : int or None, float, float or None
+        Early abandonment criteria (see is_abandoned), not used by default.
     Returns
     -------
     history : numpy.array of shape (?,)
@@ -302,6 +540,372 @@ def LBFGS_optimizer (params, f, n_steps=10, tol=1e-6, lbfgs_func_args={}):
         lbfgs.step(closure)
         if history[-1] < tol:
             break
+        if is_abandoned(history, n_steps=n_steps, stall_steps=stall_steps, stall_rtol=stall_rtol, abandon_loss=abandon_loss):
+            break
+
+    history = np.array(history)
+
+    return history
+
+def LBFGS_batch_optimizer (params, f, n_steps=10, tol=1e-6, lbfgs_func_args={}, stall_steps=None, stall_rtol=1e-3, abandon_loss=None):
+    """
+    Batched version of LBFGS_optimizer optimizing the params of n_progs independent problems at once.
+    Each problem has its own L-BFGS state (curvature pairs history, direction, step length found by its own line
+    search) as if it was optimized by its own torch.optim.LBFGS, only evaluations of f (and of its gradients) being
+    shared across problems. lbfgs_func_args are interpreted as in torch.optim.LBFGS (lr, max_iter, tolerance_grad,
+    tolerance_change, history_size, line_search_fn), any line_search_fn (eg. "strong_wolfe") resulting in a
+    per-problem line search satisfying strong Wolfe conditions.
+    Each problem stops on its own: once its loss is < tol (after the step following this loss evaluation, as in
+    LBFGS_optimizer) or non-finite, its params are kept at their values.
+    Only problems still being optimized (or still searching along their direction during line searches) are
+    evaluated, so problems that stopped or already found their step length cost nothing.
+    Parameters
+    ----------
+    params : list of torch.tensor
+        Free constants to optimize (first dimension being n_progs).
+    f : callable
+        Function to minimize, taking params and rows (numpy.array of shape (n_rows,) of int, indices of problems to
+        evaluate) as arguments and returning a torch.tensor of shape (n_rows,) of losses of these problems.
+    n_steps : int
+        Number of optimization steps.
+    tol : float
+        Error tolerance, each problem early stops if its error < tol.
+    lbfgs_func_args : dict
+        Arguments of torch.optim.LBFGS to mimic.
+    stall_steps, stall_rtol, abandon_loss : int or None, float, float or None
+        Early abandonment criteria (see is_abandoned) applied to each problem, not used by default.
+    Returns
+    -------
+    history, opti_steps : numpy.array of shape (?, n_progs,), numpy.array of shape (n_progs,) of int
+        Loss history (? <= n_steps) with NaNs after problems were stopped and number of steps done for each problem.
+    """
+
+    if type(params) != list:
+        params = [params,]
+    for p in params:
+        p.requires_grad = True
+    n_progs = params[0].shape[0]
+    device  = params[0].device
+    dtype   = params[0].dtype
+
+    # torch.optim.LBFGS args
+    lr               = lbfgs_func_args.get("lr"               , 1     )
+    max_iter         = lbfgs_func_args.get("max_iter"         , 20    )
+    tolerance_grad   = lbfgs_func_args.get("tolerance_grad"   , 1e-7  )
+    tolerance_change = lbfgs_func_args.get("tolerance_change" , 1e-9  )
+    history_size     = lbfgs_func_args.get("history_size"     , 100   )
+    line_search_fn   = lbfgs_func_args.get("line_search_fn"   , None  )
+    # Curvature pairs beyond n_steps*max_iter would never be used
+    history_size = min(history_size, n_steps*max_iter)
+    # Line search args (same as torch.optim.LBFGS's strong_wolfe)
+    c1, c2, max_ls = 1e-4, 0.9, 25
+
+    # Params of each problem flattened : x of shape (n_progs, n_params)
+    def get_x():
+        return torch.cat([p.detach().reshape(n_progs, -1).to(dtype) for p in params], dim=1)  # (n_progs, n_params)
+    def set_x(x):
+        with torch.no_grad():
+            i = 0
+            for p in params:
+                n = p[0].numel()
+                p.copy_(x[:, i:i+n].reshape(p.shape))
+                i += n
+        return None
+
+    # Losses and gradients at x of problems where is_eval, others being left NaN with null gradients (non-finite
+    # gradients being zeroed out so they do not pollute the others, problems being independent, gradient of sum of
+    # losses gives gradient of each loss)
+    def eval_f(x, is_eval):
+        set_x(x)
+        losses = torch.full((n_progs,), np.nan, dtype=dtype, device=device)                  # (n_progs,)
+        g      = torch.zeros((n_progs, x.shape[1]), dtype=dtype, device=device)               # (n_progs, n_params)
+        rows   = torch.where(is_eval)[0]                                                      # (n_rows,)
+        if len(rows) == 0:
+            return losses, g
+        with torch.enable_grad():
+            losses_rows = f(params, rows.cpu().numpy())                                       # (n_rows,)
+            objective = torch.where(torch.isfinite(losses_rows), losses_rows, 0.).sum()
+            if objective.requires_grad:
+                grads = torch.autograd.grad(objective, params, allow_unused=True)
+            else:
+                grads = [None]*len(params)
+        g_rows = torch.cat([(grad[rows] if grad is not None else torch.zeros_like(p[rows])).reshape(len(rows), -1).to(dtype)
+                            for grad, p in zip(grads, params)], dim=1)                        # (n_rows, n_params)
+        g[rows]      = torch.nan_to_num(g_rows, nan=0., posinf=0., neginf=0.)                 # (n_rows, n_params)
+        losses[rows] = losses_rows.detach().to(dtype)                                         # (n_rows,)
+        return losses, g
+
+    x = get_x()                                                                               # (n_progs, n_params)
+    n_params = x.shape[1]
+
+    # L-BFGS state of each problem (kept across steps as in torch.optim.LBFGS)
+    old_dirs = torch.zeros((n_progs, history_size, n_params), dtype=dtype, device=device)    # (n_progs, history_size, n_params)
+    old_stps = torch.zeros((n_progs, history_size, n_params), dtype=dtype, device=device)    # (n_progs, history_size, n_params)
+    ro       = torch.zeros((n_progs, history_size), dtype=dtype, device=device)              # (n_progs, history_size)
+    n_hist   = torch.zeros((n_progs,), dtype=torch.long, device=device)                      # (n_progs,)
+    H_diag   = torch.ones ((n_progs,), dtype=dtype, device=device)                           # (n_progs,)
+    d        = torch.zeros((n_progs, n_params), dtype=dtype, device=device)                  # (n_progs, n_params)
+    t        = torch.zeros((n_progs,), dtype=dtype, device=device)                           # (n_progs,)
+    prev_g   = torch.zeros((n_progs, n_params), dtype=dtype, device=device)                  # (n_progs, n_params)
+    n_iter   = torch.zeros((n_progs,), dtype=torch.long, device=device)                      # (n_progs,)
+
+    # L-BFGS two-loop recursion giving direction from gradient for each problem (most recent pairs being last)
+    def direction(g):
+        q = -g                                                                                # (n_progs, n_params)
+        al = torch.zeros_like(ro)                                                             # (n_progs, history_size)
+        is_used = torch.arange(history_size, device=device)[None, :] >= (history_size - n_hist)[:, None] # (n_progs, history_size)
+        # Pairs no problem uses yet
+        k_min = history_size - int(n_hist.max())
+        for k in range(history_size - 1, k_min - 1, -1):
+            al[:, k] = torch.where(is_used[:, k], (old_stps[:, k]*q).sum(dim=1)*ro[:, k], 0.)
+            q = q - al[:, k, None]*old_dirs[:, k]
+        r = q*H_diag[:, None]
+        for k in range(k_min, history_size):
+            be = (old_dirs[:, k]*r).sum(dim=1)*ro[:, k]
+            r = r + torch.where(is_used[:, k], al[:, k] - be, 0.)[:, None]*old_stps[:, k]
+        return r                                                                              # (n_progs, n_params)
+
+    # Minimizer of cubic interpolating (t1, f1, gd1) and (t2, f2, gd2) with t1 < t2 (values and directional
+    # derivatives at steps t1 and t2) clamped to [t_min, t_max] (middle of interval if cubic has no minimizer).
+    def cubic_minimizer(t1, f1, gd1, t2, f2, gd2, t_min, t_max):
+        d1 = gd1 + gd2 - 3*(f1 - f2)/(t1 - t2)
+        d2 = torch.sqrt(torch.clamp(d1**2 - gd1*gd2, min=0.))
+        t_cubic = t2 - (t2 - t1)*((gd2 + d2 - d1)/(gd2 - gd1 + 2*d2))
+        is_valid = (d1**2 - gd1*gd2 >= 0.) & torch.isfinite(t_cubic)
+        return torch.where(is_valid, torch.minimum(torch.maximum(t_cubic, t_min), t_max), (t_min + t_max)/2)
+
+    # Line search along d from x for each problem where is_on (step of 0 for others) satisfying strong Wolfe
+    # conditions (bracketing and zooming using cubic interpolation as in torch.optim.LBFGS's strong_wolfe), falling
+    # back to the best step satisfying sufficient decrease found (or to no step at all).
+    def line_search(x, loss, g, d, t, is_on):
+        gtd = (g*d).sum(dim=1)                                                                # (n_progs,)
+        # Bracket : lower step (sufficient decrease, descending) and upper step (no longer descending)
+        t_lo, f_lo, gd_lo = torch.zeros_like(t), loss.clone(), gtd.clone()
+        t_hi, f_hi, gd_hi = torch.full_like(t, np.inf), torch.full_like(t, np.nan), torch.full_like(t, np.nan)
+        t_best, loss_best, g_best = torch.zeros_like(t), loss.clone(), g.clone()
+        searching = is_on.clone()                                                             # (n_progs,)
+        for _ in range(max_ls):
+            t_try = torch.where(searching, t, 0.)                                             # (n_progs,)
+            f_try, g_try = eval_f(x + t_try[:, None]*d, searching)
+            gd_try = (g_try*d).sum(dim=1)                                                     # (n_progs,)
+            is_decreasing = torch.isfinite(f_try) & (f_try <= loss + c1*t_try*gtd) & (f_try <= f_lo) # (n_progs,)
+            is_done       = searching & is_decreasing & (gd_try.abs() <= -c2*gtd)             # (n_progs,)
+            is_better     = searching & is_decreasing & (f_try <= loss_best)                  # (n_progs,)
+            t_best    = torch.where(is_better, t_try, t_best)
+            loss_best = torch.where(is_better, f_try, loss_best)
+            g_best    = torch.where(is_better[:, None], g_try, g_best)
+            searching &= ~is_done
+            if not searching.any():
+                break
+            # Extrapolating or zooming
+            is_lo = searching & is_decreasing & (gd_try < 0.)                                 # (n_progs,)
+            is_hi = searching & ~is_lo                                                        # (n_progs,)
+            is_extrapolating = is_lo & torch.isinf(t_hi)                                      # (n_progs,)
+            t_ext = cubic_minimizer(t_lo, f_lo, gd_lo, t_try, f_try, gd_try, t_try + 0.01*(t_try - t_lo), 10*t_try)
+            t_lo  = torch.where(is_lo, t_try,  t_lo)
+            f_lo  = torch.where(is_lo, f_try,  f_lo)
+            gd_lo = torch.where(is_lo, gd_try, gd_lo)
+            t_hi  = torch.where(is_hi, t_try,  t_hi)
+            f_hi  = torch.where(is_hi, f_try,  f_hi)
+            gd_hi = torch.where(is_hi, gd_try, gd_hi)
+            width  = t_hi - t_lo
+            t_zoom = cubic_minimizer(t_lo, f_lo, gd_lo, t_hi, f_hi, gd_hi, t_lo + 0.1*width, t_hi - 0.1*width)
+            t = torch.where(is_extrapolating, t_ext, t_zoom)
+        return t_best, loss_best, g_best
+
+    # One torch.optim.LBFGS step (of max_iter iterations) for each problem where is_on
+    def lbfgs_step(x, loss, g, is_on):
+        # Already optimal problems are left as is
+        is_on = is_on & (g.abs().max(dim=1).values > tolerance_grad)                          # (n_progs,)
+        for _ in range(max_iter):
+            if not is_on.any():
+                break
+            n_iter.add_(is_on.long())
+            is_first = is_on & (n_iter == 1)                                                  # (n_progs,)
+            # Updating curvature pairs history
+            y  = g - prev_g                                                                   # (n_progs, n_params)
+            s  = d*t[:, None]                                                                 # (n_progs, n_params)
+            ys = (y*s).sum(dim=1)                                                             # (n_progs,)
+            is_update = is_on & ~is_first & (ys > 1e-10)                                      # (n_progs,)
+            if is_update.any():
+                old_dirs[is_update] = torch.cat((old_dirs[is_update, 1:], y[is_update, None]), dim=1)
+                old_stps[is_update] = torch.cat((old_stps[is_update, 1:], s[is_update, None]), dim=1)
+                ro      [is_update] = torch.cat((ro[is_update, 1:], 1./ys[is_update, None]), dim=1)
+                n_hist  [is_update] = torch.clamp(n_hist[is_update] + 1, max=history_size)
+                H_diag  [is_update] = ys[is_update]/(y[is_update]**2).sum(dim=1)
+            # Direction and initial step length
+            d[is_on]      = direction(g)[is_on]
+            prev_g[is_on] = g[is_on]
+            prev_loss     = loss.clone()
+            t_init = torch.where(is_first, torch.clamp(1./g.abs().sum(dim=1), max=1.)*lr, torch.full_like(t, lr))
+            t[is_on] = t_init[is_on]
+            # Directional derivative below tolerance
+            gtd = (g*d).sum(dim=1)                                                            # (n_progs,)
+            is_on &= ~(gtd > -tolerance_change)
+            if not is_on.any():
+                break
+            # Stepping
+            if line_search_fn is not None:
+                t_new, loss_new, g_new = line_search(x, loss, g, d, t.clone(), is_on)
+            else:
+                t_new = torch.where(is_on, t, 0.)
+                loss_new, g_new = eval_f(x + t_new[:, None]*d, is_on)
+            t[is_on]    = t_new[is_on]
+            x           = x + torch.where(is_on, t, 0.)[:, None]*d
+            loss        = torch.where(is_on, loss_new, loss)
+            g           = torch.where(is_on[:, None], g_new, g)
+            # Stopping conditions of torch.optim.LBFGS
+            is_on &= ~(g.abs().max(dim=1).values <= tolerance_grad)
+            is_on &= ~((d*t[:, None]).abs().max(dim=1).values <= tolerance_change)
+            is_on &= ~((loss - prev_loss).abs() < tolerance_change)
+        return x
+
+    # mask : is problem still being optimized ?
+    is_active = torch.full(size=(n_progs,), fill_value=True, dtype=bool, device=device)       # (n_progs,)
+
+    history    = []
+    opti_steps = np.zeros(n_progs, dtype=int)                                                 # (n_progs,)
+    for i in range(n_steps):
+        losses, g = eval_f(x, is_active)                                                      # (n_progs,)
+        history.append(losses.cpu().numpy())
+        opti_steps[is_active.cpu().numpy()] += 1
+        # Problems having non-finite losses are stopped right away
+        is_active &= torch.isfinite(losses)
+        if not is_active.any():
+            break
+        # Stepping (only active problems are moved)
+        x = lbfgs_step(x, losses, g, is_active)
+        # Problems that reached tolerance or are abandoned are stopped
+        is_active &= ~(losses < tol)
+        is_active &= ~torch.from_numpy(is_abandoned(history, n_steps=n_steps, stall_steps=stall_steps,
+                                                    stall_rtol=stall_rtol, abandon_loss=abandon_loss)).to(device)
+        if not is_active.any():
+            break
+    set_x(x)
+
+    history = np.array(history)                                                               # (?, n_progs,)
+
+    return history, opti_steps
+
+# --- LM ---
+
+DEFAULT_LM_OPTI_ARGS = {
+    'n_steps'           : 30,
+    'tol'               : 1e-10,
+    'damping'           : 1e-3,
+    'damping_factor'    : 10.,
+    'max_damping_tries' : 10,
+}
+
+def jacobian_of_params (r, params):
+    """
+    Computes the jacobian of r with respect to params (flattened and concatenated).
+    As functions being optimized typically read params by reference rather than from their arguments (eg.
+    Program.optimize_constants) functional transforms (torch.func.jacrev etc.) can not be used, columns of the
+    jacobian (ie. jacobian-vector products) are computed via double backward instead (one backward pass per param).
+    Parameters
+    ----------
+    r : torch.tensor of shape (?,)
+        Output depending on params.
+    params : list of torch.tensor
+        Params of total size n_params.
+    Returns
+    -------
+    jac : torch.tensor of shape (?, n_params,)
+    """
+    # J^T u as a function of u
+    u = torch.zeros_like(r, requires_grad=True)                                               # (?,)
+    JTu = torch.autograd.grad(r, params, grad_outputs=u, create_graph=True, allow_unused=True)
+    JTu = torch.cat([(g if g is not None else torch.zeros_like(p)).reshape(-1)
+                     for g, p in zip(JTu, params)])                                           # (n_params,)
+    # J v = d(J^T u . v)/du
+    cols = []
+    for k in range(JTu.shape[0]):
+        if JTu[k].requires_grad:
+            col = torch.autograd.grad(JTu[k], u, retain_graph=True, allow_unused=True)[0]
+        else:
+            col = None
+        cols.append(col if col is not None else torch.zeros_like(r))
+    jac = torch.stack(cols, dim=-1).detach()                                                  # (?, n_params,)
+    return jac
+
+def LM_optimizer (params, f, n_steps=30, tol=1e-10, damping=1e-3, damping_factor=10., max_damping_tries=10):
+    """
+    Params optimizer using damped Gauss-Newton steps (Levenberg-Marquardt) to minimize the sum of squared residuals.
+    Well suited to least squares losses with a handful of params.
+    Parameters
+    ----------
+    params : list of torch.tensor
+        Free constants to optimize.
+    f : callable
+        Residuals function, taking params as argument and returning torch.tensor of shape (?,), the loss to minimize
+        being the sum of its squares.
+    n_steps : int
+        Number of optimization steps.
+    tol : float
+        Error tolerance, early stops if error < tol.
+    damping : float
+        Initial damping (relative to the diagonal of the Gauss-Newton matrix).
+    damping_factor : float
+        Factor by which damping is divided after a successful step and multiplied after a rejected one.
+    max_damping_tries : int
+        Max number of damping increases at each step, stops if no step reducing the loss was found.
+    Returns
+    -------
+    history : numpy.array of shape (?,)
+        Loss history (? <= n_steps).
+    """
+
+    if type(params) == list:
+        for p in params:
+            p.requires_grad = True
+        params_topass = params
+    else:
+        params.requires_grad = True
+        params_topass = [params,]
+
+    def step_params(delta):
+        with torch.no_grad():
+            i = 0
+            for p in params_topass:
+                p.add_(delta[i:i+p.numel()].reshape(p.shape).to(p.dtype))
+                i += p.numel()
+        return None
+
+    history = []
+    for i in range(n_steps):
+        r = f(params)                                                                         # (?,)
+        loss = (r**2).sum()
+        history.append(loss.item())
+        if not (history[-1] >= tol):
+            # Converged (or non-finite loss)
+            break
+        jac  = jacobian_of_params(r, params_topass)                                         # (?, n_params,)
+        r    = r.detach()
+        grad = jac.T @ r                                                                      # (n_params,)
+        gn   = jac.T @ jac                                                                    # (n_params, n_params,)
+        # Params not affecting residuals have a zero diagonal, using 1 for them (their step being 0 anyway)
+        diag = torch.diagonal(gn).clone()                                                     # (n_params,)
+        diag[diag == 0.] = 1.
+        # Increasing damping until loss decreases
+        is_improved = False
+        for _ in range(max_damping_tries):
+            try:
+                delta = torch.linalg.solve(gn + damping*torch.diag(diag), -grad)              # (n_params,)
+            except RuntimeError:
+                delta = None
+            if delta is not None and torch.isfinite(delta).all():
+                step_params(delta)
+                with torch.no_grad():
+                    new_loss = (f(params)**2).sum().item()
+                if new_loss < history[-1]:
+                    is_improved = True
+                    damping = damping/damping_factor
+                    break
+                step_params(-delta)
+            damping = damping*damping_factor
+        if not is_improved:
+            break
 
     history = np.array(history)
 
@@ -310,13 +914,51 @@ def LBFGS_optimizer (params, f, n_steps=10, tol=1e-6, lbfgs_func_args={}):
 # --- DICTS ---
 
 OPTIMIZERS = {
-    "LBFGS" : LBFGS_optimizer
+    "LBFGS" : LBFGS_optimizer,
+    "LM"    : LM_optimizer,
 }
 
 OPTIMIZERS_DEFAULT_ARGS = {
-    "LBFGS" : DEFAULT_LBFGS_OPTI_ARGS
+    "LBFGS" : DEFAULT_LBFGS_OPTI_ARGS,
+    "LM"    : DEFAULT_LM_OPTI_ARGS,
+}
+
+# Optimizers minimizing the sum of squared residuals (they are given the residuals of the loss, see RESIDUALS)
+LEAST_SQUARES_OPTIMIZERS = ["LM",]
+
+# Optimizers supporting early abandonment (see is_abandoned)
+EARLY_ABANDON_OPTIMIZERS = ["LBFGS",]
+
+# Batched versions of optimizers (see optimize_free_const_batch)
+BATCH_OPTIMIZERS = {
+    "LBFGS" : LBFGS_batch_optimizer
 }
 
+# ------------ MULTI-START ------------
+
+def draw_starts (init, n_starts, starts_spread = 1.):
+    """
+    Draws initial values of free constants for multi-start optimization : log-uniformly around init values (keeping
+    their sign, zero init values being considered as 1).
+    Parameters
+    ----------
+    init : torch.tensor of shape (...,) of float
+        Initial values.
+    n_starts : int
+        Number of starts (the first one being init itself).
+    starts_spread : float, optional
+        Half-width (in decades) of the log-uniform distribution around init values.
+    Returns
+    -------
+    starts : torch.tensor of shape (n_starts, ...,) of float
+        Initial values of each start.
+    """
+    init   = init.detach()                                                              # (...,)
+    base   = torch.where(init != 0, init, torch.ones_like(init))                        # (...,)
+    u      = torch.rand((n_starts - 1,) + tuple(init.shape), dtype=init.dtype, device=init.device)*2 - 1  # (n_starts-1, ...,)
+    starts = torch.cat((init[None], base[None]*10**(starts_spread*u)), dim=0)           # (n_starts, ...,)
+    return starts
+
 # ------------ WRAPPER ------------
 
 DEFAULT_OPTI_ARGS = {
@@ -329,9 +971,12 @@ def optimize_free_const (func,
                          params,
                          y_target,
                          y_weights   = 1.,
-                         loss        = "MSE",
-                         method      = "LBFGS",
-                         method_args = None):
+                         loss          = "MSE",
+                         method        = "LBFGS",
+                         method_args   = None,
+                         n_starts      = 1,
+                         starts_spread = 1.,
+                         func_starts   = None):
     """
     Optimizes free constants params so that func output matches y_target.
     Parameters
@@ -344,8 +989,41 @@ def optimize_free_const (func,
         Target output of function.
     y_weights : torch.tensor of shape (?,) of float, optional
         Weights for each data point. By default, no weights are used.
+    n_starts : int, optional
+        Number of starts of multi-start optimization (see draw_starts), params being set to the values of the start
+        reaching the lowest loss. Starts are stacked along the first dimension of params (which must be of size 1) and
+        optimized at once as a batch of problems (see optimize_free_const_batch) : method must have a batched version
+        in BATCH_OPTIMIZERS and func_starts must be given.
+    starts_spread : float, optional
+        Half-width (in decades) of the log-uniform distribution of initial values of starts around params values.
+    func_starts : callable or None, optional
+        Function taking stacked params (first dimension being n_starts) and rows (numpy.array of shape (n_rows,) of
+        int, starts to evaluate) as arguments and returning a torch.tensor of shape (n_rows, ?,) (outputs of func with
+        the free constants values of these starts). Only used if n_starts > 1.
+    Returns
+    -------
+    history : numpy.array of shape (?,)
+        Loss history (of best start).
     """
 
+    # Multi-start : starts optimized at once as a batch of problems
+    if n_starts > 1:
+        err_msg = "Multi-start optimization requires func_starts and an optimizer having a batched version, see " \
+                  "free_const.BATCH_OPTIMIZERS: %s"%(BATCH_OPTIMIZERS)
+        assert func_starts is not None and method in BATCH_OPTIMIZERS, err_msg
+        history, _ = optimize_free_const_batch (func          = func_starts,
+                                                params        = params,
+                                                y_target      = y_target,
+                                                y_weights     = y_weights,
+                                                loss          = loss,
+                                                method        = method,
+                                                method_args   = method_args,
+                                                n_starts      = n_starts,
+                                                starts_spread = starts_spread,)
+        history = history[:, 0]                                                           # (?,)
+        history = history[~np.isnan(history)]                                             # (?,)
+        return history
+
     # Getting loss
     err_msg = "Loss should be a string contained in the dict of available const optimization losses, see " \
               "free_const.LOSSES : %s"%(LOSSES)
@@ -368,6 +1046,13 @@ def optimize_free_const (func,
     else:
         optimizer_args = method_args
 
+    # Least squares optimizers work on residuals of loss
+    if method in LEAST_SQUARES_OPTIMIZERS:
+        err_msg = "Least squares optimizer %s can only be used with losses having residuals defined in " \
+                  "free_const.RESIDUALS: %s"%(method, RESIDUALS)
+        assert loss in [LOSSES[name] for name in RESIDUALS], err_msg
+        loss = RESIDUALS[[name for name in RESIDUALS if LOSSES[name] is loss][0]]
+
     # Loss wrapper : loss_params
     loss_params = lambda params : loss(func = func, params = params, y_target = y_target, y_weights = y_weights)
 
@@ -375,3 +1060,152 @@ def optimize_free_const (func,
     history = optimizer (params = params, f = loss_params, **optimizer_args)
 
     return history
+
+def optimize_free_const_batch (func,
+                               params,
+                               y_target,
+                               y_weights   = 1.,
+                               loss          = "MSE",
+                               method        = "LBFGS",
+                               method_args   = None,
+                               n_starts      = 1,
+                               starts_spread = 1.):
+    """
+    Batched version of optimize_free_const: optimizes the free constants params of n_progs functions at once so that
+    the output of each function matches y_target.
+    Parameters
+    ----------
+    func : callable
+        Function which's constants should be optimized taking params and rows (numpy.array of shape (n_rows,) of int)
+        as arguments and returning a torch.tensor of shape (n_rows, ?,) (outputs of functions rows, only those still
+        being optimized being evaluated). When using multi-start, it must
+        also accept params of first dimension n_starts*n_progs (start k of function i being at k*n_progs + i, rows
+        being indices along this dimension).
+    params : list of torch.tensor
+        Free constants to optimize (first dimension being n_progs).
+    y_target : torch.tensor of shape (?,)
+        Target output of function.
+    y_weights : torch.tensor of shape (?,) of float, optional
+        Weights for each data point. By default, no weights are used.
+    n_starts : int, optional
+        Number of starts of multi-start optimization (see draw_starts), all starts of all functions being optimized
+        at once as a single batch of problems. params are set to the values of the start reaching the lowest loss.
+    starts_spread : float, optional
+        Half-width (in decades) of the log-uniform distribution of initial values of starts around params values.
+    Returns
+    -------
+    history, opti_steps : numpy.array of shape (?, n_progs,), numpy.array of shape (n_progs,) of int
+        Loss history (of best start) and number of steps done for each function (summed over starts).
+    """
+
+    # Getting loss
+    err_msg = "Loss should be a string contained in the dict of available batched const optimization losses, see " \
+              "free_const.BATCH_LOSSES : %s"%(BATCH_LOSSES)
+    assert isinstance(loss, str), err_msg
+    assert loss in BATCH_LOSSES, err_msg
+    loss = BATCH_LOSSES[loss]
+
+    # Getting optimizer
+    err_msg = "Optimizer should be a string contained in the dict of available batched const optimizers, see " \
+              "free_const.BATCH_OPTIMIZERS: %s"%(BATCH_OPTIMIZERS)
+    assert isinstance(method, str), err_msg
+    assert method in BATCH_OPTIMIZERS, err_msg
+    optimizer = BATCH_OPTIMIZERS[method]
+
+    # Getting optimizer_args
+    if method_args is None:
+        err_msg = "Optimizer args should be given or defined in free_const.OPTIMIZERS_DEFAULT_ARGS: %s" % (OPTIMIZERS_DEFAULT_ARGS)
+        assert method in OPTIMIZERS_DEFAULT_ARGS, err_msg
+        optimizer_args = OPTIMIZERS_DEFAULT_ARGS[method]
+    else:
+        optimizer_args = method_args
+
+    # Loss wrapper : loss_params
+    loss_params = lambda params, rows = None : loss(func = func, params = params, y_target = y_target, y_weights = y_weights, rows = rows)
+
+    # Running optimizer
+    if n_starts <= 1:
+        history, opti_steps = optimizer (params = params, f = loss_params, **optimizer_args)
+    # Multi-start : starts stacked along first dimension
+    else:
+        n_progs = params[0].shape[0]
+        stacked = [draw_starts(p, n_starts=n_starts, starts_spread=starts_spread).reshape((n_starts*n_progs,) + tuple(p.shape[1:]))
+                   for p in params]                                                       # (n_starts*n_progs, ...)
+        history, opti_steps = optimizer (params = stacked, f = loss_params, **optimizer_args)
+        # Best start of each function
+        with torch.no_grad():
+            losses = loss_params(stacked).reshape(n_starts, n_progs)                      # (n_starts, n_progs)
+            losses = torch.where(torch.isnan(losses), np.inf, losses)                     # (n_starts, n_progs)
+            best   = torch.argmin(losses, dim=0)                                          # (n_progs,)
+            arange = torch.arange(n_progs, device=best.device)                            # (n_progs,)
+            for p, p_stacked in zip(params, stacked):
+                p.copy_(p_stacked.reshape((n_starts,) + tuple(p.shape))[best, arange])
+        best    = best.cpu().numpy()                                                      # (n_progs,)
+        history = history.reshape(history.shape[0], n_starts, n_progs)[:, best, np.arange(n_progs)]  # (?, n_progs)
+        opti_steps = opti_steps.reshape(n_starts, n_progs).sum(axis=0)                    # (n_progs,)
+
+    return history, opti_steps
+
+def optimize_free_const_realizations (func,
+                                      params,
+                                      y_target,
+                                      n_samples_per_dataset,
+                                      y_weights   = 1.,
+                                      loss        = "MSE",
+                                      method      = "LBFGS",
+                                      method_args = None):
+    """
+    Optimizes the dataset specific free constants params of a function evaluated on n_realizations datasets (flattened
+    together) so that its output matches y_target, the loss on each dataset being minimized as an independent problem
+    (problems are independent given the other free constants). All problems are optimized at once using the batched
+    version of the optimizer (see optimize_free_const_batch) with a single execution of func per step.
+    Parameters
+    ----------
+    func : callable
+        Function which's constants should be optimized taking params as argument and returning a torch.tensor of shape
+        (?,) (? being the total number of samples of all datasets).
+    params : list of torch.tensor
+        Free constants to optimize (first dimension being n_realizations).
+    y_target : torch.tensor of shape (?,)
+        Target output of function.
+    n_samples_per_dataset : array_like of shape (n_realizations,) of int
+        Number of samples for each dataset (eg. [90, 100, 110] for 3 datasets).
+    y_weights : torch.tensor of shape (?,) of float, optional
+        Weights for each data point. By default, no weights are used.
+    Returns
+    -------
+    history, opti_steps : numpy.array of shape (?, n_realizations,), numpy.array of shape (n_realizations,) of int
+        Loss history and number of steps done for each dataset.
+    """
+
+    # Getting loss
+    err_msg = "Loss should be a string contained in the dict of available per realization const optimization " \
+              "losses, see free_const.REALIZATIONS_LOSSES : %s"%(REALIZATIONS_LOSSES)
+    assert isinstance(loss, str), err_msg
+    assert loss in REALIZATIONS_LOSSES, err_msg
+    loss = REALIZATIONS_LOSSES[loss]
+
+    # Getting optimizer
+    err_msg = "Optimizer should be a string contained in the dict of available batched const optimizers, see " \
+              "free_const.BATCH_OPTIMIZERS: %s"%(BATCH_OPTIMIZERS)
+    assert isinstance(method, str), err_msg
+    assert method in BATCH_OPTIMIZERS, err_msg
+    optimizer = BATCH_OPTIMIZERS[method]
+
+    # Getting optimizer_args
+    if method_args is None:
+        err_msg = "Optimizer args should be given or defined in free_const.OPTIMIZERS_DEFAULT_ARGS: %s" % (OPTIMIZERS_DEFAULT_ARGS)
+        assert method in OPTIMIZERS_DEFAULT_ARGS, err_msg
+        optimizer_args = OPTIMIZERS_DEFAULT_ARGS[method]
+    else:
+        optimizer_args = method_args
+
+    # Loss wrapper : loss_params (all realizations sharing the same execution of func, losses of all of them are
+    # computed whatever the problems to evaluate)
+    loss_params = lambda params, rows : loss(func = func, params = params, y_target = y_target, y_weights = y_weights,
+                                             n_samples_per_dataset = n_samples_per_dataset)[rows]
+
+    # Running optimizer
+    history, opti_steps = optimizer (params = params, f = loss_params, **optimizer_args)
+
+    return history, opti_steps
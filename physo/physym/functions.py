@@ -151,6 +151,30 @@ OP_POWER_VALUE_DICT = {
      "inv"  : -1,
 }
 
+# Dtypes of execution policy : data, free constants and computations are kept in the chosen dtype (float32 halves
+# memory traffic, float64 being more precise).
+DTYPES = {
+    "float32" : torch.float32,
+    "float64" : torch.float64,
+}
+
+def get_dtype (dtype):
+    """
+    Returns torch dtype of execution policy.
+    Parameters
+    ----------
+    dtype : str or torch.dtype or None
+        Name of dtype (see DTYPES) or torch dtype. None means no policy.
+    Returns
+    -------
+    dtype : torch.dtype or None
+    """
+    if dtype is None or isinstance(dtype, torch.dtype):
+        return dtype
+    if dtype not in DTYPES:
+        raise ValueError("Unknown dtype %s, available dtypes are %s."%(dtype, list(DTYPES.keys())))
+    return DTYPES[dtype]
+
 # Data conversion to perform before being able to use functions
 def data_conversion (data):
     if isinstance(data, float):
@@ -216,17 +240,19 @@ OPS_UNPROTECTED = [
 EPSILON = 0.001
 EXP_THRESHOLD = 80.
 INF = 1e6
+# Plateau values are python floats so protected functions keep the dtype of their inputs (float32 or float64, see
+# DTYPES) : numpy or torch float64 values would promote float32 computations to float64.
 
 def protected_div(x1, x2):
     #with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
     return torch.where(torch.abs(x2) > EPSILON, torch.divide(x1, x2), 1.)
 
-exp_plateau = np.exp(EXP_THRESHOLD)
+exp_plateau = float(np.exp(EXP_THRESHOLD))
 def protected_exp(x1):
     #with np.errstate(over='ignore'):
     return torch.where(x1 <= EXP_THRESHOLD, torch.exp(x1), exp_plateau)
 
-log_plateau = np.log(np.abs(EPSILON))
+log_plateau = float(np.log(np.abs(EPSILON)))
 def protected_log(x1):
     #with np.errstate(divide='ignore', invalid='ignore'):
     return torch.where(torch.abs(x1) >= EPSILON, torch.log(torch.abs(x1)), log_plateau)
@@ -243,22 +269,22 @@ def protected_inv(x1):
     # with np.errstate(divide='ignore', invalid='ignore'):
     return torch.where(torch.abs(x1) > EPSILON, 1. / x1, 0.)
 
-expneg_plateau = np.exp(--EXP_THRESHOLD)
+expneg_plateau = float(np.exp(--EXP_THRESHOLD))
 def protected_expneg(x1):
     # with np.errstate(over='ignore'):
     return torch.where(x1 >= -EXP_THRESHOLD, torch.exp(-x1), expneg_plateau)
 
-n2_plateau = np.square(INF)
+n2_plateau = float(np.square(INF))
 def protected_n2(x1):
     # with np.errstate(over='ignore'):
     return torch.where(torch.abs(x1) <= INF, torch.square(x1), n2_plateau)
 
-n3_plateau = np.power(INF, 3)
+n3_plateau = float(np.power(INF, 3))
 def protected_n3(x1):
     # with np.errstate(over='ignore'):
     return torch.where(torch.abs(x1) <= INF, torch.pow(x1, 3), torch.sign(x1)*n3_plateau)
 
-n4_plateau = np.power(INF, 4)
+n4_plateau = float(np.power(INF, 4))
 def protected_n4(x1):
     # with np.errstate(over='ignore'):
     return torch.where(torch.abs(x1) <= INF, torch.pow(x1, 4), n4_plateau)
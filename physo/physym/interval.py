@@ -0,0 +1,334 @@
+import math
+import numpy as np
+import torch as torch
+
+from physo.physym import token as Tok
+from physo.physym import functions as Func
+
+# ------------------------------------------------------------------------------------------------------------------
+# ----------------------------------------------- INTERVAL RULES ---------------------------------------------------
+# ------------------------------------------------------------------------------------------------------------------
+# Interval rules propagate bounds [lo, hi] of the non-NaN values a node can take on the whole input domain.
+# A rule takes bounds of the operands (numpy.array of shape (?,) of float) and returns (lo, hi, is_undefined, is_const)
+# with is_undefined : are all values certainly NaN and is_const : is the output certainly a constant (plateau of
+# protected operations) (numpy.array of shape (?,) of bool or None if never the case).
+# Bounds may be infinite, lo = +inf (resp. hi = -inf) meaning that all values are certainly +inf (resp. -inf).
+
+EPS = Func.EPSILON
+INF = Func.INF
+
+def _increasing (f):
+    # Rule of an increasing function defined everywhere
+    return lambda lo, hi: (f(lo), f(hi), None, None)
+
+def _decreasing (f):
+    # Rule of a decreasing function defined everywhere
+    return lambda lo, hi: (f(hi), f(lo), None, None)
+
+def _abs_bounds (lo, hi):
+    # Bounds of |x|
+    a_lo = np.where(lo >= 0, lo, np.where(hi <= 0, -hi, 0.))
+    a_hi = np.maximum(np.abs(lo), np.abs(hi))
+    return a_lo, a_hi
+
+def _even (f):
+    # Rule of f(|x|) with f increasing on positive values (eg. even function)
+    def rule (lo, hi):
+        a_lo, a_hi = _abs_bounds(lo, hi)
+        return f(a_lo), f(a_hi), None, None
+    return rule
+
+def interval_add (lo0, hi0, lo1, hi1):
+    return lo0 + lo1, hi0 + hi1, None, None
+
+def interval_sub (lo0, hi0, lo1, hi1):
+    return lo0 - hi1, hi0 - lo1, None, None
+
+def interval_mul (lo0, hi0, lo1, hi1):
+    # NaN products (0*inf) are not values of the product
+    products = np.stack([lo0*lo1, lo0*hi1, hi0*lo1, hi0*hi1])                   # (4, ?)
+    return np.fmin.reduce(products, axis=0), np.fmax.reduce(products, axis=0), None, None
+
+def interval_inv (lo, hi):
+    # 1/x is only bounded if x certainly does not change sign
+    is_sign_const = (lo > 0) | (hi < 0)
+    return np.where(is_sign_const, 1/hi, -np.inf), np.where(is_sign_const, 1/lo, np.inf), None, None
+
+def interval_div (lo0, hi0, lo1, hi1):
+    inv_lo, inv_hi, _, _ = interval_inv(lo1, hi1)
+    return interval_mul(lo0, hi0, inv_lo, inv_hi)
+
+def _periodic_bounds (lo, hi, f, max_at, min_at, period):
+    # Bounds of a periodic function in [-1, 1] reaching its max at max_at + k*period and its min at min_at + k*period
+    has_max = np.floor((hi - max_at)/period) >= np.ceil((lo - max_at)/period)
+    has_min = np.floor((hi - min_at)/period) >= np.ceil((lo - min_at)/period)
+    f_lo, f_hi = f(lo), f(hi)
+    res_lo = np.where(has_min, -1., np.minimum(f_lo, f_hi))
+    res_hi = np.where(has_max,  1., np.maximum(f_lo, f_hi))
+    # Infinite or too wide intervals
+    is_wide = ~np.isfinite(hi - lo) | (hi - lo >= period)
+    res_lo = np.where(is_wide, -1., res_lo)
+    res_hi = np.where(is_wide,  1., res_hi)
+    # sin(+/-inf) is NaN
+    is_undefined = (lo == np.inf) | (hi == -np.inf)
+    return res_lo, res_hi, is_undefined, None
+
+def interval_sin (lo, hi):
+    return _periodic_bounds(lo, hi, np.sin, max_at = np.pi/2, min_at = -np.pi/2, period = 2*np.pi)
+
+def interval_cos (lo, hi):
+    return _periodic_bounds(lo, hi, np.cos, max_at = 0., min_at = np.pi, period = 2*np.pi)
+
+def interval_tan (lo, hi):
+    # Bounded if there is no pole (pi/2 + k*pi) in interval
+    has_pole = ~np.isfinite(hi - lo) | (np.floor((hi - np.pi/2)/np.pi) >= np.ceil((lo - np.pi/2)/np.pi))
+    is_undefined = (lo == np.inf) | (hi == -np.inf)
+    return np.where(has_pole, -np.inf, np.tan(lo)), np.where(has_pole, np.inf, np.tan(hi)), is_undefined, None
+
+def interval_log (lo, hi):
+    # NaN for negative values
+    return np.log(np.maximum(lo, 0.)), np.log(hi), hi < 0, None
+
+def _root (f):
+    # Rule of a root function (NaN for negative values)
+    return lambda lo, hi: (f(np.maximum(lo, 0.)), f(hi), hi < 0, None)
+
+def interval_arccos (lo, hi):
+    # NaN outside [-1, 1]
+    return np.arccos(np.minimum(hi, 1.)), np.arccos(np.maximum(lo, -1.)), (lo > 1) | (hi < -1), None
+
+def interval_arcsin (lo, hi):
+    # NaN outside [-1, 1]
+    return np.arcsin(np.maximum(lo, -1.)), np.arcsin(np.minimum(hi, 1.)), (lo > 1) | (hi < -1), None
+
+def interval_protected_div (lo0, hi0, lo1, hi1):
+    # x1/x2 where |x2| > EPS, 1 elsewhere
+    is_div   = (lo1 > EPS) | (hi1 < -EPS)
+    is_plateau = (lo1 >= -EPS) & (hi1 <= EPS)
+    div_lo, div_hi, _, _ = interval_div(lo0, hi0, lo1, hi1)
+    res_lo = np.where(is_div, div_lo, np.where(is_plateau, 1., -np.inf))
+    res_hi = np.where(is_div, div_hi, np.where(is_plateau, 1.,  np.inf))
+    return res_lo, res_hi, None, is_plateau
+
+def interval_protected_exp (lo, hi):
+    # exp(x) where x <= EXP_THRESHOLD, exp(EXP_THRESHOLD) elsewhere
+    return (np.exp(np.minimum(lo, Func.EXP_THRESHOLD)), np.exp(np.minimum(hi, Func.EXP_THRESHOLD)), None,
+            lo > Func.EXP_THRESHOLD)
+
+def interval_protected_expneg (lo, hi):
+    # exp(-x) where x >= -EXP_THRESHOLD, exp(EXP_THRESHOLD) elsewhere
+    return (np.exp(-np.maximum(hi, -Func.EXP_THRESHOLD)), np.exp(-np.maximum(lo, -Func.EXP_THRESHOLD)), None,
+            hi < -Func.EXP_THRESHOLD)
+
+def interval_protected_log (lo, hi):
+    # log(|x|) where |x| >= EPS, log(EPS) elsewhere
+    a_lo, a_hi = _abs_bounds(lo, hi)
+    return np.log(np.maximum(a_lo, EPS)), np.log(np.maximum(a_hi, EPS)), None, a_hi < EPS
+
+def interval_protected_inv (lo, hi):
+    # 1/x where |x| > EPS, 0 elsewhere
+    inv_lo, inv_hi, _, _ = interval_inv(lo, hi)
+    is_inv     = (lo > EPS) | (hi < -EPS)
+    is_plateau = (lo >= -EPS) & (hi <= EPS)
+    res_lo = np.where(is_inv, inv_lo, np.where(lo < -EPS, -1/EPS, 0.))
+    res_hi = np.where(is_inv, inv_hi, np.where(hi >  EPS,  1/EPS, 0.))
+    return res_lo, res_hi, None, is_plateau
+
+def _protected_power (p, is_odd):
+    # x^p where |x| <= INF, (sign(x) if is_odd else 1)*INF^p elsewhere
+    def rule (lo, hi):
+        if is_odd:
+            res_lo, res_hi = np.power(np.clip(lo, -INF, INF), p), np.power(np.clip(hi, -INF, INF), p)
+        else:
+            a_lo, a_hi = _abs_bounds(lo, hi)
+            res_lo, res_hi = np.power(np.minimum(a_lo, INF), p), np.power(np.minimum(a_hi, INF), p)
+        return res_lo, res_hi, None, (lo > INF) | (hi < -INF)
+    return rule
+
+def _protected_arc (lo_valid, hi_valid):
+    # Bounds [lo_valid, hi_valid] where |x| < 1-EPS, sign(x)*INF elsewhere
+    def rule (lo, hi):
+        res_lo = np.where(lo <= -(1-EPS), -INF, lo_valid)
+        res_hi = np.where(hi >=  (1-EPS),  INF, hi_valid)
+        res_lo = np.where(lo >=  (1-EPS),  INF, res_lo)
+        res_hi = np.where(hi <= -(1-EPS), -INF, res_hi)
+        return res_lo, res_hi, None, (lo >= 1-EPS) | (hi <= -(1-EPS))
+    return rule
+
+def interval_protected_pow (lo0, hi0, lo1, hi1):
+    # Clipped at INF
+    return np.full_like(lo0, -np.inf), np.full_like(lo0, INF), None, None
+
+def interval_unknown (*args):
+    return np.full_like(args[0], -np.inf), np.full_like(args[0], np.inf), None, None
+
+_UNPROTECTED = Func.OPS_UNPROTECTED_DICT
+# Operation function -> (interval rule, is NaN propagated ie. is the output NaN if an operand is NaN)
+INTERVAL_RULES = {
+    # Unprotected operations
+    _UNPROTECTED["add"    ].function : (interval_add                         , True  ),
+    _UNPROTECTED["sub"    ].function : (interval_sub                         , True  ),
+    _UNPROTECTED["mul"    ].function : (interval_mul                         , True  ),
+    _UNPROTECTED["div"    ].function : (interval_div                         , True  ),
+    _UNPROTECTED["sin"    ].function : (interval_sin                         , True  ),
+    _UNPROTECTED["cos"    ].function : (interval_cos                         , True  ),
+    _UNPROTECTED["tan"    ].function : (interval_tan                         , True  ),
+    _UNPROTECTED["exp"    ].function : (_increasing(np.exp)                  , True  ),
+    _UNPROTECTED["log"    ].function : (interval_log                         , True  ),
+    _UNPROTECTED["sqrt"   ].function : (_root(np.sqrt)                       , True  ),
+    _UNPROTECTED["cbrt"   ].function : (_root(np.cbrt)                       , True  ),
+    _UNPROTECTED["n2"     ].function : (_even(np.square)                     , True  ),
+    _UNPROTECTED["neg"    ].function : (_decreasing(np.negative)             , True  ),
+    _UNPROTECTED["abs"    ].function : (_even(np.abs)                        , True  ),
+    _UNPROTECTED["inv"    ].function : (interval_inv                         , True  ),
+    _UNPROTECTED["tanh"   ].function : (_increasing(np.tanh)                 , True  ),
+    _UNPROTECTED["sinh"   ].function : (_increasing(np.sinh)                 , True  ),
+    _UNPROTECTED["cosh"   ].function : (_even(np.cosh)                       , True  ),
+    _UNPROTECTED["arctan" ].function : (_increasing(np.arctan)               , True  ),
+    _UNPROTECTED["arccos" ].function : (interval_arccos                      , True  ),
+    _UNPROTECTED["arcsin" ].function : (interval_arcsin                      , True  ),
+    _UNPROTECTED["erf"    ].function : (_increasing(np.vectorize(math.erf, otypes=[float])), True),
+    _UNPROTECTED["logabs" ].function : (_even(np.log)                        , True  ),
+    _UNPROTECTED["expneg" ].function : (_decreasing(lambda x: np.exp(-x))    , True  ),
+    _UNPROTECTED["n3"     ].function : (_increasing(lambda x: np.power(x, 3)), True  ),
+    _UNPROTECTED["n4"     ].function : (_even(lambda x: np.power(x, 4))      , True  ),
+    # Protected operations (NaN operands are mapped to plateaus by some of them, they are not considered propagated)
+    Func.protected_div    : (interval_protected_div                          , False ),
+    Func.protected_exp    : (interval_protected_exp                          , False ),
+    Func.protected_log    : (interval_protected_log                          , False ),
+    Func.protected_sqrt   : (_even(np.sqrt)                                  , False ),
+    Func.protected_cbrt   : (_even(np.cbrt)                                  , False ),
+    Func.protected_n2     : (_protected_power(2, is_odd=False)               , False ),
+    Func.protected_n3     : (_protected_power(3, is_odd=True )               , False ),
+    Func.protected_n4     : (_protected_power(4, is_odd=False)               , False ),
+    Func.protected_inv    : (interval_protected_inv                          , False ),
+    Func.protected_arcsin : (_protected_arc(-np.pi/2, np.pi/2)               , False ),
+    Func.protected_arccos : (_protected_arc(0., np.pi)                       , False ),
+    Func.protected_expneg : (interval_protected_expneg                       , False ),
+    Func.protected_torch_pow : (interval_protected_pow                       , False ),
+}
+
+# ------------------------------------------------------------------------------------------------------------------
+# --------------------------------------------- INTERVAL EVALUATION ------------------------------------------------
+# ------------------------------------------------------------------------------------------------------------------
+
+def ComputeIntervals (progs, X_lo, X_hi):
+    """
+    Computes bounds of the values of each program on the whole input domain (box of input variables values) using
+    interval arithmetic (see INTERVAL_RULES) in a vectorized bottom-up pass over the token arrays of the batch. Free
+    constants are unknown (unbounded), operations without interval rule give unbounded results.
+    Bounds are sound : computed intervals are widened outward to account for rounding errors.
+    Parameters
+    ----------
+    progs : vect_programs.VectPrograms
+        Programs in the batch.
+    X_lo : array_like of shape (n_dim,) of float
+        Min value of each input variable.
+    X_hi : array_like of shape (n_dim,) of float
+        Max value of each input variable.
+    Returns
+    -------
+    lo, hi, is_undefined, is_const : numpy.array of shape (batch_size,) of float,
+                                     numpy.array of shape (batch_size,) of float,
+                                     numpy.array of shape (batch_size,) of bool,
+                                     numpy.array of shape (batch_size,) of bool
+        Bounds of non-NaN values of programs, are programs certainly NaN everywhere and are programs certainly
+        constant.
+    """
+    lib = progs.library
+    X_lo = np.array(X_lo, dtype=float)                                                       # (n_dim,)
+    X_hi = np.array(X_hi, dtype=float)                                                       # (n_dim,)
+    tokens_idx   = progs.tokens.idx                                                          # (batch_size, max_time_step)
+    children_pos = np.clip(progs.tokens.children_pos, 0, progs.max_time_step - 1)            # (batch_size, max_time_step, MAX_NB_CHILDREN)
+    batch_size, max_time_step = tokens_idx.shape
+    coords = np.arange(batch_size)                                                           # (batch_size,)
+
+    lo           = np.full((batch_size, max_time_step), -np.inf)                             # (batch_size, max_time_step)
+    hi           = np.full((batch_size, max_time_step),  np.inf)                             # (batch_size, max_time_step)
+    is_undefined = np.full((batch_size, max_time_step), False)                               # (batch_size, max_time_step)
+    is_const     = np.full((batch_size, max_time_step), False)                               # (batch_size, max_time_step)
+
+    with np.errstate(all='ignore'):
+        # Children being after their parent, iterating from last to first token
+        for t in range (max_time_step-1, -1, -1):
+            for tok_idx in np.unique(tokens_idx[:, t]):
+                token = lib.lib_tokens[tok_idx]
+                b = coords[tokens_idx[:, t] == tok_idx]                                      # (?,)
+                # Terminal tokens
+                if token.arity == 0:
+                    if token.var_type == Tok.VAR_TYPE_INPUT_VAR:
+                        lo[b, t], hi[b, t] = X_lo[token.var_id], X_hi[token.var_id]
+                    elif token.var_type == Tok.VAR_TYPE_FIXED_CONST:
+                        lo[b, t] = hi[b, t] = float(token.fixed_const)
+                        is_const[b, t] = True
+                    # Free constants, dummies etc. are unknown
+                    continue
+                # Operations
+                children = [children_pos[b, t, i] for i in range (token.arity)]
+                args = []
+                for c in children:
+                    args += [lo[b, c], hi[b, c]]
+                rule, is_nan_propagated = INTERVAL_RULES.get(token.function, (interval_unknown, False))
+                res_lo, res_hi, res_undefined, res_const = rule(*args)
+                # NaN bounds (eg. inf - inf) are unknown, finite bounds are widened outward
+                res_lo = np.where(np.isnan(res_lo), -np.inf, res_lo)
+                res_hi = np.where(np.isnan(res_hi),  np.inf, res_hi)
+                res_lo = np.where(np.isfinite(res_lo), np.nextafter(res_lo, -np.inf), res_lo)
+                res_hi = np.where(np.isfinite(res_hi), np.nextafter(res_hi,  np.inf), res_hi)
+                # Undefined operands
+                children_undefined = np.any([is_undefined[b, c] for c in children], axis=0)  # (?,)
+                res_undefined = np.full(len(b), False) if res_undefined is None else res_undefined
+                if is_nan_propagated:
+                    res_undefined = res_undefined | children_undefined
+                # Bounds and plateaus computed from undefined operands are meaningless
+                res_const = np.full(len(b), False) if res_const is None else res_const
+                res_const = res_const & ~children_undefined
+                res_lo = np.where(res_undefined | children_undefined, -np.inf, res_lo)
+                res_hi = np.where(res_undefined | children_undefined,  np.inf, res_hi)
+                # Constants : all operands are constants or plateau is reached
+                children_const = np.all([is_const[b, c] for c in children], axis=0)          # (?,)
+                is_const     [b, t] = children_const | res_const
+                is_undefined [b, t] = res_undefined
+                lo           [b, t] = res_lo
+                hi           [b, t] = res_hi
+
+    return lo[:, 0], hi[:, 0], is_undefined[:, 0], is_const[:, 0]
+
+def IntervalPrescreen (progs, X, mask = None, zero_out_constant = False):
+    """
+    Flags programs that certainly cannot fit data whatever their free constants values using interval arithmetic
+    (see ComputeIntervals) : programs that are NaN everywhere, infinite everywhere and optionally constant despite
+    containing input variables.
+    Parameters
+    ----------
+    progs : vect_programs.VectPrograms
+        Programs in the batch.
+    X : torch.tensor of shape (n_dim, ?,) of float
+        Values of the input variables of the problem with n_dim = nb of input variables.
+    mask : array_like of shape (batch_size,) of bool or None
+        Only programs where mask is True are screened, others are not flagged. By default, all programs are screened.
+    zero_out_constant : bool
+        Should programs that are certainly constant despite containing input variables be flagged ?
+    Returns
+    -------
+    is_flagged : numpy.array of shape (batch_size,) of bool
+        Is program flagged.
+    """
+    if mask is None:
+        mask = np.full(shape=progs.batch_size, fill_value=True, dtype=bool)                 # (batch_size,)
+    mask = np.array(mask, dtype=bool)                                                        # (batch_size,)
+    with torch.no_grad():
+        X_lo = torch.amin(X, dim=1).cpu().numpy()                                            # (n_dim,)
+        X_hi = torch.amax(X, dim=1).cpu().numpy()                                            # (n_dim,)
+    # Input variables containing NaNs are unbounded
+    X_lo = np.where(np.isnan(X_lo), -np.inf, X_lo)                                           # (n_dim,)
+    X_hi = np.where(np.isnan(X_hi),  np.inf, X_hi)                                           # (n_dim,)
+    lo, hi, is_undefined, is_const = ComputeIntervals(progs = progs, X_lo = X_lo, X_hi = X_hi)
+    is_infinite = (lo == np.inf) | (hi == -np.inf)                                           # (batch_size,)
+    is_flagged  = is_undefined | is_infinite                                                 # (batch_size,)
+    if zero_out_constant:
+        in_prog       = np.arange(progs.max_time_step) < progs.n_lengths[:, np.newaxis]      # (batch_size, max_time_step)
+        has_input_var = ((progs.tokens.var_type == Tok.VAR_TYPE_INPUT_VAR) & in_prog).any(axis=1)  # (batch_size,)
+        is_flagged = is_flagged | (is_const & has_input_var)                                 # (batch_size,)
+    is_flagged = is_flagged & mask & progs.is_complete                                       # (batch_size,)
+    return is_flagged
@@ -6,6 +6,14 @@ from abc import ABC, abstractmethod
 from physo.physym import token as Tok
 from physo.physym import functions as Func
 
+# Kinds of priors (used by PriorCollection to only evaluate priors depending on programs at each step):
+# Prior is the same for all programs at all steps
+PRIOR_KIND_STATIC  = "static"
+# Prior is the same for all programs but depends on the step
+PRIOR_KIND_STEP    = "step"
+# Prior depends on the state of programs
+PRIOR_KIND_DYNAMIC = "dynamic"
+
 # ----------------------------------------------------------------------------------------------------------------------
 # ----------------------------------------------------- PRIOR CLASS ----------------------------------------------------
 # ----------------------------------------------------------------------------------------------------------------------
@@ -15,6 +23,10 @@ class Prior (ABC):
     """
     Abstract prior.
     """
+    # Kind of prior (PRIOR_KIND_STATIC, PRIOR_KIND_STEP or PRIOR_KIND_DYNAMIC), priors that are not dynamic must
+    # implement get_step_mask_prob.
+    kind = PRIOR_KIND_DYNAMIC
+
     def __init__(self, library, programs):
         """
         Parameters
@@ -44,6 +56,20 @@ class Prior (ABC):
         """
         raise NotImplementedError
 
+    def get_step_mask_prob(self, step):
+        """
+        Returns probabilities of priors for each choosable token in the library at step for priors which are the same
+        for all programs (ie. static or step priors).
+        Parameters
+        ----------
+        step : int
+            Step at which prior is evaluated.
+        Returns
+        -------
+        mask_probabilities : numpy.array of shape (self.lib.n_choices,) of float
+        """
+        raise NotImplementedError
+
 # ----------------------------------------------------------------------------------------------------------------------
 # ------------------------------------------ INDIVIDUAL PRIORS IMPLEMENTATION ------------------------------------------
 # ----------------------------------------------------------------------------------------------------------------------
@@ -55,6 +81,7 @@ class UniformArityPrior (Prior):
     This prior encourages tokens with an arity that is under-represented and discourages tokens with an arity that
     is over-represented by normalising token probabilities by the number of tokens having its arity.
     """
+    kind = PRIOR_KIND_STATIC
 
     def __init__(self, library, programs):
         """
@@ -69,14 +96,17 @@ class UniformArityPrior (Prior):
         count_arities = np.array ([ (self.lib.get_choosable_prop("arity") == arity).sum() for arity in range (Tok.MAX_ARITY + 1) ])
         # Uniform mask over arities ie. inverse of total number of tokens per arity for each choosable token arity
         # Mask for one prog
-        individual_mask = 1 / count_arities[self.lib.get_choosable_prop("arity")].astype(float)
+        self.individual_mask = 1 / count_arities[self.lib.get_choosable_prop("arity")].astype(float)
         # Mask is the same for every program -> tile
         self.reset_mask_prob()
-        self.mask_prob[:,:] = np.tile(individual_mask, (self.progs.batch_size, 1))
+        self.mask_prob[:,:] = np.tile(self.individual_mask, (self.progs.batch_size, 1))
 
     def __call__(self):
         return self.mask_prob
 
+    def get_step_mask_prob(self, step):
+        return self.individual_mask
+
     def __repr__(self):
         return "UniformArityPrior"
 
@@ -407,6 +437,7 @@ class NoUselessInversePrior(Prior):
         if len(self.effectors) == 0:
             # warnings.warn("No (func, inverse func) couples detected, no prior from %s" % (self))
             self.active = False
+            self.kind   = PRIOR_KIND_STATIC
         # Using RelationshipConstraintPrior prior
         # Enforcing that [targets] cannot be the [relationship] of [effectors]
         else:
@@ -422,6 +453,10 @@ class NoUselessInversePrior(Prior):
             mask_prob = self.get_default_mask_prob()  # (batch_size, lib.n_choices)
         return mask_prob
 
+    def get_step_mask_prob(self, step):
+        # Only used when prior is inactive (static)
+        return np.ones(shape=self.lib.n_choices, dtype=float)                                                   # (n_choices,)
+
     def __repr__(self):
         repr = "NoUselessInversePrior (%s can not be %s of %s)" \
                % (self.targets, self.relationship, self.effectors)
@@ -473,13 +508,9 @@ class NestedFunctions (Prior):
 
         # ---- ANCESTOR RELATIONSHIP PARAMETERS ----
 
-        # Max number of ancestors
-        self.max_n_ancestors = self.progs.max_time_step
-
-        # Method of programs returning ancestors of token at step (and filling non-existing relatives with
-        # self.lib.invalid_idx).
-        self.get_ancestors_idx = lambda step: self.progs.get_ancestors_idx_of_step (
-            step, no_ancestor_idx_filler = self.lib.invalid_idx)               # Returns (batch_size, max_n_ancestors)
+        # Running counter of ancestors that are part of [functions] maintained by programs (see
+        # vect_programs.VectPrograms.add_ancestors_counter).
+        self.counter_id = self.progs.add_ancestors_counter(self.functions)
 
         # ---- PRIOR TEMPLATES ----
 
@@ -495,14 +526,8 @@ class NestedFunctions (Prior):
 
     def __call__(self):
 
-        # Getting idx in the lib of ancestors
-        ancestors_idx = self.get_ancestors_idx(step=self.progs.curr_step)                                            # (batch_size, max_n_ancestors)
-
-        # Counts of ancestors in a complete lib (including dummy, invalid etc.) size vector for each prog of batch
-        counts_ancestors = self.progs.count_tokens_idx(ancestors_idx)                                                # (batch_size, lib.n_library)
-
-        # Number of ancestors that are part of [functions] for each prog in batch
-        nesting_level = counts_ancestors[:, self.functions].sum(axis=1)                                              # (batch_size,)
+        # Number of ancestors of current dummies that are part of [functions] for each prog in batch
+        nesting_level = self.progs.ancestors_counters[self.counter_id][:, self.progs.curr_step]                      # (batch_size,)
 
         # mask : is prog allowed to continue with tokens of type [functions]
         mask_allow = nesting_level < self.max_nesting                                                                # (batch_size,)
@@ -556,6 +581,7 @@ class NestedTrigonometryPrior(Prior):
         if len(self.trigonometric_functions) == 0:
             warnings.warn("No trigonometric functions detected, (%s), this prior will be ignored." % (self))
             self.active = False
+            self.kind   = PRIOR_KIND_STATIC
         # Using NestedFunctions prior
         else:
             self.prior = NestedFunctions (library = self.lib, programs = self.progs,
@@ -569,6 +595,10 @@ class NestedTrigonometryPrior(Prior):
             mask_prob = self.get_default_mask_prob()  # (batch_size, lib.n_choices)
         return mask_prob
 
+    def get_step_mask_prob(self, step):
+        # Only used when prior is inactive (static)
+        return np.ones(shape=self.lib.n_choices, dtype=float)                                                   # (n_choices,)
+
     def __repr__(self):
         if self.max_nesting == 1:
             repr = "NestedTrigonometryPrior (tokens = %s, nesting forbidden)" \
@@ -623,9 +653,9 @@ class OccurrencesPrior (Prior):
         self.max = max                                                                                           # (n_constraints,)
 
     def __call__(self):
-        # Recounting at each step allows for the use of this prior even if it was not used before
-        # For each prog in batch, number of occurrences of each target
-        counts = np.equal.outer(self.progs.tokens.idx, self.targets,).sum(axis=1)                               # (batch_size, n_constraints,)
+        # For each prog in batch, number of occurrences of each target (counted by programs at each append, allowing
+        # for the use of this prior even if it was not used before)
+        counts = self.progs.n_occurrences[:, self.targets]                                                      # (batch_size, n_constraints,)
         # For each prog in batch, for each target : is target allowed at next step ?
         is_target_allowed = np.less(counts, self.max)                                                           # (batch_size, n_constraints,)
         # mask : for each prog in batch, for each token in choosable tokens, is token allowed
@@ -640,6 +670,8 @@ class SymbolicPrior (Prior):
     """
     Enforces that programs must be exactly like [expression].
     """
+    kind = PRIOR_KIND_STEP
+
     def __init__(self, library, programs, expression):
         """
         Parameters
@@ -692,6 +724,9 @@ class SymbolicPrior (Prior):
         mask_prob = np.tile(self.step_mask[self.progs.curr_step], (self.progs.batch_size,1))                    # (batch_size, n_choices,)
         return mask_prob
 
+    def get_step_mask_prob(self, step):
+        return self.step_mask[step]                                                                             # (n_choices,)
+
     def __repr__(self):
         return "SymbolicPrior (programs must be like %s)"%(self.expression_str)
 
@@ -875,6 +910,8 @@ def make_PriorCollection (library, programs, priors_config,):
 class PriorCollection:
     """
     Collection of prior.Prior, returns value of element-wise multiplication of constituent priors.
+    Priors that are the same for all programs (static or step priors, see Prior.kind) are precomputed into a single
+    table of shape (max_time_step, n_choices) so only dynamic priors are evaluated at each step.
     """
     def __init__(self, library, programs,):
         """
@@ -888,7 +925,10 @@ class PriorCollection:
         self.priors    = []
         self.lib       = library
         self.progs     = programs
-        self.init_prob = np.ones( (self.progs.batch_size, self.lib.n_choices), dtype = float)
+        # Element-wise product of static and step priors at each step
+        self.step_table     = np.ones( (self.progs.max_time_step, self.lib.n_choices), dtype = float)  # (max_time_step, n_choices)
+        # Priors that must be evaluated at each step
+        self.dynamic_priors = []
 
     def set_priors (self, priors):
         """
@@ -899,17 +939,32 @@ class PriorCollection:
         """
         for prior in priors:
             self.priors.append(prior)
+            if prior.kind == PRIOR_KIND_STATIC:
+                self.step_table *= prior.get_step_mask_prob(step = 0)                                    # (n_choices,)
+            elif prior.kind == PRIOR_KIND_STEP:
+                for step in range (self.progs.max_time_step):
+                    self.step_table[step] *= prior.get_step_mask_prob(step = step)                       # (n_choices,)
+            else:
+                self.dynamic_priors.append(prior)
 
-    def __call__(self):
+    def __call__(self, out = None):
         """
         Returns probabilities of priors for each choosable token in the library.
+        Parameters
+        ----------
+        out : numpy.array of shape (self.progs.batch_size, self.lib.n_choices) of float or None, optional
+            Array in which probabilities are written and which is returned, so callers can reuse the same buffer at
+            each step (its content being overwritten at each call). By default, a new array is returned.
         Returns
         -------
         mask_probabilities : numpy.array of shape (self.progs.batch_size, self.lib.n_choices) of float
         """
-        res = self.init_prob
-        for prior in self.priors:
-            res = np.multiply(res, prior())
+        if out is None:
+            out = np.empty((self.progs.batch_size, self.lib.n_choices), dtype = float)                   # (batch_size, n_choices)
+        res = out
+        res[:] = self.step_table[self.progs.curr_step]                                                    # (batch_size, n_choices)
+        for prior in self.dynamic_priors:
+            np.multiply(res, prior(), out = res)                                                          # (batch_size, n_choices)
         return res
 
     def __repr__(self):
@@ -3,6 +3,7 @@ import numpy as np
 import copy as copy  # for Cursor
 import sympy as sympy
 import pickle
+import torch
 
 # For tree image (optional)
 import matplotlib.pyplot as plt
@@ -12,6 +13,7 @@ import io
 from physo.physym import token as Tok
 from physo.physym import execute as Exec
 from physo.physym import free_const
+from physo.physym import dataset
 
 # Fig params
 try:
@@ -24,6 +26,24 @@ except:
 plt.rc('font', size=16)
 
 
+# Should programs be executed using their cached compiled version (see execute.CompileProgram) ?
+USE_COMPILED_EXECUTION = True
+
+# Should free constants appearing linearly in programs (see Program.get_linear_free_consts) be solved in closed form
+# during free constant optimization ? If so, this overrides the optimizer configured in free_const_opti_args for these
+# constants (only when using the MSE loss), the configured method only being used to optimize the remaining constants
+# (with linear ones being solved at each of its evaluations). Disabled by default, optimized values (and the number of
+# optimization steps) then differing from those of the configured method.
+USE_CLOSED_FORM_LINEAR_FREE_CONSTS = False
+
+# Should spe free constants of programs optimized on multiple datasets be optimized as independent problems (one per
+# realization, solved all at once) at each evaluation of the loss of the optimization of class free constants rather
+# than jointly with them (see Program.optimize_constants_per_realization) ? Closed form solve of linear free constants
+# takes precedence.
+USE_PER_REALIZATION_FREE_CONSTS_OPTI = False
+# Max number of steps of spe free constants optimization done at each evaluation of the loss of class free constants
+PER_REALIZATION_OPTI_INNER_N_STEPS = 3
+
 # Pickable default identity wrapper
 def DEFAULT_WRAPPER (func, X):
         return func(X)
@@ -256,30 +276,33 @@ class Program:
         y : torch.tensor of shape (?,) of float
             Result of computation.
         """
-        # If n_samples_per_dataset is given, we need to flatten the free constants to match the number of samples
-        # No need to flatten if there are no spe free constants -> this could be faster
+        # If n_samples_per_dataset is given, spe free constants values of each sample's realization are gathered
+        # (class free constants being the same for all realizations are broadcast as is).
+        # No need to gather if there are no spe free constants.
         # One would probably not pass n_samples_per_dataset if there are no spe free constants but physo.SR will
         # as SR problems are treated as Class SR problems of one realization.
         if self.free_consts.n_spe_free_const == 0:
             class_vals = self.free_consts.class_values [0]                              # (n_class_free_const,)
             spe_vals   = None
         elif n_samples_per_dataset is not None :
-            class_const_flatten, spe_const_flatten = self.free_consts.flatten_like_data(n_samples_per_dataset=n_samples_per_dataset)
-            # class_const_flatten                                                       # (1, n_class_free_const, ?)
-            # spe_const_flatten                                                         # (1, n_spe_free_const,   ?)
-            class_vals = class_const_flatten [0]                                        # (n_class_free_const, ?)
-            spe_vals   = spe_const_flatten   [0]                                        # (n_spe_free_const,   ?)
+            real_idx   = dataset.realization_index(n_samples_per_dataset, device=self.free_consts.spe_values.device)  # (?,)
+            class_vals = self.free_consts.class_values [0]                              # (n_class_free_const,)
+            spe_vals   = self.free_consts.spe_values   [0][:, real_idx]                 # (n_spe_free_const, ?)
         else:
             # self.free_consts.class_values                                             # (1, n_class_free_const,)
             # self.free_consts.spe_values                                               # (1, n_spe_free_const, n_realizations,)
             class_vals = self.free_consts.class_values[0]                               # (n_class_free_const,)
             spe_vals   = self.free_consts.spe_values  [0,:,i_realization]               # (n_spe_free_const,)
 
-        y = Exec.ExecuteProgram(input_var_data         = X,
-                                program_tokens         = self.tokens,
-                                class_free_consts_vals = class_vals,
-                                spe_free_consts_vals   = spe_vals,
-                                )
+        if USE_COMPILED_EXECUTION:
+            execute_program = Exec.ExecuteCompiledProgram
+        else:
+            execute_program = Exec.ExecuteProgram
+        y = execute_program(input_var_data         = X,
+                            program_tokens         = self.tokens,
+                            class_free_consts_vals = class_vals,
+                            spe_free_consts_vals   = spe_vals,
+                            )
         return y
 
     def execute(self, X, i_realization = 0, n_samples_per_dataset = None):
@@ -305,6 +328,251 @@ class Program:
         y = self.candidate_wrapper(lambda X: self.execute_wo_wrapper(X=X, i_realization=i_realization, n_samples_per_dataset=n_samples_per_dataset), X)
         return y
 
+    def execute_starts(self, X, class_values, spe_values, i_realization = 0, n_samples_per_dataset = None):
+        """
+        Executes program (without candidate wrapper) on X for n_rows sets of free constants values at once (eg. starts
+        of multi-start optimization) : X is tiled n_rows times and each set of values is given as values for each data
+        point of its tile, so that the program is executed only once.
+        Parameters
+        ----------
+        X : torch.tensor of shape (n_dim, ?,) of float
+            Values of the input variables of the problem with n_dim = nb of input variables, ? = number of samples.
+        class_values : torch.tensor of shape (n_rows, n_class_free_const,) of float
+            Class free constants values of each set.
+        spe_values : torch.tensor of shape (n_rows, n_spe_free_const, n_realizations,) of float
+            Spe free constants values of each set.
+        i_realization : int, optional
+            Index of realization to use for dataset specific free constants (0 by default).
+        n_samples_per_dataset : array_like of shape (n_realizations,) of int or None, optional
+            Overrides i_realization if given. See Program.execute for details.
+        Returns
+        -------
+        y : torch.tensor of shape (n_rows, ?,) of float
+            Result of computation for each set of free constants values.
+        """
+        (n_rows, n_class_free_const,) = class_values.shape
+        n_spe_free_const              = spe_values.shape[1]
+        n_samples                     = X.shape[1]
+        # Values of each set for each data point of its tile
+        class_vals = class_values.T[:, :, None].expand(-1, -1, n_samples).reshape(n_class_free_const, n_rows*n_samples) # (n_class_free_const, n_rows*?)
+        if n_spe_free_const == 0:
+            spe_vals = None
+        else:
+            if n_samples_per_dataset is not None:
+                real_idx = dataset.realization_index(n_samples_per_dataset, device=spe_values.device)  # (?,)
+                spe_vals = spe_values[:, :, real_idx]                                     # (n_rows, n_spe_free_const, ?)
+            else:
+                spe_vals = spe_values[:, :, i_realization, None].expand(-1, -1, n_samples) # (n_rows, n_spe_free_const, ?)
+            spe_vals = spe_vals.transpose(0, 1).reshape(n_spe_free_const, n_rows*n_samples)  # (n_spe_free_const, n_rows*?)
+
+        if USE_COMPILED_EXECUTION:
+            execute_program = Exec.ExecuteCompiledProgram
+        else:
+            execute_program = Exec.ExecuteProgram
+        y = execute_program(input_var_data         = X.repeat(1, n_rows),
+                            program_tokens         = self.tokens,
+                            class_free_consts_vals = class_vals,
+                            spe_free_consts_vals   = spe_vals,
+                            )                                                             # (n_rows*?,) or ()
+        y = torch.as_tensor(y).expand(n_rows*n_samples).reshape(n_rows, n_samples)        # (n_rows, ?,)
+        return y
+
+    def evaluate(self, X, i_realization = 0, n_samples_per_dataset = None):
+        """
+        Executes program on X in inference mode (see torch.inference_mode) : no autograd graph is recorded even if free
+        constants require gradients (eg. after their optimization). To use for reward, duplicates or logging
+        evaluations, Program.execute being kept for free constants optimization.
+        Parameters
+        ----------
+        X : torch.tensor of shape (n_dim, ?,) of float
+            Values of the input variables of the problem with n_dim = nb of input variables, ? = number of samples.
+        i_realization : int, optional
+            Index of realization to use for dataset specific free constants (0 by default).
+        n_samples_per_dataset : array_like of shape (n_realizations,) of int or None, optional
+            Overrides i_realization if given. See Program.execute for details.
+        Returns
+        -------
+        y : torch.tensor of shape (?,) of float
+            Result of computation (inference tensor that can not be used in autograd).
+        """
+        with torch.inference_mode():
+            y = self.execute(X = X, i_realization = i_realization, n_samples_per_dataset = n_samples_per_dataset)
+        return y
+
+    def get_subtree_end (self, pos):
+        """
+        Returns position right after the last token of the subtree starting at pos (subtrees being contiguous in
+        prefix notation).
+        Parameters
+        ----------
+        pos : int
+            Position of the root token of the subtree.
+        Returns
+        -------
+        end : int
+        """
+        n_pending = 1
+        while n_pending > 0:
+            n_pending += self.tokens[pos].arity - 1
+            pos += 1
+        return pos
+
+    def get_linear_free_consts (self):
+        """
+        Static analysis finding free constants appearing linearly in program ie. at the root additive chain of the tree
+        (made of add, sub, neg tokens), either as an additive term on their own (offset) or as a multiplicative scalar
+        of a term (mul of the constant and a sub-tree), without appearing anywhere else in the program.
+        Program can then be written y = sum_j sign_j * coef_j * h_j (X) + sum_k sign_k * g_k (X) where coef_j are linear
+        free constants, h_j (X) their sub-trees (or 1 for offsets) and g_k (X) the remaining terms.
+        Returns
+        -------
+        linear_structure : dict or None
+            None if there are no linear free constants, otherwise dict with keys:
+                linear_terms : list of (int, int, int, int, int)
+                    (var_type, var_id, sign, start, end) for each linear free constant, start:end being the position
+                    range of its sub-tree h_j in program (start = end for offsets).
+                other_terms : list of (int, int, int)
+                    (sign, start, end) for each remaining term, start:end being its position range in program.
+        """
+        free_const_types = (Tok.VAR_TYPE_CLASS_FREE_CONST, Tok.VAR_TYPE_SPE_FREE_CONST)
+        # Number of occurrences of each free constant
+        counts = {}
+        for tok in self.tokens:
+            if tok.var_type in free_const_types:
+                counts[(tok.var_type, tok.var_id)] = counts.get((tok.var_type, tok.var_id), 0) + 1
+        is_linear_const = lambda tok: (tok.var_type in free_const_types) and counts[(tok.var_type, tok.var_id)] == 1
+
+        linear_terms = []
+        other_terms  = []
+        # Flattening root additive chain (pending: (position, sign))
+        pending = [(0, 1)]
+        while len(pending) > 0:
+            pos, sign = pending.pop()
+            tok = self.tokens[pos]
+            end = self.get_subtree_end(pos)
+            if tok.name in ("add", "sub"):
+                pos_right = self.get_subtree_end(pos + 1)
+                pending.append((pos + 1, sign))
+                pending.append((pos_right, sign if tok.name == "add" else -sign))
+            elif tok.name == "neg":
+                pending.append((pos + 1, -sign))
+            # Offset
+            elif is_linear_const(tok):
+                linear_terms.append((tok.var_type, tok.var_id, sign, end, end))
+            # Multiplicative scalar of a sub-tree
+            elif tok.name == "mul" and is_linear_const(self.tokens[pos + 1]):
+                const = self.tokens[pos + 1]
+                linear_terms.append((const.var_type, const.var_id, sign, pos + 2, end))
+            elif tok.name == "mul" and is_linear_const(self.tokens[end - 1]) and self.get_subtree_end(pos + 1) == end - 1:
+                const = self.tokens[end - 1]
+                linear_terms.append((const.var_type, const.var_id, sign, pos + 1, end - 1))
+            else:
+                other_terms.append((sign, pos, end))
+
+        if len(linear_terms) == 0:
+            return None
+        linear_structure = {"linear_terms" : linear_terms, "other_terms" : other_terms}
+        return linear_structure
+
+    def optimize_linear_constants(self, X, y_target, y_weights = 1., i_realization = 0, n_samples_per_dataset = None, args_opti = None, freeze_class_free_consts = False):
+        """
+        Optimizes free constants of program, free constants appearing linearly (see get_linear_free_consts) being
+        solved in closed form (weighted least squares) and remaining free constants being iteratively optimized with
+        linear ones solved at each evaluation (variable projection).
+        See optimize_constants for arguments.
+        Returns
+        -------
+        history : numpy.array or None
+            Loss history, None if program has no linear free constants that can be solved in closed form.
+        """
+        if args_opti is None:
+            args_opti = free_const.DEFAULT_OPTI_ARGS
+        linear_structure = self.get_linear_free_consts()
+        # Closed form solve is only valid for MSE loss on unwrapped programs
+        if linear_structure is None or args_opti["loss"] != "MSE" or self.candidate_wrapper is not DEFAULT_WRAPPER:
+            return None
+        linear_terms = linear_structure["linear_terms"]
+        other_terms  = linear_structure["other_terms"]
+        free_const_types = (Tok.VAR_TYPE_CLASS_FREE_CONST, Tok.VAR_TYPE_SPE_FREE_CONST)
+        if freeze_class_free_consts and any([var_type == Tok.VAR_TYPE_CLASS_FREE_CONST for var_type, _, _, _, _ in linear_terms]):
+            return None
+
+        # Sub-programs for sub-trees (sharing free constants table with this program)
+        make_sub_prog = lambda start, end: Program(tokens=self.tokens[start:end], library=self.library,
+                                                   free_consts=self.free_consts)
+        linear_progs = [make_sub_prog(start, end) if start < end else None for _, _, _, start, end in linear_terms]
+        other_progs  = [make_sub_prog(start, end) for _, start, end in other_terms]
+
+        # Solving in free constants' dtype (data might be in lower precision)
+        dtype = self.free_consts.class_values.dtype
+        zeros = torch.zeros_like(X[0], dtype=dtype)                                            # (?,)
+        ones  = torch.ones_like (X[0], dtype=dtype)                                            # (?,)
+
+        # Realizations of data points
+        if n_samples_per_dataset is None:
+            realizations = [i_realization]
+            real_masks   = [ones]                                                              # (n_realizations, ?,)
+        else:
+            realizations = list(range(len(n_samples_per_dataset)))
+            real_idx     = dataset.realization_index(n_samples_per_dataset, device=X.device)  # (?,)
+            real_masks   = [(real_idx == r).to(dtype) for r in realizations]                   # (n_realizations, ?,)
+
+        # Design matrix columns and their corresponding free constants (var_type, var_id, i_realization or None)
+        def linear_model():
+            execute = lambda prog: prog.execute_wo_wrapper(X, i_realization=i_realization,
+                                                           n_samples_per_dataset=n_samples_per_dataset) \
+                                   + zeros                                                     # (?,)
+            cols   = []
+            coords = []
+            for (var_type, var_id, sign, _, _), prog in zip(linear_terms, linear_progs):
+                h = sign * (execute(prog) if prog is not None else ones)                       # (?,)
+                if var_type == Tok.VAR_TYPE_CLASS_FREE_CONST:
+                    cols  .append(h)
+                    coords.append((var_type, var_id, None))
+                else:
+                    for r, mask in zip(realizations, real_masks):
+                        cols  .append(h*mask)
+                        coords.append((var_type, var_id, r))
+            A = torch.stack(cols, dim=-1)                                                      # (?, n_coefs,)
+            y_other = zeros                                                                    # (?,)
+            for (sign, _, _), prog in zip(other_terms, other_progs):
+                y_other = y_other + sign * execute(prog)
+            coefs = free_const.solve_linear_least_squares(A = A, y_target = y_target - y_other, y_weights = y_weights)
+            y_pred = A @ coefs + y_other                                                       # (?,)
+            return y_pred, coefs, coords
+
+        # Iterative optimization of remaining free constants
+        linear_consts = [(var_type, var_id) for var_type, var_id, _, _, _ in linear_terms]
+        n_remaining   = len([tok for tok in self.tokens if tok.var_type in free_const_types
+                             and (tok.var_type, tok.var_id) not in linear_consts])
+        loss = free_const.LOSSES[args_opti["loss"]]
+        if n_remaining > 0:
+            func_params = lambda params: linear_model()[0]
+            params = [self.free_consts.spe_values] if freeze_class_free_consts else \
+                     [self.free_consts.class_values, self.free_consts.spe_values]
+            history = free_const.optimize_free_const (  func      = func_params,
+                                                        params    = params,
+                                                        y_target  = y_target,
+                                                        y_weights = y_weights,
+                                                        **args_opti)
+        else:
+            history = None
+
+        # Closed form solve of linear free constants
+        with torch.no_grad():
+            y_pred, coefs, coords = linear_model()
+            if torch.isfinite(coefs).all():
+                for coef, (var_type, var_id, r) in zip(coefs, coords):
+                    if var_type == Tok.VAR_TYPE_CLASS_FREE_CONST:
+                        self.free_consts.class_values [0, var_id]    = coef
+                    else:
+                        self.free_consts.spe_values   [0, var_id, r] = coef
+            if history is None:
+                history = np.array([loss(func = lambda params: y_pred, params = None, y_target = y_target,
+                                         y_weights = y_weights).item()])
+
+        return history
+
     def optimize_constants(self, X, y_target, y_weights = 1., i_realization = 0, n_samples_per_dataset = None, args_opti = None, freeze_class_free_consts = False):
         """
         Optimizes free constants of program.
@@ -326,7 +594,8 @@ class Program:
             are for the first dataset, the next 100 for the second and the last 110 for the third.
         args_opti : dict or None, optional
             Arguments to pass to free_const.optimize_free_const. By default, free_const.DEFAULT_OPTI_ARGS
-            arguments are used.
+            arguments are used. With multi-start (n_starts > 1), all starts are executed at once (see
+            Program.execute_starts).
         freeze_class_free_consts : bool, optional
             If True, class free constants are not optimized.
         """
@@ -334,22 +603,171 @@ class Program:
             args_opti = free_const.DEFAULT_OPTI_ARGS
         func_params = lambda params: self.__call__(X, i_realization=i_realization, n_samples_per_dataset=n_samples_per_dataset)
 
-        if freeze_class_free_consts:
-            history = free_const.optimize_free_const (  func      = func_params,
-                                                        params    = [self.free_consts.spe_values],
-                                                        y_target  = y_target,
-                                                        y_weights = y_weights,
-                                                        **args_opti)
+        # Multi-start : starts stacked along the first dimension of free constants values and executed at once (only
+        # available for the default candidate wrapper and optimizers having a batched version)
+        n_starts = args_opti.get("n_starts", 1)
+        if n_starts > 1 and not (self.candidate_wrapper is DEFAULT_WRAPPER
+                                 and args_opti.get("method", "LBFGS") in free_const.BATCH_OPTIMIZERS):
+            warnings.warn("Multi-start free constants optimization is only available for programs using the default "
+                          "candidate wrapper and optimizers having a batched version (%s), using a single start."
+                          % (list(free_const.BATCH_OPTIMIZERS)))
+            n_starts = 1
+        if n_starts > 1:
+            def func_starts(params, rows):
+                class_values = self.free_consts.class_values.expand(len(rows), -1) if freeze_class_free_consts \
+                               else params[0][rows]                                         # (n_rows, n_class_free_const,)
+                spe_values   = params[-1][rows]                                             # (n_rows, n_spe_free_const, n_realizations,)
+                return self.execute_starts(X, class_values = class_values, spe_values = spe_values,
+                                           i_realization = i_realization, n_samples_per_dataset = n_samples_per_dataset)
+            args_opti = dict(args_opti, n_starts = n_starts, func_starts = func_starts)
+        # Single start otherwise
         else:
-            history = free_const.optimize_free_const (  func      = func_params,
-                                                        params    = [self.free_consts.class_values, self.free_consts.spe_values],
-                                                        y_target  = y_target,
-                                                        y_weights = y_weights,
-                                                        **args_opti)
+            args_opti = {key: val for key, val in args_opti.items() if key not in ["n_starts", "starts_spread"]}
+
+        # Solving linearly appearing free constants in closed form if possible
+        # (Closed form and per realization optimizations being single start)
+        single_start_args_opti = {key: val for key, val in args_opti.items()
+                                  if key not in ["n_starts", "starts_spread", "func_starts"]}
+        history = None
+        if USE_CLOSED_FORM_LINEAR_FREE_CONSTS:
+            history = self.optimize_linear_constants(X                        = X,
+                                                     y_target                 = y_target,
+                                                     y_weights                = y_weights,
+                                                     i_realization            = i_realization,
+                                                     n_samples_per_dataset    = n_samples_per_dataset,
+                                                     args_opti                = single_start_args_opti,
+                                                     freeze_class_free_consts = freeze_class_free_consts)
+
+        # Iterative optimization otherwise
+        # (Spe free constants of each realization being optimized independently if possible)
+        if history is None and USE_PER_REALIZATION_FREE_CONSTS_OPTI and n_samples_per_dataset is not None \
+                and len(n_samples_per_dataset) > 1 and self.free_consts.n_spe_free_const > 0 \
+                and args_opti.get("method", "LBFGS") in free_const.BATCH_OPTIMIZERS:
+            history = self.optimize_constants_per_realization(X                        = X,
+                                                              y_target                 = y_target,
+                                                              y_weights                = y_weights,
+                                                              n_samples_per_dataset    = n_samples_per_dataset,
+                                                              args_opti                = single_start_args_opti,
+                                                              freeze_class_free_consts = freeze_class_free_consts)
+        if history is None:
+            if freeze_class_free_consts:
+                history = free_const.optimize_free_const (  func      = func_params,
+                                                            params    = [self.free_consts.spe_values],
+                                                            y_target  = y_target,
+                                                            y_weights = y_weights,
+                                                            **args_opti)
+            else:
+                history = free_const.optimize_free_const (  func      = func_params,
+                                                            params    = [self.free_consts.class_values, self.free_consts.spe_values],
+                                                            y_target  = y_target,
+                                                            y_weights = y_weights,
+                                                            **args_opti)
 
         # Logging optimization process
         self.free_consts.is_opti    [0] = True
         self.free_consts.opti_steps [0] = len(history)  # Number of iterations it took to optimize the constants
+        method_args = args_opti.get("method_args", None) or free_const.OPTIMIZERS_DEFAULT_ARGS.get(args_opti.get("method", "LBFGS"))
+        self.free_consts.opti_abandoned [0] = bool(free_const.was_abandoned(history, method_args = method_args))
+
+        return history
+
+    def optimize_constants_per_realization(self, X, y_target, n_samples_per_dataset, y_weights = 1., args_opti = None, freeze_class_free_consts = False):
+        """
+        Optimizes free constants of program on multiple datasets, spe free constants of each realization being
+        optimized independently.
+        Given class free constants, the loss on each dataset only depends on its own spe free constants : the spe free
+        constants are optimized as n_realizations independent problems all at once (see
+        free_const.optimize_free_const_realizations) with a single execution of the program on all datasets per step.
+        Class free constants are optimized by variable projection : a single optimization (of method) of class free
+        constants is run on the loss with spe free constants optimal given class free constants, each evaluation of
+        this loss (including those of line searches) re-optimizing the spe free constants (warm started from their
+        last values) given the class free constants evaluated. The gradient of this loss with respect to class free
+        constants is then that of the loss with spe free constants fixed at their optimal values.
+        Parameters
+        ----------
+        X : torch.tensor of shape (n_dim, ?,) of float
+            Values of the input variables of the problem with n_dim = nb of input variables, ? = number of samples.
+        y_target : torch.tensor of shape (?,) of float
+            Values of target output, ? = number of samples.
+        n_samples_per_dataset : array_like of shape (n_realizations,) of int
+            X/y_target contain multiple datasets with samples of each dataset following each other, n_samples_per_dataset
+            is the number of samples for each dataset (eg. [90, 100, 110] for 3 datasets).
+        y_weights : torch.tensor of shape (?,) of float, optional
+            Weights for each data point.
+        args_opti : dict or None, optional
+            Arguments to pass to free_const.optimize_free_const (method must have a batched version in
+            free_const.BATCH_OPTIMIZERS). By default, free_const.DEFAULT_OPTI_ARGS arguments are used.
+        freeze_class_free_consts : bool, optional
+            If True, class free constants are not optimized.
+        Returns
+        -------
+        history : numpy.array of shape (?,) of float
+            Loss history (of outer loop, spe free constants being optimal given class free constants).
+        """
+        if args_opti is None:
+            args_opti = free_const.DEFAULT_OPTI_ARGS
+        execute = lambda: self.__call__(X, n_samples_per_dataset=n_samples_per_dataset)
+        # Inner optimizations being warm started, a few steps are enough to follow the optimum as class free
+        # constants change from one loss evaluation to the next
+        method_args       = args_opti.get("method_args", None) or free_const.OPTIMIZERS_DEFAULT_ARGS[args_opti["method"]]
+        inner_method_args = dict(method_args)
+        if not freeze_class_free_consts:
+            inner_method_args["n_steps"] = min(method_args.get("n_steps", 10), PER_REALIZATION_OPTI_INNER_N_STEPS)
+        # Inner losses being per dataset, they can not be compared to the loss needed by the whole program
+        if "abandon_loss" in inner_method_args:
+            inner_method_args["abandon_loss"] = None
+        inner_args_opti = dict(args_opti, method_args=inner_method_args)
+
+        # Optimizing spe free constants of all realizations given class free constants
+        def optimize_spe_free_consts():
+            spe_values   = self.free_consts.spe_values                                     # (1, n_spe_free_const, n_realizations,)
+            class_values = self.free_consts.class_values                                   # (1, n_class_free_const,)
+            spe_params   = spe_values[0].detach().T.clone()                                # (n_realizations, n_spe_free_const,)
+            # Program reads spe free constants from a view of params (having realizations first) and class free
+            # constants as constants during optimization
+            try:
+                self.free_consts.spe_values   = spe_params.T[None]                         # (1, n_spe_free_const, n_realizations,)
+                self.free_consts.class_values = class_values.detach()                      # (1, n_class_free_const,)
+                free_const.optimize_free_const_realizations(func                  = lambda params: execute(),
+                                                            params                = [spe_params],
+                                                            y_target              = y_target,
+                                                            n_samples_per_dataset = n_samples_per_dataset,
+                                                            y_weights             = y_weights,
+                                                            **inner_args_opti)
+            finally:
+                self.free_consts.spe_values   = spe_values
+                self.free_consts.class_values = class_values
+            with torch.no_grad():
+                spe_values[0] = spe_params.T.to(spe_values.dtype)
+            return None
+
+        loss = free_const.LOSSES[args_opti["loss"]]
+        def compute_loss():
+            with torch.no_grad():
+                res = loss(func = lambda params: execute(), params = None, y_target = y_target, y_weights = y_weights).item()
+            return res
+
+        if freeze_class_free_consts:
+            optimize_spe_free_consts()
+            history = np.array([compute_loss()])
+        else:
+            # Program output with spe free constants optimal given class free constants (and seen as constants)
+            def func_projected(params):
+                optimize_spe_free_consts()
+                spe_values = self.free_consts.spe_values                                   # (1, n_spe_free_const, n_realizations,)
+                try:
+                    self.free_consts.spe_values = spe_values.detach()                      # (1, n_spe_free_const, n_realizations,)
+                    y = execute()                                                          # (?,)
+                finally:
+                    self.free_consts.spe_values = spe_values
+                return y
+            history = free_const.optimize_free_const (func      = func_projected,
+                                                      params    = [self.free_consts.class_values],
+                                                      y_target  = y_target,
+                                                      y_weights = y_weights,
+                                                      **args_opti)
+            # Spe free constants optimal given final class free constants (last evaluation may be a line search trial)
+            optimize_spe_free_consts()
 
         return history
 
@@ -1,12 +1,44 @@
 import warnings
+import collections
+import hashlib
 
 import numpy as np
 import torch as torch
 import physo.physym.batch_execute as bexec
+from physo.physym import free_const
+from physo.physym import program as Prog
+from physo.physym import canonical
+from physo.physym import interval
+from physo.physym import dataset
 
 # During programs evaluation, should parallel execution be used ?
 USE_PARALLEL_EXE        = False  # Only worth it if n_all_samples > 1e6
 USE_PARALLEL_OPTI_CONST = True   # Only worth it if batch_size > 1k
+# During programs evaluation, should vectorized execution be used when not executing in parallel ?
+# (Slower than execution in a loop at config0 and Feynman sizes on CPU, see
+# benchmarking/FeynmanBenchmark/feynman_vectorized_exe_benchmark.py)
+USE_VECTORIZED_EXE      = False
+# During free constants optimization, should all programs be optimized at once when not optimizing in parallel ?
+# (Memory use scales as batch_size x max_time_step x n_all_samples)
+USE_VECTORIZED_OPTI_CONST = False
+# During programs evaluation, should rewards be streamed over blocks of samples when using vectorized execution ?
+# Only used above this number of samples and for rewards having a streaming counterpart in STREAMING_REWARDS
+# (Memory use then scales as batch_size x max_time_step x batch_execute.VECTORIZED_EXE_SAMPLES_CHUNK_SIZE)
+STREAMING_EXE_MIN_N_SAMPLES = 1_000_000
+# During duplicates elimination, programs are identified by their outputs on a probe set made of this number of samples
+# of each dataset, outputs being compared using only DUPLICATES_MANTISSA_BITS bits of their float32 mantissa.
+DUPLICATES_PROBE_N_SAMPLES = 64
+DUPLICATES_MANTISSA_BITS   = 16
+# Free constants are set to values drawn log-uniformly in this range (with a fixed seed, so the same at each call) on the
+# probe set, rather than to their initial values, so that programs only matching for special values of constants (eg.
+# mul(c0, x) and x or add(x, c0) and add(x, 1) for c0 = 1) are not mistaken for duplicates before constants are fitted.
+DUPLICATES_PROBE_FREE_CONSTS_RANGE = (1.3, 3.7)
+# During interval pre-screening (see RewardsComputer's interval_prescreen), should programs certainly constant despite
+# containing input variables (eg. having a protected operation stuck on its plateau) be zeroed out as well ?
+INTERVAL_PRESCREEN_ZERO_OUT_CONSTANT = False
+# Default max number of programs kept in and max memory (in bytes, estimation) used by rewards cache (see RewardsCache)
+REWARDS_CACHE_MAX_SIZE   = 10000
+REWARDS_CACHE_MAX_MEMORY = 1e8
 
 def SquashedNRMSE (y_target, y_pred, y_weights = 1.):
     """
@@ -25,9 +57,9 @@ def SquashedNRMSE (y_target, y_pred, y_weights = 1.):
         Reward encoding prediction vs target discrepancy in [0,1].
     """
     sigma_targ = y_target.std()
-    # Computing error with weights
+    # Computing error with weights (accumulated in float64 whatever the dtype of execution)
     err   = y_weights*(y_target - y_pred)**2 # (?,)
-    RMSE  = torch.sqrt(torch.mean(err))
+    RMSE  = torch.sqrt(torch.mean(err, dtype=torch.float64))
     NRMSE = (1/sigma_targ)*RMSE
     reward = 1/(1 + NRMSE)
     return reward
@@ -47,6 +79,346 @@ def SquashedNRMSE_to_R2 (reward):
     R2 = 2/reward - (1/reward)**2
     return R2
 
+def SquashedNRMSE_stats (y_target, y_pred, y_weights = 1.):
+    """
+    Additive statistics of a block of samples from which SquashedNRMSE rewards can be computed (see
+    SquashedNRMSE_from_stats).
+    Parameters
+    ----------
+    y_target : torch.tensor of shape (n_block,) of float
+        Target output data of block.
+    y_pred   : torch.tensor of shape (?, n_block,) of float
+        Predicted data of block for each program.
+    y_weights : torch.tensor of shape (n_block,) of float, optional
+        Weights for each data point of block. By default, no weights are used.
+    Returns
+    -------
+    stats : torch.tensor of shape (?, 1) of float
+        Weighted sum of squared errors of each program on block.
+    """
+    err = y_weights*(y_target - y_pred)**2                                        # (?, n_block)
+    SSE = torch.sum(err, dim=-1, dtype=torch.float64)                             # (?,)
+    stats = SSE[:, None]                                                          # (?, 1)
+    return stats
+
+def SquashedNRMSE_from_stats (stats, y_target, y_weights = 1.):
+    """
+    Squashed NRMSE rewards from statistics summed over all blocks of samples (see SquashedNRMSE_stats).
+    Parameters
+    ----------
+    stats : torch.tensor of shape (?, 1) of float
+        Weighted sum of squared errors of each program over all samples.
+    y_target : torch.tensor of shape (n_samples,) of float
+        Target output data.
+    y_weights : torch.tensor of shape (n_samples,) of float, optional
+        Weights for each data point (already accounted for in stats).
+    Returns
+    -------
+    rewards : torch.tensor of shape (?,) of float
+        Rewards encoding prediction vs target discrepancy in [0,1].
+    """
+    sigma_targ = y_target.std()
+    RMSE  = torch.sqrt(stats[:, 0]/y_target.shape[-1])                            # (?,)
+    NRMSE = (1/sigma_targ)*RMSE                                                   # (?,)
+    rewards = 1/(1 + NRMSE)                                                       # (?,)
+    return rewards
+
+def SquashedNRMSE_to_MSE (reward, y_target, y_weights = 1.):
+    """
+    Converts SquashedNRMSE reward to the (weighted) MSE loss minimized by free constants optimization (see
+    free_const.MSE_loss) giving this reward.
+    Parameters
+    ----------
+    reward : float
+        Reward encoding prediction vs target discrepancy in [0,1].
+    y_target : torch.tensor of shape (?,) of float
+        Target output data.
+    y_weights : torch.tensor of shape (?,) of float, optional
+        Weights for each data point (already accounted for in MSE).
+    Returns
+    -------
+    MSE : float
+        MSE loss.
+    """
+    sigma_targ = float(y_target.std())
+    MSE = (sigma_targ*(1/reward - 1))**2
+    return MSE
+
+# Reward functions -> function converting a reward to the free constants optimization loss giving it
+REWARDS_TO_LOSSES = {
+    SquashedNRMSE : SquashedNRMSE_to_MSE,
+}
+
+# Reward functions -> (reward_stats_function, reward_from_stats_function) computing them by streaming over samples
+STREAMING_REWARDS = {
+    SquashedNRMSE : (SquashedNRMSE_stats, SquashedNRMSE_from_stats),
+}
+
+def DatasetFingerprint (X, y_target, y_weights = 1., n_samples_per_dataset = None, free_const_opti_args = None):
+    """
+    Computes a fingerprint of the data programs are evaluated on (and of the free constants optimization settings) so
+    cached results are never reused on different data.
+    Parameters
+    ----------
+    X : torch.tensor of shape (n_dim, ?,) of float
+        Values of the input variables of the problem with n_dim = nb of input variables.
+    y_target : torch.tensor of shape (?,) of float
+        Values of the target symbolic function on input variables contained in X_target.
+    y_weights : torch.tensor of shape (?,) of float, optional
+        Weights for each data point.
+    n_samples_per_dataset : array_like of shape (n_realizations,) of int or None, optional
+        Number of samples for each dataset.
+    free_const_opti_args : dict or None, optional
+        Arguments passed to free_const.optimize_free_const for free constant optimization.
+    Returns
+    -------
+    fingerprint : str
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for data in (X, y_target, y_weights):
+        if torch.is_tensor(data):
+            data = data.detach().cpu().numpy()
+        data = np.ascontiguousarray(data)
+        h.update(str((data.shape, data.dtype)).encode())
+        h.update(data.tobytes())
+    h.update(str(None if n_samples_per_dataset is None else np.asarray(n_samples_per_dataset).tolist()).encode())
+    h.update(str(free_const_opti_args).encode())
+    fingerprint = h.hexdigest()
+    return fingerprint
+
+def SubsetFingerprint (fingerprint, n_samples, seed = 0):
+    """
+    Computes the fingerprint of a subset of data drawn by DataSubset (which only depends on the sizes of datasets,
+    n_samples and seed) from the fingerprint of the full data, without hashing the subset again.
+    Parameters
+    ----------
+    fingerprint : str
+        Fingerprint of full data (see DatasetFingerprint).
+    n_samples : int
+        Max number of samples of each dataset in subset (see DataSubset).
+    seed : int
+        Seed used to draw subset (see DataSubset).
+    Returns
+    -------
+    fingerprint : str
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str((fingerprint, int(n_samples), int(seed))).encode())
+    fingerprint = h.hexdigest()
+    return fingerprint
+
+class RewardsCache:
+    """
+    Bounded least recently used (LRU) cache of evaluation results of programs (reward, optimized free constants values
+    and number of optimization steps) persisting across epochs so programs sampled again do not need to have their
+    free constants optimized and their reward computed again.
+    Programs are identified by their 64-bit canonical hash (see canonical.ComputeCanonicalHashes) so equivalent
+    programs (eg. mul(c0, x) and mul(x, c0)) share results, and by the fingerprint of the data they are evaluated on
+    (see DatasetFingerprint).
+    Attributes
+    ----------
+    max_size : int
+        Max number of programs kept in cache.
+    max_memory : float or None
+        Max memory (in bytes) used by cached results (estimation). No limit if None.
+    memory : int
+        Estimated memory (in bytes) currently used by cached results.
+    hits : int
+        Number of programs found in cache.
+    misses : int
+        Number of programs not found in cache.
+    evictions : int
+        Number of programs evicted from cache to stay within max_size and max_memory.
+    """
+    # Estimated memory overhead (in bytes) of an entry (dict entry, key tuple, result tuple and tensors objects)
+    ENTRY_OVERHEAD = 512
+
+    def __init__(self, max_size = REWARDS_CACHE_MAX_SIZE, max_memory = REWARDS_CACHE_MAX_MEMORY):
+        """
+        Parameters
+        ----------
+        max_size : int
+            Max number of programs kept in cache.
+        max_memory : float or None
+            Max memory (in bytes) used by cached results (estimation). No limit if None.
+        """
+        self.max_size   = max_size
+        self.max_memory = max_memory
+        self.clear()
+
+    def clear (self):
+        """
+        Empties cache and resets stats.
+        """
+        self.cache     = collections.OrderedDict()
+        self.memory    = 0
+        self.hits      = 0
+        self.misses    = 0
+        self.evictions = 0
+
+    @property
+    def hit_rate (self):
+        """
+        Fraction of programs found in cache among all looked up programs.
+        """
+        n_lookups = self.hits + self.misses
+        return self.hits / n_lookups if n_lookups > 0 else 0.
+
+    @staticmethod
+    def get_keys (programs, fingerprint, mask = None):
+        """
+        Computes cache keys of programs.
+        Parameters
+        ----------
+        programs : vect_programs.VectPrograms
+            Programs contained in batch.
+        fingerprint : str
+            Fingerprint of data (see DatasetFingerprint).
+        mask : array_like of shape (batch_size,) of bool or None
+            Keys are only computed where mask is True (None elsewhere). By default, computed for all programs.
+        Returns
+        -------
+        keys : list of len (batch_size,) of tuple or None
+        """
+        if mask is None:
+            mask = np.full(shape=programs.batch_size, fill_value=True, dtype=bool)                      # (batch_size,)
+        hashes = canonical.ComputeCanonicalHashes(programs)                                             # (batch_size,)
+        keys = [(int(hashes[i]), fingerprint) if mask[i] else None for i in range(programs.batch_size)]
+        return keys
+
+    def get (self, key):
+        """
+        Returns cached result of a program (updating stats).
+        Parameters
+        ----------
+        key : tuple
+            Key of program (see get_keys).
+        Returns
+        -------
+        result : tuple or None
+            (reward, class_values, spe_values, opti_steps) with reward (float), class_values (torch.tensor of shape
+            (n_class_free_const,)), spe_values (torch.tensor of shape (n_spe_free_const, n_realizations,)) and
+            opti_steps (int) or None if program is not in cache.
+        """
+        result = self.cache.get(key)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.cache.move_to_end(key)
+        return result
+
+    def put (self, key, reward, class_values, spe_values, opti_steps):
+        """
+        Stores result of a program, evicting least recently used programs if cache is full.
+        Parameters
+        ----------
+        key : tuple
+            Key of program (see get_keys).
+        reward : float
+            Reward of program.
+        class_values : torch.tensor of shape (n_class_free_const,)
+            Optimized class free constants values of program.
+        spe_values : torch.tensor of shape (n_spe_free_const, n_realizations,)
+            Optimized spe free constants values of program.
+        opti_steps : int
+            Number of free constants optimization steps.
+        """
+        if key in self.cache:
+            self.memory -= self.entry_memory(key, self.cache[key])
+        result = (float(reward), class_values.clone().detach(), spe_values.clone().detach(), int(opti_steps))
+        self.cache[key] = result
+        self.cache.move_to_end(key)
+        self.memory += self.entry_memory(key, result)
+        # Evicting least recently used
+        while len(self.cache) > self.max_size or (self.max_memory is not None and self.memory > self.max_memory):
+            old_key, old_result = self.cache.popitem(last=False)
+            self.memory    -= self.entry_memory(old_key, old_result)
+            self.evictions += 1
+        return None
+
+    @classmethod
+    def entry_memory (cls, key, result):
+        """
+        Estimated memory (in bytes) used by an entry.
+        """
+        (_, class_values, spe_values, _) = result
+        memory = cls.ENTRY_OVERHEAD + class_values.nbytes + spe_values.nbytes
+        return memory
+
+    def __len__(self):
+        return len(self.cache)
+
+    def __repr__(self):
+        s = "RewardsCache : %i programs (%.3f MB), hit rate = %.3f, evictions = %i" \
+            % (len(self), self.memory/1e6, self.hit_rate, self.evictions)
+        return s
+
+
+def NumericFingerprints (programs, X, y_target, n_samples_per_dataset, mask = None):
+    """
+    Numeric fingerprints of programs : outputs of programs on a small fixed probe set of data (see DataSubset) with
+    free constants at fixed probe values (see DUPLICATES_PROBE_FREE_CONSTS_RANGE), quantized so programs having
+    equivalent functional forms have the same fingerprint.
+    Parameters
+    ----------
+    programs : Program.VectProgram
+        Programs contained in batch.
+    X : torch.tensor of shape (n_dim, ?,) of float
+        Values of the input variables of the problem with n_dim = nb of input variables.
+    y_target : torch.tensor of shape (?,) of float
+        Values of the target symbolic function on input variables contained in X_target.
+    n_samples_per_dataset : array_like of shape (n_realizations,) of int or None
+        Number of samples for each dataset (single dataset if None).
+    mask : array_like of shape (batch_size,) of bool or None
+        Only programs where mask is True are executed, others having a fingerprint of NaNs. By default, all programs
+        are executed.
+    Returns
+    -------
+    fingerprints : numpy.array of shape (batch_size,) of numpy.void
+        Fingerprints of programs (quantized outputs on probe set as raw bytes), can be compared or used with np.unique.
+    """
+    if mask is None:
+        mask = np.full(shape=programs.batch_size, fill_value=True, dtype=bool)                           # (batch_size,)
+    mask = np.array(mask, dtype=bool)                                                                    # (batch_size,)
+    # Probe set (the same at each call)
+    probe_X, _, probe_n_samples_per_dataset, _ = DataSubset(X = X, y_target = y_target,
+                                                            n_samples_per_dataset = n_samples_per_dataset,
+                                                            n_samples = DUPLICATES_PROBE_N_SAMPLES, seed = 0)
+    if n_samples_per_dataset is None:
+        probe_n_samples_per_dataset = None
+    n_probe = probe_X.shape[1]
+    y = np.full((programs.batch_size, n_probe), np.nan, dtype=np.float32)                                # (batch_size, n_probe)
+    if mask.any():
+        # Executing programs with free consts at probe values (the same for all programs)
+        free_consts = programs.free_consts
+        probe_consts = free_const.FreeConstantsTable(batch_size     = programs.batch_size,
+                                                     library        = programs.library,
+                                                     n_realizations = free_consts.n_realizations,
+                                                     dtype          = free_consts.dtype)
+        generator  = torch.Generator().manual_seed(0)
+        low, high  = DUPLICATES_PROBE_FREE_CONSTS_RANGE
+        for values in (probe_consts.class_values, probe_consts.spe_values):
+            u = torch.rand(values.shape[1:], generator=generator, dtype=torch.float64)                  # (...,)
+            values[:] = (low*(high/low)**u).to(values.dtype)                                             # (batch_size, ...,)
+        programs.free_consts = probe_consts
+        try:
+            y_probe = programs.batch_evaluate (X = probe_X,
+                                               n_samples_per_dataset = probe_n_samples_per_dataset,
+                                               mask            = mask,
+                                               vectorized_mode = USE_VECTORIZED_EXE)                     # (batch_size, n_probe)
+        finally:
+            programs.free_consts = free_consts
+        with np.errstate(over='ignore', invalid='ignore'):
+            # + 0. so -0. and 0. are the same
+            y[mask] = y_probe[torch.tensor(mask, device=y_probe.device)].cpu().numpy().astype(np.float32) + 0.
+    # Quantization : keeping the first DUPLICATES_MANTISSA_BITS bits of mantissa, all NaNs being the same
+    bits = y.view(np.uint32) & np.uint32((0xFFFFFFFF << (23 - DUPLICATES_MANTISSA_BITS)) & 0xFFFFFFFF)     # (batch_size, n_probe)
+    bits[np.isnan(y)] = np.uint32(0x7FC00000)                                                            # (batch_size, n_probe)
+    # Fingerprint : raw bytes of quantized outputs
+    fingerprints = np.ascontiguousarray(bits).view(np.dtype((np.void, bits.itemsize*n_probe)))[:, 0]    # (batch_size,)
+    return fingerprints
+
 def RewardsComputer(programs,
                     X,
                     y_target,
@@ -60,6 +432,12 @@ def RewardsComputer(programs,
                     parallel_mode = False,
                     n_cpus = None,
                     progress_bar = False,
+                    executor = None,
+                    rewards_cache = None,
+                    dataset_fingerprint = None,
+                    interval_prescreen = False,
+                    mask = None,
+                    abandon_reward = None,
                     ):
     """
     Computes rewards of programs on X data accordingly with target y_target and reward reward_function using torch
@@ -95,6 +473,32 @@ def RewardsComputer(programs,
     keep_lowest_complexity_duplicate : bool
         If True, when eliminating duplicates (via zero_out_duplicates = True), the least complex duplicate is kept, else
         a random duplicate is kept.
+    executor : batch_execute.ParallelExecutor or None
+        Persistent pool of workers having the dataset registered to use in parallel mode. By default, a new pool of
+        processes is opened at each parallel call.
+    rewards_cache : reward.RewardsCache or None
+        Cache of rewards and optimized free constants of already evaluated programs. Valid programs found in cache are
+        not optimized nor evaluated again, results of others are stored in cache. Not used if None.
+    dataset_fingerprint : str or None
+        Fingerprint of data and of free constants optimization settings (see DatasetFingerprint) used to key
+        rewards_cache, should be computed once per dataset. By default, it is computed at each call if rewards_cache
+        is used.
+    interval_prescreen : bool
+        Should programs certainly NaN or infinite on the whole input domain whatever their free constants values (using
+        interval arithmetic on the box of input variables values, see interval.IntervalPrescreen) be zeroed out
+        without being optimized nor evaluated ? Bounds being sound over-approximations, only programs that would get
+        a NaN (ie. zero) reward anyway are zeroed out. Only used for programs using the default candidate wrapper,
+        bounds of wrapped programs being unknown. Disabled by default.
+    mask : array_like of shape (batch_size,) of bool or None
+        Only programs where mask is True are optimized and evaluated, others are given a reward of 0. By default, all
+        programs are evaluated.
+    abandon_reward : float or None
+        Free constants optimization of a program is abandoned once its projected best reward can not reach this
+        reward (eg. the elite threshold of the previous epoch, see free_const.is_abandoned). The reward of abandoned
+        programs is then that of their free constants when abandoned, these partly optimized results not being stored
+        in rewards_cache (so abandoned programs are optimized again if met with a laxer threshold). Only used if
+        reward_function has a counterpart loss in REWARDS_TO_LOSSES and with optimizers of
+        free_const.EARLY_ABANDON_OPTIMIZERS. Not used if None.
     Returns
     -------
     rewards : numpy.array of shape (?,) of float
@@ -106,6 +510,13 @@ def RewardsComputer(programs,
     # mask : should program reward NOT be zeroed out ie. is program invalid ?
     # By default all programs are considered valid
     mask_valid = np.full(shape=programs.batch_size, fill_value=True, dtype=bool)                         # (batch_size,)
+    if mask is not None:
+        mask_valid = (mask_valid & np.array(mask, dtype=bool))                                           # (batch_size,)
+
+    # Streaming rewards over blocks of samples for very large datasets (if available for reward_function)
+    streaming_reward = None
+    if X.shape[1] > STREAMING_EXE_MIN_N_SAMPLES:
+        streaming_reward = STREAMING_REWARDS.get(reward_function, None)
 
     # ----- PHYSICALITY -----
     if zero_out_unphysical:
@@ -114,52 +525,83 @@ def RewardsComputer(programs,
         # Update mask to zero out unphysical programs
         mask_valid = (mask_valid & mask_is_physical)                                                     # (batch_size,)
 
+    # ----- INTERVAL PRESCREEN -----
+    if interval_prescreen and programs.candidate_wrapper is Prog.DEFAULT_WRAPPER:
+        # mask : is program certainly invalid (NaN or infinite everywhere whatever its free constants values)
+        mask_is_invalid = interval.IntervalPrescreen(progs             = programs,
+                                                     X                 = X,
+                                                     mask              = mask_valid,
+                                                     zero_out_constant = INTERVAL_PRESCREEN_ZERO_OUT_CONSTANT)  # (batch_size,)
+        # Update mask to zero out invalid programs
+        mask_valid = (mask_valid & ~mask_is_invalid)                                                     # (batch_size,)
+
     # ----- DUPLICATES -----
     if zero_out_duplicates:
-        # Compute rewards (even if programs have non-optimized free consts) to serve as a unique numeric identifier of
-        # functional forms (programs having equivalent forms will have the same reward).
-
-        # Only use parallel mode if enabled in function param and in USE_PARALLEL_EXE flag.
-        # This way users can use flags to specifically enable or disable parallel exe and/or const opti.
-        parallel_mode_exe = parallel_mode and USE_PARALLEL_EXE
-        rewards_non_opt = programs.batch_exe_reward (X         = X,
-                                                     y_target  = y_target,
-                                                     y_weights = y_weights,
-                                                     reward_function       = reward_function,
-                                                     n_samples_per_dataset = n_samples_per_dataset,
-                                                     mask            = mask_valid,
-                                                     pad_with        = 0.0,
-                                                     # Parallel related
-                                                     parallel_mode   = parallel_mode_exe,
-                                                     n_cpus          = n_cpus,
-                                                    )
+        # Numeric fingerprints of programs (outputs on a small probe set with free consts at their initial values) to
+        # serve as a unique identifier of functional forms (programs having equivalent forms have the same fingerprint).
+        fingerprints = NumericFingerprints (programs = programs,
+                                            X        = X,
+                                            y_target = y_target,
+                                            n_samples_per_dataset = n_samples_per_dataset,
+                                            mask = mask_valid)                                           # (batch_size,)
         # mask : is program a unique one we should keep ?
         # By default, all programs are eliminated.
         mask_unique_keep = np.full(shape=programs.batch_size, fill_value=False, dtype=bool)              # (batch_size,)
-        # Identifying unique programs.
-        unique_rewards, unique_idx = np.unique(rewards_non_opt, return_index=True)                       # (n_unique,), (n_unique,)
+        # Identifying unique programs among valid ones.
+        valid_idx = np.where(mask_valid)[0]                                                              # (n_valid,)
+        _, unique_idx, inverse = np.unique(fingerprints[valid_idx], return_index=True, return_inverse=True) # (n_unique,), (n_valid,)
         if keep_lowest_complexity_duplicate:
-            unique_idx_lowest_comp = []
-            # Iterating through unique rewards
-            for r in unique_rewards:
-                # mask: does program have current unique reward ?
-                mask_have_r = (rewards_non_opt == r)                                                     # (batch_size,)
-                # complexities of programs having current unique reward
-                complexities_at_r = programs.n_complexity[mask_have_r]                                   # (n_at_r,)
-                # idx in batch of program having current unique reward of the lowest complexity
-                idx_lowest_comp = np.arange(programs.batch_size)[mask_have_r][complexities_at_r.argmin()]
-                unique_idx_lowest_comp.append(idx_lowest_comp)
-            # Idx of unique programs (having the lowest complexity among their duplicates)
-            unique_idx_lowest_comp = np.array(unique_idx_lowest_comp)
-            # Keeping the lowest complexity duplicate of unique programs
-            mask_unique_keep[unique_idx_lowest_comp] = True
-        else:
-            # Keeping first occurrences of unique programs (random)
-            mask_unique_keep[unique_idx] = True                                                          # (n_unique,)
+            complexities = programs.n_complexity[valid_idx]                                              # (n_valid,)
+            # Lowest complexity among duplicates of each unique program
+            min_complexities = np.full(shape=len(unique_idx), fill_value=np.inf)                         # (n_unique,)
+            np.minimum.at(min_complexities, inverse, complexities)
+            # First occurrences of unique programs among programs having the lowest complexity of their duplicates
+            lowest_comp_idx = np.where(complexities == min_complexities[inverse])[0]                     # (?,)
+            _, first_idx = np.unique(inverse[lowest_comp_idx], return_index=True)                        # (n_unique,)
+            unique_idx = lowest_comp_idx[first_idx]                                                      # (n_unique,)
+        # Keeping unique programs (first occurrences ie. random if not keeping the lowest complexity duplicates)
+        mask_unique_keep[valid_idx[unique_idx]] = True                                                   # (n_unique,)
         # Update mask to zero out duplicate programs
         mask_valid = (mask_valid & mask_unique_keep)                                                     # (batch_size,)
 
+    # ----- CACHE -----
+    use_cache = (rewards_cache is not None)
+    # mask : is program result retrieved from cache ?
+    mask_cached    = np.full(shape=programs.batch_size, fill_value=False, dtype=bool)                    # (batch_size,)
+    rewards_cached = np.zeros(shape=programs.batch_size, dtype=float)                                    # (batch_size,)
+    if use_cache:
+        if dataset_fingerprint is None:
+            dataset_fingerprint = DatasetFingerprint(X = X, y_target = y_target, y_weights = y_weights,
+                                                     n_samples_per_dataset = n_samples_per_dataset,
+                                                     free_const_opti_args  = free_const_opti_args)
+        keys = rewards_cache.get_keys(programs = programs, fingerprint = dataset_fingerprint, mask = mask_valid)  # (batch_size,)
+        free_consts = programs.free_consts
+        with torch.no_grad():
+            for i in np.where(mask_valid)[0]:
+                result = rewards_cache.get(keys[i])
+                if result is not None:
+                    (reward, class_values, spe_values, opti_steps) = result
+                    mask_cached    [i] = True
+                    rewards_cached [i] = reward
+                    # Restoring optimized free constants
+                    free_consts.class_values [i] = class_values
+                    free_consts.spe_values   [i] = spe_values
+                    free_consts.is_opti      [i] = True
+                    free_consts.opti_steps   [i] = opti_steps
+                    free_consts.opti_abandoned [i] = False
+    # mask : should program be optimized and evaluated ?
+    mask_compute = (mask_valid & ~mask_cached)                                                           # (batch_size,)
+
     # ----- FREE CONST OPTIMIZATION -----
+    # Early abandonment of optimization of programs that can not reach abandon_reward
+    if abandon_reward is not None and abandon_reward > 0. and reward_function in REWARDS_TO_LOSSES:
+        if free_const_opti_args is None:
+            free_const_opti_args = free_const.DEFAULT_OPTI_ARGS
+        method = free_const_opti_args.get("method", "LBFGS")
+        if method in free_const.EARLY_ABANDON_OPTIMIZERS:
+            method_args  = free_const_opti_args.get("method_args", None) or free_const.OPTIMIZERS_DEFAULT_ARGS[method]
+            abandon_loss = REWARDS_TO_LOSSES[reward_function](reward = abandon_reward, y_target = y_target, y_weights = y_weights)
+            free_const_opti_args = dict(free_const_opti_args, method_args = dict(method_args, abandon_loss = abandon_loss))
     # If there are free constants in the library, we have to optimize them
     if programs.library.n_free_const > 0:
         # Only use parallel mode if enabled in function param and in USE_PARALLEL_OPTI_CONST flag.
@@ -171,33 +613,46 @@ def RewardsComputer(programs,
                                           y_target = y_target,
                                           free_const_opti_args  = free_const_opti_args,
                                           y_weights             = y_weights,
-                                          mask                  = mask_valid,
+                                          mask                  = mask_compute,
                                           n_samples_per_dataset = n_samples_per_dataset,
                                           # Parallel related
                                           parallel_mode         = parallel_mode_const_opti,
-                                          n_cpus                = n_cpus)
+                                          n_cpus                = n_cpus,
+                                          executor              = executor,
+                                          # Vectorized related
+                                          vectorized_mode       = USE_VECTORIZED_OPTI_CONST)
 
     # ----- REWARDS -----
-    # If rewards were already computed at the duplicate elimination step and there are no free constants in the library
-    # No need to recompute rewards.
-    if zero_out_duplicates and programs.library.n_free_const == 0:
-        rewards = rewards_non_opt
-    # Else we need to compute rewards
-    else:
-        # Only use parallel mode if enabled in function param and in USE_PARALLEL_EXE flag.
-        # This way users can use flags to specifically enable or disable parallel exe and/or const opti.
-        parallel_mode_exe = parallel_mode and USE_PARALLEL_EXE
-        rewards = programs.batch_exe_reward (X         = X,
-                                             y_target  = y_target,
-                                             y_weights = y_weights,
-                                             reward_function       = reward_function,
-                                             n_samples_per_dataset = n_samples_per_dataset,
-                                             mask            = mask_valid,
-                                             pad_with        = 0.0,
-                                             # Parallel related
-                                             parallel_mode   = parallel_mode_exe,
-                                             n_cpus          = n_cpus,
-                                            )
+    # Only use parallel mode if enabled in function param and in USE_PARALLEL_EXE flag.
+    # This way users can use flags to specifically enable or disable parallel exe and/or const opti.
+    parallel_mode_exe = parallel_mode and USE_PARALLEL_EXE
+    rewards = programs.batch_exe_reward (X         = X,
+                                         y_target  = y_target,
+                                         y_weights = y_weights,
+                                         reward_function       = reward_function,
+                                         n_samples_per_dataset = n_samples_per_dataset,
+                                         mask            = mask_compute,
+                                         pad_with        = 0.0,
+                                         # Parallel related
+                                         parallel_mode   = parallel_mode_exe,
+                                         n_cpus          = n_cpus,
+                                         executor        = executor,
+                                         # Vectorized related
+                                         vectorized_mode  = USE_VECTORIZED_EXE,
+                                         streaming_reward = streaming_reward,
+                                        )
+
+    # Using cached results and storing new ones (except those of programs which optimization was abandoned as they
+    # depend on the abandonment threshold)
+    if use_cache:
+        rewards = np.where(mask_cached, rewards_cached, rewards)                                         # (batch_size,)
+        free_consts = programs.free_consts
+        mask_store  = mask_compute & ~free_consts.opti_abandoned.cpu().numpy()                           # (batch_size,)
+        for i in np.where(mask_store)[0]:
+            rewards_cache.put(keys[i], reward       = rewards[i],
+                                       class_values = free_consts.class_values [i],
+                                       spe_values   = free_consts.spe_values   [i],
+                                       opti_steps   = free_consts.opti_steps   [i])
 
     # Applying mask (this is redundant)
     rewards = rewards * mask_valid.astype(float)
@@ -207,13 +662,160 @@ def RewardsComputer(programs,
     return rewards
 
 
+def DataSubset (X, y_target, n_samples_per_dataset, y_weights = 1., n_samples = 1000, seed = 0):
+    """
+    Random subset of data made of (at most) n_samples samples of each dataset. The subset only depends on seed and on
+    the sizes of datasets so the same subset is drawn at each call (ie. at each epoch).
+    Parameters
+    ----------
+    X : torch.tensor of shape (n_dim, ?,) of float
+        Values of the input variables of the problem with n_dim = nb of input variables.
+    y_target : torch.tensor of shape (?,) of float
+        Values of the target symbolic function on input variables contained in X_target.
+    n_samples_per_dataset : array_like of shape (n_realizations,) of int or None
+        Number of samples for each dataset (single dataset if None).
+    y_weights : torch.tensor of shape (?,) of float or float, optional
+        Weights for each data point.
+    n_samples : int
+        Max number of samples of each dataset to keep.
+    seed : int
+        Seed of random number generator used to draw samples.
+    Returns
+    -------
+    X, y_target, n_samples_per_dataset, y_weights : torch.tensor of shape (n_dim, ??,) of float,
+                                                    torch.tensor of shape (??,) of float,
+                                                    numpy.array of shape (n_realizations,) of int,
+                                                    torch.tensor of shape (??,) of float or float
+        Subset of data (samples of each dataset still following each other, in their original order).
+    """
+    if n_samples_per_dataset is None:
+        n_samples_per_dataset = [X.shape[1]]
+    idx, sub_n_samples_per_dataset = dataset.subset_index(n_samples_per_dataset = n_samples_per_dataset,
+                                                          n_samples = n_samples,
+                                                          seed      = seed)                              # (??,), (n_realizations,)
+    idx = torch.tensor(idx, device=X.device)                                                             # (??,)
+    sub_X        = X[:, idx]                                                                             # (n_dim, ??,)
+    sub_y_target = y_target[idx]                                                                         # (??,)
+    sub_y_weights = y_weights[idx] if torch.is_tensor(y_weights) and y_weights.dim() > 0 else y_weights  # (??,) or float
+    return sub_X, sub_y_target, sub_n_samples_per_dataset, sub_y_weights
+
+def SuccessiveHalvingRewardsComputer(programs,
+                                     X,
+                                     y_target,
+                                     n_samples_per_dataset,
+                                     y_weights = 1.,
+                                     rungs_n_samples = (1000,),
+                                     rungs_keep_fractions = (0.1,),
+                                     seed = 0,
+                                     **rewards_computer_args,
+                                     ):
+    """
+    Multi-fidelity version of RewardsComputer (successive halving). Programs are first evaluated (free constants
+    optimization included) on a small random subset of data (see DataSubset), only the best ones are promoted to the
+    next rung using a larger subset and so on until the last rung using the full data. Programs that were not promoted
+    keep the reward of the last rung they were evaluated at. Free constants of promoted programs are optimized
+    starting from their values optimized at the previous rung.
+    Parameters
+    ----------
+    programs : Program.VectProgram
+        Programs contained in batch to evaluate.
+    X : torch.tensor of shape (n_dim, ?,) of float
+        Values of the input variables of the problem with n_dim = nb of input variables.
+    y_target : torch.tensor of shape (?,) of float
+        Values of the target symbolic function on input variables contained in X_target.
+    n_samples_per_dataset : array_like of shape (n_realizations,) of int
+        Number of samples for each dataset (see RewardsComputer).
+    y_weights : torch.tensor of shape (?,) of float, optional
+        Weights for each data point.
+    rungs_n_samples : array_like of shape (n_rungs,) of int
+        Number of samples of each dataset used at each low fidelity rung (last rung using full data being implied).
+    rungs_keep_fractions : array_like of shape (n_rungs,) of float
+        Fraction of the batch (programs having the highest rewards) promoted from each low fidelity rung to the next.
+        The fraction of the batch evaluated on full data is the product of these and should be larger than the
+        fraction of elite programs kept for training (ie. risk_factor).
+    seed : int
+        Seed of random number generator used to draw subsets of data.
+    rewards_computer_args
+        Other arguments to pass to RewardsComputer (dataset_fingerprint being that of the full data, fingerprints of
+        subsets being derived from it, see SubsetFingerprint).
+    Returns
+    -------
+    rewards, n_evaluated : numpy.array of shape (?,) of float, list of len (n_rungs + 1,) of int
+        Rewards of programs and number of programs evaluated at each rung (last one being full data).
+    """
+    assert len(rungs_n_samples) == len(rungs_keep_fractions), \
+        "There should be one keep fraction per low fidelity rung in rungs_keep_fractions."
+    rewards     = np.zeros(shape=programs.batch_size, dtype=float)                                       # (batch_size,)
+    mask        = np.full(shape=programs.batch_size, fill_value=True, dtype=bool)                        # (batch_size,)
+    n_evaluated = []
+    # Persistent pool of workers used in parallel mode draws subsets from the full dataset registered in its workers
+    # instead of being restarted at each rung (see batch_execute.ParallelExecutor.register_subset)
+    executor = rewards_computer_args.get("executor", None)
+    # Fingerprints of subsets used by rewards cache are derived from that of full data (not hashing subsets again)
+    dataset_fingerprint = rewards_computer_args.pop("dataset_fingerprint", None)
+    if rewards_computer_args.get("rewards_cache", None) is not None and dataset_fingerprint is None:
+        dataset_fingerprint = DatasetFingerprint(X = X, y_target = y_target, y_weights = y_weights,
+                                                 n_samples_per_dataset = n_samples_per_dataset,
+                                                 free_const_opti_args  = rewards_computer_args.get("free_const_opti_args", None))
+    full_n_samples_per_dataset = tuple(int(n) for n in (n_samples_per_dataset if n_samples_per_dataset is not None
+                                                        else [X.shape[1]]))
+    for n_samples, keep_fraction in zip(rungs_n_samples, rungs_keep_fractions):
+        sub_X, sub_y_target, sub_n_samples_per_dataset, sub_y_weights = DataSubset(X = X, y_target = y_target,
+                                                                                   n_samples_per_dataset = n_samples_per_dataset,
+                                                                                   y_weights = y_weights,
+                                                                                   n_samples = n_samples,
+                                                                                   seed      = seed)
+        if executor is not None:
+            executor.register_subset(subset_key  = (full_n_samples_per_dataset, n_samples, seed),
+                                     subset_data = (sub_X, sub_y_target, sub_y_weights),
+                                     full_data   = (X, y_target, y_weights))
+        rewards_rung = RewardsComputer(programs  = programs,
+                                       X         = sub_X,
+                                       y_target  = sub_y_target,
+                                       y_weights = sub_y_weights,
+                                       n_samples_per_dataset = sub_n_samples_per_dataset,
+                                       mask      = mask,
+                                       dataset_fingerprint = None if dataset_fingerprint is None else
+                                                             SubsetFingerprint(dataset_fingerprint, n_samples = n_samples, seed = seed),
+                                       **rewards_computer_args)                                          # (batch_size,)
+        n_evaluated.append(int(mask.sum()))
+        rewards = np.where(mask, rewards_rung, rewards)                                                  # (batch_size,)
+        # Promoting best programs (among those having a non-zero reward)
+        n_keep  = int(np.ceil(keep_fraction*programs.batch_size))
+        promoted = np.argsort(-rewards, kind="stable")[:n_keep]                                          # (n_keep,)
+        mask = np.full(shape=programs.batch_size, fill_value=False, dtype=bool)                          # (batch_size,)
+        mask[promoted] = True
+        mask &= (rewards > 0.)                                                                           # (batch_size,)
+    # Full data
+    rewards_full = RewardsComputer(programs  = programs,
+                                   X         = X,
+                                   y_target  = y_target,
+                                   y_weights = y_weights,
+                                   n_samples_per_dataset = n_samples_per_dataset,
+                                   mask      = mask,
+                                   dataset_fingerprint = dataset_fingerprint,
+                                   **rewards_computer_args)                                              # (batch_size,)
+    n_evaluated.append(int(mask.sum()))
+    rewards = np.where(mask, rewards_full, rewards)                                                      # (batch_size,)
+    return rewards, n_evaluated
+
 def make_RewardsComputer(reward_function     = SquashedNRMSE,
                          zero_out_unphysical = False,
                          zero_out_duplicates = False,
                          keep_lowest_complexity_duplicate = False,
+                         interval_prescreen  = False,
                          # Parallel related
                          parallel_mode = True,
                          n_cpus        = None,
+                         # Cache related
+                         use_rewards_cache        = False,
+                         rewards_cache_max_size   = REWARDS_CACHE_MAX_SIZE,
+                         rewards_cache_max_memory = REWARDS_CACHE_MAX_MEMORY,
+                         # Successive halving related
+                         successive_halving_n_samples       = None,
+                         successive_halving_keep_fractions  = None,
+                         # Early abandonment related
+                         early_abandon_quantile = None,
                          ):
     """
     Helper function to make custom reward computing function.
@@ -230,19 +832,56 @@ def make_RewardsComputer(reward_function     = SquashedNRMSE,
     keep_lowest_complexity_duplicate : bool
         If True, when eliminating duplicates (via zero_out_duplicates = True), the least complex duplicate is kept, else
         a random duplicate is kept.
+    interval_prescreen : bool
+        Should programs certainly NaN or infinite on the whole input domain be zeroed out without being optimized nor
+        evaluated (see RewardsComputer) ? Disabled by default.
     parallel_mode : bool
         Tries to use parallel execution if True (availability will be checked by batch_execute.ParallelExeAvailability),
         execution in a loop else.
     n_cpus : int or None
         Number of CPUs to use when running in parallel mode. By default, uses the maximum number of CPUs available.
+    use_rewards_cache : bool
+        Should rewards and optimized free constants of programs be cached across epochs (see RewardsCache) ? Programs
+        equivalent up to their canonical form (see canonical.ComputeCanonicalHashes) then share results. Disabled by
+        default.
+    rewards_cache_max_size : int
+        Max number of programs kept in cache.
+    rewards_cache_max_memory : float or None
+        Max memory (in bytes) used by cache. No limit if None.
+    successive_halving_n_samples : array_like of shape (n_rungs,) of int or None
+        If given, programs are evaluated by successive halving (see SuccessiveHalvingRewardsComputer): number of
+        samples of each dataset used at each low fidelity rung (eg. [1000,]). By default, all programs are evaluated
+        on full data.
+    successive_halving_keep_fractions : array_like of shape (n_rungs,) of float or None
+        Fraction of the batch promoted from each low fidelity rung to the next (eg. [0.1,]), their product should be
+        larger than risk_factor. Must be given if successive_halving_n_samples is given.
+    early_abandon_quantile : float or None
+        If given, free constants optimization of programs that can not reach this quantile of the rewards of the
+        previous call (eg. 1-risk_factor for the elite threshold of the previous epoch) is abandoned (see
+        RewardsComputer's abandon_reward). By default, optimizations are never abandoned.
     Returns
     -------
     rewards_computer : callable
          Custom reward computing function taking programs (vect_programs.VectPrograms), X (torch.tensor of shape (n_dim,?,)
          of float), y_target (torch.tensor of shape (?,) of float), y_weights (torch.tensor of shape (?,) of float),
          n_samples_per_dataset (array_like of shape (n_realizations,) of int) and free_const_opti_args as key arguments
-         and returning reward for each program (array_like of float).
+         and returning reward for each program (array_like of float). Its cache (reward.RewardsCache or None) is
+         accessible via rewards_computer.rewards_cache and its persistent pool of workers used in parallel mode
+         (batch_execute.ParallelExecutor or None) via rewards_computer.executor. When using successive halving, the
+         number of programs evaluated at each rung during the last call (list of int) is accessible via
+         rewards_computer.successive_halving_n_evaluated. When using early abandonment, the reward used as threshold
+         during the next call (float or None) is accessible via rewards_computer.abandon_reward.
     """
+    # Successive halving config
+    use_successive_halving = successive_halving_n_samples is not None
+    if use_successive_halving:
+        assert successive_halving_keep_fractions is not None, \
+            "successive_halving_keep_fractions should be given when using successive halving."
+        assert len(successive_halving_n_samples) == len(successive_halving_keep_fractions), \
+            "There should be one keep fraction per rung in successive_halving_keep_fractions."
+        for keep_fraction in successive_halving_keep_fractions:
+            assert 0 < keep_fraction <= 1, "Successive halving keep fractions should be > 0 and <= 1."
+
     # Check that parallel execution is available on this system
     recommended_config = bexec.ParallelExeAvailability()
     is_parallel_mode_available_on_system = recommended_config["parallel_mode"]
@@ -252,23 +891,70 @@ def make_RewardsComputer(reward_function     = SquashedNRMSE,
         warnings.warn("Parallel mode is not available on this system, switching to non parallel mode.")
         parallel_mode = False
 
+    # Persistent pool of workers (started at first parallel call and kept across calls ie. across epochs)
+    executor = bexec.ParallelExecutor(n_cpus = n_cpus) if parallel_mode else None
+
+    # Cache persisting across calls (ie. across epochs)
+    rewards_cache = RewardsCache(max_size = rewards_cache_max_size, max_memory = rewards_cache_max_memory) if use_rewards_cache else None
+
+    # Fingerprint of data used by cache, only computed again when data (identity of tensors) or settings change
+    fingerprint_memo = {"data": None, "fingerprint": None}
+    def get_dataset_fingerprint(X, y_target, y_weights, n_samples_per_dataset, free_const_opti_args):
+        data = (X, y_target, y_weights,
+                str(None if n_samples_per_dataset is None else np.asarray(n_samples_per_dataset).tolist()),
+                str(free_const_opti_args))
+        memo = fingerprint_memo["data"]
+        is_same = memo is not None and all(a is b or (not torch.is_tensor(a) and not torch.is_tensor(b) and a == b)
+                                           for a, b in zip(memo, data))
+        if not is_same:
+            fingerprint_memo["data"]        = data
+            fingerprint_memo["fingerprint"] = DatasetFingerprint(X = X, y_target = y_target, y_weights = y_weights,
+                                                                 n_samples_per_dataset = n_samples_per_dataset,
+                                                                 free_const_opti_args  = free_const_opti_args)
+        return fingerprint_memo["fingerprint"]
+
     # rewards_computer
     def rewards_computer(programs, X, y_target, y_weights, n_samples_per_dataset, free_const_opti_args):
-        R = RewardsComputer(programs  = programs,
-                            X         = X,
-                            y_target  = y_target,
-                            y_weights = y_weights,
-                            n_samples_per_dataset = n_samples_per_dataset,
-                            free_const_opti_args  = free_const_opti_args,
-                            # Frozen args
-                            reward_function     = reward_function,
-                            zero_out_unphysical = zero_out_unphysical,
-                            zero_out_duplicates = zero_out_duplicates,
-                            keep_lowest_complexity_duplicate = keep_lowest_complexity_duplicate,
-                            # Parallel related
-                            parallel_mode = parallel_mode,
-                            n_cpus        = n_cpus,
-                            )
+        dataset_fingerprint = None
+        if rewards_cache is not None:
+            dataset_fingerprint = get_dataset_fingerprint(X = X, y_target = y_target, y_weights = y_weights,
+                                                          n_samples_per_dataset = n_samples_per_dataset,
+                                                          free_const_opti_args  = free_const_opti_args)
+        args = {"programs"  : programs,
+                "X"         : X,
+                "y_target"  : y_target,
+                "y_weights" : y_weights,
+                "n_samples_per_dataset" : n_samples_per_dataset,
+                "free_const_opti_args"  : free_const_opti_args,
+                # Frozen args
+                "reward_function"     : reward_function,
+                "zero_out_unphysical" : zero_out_unphysical,
+                "zero_out_duplicates" : zero_out_duplicates,
+                "keep_lowest_complexity_duplicate" : keep_lowest_complexity_duplicate,
+                "interval_prescreen"  : interval_prescreen,
+                # Parallel related
+                "parallel_mode" : parallel_mode,
+                "n_cpus"        : n_cpus,
+                "executor"      : executor,
+                # Cache related
+                "rewards_cache"       : rewards_cache,
+                "dataset_fingerprint" : dataset_fingerprint,
+                # Early abandonment related
+                "abandon_reward" : rewards_computer.abandon_reward,
+                }
+        if use_successive_halving:
+            R, n_evaluated = SuccessiveHalvingRewardsComputer(rungs_n_samples      = successive_halving_n_samples,
+                                                              rungs_keep_fractions = successive_halving_keep_fractions,
+                                                              **args)
+            rewards_computer.successive_halving_n_evaluated = n_evaluated
+        else:
+            R = RewardsComputer(**args)
+        if early_abandon_quantile is not None:
+            rewards_computer.abandon_reward = float(np.quantile(R, early_abandon_quantile))
         return R
+    rewards_computer.rewards_cache = rewards_cache
+    rewards_computer.executor      = executor
+    rewards_computer.successive_halving_n_evaluated = None
+    rewards_computer.abandon_reward = None
 
     return rewards_computer
\ No newline at end of file
@@ -152,6 +152,110 @@ class BatchTest(unittest.TestCase):
         t1 = time.perf_counter()
         print("Dummy epoch time = %f ms"%((t1-t0)*1e3))
 
+    def test_reset(self):
+
+        # --- DATA ---
+        N = int(1e2)
+        x_array = np.linspace(0.04, 4, N)
+        x = data_conversion (x_array)
+        X = torch.stack((x,), axis=0)
+        y_target = data_conversion(x_array/1.028 + 0.995)
+
+        # --- LIBRARY CONFIG ---
+        args_make_tokens = {
+                        # operations
+                        "op_names"             : ["add", "mul", "div", "exp"],
+                        "use_protected_ops"    : True,
+                        # input variables
+                        "input_var_ids"        : {"x" : 0         },
+                        "input_var_units"      : {"x" : [1, 0, 0] },
+                        "input_var_complexity" : {"x" : 1.        },
+                        # constants
+                        "constants"            : {"const1" : data_conversion(1.) },
+                        "constants_units"      : {"const1" : [0, 0, 0]           },
+                        "constants_complexity" : {"const1" : 1.                  },
+                        # free constants
+                        "free_constants"            : {"T"             , "v0"              },
+                        "free_constants_init_val"   : {"T" : 1.        , "v0" : 1.         },
+                        "free_constants_units"      : {"T" : [0, 1, 0] , "v0" : [1, -1, 0] },
+                        "free_constants_complexity" : {"T" : 1.        , "v0" : 1.         },
+                            }
+        library_args = {"args_make_tokens"  : args_make_tokens,
+                        "superparent_units" : [1, -1, 0],
+                        "superparent_name"  : "v",
+                        }
+
+        # --- PRIORS ---
+        priors_config  = [ ("UniformArityPrior", None),
+                           ("HardLengthPrior", {"min_length": 1,
+                                               "max_length": 5, }),
+                           ("PhysicalUnitsPrior", {"prob_eps": np.finfo(np.float32).eps})]
+
+        # --- BATCH ---
+        batch_size    = 100
+        max_time_step = 10
+
+        def make_batch():
+            return batch.Batch(library_args     = library_args,
+                               priors_config    = priors_config,
+                               batch_size       = batch_size,
+                               max_time_step    = max_time_step,
+                               rewards_computer = reward.make_RewardsComputer (reward_function = reward.SquashedNRMSE),
+                               multi_X = [X,],
+                               multi_y = [y_target,],
+                               )
+
+        def dummy_epoch(my_batch):
+            for step in range(max_time_step):
+                prior   = torch.tensor(my_batch.prior().astype(np.float32), requires_grad=False)
+                probs   = torch.tensor(np.random.rand(my_batch.batch_size, my_batch.library.n_choices).astype(np.float32))
+                actions = torch.multinomial(probs * prior, num_samples=1)[:, 0]
+                my_batch.programs.append(actions)
+            return my_batch.get_rewards()
+
+        ref_batch = make_batch()
+        my_batch  = make_batch()
+        dummy_epoch(my_batch)
+        # Program exported before reset should be unaffected by reset
+        prog         = my_batch.programs.get_prog(0)
+        prog_str     = prog.get_infix_str()
+        prog.free_consts.class_values[0] = 2.
+        tokens       = my_batch.programs.tokens
+        library      = my_batch.library
+        prior        = my_batch.prior
+
+        # --- RESET ---
+        res = my_batch.reset()
+        self.assertIs(res, my_batch)
+        # Static tables are kept
+        self.assertIs(my_batch.programs.tokens, tokens)
+        self.assertIs(my_batch.library,         library)
+        self.assertIs(my_batch.prior,           prior)
+        # Program state is the same as that of a new batch
+        ref_progs, progs = ref_batch.programs, my_batch.programs
+        self.assertEqual(progs.curr_step, ref_progs.curr_step)
+        for attr in ["n_lengths", "n_dummies", "total_arities", "is_complete", "n_dummies_history", "is_physical",
+                     "units_analysis_cases"]:
+            np.testing.assert_array_equal(getattr(progs, attr), getattr(ref_progs, attr), err_msg=attr)
+        for attr, val in vars(ref_progs.tokens).items():
+            if isinstance(val, np.ndarray):
+                np.testing.assert_array_equal(getattr(progs.tokens, attr), val, err_msg=attr)
+        for attr in ["class_values", "spe_values", "is_opti", "opti_steps"]:
+            self.assertTrue(torch.equal(getattr(progs.free_consts, attr), getattr(ref_progs.free_consts, attr)), attr)
+        np.testing.assert_array_equal(my_batch.prior(), ref_batch.prior())
+        # (seeding as unavailable units are filled with random values in observations)
+        np.random.seed(0)
+        obs = my_batch.get_obs()
+        np.random.seed(0)
+        np.testing.assert_array_equal(obs, ref_batch.get_obs())
+        # Exported program is unaffected
+        self.assertEqual(prog.get_infix_str(), prog_str)
+        self.assertEqual(float(prog.free_consts.class_values[0, 0]), 2.)
+
+        # --- NEW EPOCH ---
+        R = dummy_epoch(my_batch)
+        self.assertEqual(R.shape, (batch_size,))
+
     def test_dummy_epoch_duplicate_elimination (self):
 
         # ------- TEST CASE -------
@@ -7,6 +7,7 @@ import torch as torch
 import torch.multiprocessing as mp
 import matplotlib.pyplot as plt
 import os
+import pickle
 import importlib.util
 
 
@@ -1884,5 +1885,262 @@ class ExecuteProgramTest(unittest.TestCase):
     #
     #     return None
 
+    # Test persistent pool of workers with dataset registered once per worker
+    def test_07_ParallelExecutor (self):
+
+        seed = 42
+        np.random.seed(seed)
+        torch.manual_seed(seed)
+
+        DEVICE = 'cpu'
+
+        # LIBRARY CONFIG
+        args_make_tokens = {
+                        # operations
+                        "op_names"             : "all",
+                        "use_protected_ops"    : True,
+                        # input variables
+                        "input_var_ids"        : {"x" : 0         },
+                        "input_var_units"      : {"x" : [0, 0, 0] },
+                        "input_var_complexity" : {"x" : 0.        },
+                        # constants
+                        "constants"            : {"pi" : np.pi     , "1" : 1         },
+                        "constants_units"      : {"pi" : [0, 0, 0] , "1" : [0, 0, 0] },
+                        "constants_complexity" : {"pi" : 0.        , "1" : 1.        },
+                        # free constants
+                        "free_constants"            : {"a"             , "b"              },
+                        "free_constants_init_val"   : {"a" : 1.        , "b"  : 1.        },
+                        "free_constants_units"      : {"a" : [0, 0, 0] , "b"  : [0, 0, 0] },
+                        "free_constants_complexity" : {"a" : 0.        , "b"  : 0.        },
+                           }
+        my_lib = Lib.Library(args_make_tokens = args_make_tokens,
+                             superparent_units = [0, 0, 0], superparent_name = "y")
+
+        # TEST PROGRAMS
+        batch_size = 100
+        test_program_str = ["mul", "a", "sin", "mul", "x", "b"]
+        test_program_idx = np.array([my_lib.lib_name_to_idx[tok_str] for tok_str in test_program_str])
+        test_program_length = len(test_program_str)
+        test_program_idx = np.tile(test_program_idx, reps=(batch_size,1))
+
+        # TEST DATA
+        ideal_params = [1.14, 0.936] # Mock target free constants
+        x = torch.tensor(np.linspace(-10, 10, 1000)).to(DEVICE)
+        X = torch.stack((x,), axis=0)
+        y_target = ideal_params[0]*torch.sin(ideal_params[1]*x)
+        y_weights = torch.rand(x.shape[0])
+        free_const_opti_args = {
+            'loss'   : "MSE",
+            'method' : 'LBFGS',
+            'method_args': {
+                        'n_steps' : 10,
+                        'tol'     : 1e-8,
+                        'lbfgs_func_args' : {
+                            'max_iter'       : 4,
+                            'line_search_fn' : "strong_wolfe",
+                                             },
+                            },
+            }
+
+        mask = np.random.rand(batch_size) < 0.9
+
+        executor = BExec.ParallelExecutor(n_cpus=2)
+
+        # Free const optimization and rewards (parallel using executor vs loop)
+        results = {}
+        for parallel in [True, False]:
+            my_programs = VProg.VectPrograms(batch_size=batch_size, max_time_step=test_program_length, library=my_lib, n_realizations=1)
+            my_programs.set_programs(test_program_idx)
+            BExec.BatchFreeConstOpti(progs = my_programs, X = X, y_target = y_target, y_weights = y_weights,
+                                     free_const_opti_args = free_const_opti_args,
+                                     mask = mask, parallel_mode = parallel, executor = executor)
+            rewards = BExec.BatchExecutionReward(progs = my_programs, X = X, y_target = y_target, y_weights = y_weights,
+                                                 reward_function = physo.physym.reward.SquashedNRMSE,
+                                                 mask = mask, parallel_mode = parallel, executor = executor)
+            results[parallel] = (my_programs.free_consts.class_values.detach().clone(), rewards)
+
+        # Same results in both modes
+        class_values_par, rewards_par = results[True]
+        class_values_seq, rewards_seq = results[False]
+        self.assertTrue(torch.allclose(class_values_par, class_values_seq))
+        self.assertTrue(np.allclose(rewards_par[mask], rewards_seq[mask]))
+        self.assertTrue(np.isnan(rewards_par[~mask]).all())
+        # Free consts of optimized programs were written back from the bytes returned by workers
+        self.assertTrue(np.allclose(class_values_par[mask].numpy(), ideal_params, rtol=1e-3))
+
+        # Pool was started once (same dataset used by all calls) and is kept open
+        self.assertEqual(executor.n_pool_starts, 1)
+        self.assertTrue(executor.pool is not None)
+        # Same tensors are recognized without comparing values, equal copies are recognized and become the source
+        self.assertTrue(executor.data_sources["X"] is X)
+        X_copy = X.clone()
+        self.assertTrue(BExec.is_identical_data(X, X))
+        self.assertFalse(BExec.is_identical_data(X, X_copy))
+        self.assertTrue(executor.is_registered(X = X_copy, y_target = y_target, y_weights = y_weights))
+        self.assertTrue(executor.data_sources["X"] is X_copy)
+        # Pool is restarted when dataset changes
+        BExec.BatchExecutionReward(progs = my_programs, X = X, y_target = 2*y_target, y_weights = y_weights,
+                                   reward_function = physo.physym.reward.SquashedNRMSE,
+                                   mask = mask, parallel_mode = True, executor = executor)
+        self.assertEqual(executor.n_pool_starts, 2)
+
+        executor.close()
+        self.assertTrue(executor.pool is None)
+
+        return None
+
+    # Test compact task payloads sent to workers of ParallelExecutor
+    def test_08_TaskPayload (self):
+
+        # LIBRARY CONFIG
+        args_make_tokens = {
+                        # operations
+                        "op_names"             : "all",
+                        "use_protected_ops"    : True,
+                        # input variables
+                        "input_var_ids"        : {"x" : 0         },
+                        "input_var_units"      : {"x" : [0, 0, 0] },
+                        "input_var_complexity" : {"x" : 0.        },
+                        # constants
+                        "constants"            : {"pi" : np.pi     , "1" : 1         },
+                        "constants_units"      : {"pi" : [0, 0, 0] , "1" : [0, 0, 0] },
+                        "constants_complexity" : {"pi" : 0.        , "1" : 1.        },
+                        # free constants
+                        "class_free_constants"            : {"a"             , "b"              },
+                        "class_free_constants_init_val"   : {"a" : 1.        , "b"  : 1.        },
+                        "class_free_constants_units"      : {"a" : [0, 0, 0] , "b"  : [0, 0, 0] },
+                        "class_free_constants_complexity" : {"a" : 0.        , "b"  : 0.        },
+                        # spe free constants
+                        "spe_free_constants"            : {"k"             },
+                        "spe_free_constants_init_val"   : {"k" : 1.        },
+                        "spe_free_constants_units"      : {"k" : [0, 0, 0] },
+                        "spe_free_constants_complexity" : {"k" : 0.        },
+                           }
+        my_lib = Lib.Library(args_make_tokens = args_make_tokens,
+                             superparent_units = [0, 0, 0], superparent_name = "y")
+
+        # TEST PROGRAM (35 tokens)
+        n_realizations = 3
+        test_program_str = ["add", "mul", "a", "sin", "mul", "x", "b", "mul", "k", "exp", "mul", "x", "a",]
+        test_program_str = ["add",]*11 + test_program_str + ["x",]*11
+        test_program_idx = np.array([my_lib.lib_name_to_idx[tok_str] for tok_str in test_program_str])
+        test_program_length = len(test_program_str)
+        self.assertEqual(test_program_length, 35)
+
+        my_programs = VProg.VectPrograms(batch_size=2, max_time_step=test_program_length, library=my_lib, n_realizations=n_realizations)
+        my_programs.set_programs(np.tile(test_program_idx, reps=(2, 1)))
+        my_programs.free_consts.class_values[1] = torch.tensor([1.14, 0.936])
+        my_programs.free_consts.spe_values  [1] = torch.tensor([[1., 2., 3.]])
+
+        # Payload is light
+        payload = BExec.make_task_payload(my_programs, prog_idx=1)
+        payload_size = len(pickle.dumps(payload))
+        prog_size    = len(pickle.dumps(my_programs.get_prog(1, skeleton=True)))
+        self.assertTrue(payload_size < 200)
+        self.assertTrue(payload_size < prog_size/10)
+
+        # Rebuilding program from payload in "worker" (here in this process)
+        x = torch.tensor(np.linspace(-10, 10, 30))
+        X = torch.stack((x,), axis=0)
+        BExec.init_worker_data(X=X, y_target=None, y_weights=None,
+                               programs_context=BExec.make_programs_context(my_programs))
+        prog = BExec.load_task_payload(payload)
+        n_samples_per_dataset = np.array([10, 10, 10])
+        expected = my_programs.get_prog(1)(X, n_samples_per_dataset=n_samples_per_dataset)
+        result   = prog(X, n_samples_per_dataset=n_samples_per_dataset)
+        self.assertEqual(prog.size, test_program_length)
+        self.assertTrue(torch.equal(prog.free_consts.spe_values, my_programs.free_consts.spe_values[1:2]))
+        self.assertTrue(torch.allclose(result, expected, equal_nan=True))
+
+        return None
+
+    # Test that successive halving rungs (subsets of data) reuse the pool of workers having the full dataset registered
+    def test_09_ParallelExecutor_SuccessiveHalving (self):
+
+        seed = 42
+        np.random.seed(seed)
+        torch.manual_seed(seed)
+
+        # LIBRARY CONFIG
+        args_make_tokens = {
+                        # operations
+                        "op_names"             : "all",
+                        "use_protected_ops"    : True,
+                        # input variables
+                        "input_var_ids"        : {"x" : 0         },
+                        "input_var_units"      : {"x" : [0, 0, 0] },
+                        "input_var_complexity" : {"x" : 0.        },
+                        # constants
+                        "constants"            : {"pi" : np.pi     , "1" : 1         },
+                        "constants_units"      : {"pi" : [0, 0, 0] , "1" : [0, 0, 0] },
+                        "constants_complexity" : {"pi" : 0.        , "1" : 1.        },
+                        # free constants
+                        "free_constants"            : {"a"             , "b"              },
+                        "free_constants_init_val"   : {"a" : 1.        , "b"  : 1.        },
+                        "free_constants_units"      : {"a" : [0, 0, 0] , "b"  : [0, 0, 0] },
+                        "free_constants_complexity" : {"a" : 0.        , "b"  : 0.        },
+                           }
+        my_lib = Lib.Library(args_make_tokens = args_make_tokens,
+                             superparent_units = [0, 0, 0], superparent_name = "y")
+
+        # TEST PROGRAMS
+        test_progs_str = [["mul", "a", "sin", "mul", "x", "b"],
+                          ["mul", "a", "cos", "mul", "x", "b"],
+                          ["add", "a", "mul", "x", "b"],
+                          ["mul", "a", "x", "x", "x", "x"],]*5
+        max_len = max([len(prog_str) for prog_str in test_progs_str])
+        test_progs_idx = np.full((len(test_progs_str), max_len), my_lib.lib_name_to_idx["x"])
+        for i, prog_str in enumerate(test_progs_str):
+            test_progs_idx[i, :len(prog_str)] = [my_lib.lib_name_to_idx[name] for name in prog_str]
+
+        # TEST DATA (3 datasets)
+        n_samples_per_dataset = np.array([400, 500, 600])
+        x = torch.tensor(np.linspace(-10, 10, n_samples_per_dataset.sum()))
+        X = torch.stack((x,), axis=0)
+        y_target  = 1.14*torch.sin(0.936*x)
+        y_weights = torch.rand(x.shape[0])
+        free_const_opti_args = {
+            'loss'   : "MSE",
+            'method' : 'LBFGS',
+            'method_args': {
+                        'n_steps' : 10,
+                        'tol'     : 1e-8,
+                        'lbfgs_func_args' : {
+                            'max_iter'       : 4,
+                            'line_search_fn' : "strong_wolfe",
+                                             },
+                            },
+            }
+
+        # Successive halving over several epochs (parallel using executor vs loop)
+        n_epochs = 3
+        results = {}
+        for parallel in [True, False]:
+            rewards_computer = physo.physym.reward.make_RewardsComputer(parallel_mode = parallel, n_cpus = 2,
+                                                                        use_rewards_cache = False,
+                                                                        successive_halving_n_samples      = [50, 200],
+                                                                        successive_halving_keep_fractions = [0.5, 0.5])
+            results[parallel] = []
+            for epoch in range (n_epochs):
+                my_programs = VProg.VectPrograms(batch_size=len(test_progs_str), max_time_step=max_len, library=my_lib,
+                                                 n_realizations=len(n_samples_per_dataset))
+                my_programs.set_programs(test_progs_idx)
+                rewards = rewards_computer(programs = my_programs, X = X, y_target = y_target, y_weights = y_weights,
+                                           n_samples_per_dataset = n_samples_per_dataset,
+                                           free_const_opti_args  = free_const_opti_args)
+                results[parallel].append(rewards)
+            if parallel:
+                executor = rewards_computer.executor
+                # Pool was started once for all rungs of all epochs
+                self.assertEqual(executor.n_pool_starts, 1)
+                self.assertEqual(len(executor.subsets), 2)
+                executor.close()
+
+        # Same results in both modes
+        for rewards_par, rewards_seq in zip(results[True], results[False]):
+            self.assertTrue(np.allclose(rewards_par, rewards_seq))
+
+        return None
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -0,0 +1,125 @@
+import unittest
+import numpy as np
+import torch as torch
+
+# Internal imports
+from physo.physym import canonical
+from physo.physym import library as Lib
+from physo.physym import vect_programs as VProg
+from physo.physym.functions import data_conversion
+
+def make_lib(use_protected_ops = True):
+    # LIBRARY CONFIG
+    args_make_tokens = {
+                    # operations
+                    "op_names"             : ["mul", "add", "sub", "neg", "inv", "exp"],
+                    "use_protected_ops"    : use_protected_ops,
+                    # input variables
+                    "input_var_ids"        : {"x0" : 0         , "x1" : 1         },
+                    "input_var_units"      : {"x0" : [0, 0, 0] , "x1" : [0, 0, 0] },
+                    "input_var_complexity" : {"x0" : 1.        , "x1" : 1.        },
+                    # constants
+                    "constants"            : {"1" : data_conversion(1.) },
+                    "constants_units"      : {"1" : [0, 0, 0]           },
+                    "constants_complexity" : {"1" : 1.                  },
+                    # free constants
+                    "free_constants"            : {"c0"              },
+                    "free_constants_init_val"   : {"c0" : 1.         },
+                    "free_constants_units"      : {"c0" : [0, 0, 0]  },
+                    "free_constants_complexity" : {"c0" : 1.         },
+                       }
+    my_lib = Lib.Library(args_make_tokens = args_make_tokens,
+                         superparent_units = [0, 0, 0], superparent_name = "y")
+    return my_lib
+
+def make_programs_of_lib(my_lib, progs_str):
+    max_len = max([len(prog_str) for prog_str in progs_str])
+    progs_idx = np.full((len(progs_str), max_len), my_lib.lib_name_to_idx["x0"])
+    for i, prog_str in enumerate(progs_str):
+        progs_idx[i, :len(prog_str)] = [my_lib.lib_name_to_idx[name] for name in prog_str]
+    programs = VProg.VectPrograms(batch_size=len(progs_str), max_time_step=max_len, library=my_lib,
+                                  n_realizations=1)
+    programs.set_programs(progs_idx)
+    return programs
+
+class CanonicalTest(unittest.TestCase):
+
+    # Test canonical hashes and token sequences of equivalent programs
+    def test_ComputeCanonicalHashes (self):
+
+        # LIBRARY (unprotected so that inv is involutive)
+        my_lib = make_lib(use_protected_ops = False)
+        make_programs = lambda progs_str: make_programs_of_lib(my_lib, progs_str)
+
+        # PROGRAMS (pairs of equivalent programs)
+        test_progs_str = [
+            ["add", "x0", "x1"],                                              # 0
+            ["add", "x1", "x0"],                                              # 1
+            ["mul", "c0", "x0"],                                              # 2
+            ["mul", "x0", "c0"],                                              # 3
+            ["add", "x0", "add", "x1", "c0"],                                 # 4
+            ["add", "add", "c0", "x0", "x1"],                                 # 5
+            ["neg", "neg", "x0"],                                             # 6
+            ["x0"],                                                           # 7
+            ["neg", "neg", "neg", "x0"],                                      # 8
+            ["neg", "x0"],                                                    # 9
+            ["add", "inv", "inv", "add", "x1", "c0", "x1"],                   # 10
+            ["add", "x1", "add", "c0", "x1"],                                 # 11
+            ["add", "mul", "x0", "x1", "exp", "neg", "neg", "mul", "x1", "x0"],  # 12
+            ["add", "exp", "mul", "x0", "x1", "mul", "x1", "x0"],             # 13
+            ["sub", "x0", "x1"],                                              # 14
+            ["sub", "x1", "x0"],                                              # 15
+            ["mul", "x0", "add", "x1", "c0"],                                 # 16
+            ["add", "x0", "mul", "x1", "c0"],                                 # 17
+        ]
+        programs = make_programs(test_progs_str)
+
+        # TEST HASHES
+        hashes = canonical.ComputeCanonicalHashes(programs)
+        self.assertEqual(hashes.dtype, np.uint64)
+        for i in range (0, 14, 2):
+            self.assertEqual(hashes[i], hashes[i+1], "Programs %i and %i should be equivalent"%(i, i+1))
+        self.assertEqual(len(np.unique(hashes[0:14])), 7)
+        # Non-commutative operations and different structures are not equivalent
+        self.assertEqual(len(np.unique(hashes[[0, 4, 14, 15, 16, 17]])), 6)
+
+        # TEST CANONICAL TOKENS
+        canonical_nodes = canonical.ComputeCanonicalNodes(programs)
+        canonical_progs_idx = [canonical.ComputeCanonicalTokensIdx(programs, i, canonical_nodes = canonical_nodes)
+                               for i in range (programs.batch_size)]
+        for i in range (0, 14, 2):
+            self.assertTrue(np.array_equal(canonical_progs_idx[i], canonical_progs_idx[i+1]))
+        self.assertEqual(my_lib.lib_name[canonical_progs_idx[6]].tolist(), ["x0"])
+        self.assertEqual(my_lib.lib_name[canonical_progs_idx[8]].tolist(), ["neg", "x0"])
+        self.assertEqual(len(canonical_progs_idx[10]), 5)
+        # Canonical programs have the same hashes as original programs
+        canonical_programs = make_programs([my_lib.lib_name[idx] for idx in canonical_progs_idx])
+        self.assertTrue(np.array_equal(canonical.ComputeCanonicalHashes(canonical_programs), hashes))
+        # Canonical programs compute the same thing
+        X = torch.rand(2, 100) + 0.5
+        y      = programs.batch_exe_reduce_gather          (X = X, reduce_wrapper = lambda y: y.sum())
+        y_cano = canonical_programs.batch_exe_reduce_gather(X = X, reduce_wrapper = lambda y: y.sum())
+        self.assertTrue(np.allclose(y, y_cano, rtol=1e-5))
+
+        return None
+
+    # Test that protected operations are not folded as involutive ones (protected_inv(protected_inv(x)) being 0 for
+    # very small and very large x)
+    def test_ComputeCanonicalHashes_protected (self):
+
+        my_lib = make_lib(use_protected_ops = True)
+        test_progs_str = [
+            ["inv", "inv", "x0"],                                             # 0
+            ["x0"],                                                           # 1
+            ["neg", "neg", "x0"],                                             # 2
+        ]
+        programs = make_programs_of_lib(my_lib, test_progs_str)
+        hashes = canonical.ComputeCanonicalHashes(programs)
+        self.assertNotEqual(hashes[0], hashes[1])
+        self.assertEqual   (hashes[2], hashes[1])
+        self.assertEqual(len(canonical.ComputeCanonicalTokensIdx(programs, 0)), 3)
+
+        return None
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -371,6 +371,16 @@ class TestDataset(unittest.TestCase):
         self.assertTrue((my_dataset.multi_y_flatten         == y_ideals_flatten  ).all())
         self.assertTrue((my_dataset.multi_y_weights_flatten == y_weights_flatten ).all())
 
+        # ----- Dtype policy -----
+        self.assertEqual(my_dataset.dtype, multi_X_flatten.dtype)
+        for dtype in ["float32", "float64"]:
+            my_dataset = dataset.Dataset(multi_X=multi_X, multi_y=multi_y_target, multi_y_weights=multi_y_weights,
+                                         library=my_lib, dtype=dtype)
+            self.assertEqual(str(my_dataset.dtype), "torch.%s"%(dtype))
+            self.assertEqual(str(my_dataset.multi_y_flatten.dtype), "torch.%s"%(dtype))
+            self.assertEqual(str(my_dataset.multi_y_weights_flatten.dtype), "torch.%s"%(dtype))
+        with self.assertRaises(ValueError):
+            my_dataset = dataset.Dataset(multi_X=multi_X, multi_y=multi_y_target, library=my_lib, dtype="float16")
 
         return None
 
@@ -8,6 +8,9 @@ import matplotlib.pyplot as plt
 # Internal imports
 from physo.physym import execute as Exec
 from physo.physym import library as Lib
+from physo.physym import vect_programs as VProg
+from physo.physym import batch_execute as BExec
+from physo.physym import reward
 from physo.physym.functions import data_conversion, data_conversion_inv
 
 class ExecuteProgramTest(unittest.TestCase):
@@ -316,6 +319,523 @@ class ExecuteProgramTest(unittest.TestCase):
 
         return None
 
+    # Test vectorized batch execution against program by program execution
+    def test_ExecuteVectPrograms (self):
+
+        DEVICE = 'cpu'
+        if torch.cuda.is_available():
+            DEVICE = 'cuda'
+
+        # -------------------------------------- Making fake datasets --------------------------------------
+
+        multi_X = []
+        for n_samples in [90, 100, 110]:
+            x1 = np.linspace(0, 10, n_samples)
+            x2 = np.linspace(0, 1 , n_samples)
+            X = np.stack((x1,x2),axis=0)
+            X = torch.tensor(X).to(DEVICE)
+            multi_X.append(X)
+        multi_X = multi_X*10                         # (n_realizations,) of (n_dim, [n_samples depends on dataset],)
+
+        n_samples_per_dataset = np.array([X.shape[1] for X in multi_X])
+        n_realizations  = len(multi_X)
+        multi_X_flatten = torch.cat(multi_X, axis=-1)                                            # (n_dim, n_all_samples)
+        y_target        = multi_X_flatten[0]*torch.exp(-0.3*multi_X_flatten[0]) + multi_X_flatten[1] # (n_all_samples,)
+
+        # consts
+        pi     = data_conversion (np.pi) .to(DEVICE)
+        const1 = data_conversion (1.)    .to(DEVICE)
+
+        # LIBRARY CONFIG
+        args_make_tokens = {
+                        # operations
+                        "op_names"             : "all",
+                        "use_protected_ops"    : True,
+                        # input variables
+                        "input_var_ids"        : {"t" : 0         , "l" : 1          },
+                        "input_var_units"      : {"t" : [1, 0, 0] , "l" : [0, 1, 0]  },
+                        "input_var_complexity" : {"t" : 0.        , "l" : 1.         },
+                        # constants
+                        "constants"            : {"pi" : pi        , "const1" : const1    },
+                        "constants_units"      : {"pi" : [0, 0, 0] , "const1" : [0, 0, 0] },
+                        "constants_complexity" : {"pi" : 1.        , "const1" : 1.        },
+                        # free constants
+                        "class_free_constants"            : {"c0"              , "c1"               },
+                        "class_free_constants_init_val"   : {"c0" : 21.        , "c1"  : 22.         },
+                        "class_free_constants_units"      : {"c0" : [-1, 0, 0] , "c1"  : [0, -1, 0] },
+                        "class_free_constants_complexity" : {"c0" : 1.         , "c1"  : 1.         },
+                        # free constants
+                        "spe_free_constants"            : {"k0"              , "k1"               , "k2"               },
+                        "spe_free_constants_init_val"   : {"k0" : [9,10,11]*10, "k1"  : 2.        , "k2"  : 3.         },
+                        "spe_free_constants_units"      : {"k0" : [0, 0, 0]  , "k1"  : [-1, 0, 0] , "k2"  : [0, 0, 0]  },
+                        "spe_free_constants_complexity" : {"k0" : 1.         , "k1"  : 1.         , "k2"  : 1.         },
+                           }
+        my_lib = Lib.Library(args_make_tokens = args_make_tokens,
+                             superparent_units = [0, 0, 0], superparent_name = "y")
+
+        # TEST PROGRAMS (of different lengths, tokens out of tree are ignored)
+        test_progs_str = [
+            ["add", "mul", "mul", "k0"  , "exp", "mul", "neg", "k1", "t", "cos", "add", "mul", "c0", "t", "k2", "mul", "c1", "l", ],
+            ["mul", "t", "exp", "mul", "neg", "k1", "t",],
+            ["div", "log", "t", "sub", "pi", "const1",],
+            ["add", "t", "l",],
+            ["inv", "sqrt", "l",],
+            ["l",],
+            ["sub", "c1", "mul", "k2", "n2", "t",],
+        ]
+        batch_size = 100
+        max_len    = max([len(prog_str) for prog_str in test_progs_str])
+        test_progs_idx = np.full((batch_size, max_len), my_lib.lib_name_to_idx["t"])
+        for i in range (batch_size):
+            prog_str = test_progs_str[i%len(test_progs_str)]
+            test_progs_idx[i, :len(prog_str)] = [my_lib.lib_name_to_idx[name] for name in prog_str]
+
+        # BATCH
+        my_programs = VProg.VectPrograms(batch_size=batch_size, max_time_step=max_len, library=my_lib, n_realizations=n_realizations)
+        my_programs.set_programs(test_progs_idx)
+        # Spoiling free constants so each program has different values
+        my_programs.free_consts.class_values = my_programs.free_consts.class_values * torch.rand(batch_size, 1).to(torch.float64)
+        my_programs.free_consts.spe_values   = my_programs.free_consts.spe_values   * torch.rand(batch_size, 1, 1).to(torch.float64)
+
+        # MASK: WHICH PROGRAM SHOULD BE EXECUTED
+        mask = np.random.rand(batch_size) < 0.9
+
+        # Test vectorized execution (flattened class SR)
+        t0 = time.perf_counter()
+        y_vect = BExec.VectBatchExecution(progs = my_programs, X = multi_X_flatten,
+                                          n_samples_per_dataset = n_samples_per_dataset,
+                                          mask = mask)                               # (batch_size, n_all_samples)
+        t1 = time.perf_counter()
+        print("\nVectBatchExecution time (flattened class SR) = %.3f ms"%((t1-t0)*1e3))
+        t0 = time.perf_counter()
+        for i in range (batch_size):
+            prog = my_programs.get_prog(i)
+            y_expected = prog.execute(multi_X_flatten, n_samples_per_dataset=n_samples_per_dataset)
+            if mask[i]:
+                works_bool = torch.allclose(y_vect[i], y_expected, equal_nan=True)
+                self.assertTrue(works_bool)
+            else:
+                self.assertTrue(torch.isnan(y_vect[i]).all())
+        t1 = time.perf_counter()
+        print("Program by program execution time (flattened class SR) = %.3f ms"%((t1-t0)*1e3))
+
+        # Test vectorized execution (single realization)
+        y_vect = BExec.VectBatchExecution(progs = my_programs, X = multi_X[1], i_realization = 1)
+        for i in range (batch_size):
+            y_expected = my_programs.get_prog(i).execute(multi_X[1], i_realization = 1)
+            works_bool = torch.allclose(y_vect[i], y_expected, equal_nan=True)
+            self.assertTrue(works_bool)
+
+        # Test vectorized rewards (through VectPrograms) against rewards computed in a loop
+        rewards_loop = my_programs.batch_exe_reward(X = multi_X_flatten, y_target = y_target,
+                                                    reward_function = reward.SquashedNRMSE,
+                                                    n_samples_per_dataset = n_samples_per_dataset,
+                                                    mask = mask, vectorized_mode = False)
+        rewards_vect = my_programs.batch_exe_reward(X = multi_X_flatten, y_target = y_target,
+                                                    reward_function = reward.SquashedNRMSE,
+                                                    n_samples_per_dataset = n_samples_per_dataset,
+                                                    mask = mask, vectorized_mode = True)
+        works_bool = np.allclose(rewards_loop, rewards_vect, equal_nan=True)
+        self.assertTrue(works_bool)
+
+        # Test execution layout shared across executions with different free constants values
+        tokens_idx   = my_programs.tokens.idx
+        children_pos = my_programs.tokens.children_pos
+        class_vals   = my_programs.free_consts.class_values                                      # (batch_size, n_class_free_const,)
+        spe_vals     = my_programs.free_consts.spe_values[:, :, 1]                               # (batch_size, n_spe_free_const,)
+        layout = Exec.VectProgramsLayout(tokens_idx = tokens_idx, children_pos = children_pos, library = my_lib,
+                                         class_free_consts_vals = class_vals, spe_free_consts_vals = spe_vals,
+                                         device = multi_X[1].device)
+        for factor in [1., 3.]:
+            y_shared = Exec.ExecuteVectPrograms(input_var_data = multi_X[1], tokens_idx = None, children_pos = None,
+                                                library = my_lib, class_free_consts_vals = factor*class_vals,
+                                                spe_free_consts_vals = factor*spe_vals, layout = layout)
+            y_fresh  = Exec.ExecuteVectPrograms(input_var_data = multi_X[1], tokens_idx = tokens_idx,
+                                                children_pos = children_pos, library = my_lib,
+                                                class_free_consts_vals = factor*class_vals,
+                                                spe_free_consts_vals = factor*spe_vals)
+            works_bool = torch.equal(torch.nan_to_num(y_shared, nan=-1.), torch.nan_to_num(y_fresh, nan=-1.))
+            self.assertTrue(works_bool)
+
+        return None
+
+    # Test vectorized execution against program by program execution on random programs (float32 data, float64
+    # constants) with a memory budget forcing execution by chunks
+    def test_ExecuteVectPrograms_random_parity (self):
+
+        DEVICE = 'cpu'
+        if torch.cuda.is_available():
+            DEVICE = 'cuda'
+
+        seed = 42
+        np.random.seed(seed)
+        torch.manual_seed(seed)
+
+        # DATA (float32 as in real runs)
+        n_samples = 500
+        X = torch.stack((torch.linspace(0.1, 10, n_samples), torch.linspace(-1, 1, n_samples)), axis=0).to(DEVICE)
+        y_target = X[0]*torch.exp(-0.3*X[0]) + X[1]                                                      # (n_samples,)
+
+        # LIBRARY CONFIG (fixed constants as float64 tensors as in real runs)
+        args_make_tokens = {
+                        # operations
+                        "op_names"             : "all",
+                        "use_protected_ops"    : True,
+                        # input variables
+                        "input_var_ids"        : {"t" : 0         , "l" : 1          },
+                        "input_var_units"      : {"t" : [0, 0, 0] , "l" : [0, 0, 0]  },
+                        "input_var_complexity" : {"t" : 1.        , "l" : 1.         },
+                        # constants
+                        "constants"            : {"pi" : torch.tensor(np.pi).to(DEVICE) , "const1" : torch.tensor(1.).to(torch.float64).to(DEVICE) },
+                        "constants_units"      : {"pi" : [0, 0, 0]                      , "const1" : [0, 0, 0]                                     },
+                        "constants_complexity" : {"pi" : 1.                             , "const1" : 1.                                            },
+                        # free constants
+                        "class_free_constants"            : {"c0"              , "c1"               },
+                        "class_free_constants_init_val"   : {"c0" : 1.         , "c1"  : 1.         },
+                        "class_free_constants_units"      : {"c0" : [0, 0, 0]  , "c1"  : [0, 0, 0]  },
+                        "class_free_constants_complexity" : {"c0" : 1.         , "c1"  : 1.         },
+                        # free constants
+                        "spe_free_constants"            : {"k0"              , "k1"               },
+                        "spe_free_constants_init_val"   : {"k0" : 1.         , "k1"  : 1.         },
+                        "spe_free_constants_units"      : {"k0" : [0, 0, 0]  , "k1"  : [0, 0, 0]  },
+                        "spe_free_constants_complexity" : {"k0" : 1.         , "k1"  : 1.         },
+                           }
+        my_lib = Lib.Library(args_make_tokens = args_make_tokens,
+                             superparent_units = [0, 0, 0], superparent_name = "y")
+
+        # RANDOM PROGRAMS (constants only sub-trees being frequent)
+        ops       = [tok.name for tok in my_lib.lib_tokens if tok.arity > 0 and tok.var_type == 0]
+        terminals = ["t", "l", "pi", "const1", "c0", "c1", "k0", "k1"]
+        def random_prog (depth):
+            if depth == 0 or np.random.rand() < 0.3:
+                return [np.random.choice(terminals)]
+            op = np.random.choice(ops)
+            prog = [op]
+            for _ in range(my_lib.lib_name_to_token[op].arity):
+                prog += random_prog(depth-1)
+            return prog
+        batch_size = 1000
+        test_progs_str = [random_prog(depth=5) for _ in range (batch_size)]
+        max_len    = max([len(prog_str) for prog_str in test_progs_str])
+        test_progs_idx = np.full((batch_size, max_len), my_lib.lib_name_to_idx["t"])
+        for i, prog_str in enumerate(test_progs_str):
+            test_progs_idx[i, :len(prog_str)] = [my_lib.lib_name_to_idx[name] for name in prog_str]
+
+        # BATCH
+        my_programs = VProg.VectPrograms(batch_size=batch_size, max_time_step=max_len, library=my_lib, n_realizations=1)
+        my_programs.set_programs(test_progs_idx)
+        # Free constants values spanning several orders of magnitude
+        my_programs.free_consts.class_values = my_programs.free_consts.class_values * 10**(4*torch.rand(batch_size, 2).to(torch.float64) - 2)
+        my_programs.free_consts.spe_values   = my_programs.free_consts.spe_values   * 10**(4*torch.rand(batch_size, 2, 1).to(torch.float64) - 2)
+        # Free constants being optimized typically require grad
+        my_programs.free_consts.class_values.requires_grad_(True)
+
+        # Memory budget forcing execution by chunks
+        max_memory = BExec.VECTORIZED_EXE_MAX_MEMORY
+        BExec.VECTORIZED_EXE_MAX_MEMORY = 100*n_samples*4
+        try:
+            n_chunks = len(list(BExec.VectBatchExecutionChunks(progs = my_programs, X = X)))
+            rewards_loop = my_programs.batch_exe_reward(X = X, y_target = y_target, reward_function = reward.SquashedNRMSE,
+                                                        vectorized_mode = False)
+            # No autograd graph should be built for rewards
+            y_pred_requires_grad = []
+            def reward_function (y_target, y_pred, y_weights):
+                y_pred_requires_grad.append(y_pred.requires_grad)
+                return reward.SquashedNRMSE(y_target=y_target, y_pred=y_pred, y_weights=y_weights)
+            rewards_vect = my_programs.batch_exe_reward(X = X, y_target = y_target, reward_function = reward_function,
+                                                        vectorized_mode = True)
+        finally:
+            BExec.VECTORIZED_EXE_MAX_MEMORY = max_memory
+
+        # TEST
+        self.assertTrue(n_chunks > 1)
+        self.assertFalse(any(y_pred_requires_grad))
+        works_bool = np.allclose(rewards_loop, rewards_vect, rtol=1e-5, atol=1e-6, equal_nan=True)
+        self.assertTrue(works_bool, "Max reward difference = %f"%(np.nanmax(np.abs(rewards_loop - rewards_vect))))
+
+        return None
+
+    # Test rewards streamed over blocks of samples against rewards computed on all samples at once
+    def test_VectBatchExecutionStreamingReward (self):
+
+        DEVICE = 'cpu'
+        if torch.cuda.is_available():
+            DEVICE = 'cuda'
+
+        seed = 42
+        np.random.seed(seed)
+        torch.manual_seed(seed)
+
+        # DATA (3 datasets)
+        n_samples_per_dataset = np.array([300, 200, 500])
+        n_samples = n_samples_per_dataset.sum()
+        X = torch.stack((torch.linspace(0.1, 10, n_samples), torch.linspace(-1, 1, n_samples)), axis=0).to(DEVICE)
+        y_target  = X[0]*torch.exp(-0.3*X[0]) + X[1]                                                     # (n_samples,)
+        y_weights = torch.rand(n_samples).to(DEVICE)                                                     # (n_samples,)
+
+        # LIBRARY CONFIG
+        args_make_tokens = {
+                        # operations
+                        "op_names"             : ["mul", "add", "sub", "div", "exp", "log", "cos"],
+                        "use_protected_ops"    : True,
+                        # input variables
+                        "input_var_ids"        : {"t" : 0         , "l" : 1          },
+                        "input_var_units"      : {"t" : [0, 0, 0] , "l" : [0, 0, 0]  },
+                        "input_var_complexity" : {"t" : 1.        , "l" : 1.         },
+                        # constants
+                        "constants"            : {"pi" : torch.tensor(np.pi).to(DEVICE) },
+                        "constants_units"      : {"pi" : [0, 0, 0]                      },
+                        "constants_complexity" : {"pi" : 1.                             },
+                        # free constants
+                        "class_free_constants"            : {"c0"              },
+                        "class_free_constants_init_val"   : {"c0" : 1.         },
+                        "class_free_constants_units"      : {"c0" : [0, 0, 0]  },
+                        "class_free_constants_complexity" : {"c0" : 1.         },
+                        # free constants
+                        "spe_free_constants"            : {"k0"              },
+                        "spe_free_constants_init_val"   : {"k0" : 1.         },
+                        "spe_free_constants_units"      : {"k0" : [0, 0, 0]  },
+                        "spe_free_constants_complexity" : {"k0" : 1.         },
+                           }
+        my_lib = Lib.Library(args_make_tokens = args_make_tokens,
+                             superparent_units = [0, 0, 0], superparent_name = "y")
+
+        # RANDOM PROGRAMS
+        ops       = [tok.name for tok in my_lib.lib_tokens if tok.arity > 0 and tok.var_type == 0]
+        terminals = ["t", "l", "pi", "c0", "k0"]
+        def random_prog (depth):
+            if depth == 0 or np.random.rand() < 0.3:
+                return [np.random.choice(terminals)]
+            op = np.random.choice(ops)
+            prog = [op]
+            for _ in range(my_lib.lib_name_to_token[op].arity):
+                prog += random_prog(depth-1)
+            return prog
+        batch_size = 200
+        test_progs_str = [random_prog(depth=4) for _ in range (batch_size)]
+        max_len    = max([len(prog_str) for prog_str in test_progs_str])
+        test_progs_idx = np.full((batch_size, max_len), my_lib.lib_name_to_idx["t"])
+        for i, prog_str in enumerate(test_progs_str):
+            test_progs_idx[i, :len(prog_str)] = [my_lib.lib_name_to_idx[name] for name in prog_str]
+
+        # BATCH
+        n_realizations = len(n_samples_per_dataset)
+        my_programs = VProg.VectPrograms(batch_size=batch_size, max_time_step=max_len, library=my_lib,
+                                         n_realizations=n_realizations)
+        my_programs.set_programs(test_progs_idx)
+        my_programs.free_consts.class_values = my_programs.free_consts.class_values * 10**(2*torch.rand(batch_size, 1).to(torch.float64) - 1)
+        my_programs.free_consts.spe_values   = my_programs.free_consts.spe_values   * 10**(2*torch.rand(batch_size, 1, n_realizations).to(torch.float64) - 1)
+        mask = np.random.rand(batch_size) < 0.9
+
+        # REWARDS
+        args = {"X"                     : X,
+                "y_target"              : y_target,
+                "y_weights"             : y_weights,
+                "reward_function"       : reward.SquashedNRMSE,
+                "n_samples_per_dataset" : n_samples_per_dataset,
+                "mask"                  : mask,
+                "pad_with"              : 0.,
+                "vectorized_mode"       : True,}
+        rewards = my_programs.batch_exe_reward(**args)
+        # Blocks not aligned with datasets
+        samples_chunk_size = BExec.VECTORIZED_EXE_SAMPLES_CHUNK_SIZE
+        BExec.VECTORIZED_EXE_SAMPLES_CHUNK_SIZE = 70
+        try:
+            rewards_streamed = my_programs.batch_exe_reward(**args,
+                                streaming_reward = reward.STREAMING_REWARDS[reward.SquashedNRMSE])
+        finally:
+            BExec.VECTORIZED_EXE_SAMPLES_CHUNK_SIZE = samples_chunk_size
+
+        # TEST
+        self.assertTrue(np.isfinite(rewards[mask]).sum() > batch_size//2)
+        self.assertTrue((rewards_streamed[~mask] == 0.).all())
+        works_bool = np.allclose(rewards, rewards_streamed, rtol=1e-5, atol=1e-6, equal_nan=True)
+        self.assertTrue(works_bool, "Max reward difference = %f"%(np.nanmax(np.abs(rewards - rewards_streamed))))
+
+        return None
+
+    # Test compiled program execution against program execution
+    def test_ExecuteCompiledProgram (self):
+
+        DEVICE = 'cpu'
+        if torch.cuda.is_available():
+            DEVICE = 'cuda'
+
+        # DATA
+        N = int(1e3)
+
+        # input var
+        x = data_conversion  (np.linspace(0.04, 4, N)  ).to(DEVICE)
+        v = data_conversion  (np.linspace(0.10, 10, N) ).to(DEVICE)
+        t = data_conversion  (np.linspace(0.06, 6, N)  ).to(DEVICE)
+        data = torch.stack((x, v, t), axis=0)
+
+        # consts
+        pi = data_conversion (np.pi).to(DEVICE)
+        const1 = data_conversion (1.).to(DEVICE)
+
+        # free consts
+        c  = data_conversion (3e8).to(DEVICE)
+        M  = data_conversion (1e6).to(DEVICE)
+        free_const_values = torch.stack((M, c), axis=0)
+        # (M, c) in alphabetical order as library will give them ids based on that order
+
+        # LIBRARY CONFIG
+        args_make_tokens = {
+                        # operations
+                        "op_names"             : "all",  # or ["mul", "neg", "inv", "sin"]
+                        "use_protected_ops"    : False,
+                        # input variables
+                        "input_var_ids"        : {"x" : 0         , "v" : 1          , "t" : 2,        },
+                        "input_var_units"      : {"x" : [1, 0, 0] , "v" : [1, -1, 0] , "t" : [0, 1, 0] },
+                        "input_var_complexity" : {"x" : 0.        , "v" : 1.         , "t" : 0.,       },
+                        # constants
+                        "constants"            : {"pi" : pi        , "1" : const1    },
+                        "constants_units"      : {"pi" : [0, 0, 0] , "1" : [0, 0, 0] },
+                        "constants_complexity" : {"pi" : 0.        , "1" : 1.        },
+                        # free constants
+                        "free_constants"            : {"c"              , "M"             },
+                        "free_constants_init_val"   : {"c" : 1.         , "M" : 1.        },
+                        "free_constants_units"      : {"c" : [1, -1, 0] , "M" : [0, 0, 1] },
+                        "free_constants_complexity" : {"c" : 0.         , "M" : 1.        },
+                           }
+        my_lib = Lib.Library(args_make_tokens = args_make_tokens,
+                             superparent_units = [1, -2, 1], superparent_name = "y")
+
+        # PROGRAM
+        test_program_str = ["mul", "mul", "M", "n2", "c", "sub", "inv", "sqrt", "sub", "1", "div", "n2", "v", "n2",
+                            "c", "cos", "div", "sub", "1", "div", "v", "c", "div", "div", "x", "t", "c"]
+        test_program     = [my_lib.lib_name_to_token[name] for name in test_program_str]
+        expected_res = Exec.ExecuteProgram(input_var_data = data, class_free_consts_vals = free_const_values, program_tokens = test_program, )
+
+        # EXECUTION
+        Exec.COMPILED_PROGRAMS_CACHE.clear()
+        n_exe = 100
+        t0 = time.perf_counter()
+        for _ in range (n_exe):
+            res = Exec.ExecuteCompiledProgram(input_var_data = data, class_free_consts_vals = free_const_values, program_tokens = test_program, )
+        t1 = time.perf_counter()
+        print("\nExecuteCompiledProgram time = %.3f ms"%((t1-t0)*1e3/n_exe))
+
+        # TEST
+        works_bool = np.array_equal(data_conversion_inv(res.cpu()), data_conversion_inv(expected_res.cpu()),)
+        self.assertTrue(works_bool)
+        # Program was compiled once then retrieved from cache
+        self.assertEqual(Exec.COMPILED_PROGRAMS_CACHE.misses, 1)
+        self.assertEqual(Exec.COMPILED_PROGRAMS_CACHE.hits, n_exe-1)
+
+        # TEST ERRORS
+        with self.assertRaises(ValueError):
+            Exec.ExecuteCompiledProgram(input_var_data = data, program_tokens = test_program, )
+
+        # TEST CACHE EVICTION
+        cache = Exec.CompiledProgramsCache(max_size = 2)
+        progs_str = [["x"], ["n2", "x"], ["mul", "x", "v"]]
+        for prog_str in progs_str:
+            cache.get([my_lib.lib_name_to_token[name] for name in prog_str])
+        self.assertEqual(len(cache), 2)
+        cache.get([my_lib.lib_name_to_token[name] for name in progs_str[0]])
+        self.assertEqual(cache.misses, 4)
+
+        # TEST CACHE ACROSS LIBRARIES
+        # Equivalent library (eg. re-created at each epoch) : compiled program is retrieved from cache
+        Exec.COMPILED_PROGRAMS_CACHE.clear()
+        Exec.ExecuteCompiledProgram(input_var_data = data, class_free_consts_vals = free_const_values, program_tokens = test_program, )
+        other_lib = Lib.Library(args_make_tokens = args_make_tokens,
+                                superparent_units = [1, -2, 1], superparent_name = "y")
+        other_program = [other_lib.lib_name_to_token[name] for name in test_program_str]
+        res = Exec.ExecuteCompiledProgram(input_var_data = data, class_free_consts_vals = free_const_values, program_tokens = other_program, )
+        self.assertEqual(Exec.COMPILED_PROGRAMS_CACHE.misses, 1)
+        self.assertEqual(Exec.COMPILED_PROGRAMS_CACHE.hits, 1)
+        self.assertTrue(np.array_equal(data_conversion_inv(res.cpu()), data_conversion_inv(expected_res.cpu()),))
+        # Library with a different fixed constant value : program is compiled again
+        other_args_make_tokens = args_make_tokens.copy()
+        other_args_make_tokens["constants"] = {"pi" : pi, "1" : data_conversion (2.).to(DEVICE)}
+        other_lib = Lib.Library(args_make_tokens = other_args_make_tokens,
+                                superparent_units = [1, -2, 1], superparent_name = "y")
+        other_program = [other_lib.lib_name_to_token[name] for name in test_program_str]
+        res = Exec.ExecuteCompiledProgram(input_var_data = data, class_free_consts_vals = free_const_values, program_tokens = other_program, )
+        self.assertEqual(Exec.COMPILED_PROGRAMS_CACHE.misses, 2)
+        expected_res = Exec.ExecuteProgram(input_var_data = data, class_free_consts_vals = free_const_values, program_tokens = other_program, )
+        self.assertTrue(np.array_equal(data_conversion_inv(res.cpu()), data_conversion_inv(expected_res.cpu()), equal_nan=True))
+
+        return None
+
+    # Test constant folding and identity operations removal of compiled programs
+    def test_CompileProgram_constant_folding (self):
+
+        DEVICE = 'cpu'
+        if torch.cuda.is_available():
+            DEVICE = 'cuda'
+
+        # DATA
+        N = int(1e3)
+        x = data_conversion (np.linspace(0.04, 4, N)).to(DEVICE)
+        v = data_conversion (np.linspace(0.10, 10, N)).to(DEVICE)
+        data = torch.stack((x, v), axis=0)
+
+        # LIBRARY CONFIG
+        args_make_tokens = {
+                        # operations
+                        "op_names"             : "all",
+                        "use_protected_ops"    : True,
+                        # input variables
+                        "input_var_ids"        : {"x" : 0         , "v" : 1          },
+                        "input_var_units"      : {"x" : [0, 0, 0] , "v" : [0, 0, 0]  },
+                        "input_var_complexity" : {"x" : 1.        , "v" : 1.         },
+                        # constants
+                        "constants"            : {"pi" : torch.tensor(np.pi).to(DEVICE) , "1" : torch.tensor(1.).to(torch.float64).to(DEVICE) },
+                        "constants_units"      : {"pi" : [0, 0, 0]                      , "1" : [0, 0, 0]                                     },
+                        "constants_complexity" : {"pi" : 1.                             , "1" : 1.                                            },
+                           }
+        my_lib = Lib.Library(args_make_tokens = args_make_tokens,
+                             superparent_units = [0, 0, 0], superparent_name = "y")
+
+        # PROGRAMS : (program, expected number of operations computed at execution)
+        test_programs_str = [
+            (["mul", "mul", "1", "pi", "x"]                         , 1),
+            (["add", "x", "sub", "pi", "pi"]                        , 0),
+            (["div", "v", "div", "pi", "pi"]                        , 0),
+            (["mul", "add", "sub", "1", "1", "x", "mul", "1", "v"]  , 1),
+            (["sub", "sub", "1", "1", "x"]                          , 1),
+            (["div", "1", "x"]                                      , 1),
+            (["exp", "mul", "1", "pi"]                              , 0),
+            (["cos", "add", "x", "mul", "v", "div", "pi", "pi"]     , 2),
+        ]
+
+        # TEST
+        for test_program_str, n_ops in test_programs_str:
+            test_program = [my_lib.lib_name_to_token[name] for name in test_program_str]
+            compiled_program = Exec.CompileProgram(test_program)
+            self.assertEqual(compiled_program.source.count("= f"), n_ops, compiled_program.source)
+            res          = compiled_program(data)
+            expected_res = Exec.ExecuteProgram(input_var_data = data, program_tokens = test_program)
+            self.assertEqual(res.dtype, expected_res.dtype)
+            works_bool = np.array_equal(data_conversion_inv(res.cpu()), data_conversion_inv(expected_res.cpu()))
+            self.assertTrue(works_bool, " ".join(test_program_str))
+
+        # Python scalar constants : folding results in tensors (same values as with tensor constants)
+        args_make_tokens_scalars = dict(args_make_tokens, constants = {"pi" : float(np.pi), "1" : 1})
+        my_lib_scalars = Lib.Library(args_make_tokens = args_make_tokens_scalars,
+                                     superparent_units = [0, 0, 0], superparent_name = "y")
+        test_programs_str += [
+            (["div", "1", "1"]                                      , 0),
+            (["add", "1", "1"]                                      , 0),
+            (["sqrt", "add", "1", "pi"]                             , 0),
+        ]
+        for test_program_str, n_ops in test_programs_str:
+            test_program = [my_lib_scalars.lib_name_to_token[name] for name in test_program_str]
+            compiled_program = Exec.CompileProgram(test_program)
+            self.assertEqual(compiled_program.source.count("= f"), n_ops, compiled_program.source)
+            res = compiled_program(data)
+            self.assertTrue(torch.is_tensor(res), " ".join(test_program_str))
+            expected_res = Exec.ExecuteProgram(input_var_data = data,
+                                               program_tokens = [my_lib.lib_name_to_token[name] for name in test_program_str])
+            works_bool = torch.allclose(res.to(torch.float64), expected_res.to(torch.float64))
+            self.assertTrue(works_bool, " ".join(test_program_str))
+
+        return None
+
     # Test program infix notation on a complicated function
     def test_ComputeInfixNotation(self):
 
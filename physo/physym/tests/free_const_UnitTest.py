@@ -1,5 +1,6 @@
 import time
 import unittest
+from unittest import mock
 import torch
 import numpy as np
 
@@ -11,6 +12,8 @@ from physo.physym import library as Lib
 from physo.physym import vect_programs as VProg
 from physo.physym.functions import data_conversion, data_conversion_inv
 from physo.physym import execute as Exec
+from physo.physym import dataset
+from physo.physym import program as Prog
 
 
 class FreeConstUtilsTest(unittest.TestCase):
@@ -73,6 +76,384 @@ class FreeConstUtilsTest(unittest.TestCase):
 
         return None
 
+    # Testing early abandonment of optimization (stalling and racing)
+    def test_early_abandonment (self):
+
+        # is_abandoned
+        history = np.array([[1., 1., 1.], [0.5, 0.99, 0.5], [0.25, 0.98, 0.499]])              # (3, 3)
+        res = free_const.is_abandoned(history, n_steps=30)
+        self.assertEqual(res.tolist(), [False, False, False])
+        res = free_const.is_abandoned(history, n_steps=30, stall_steps=1, stall_rtol=1e-2)
+        self.assertEqual(res.tolist(), [False, False, True])
+        # Racing : 0.25*0.5**27 < 1e-6, 0.98*0.98**27 > 1e-6, 0.499*0.5**27 < 1e-6
+        res = free_const.is_abandoned(history, n_steps=30, abandon_loss=1e-6)
+        self.assertEqual(res.tolist(), [False, True, False])
+        # NaNs (stopped problems) are not abandoned
+        res = free_const.is_abandoned(np.full((3, 2), np.nan), n_steps=30, stall_steps=1, abandon_loss=1e-6)
+        self.assertEqual(res.tolist(), [False, False])
+
+        # Data : y = a*exp(b*x) (a and b being reachable) and trial function a*cos(b*x) (plateauing far above tol)
+        x = torch.linspace(0., 2., 100).double()
+        y_target = 1.5*torch.exp(0.7*x)
+        func_good = lambda params: params[0]*torch.exp(params[1]*x)
+        func_bad  = lambda params: params[0]*torch.cos(params[1]*x)
+        method_args = dict(free_const.DEFAULT_LBFGS_OPTI_ARGS, abandon_loss=1e-6)
+
+        # Scalar optimizer
+        params = torch.ones(2).double()
+        history = free_const.optimize_free_const(func=func_good, params=params, y_target=y_target, method_args=method_args)
+        self.assertTrue(history[-1] < 1e-6)
+        params = torch.ones(2).double()
+        history_full = free_const.optimize_free_const(func=func_bad, params=params, y_target=y_target)
+        params = torch.ones(2).double()
+        history = free_const.optimize_free_const(func=func_bad, params=params, y_target=y_target, method_args=method_args)
+        self.assertTrue(len(history) < len(history_full))
+        # Abandonment is recognized afterwards from history (not when optimization used its whole budget)
+        self.assertTrue(free_const.was_abandoned(history, method_args=method_args))
+        self.assertFalse(free_const.was_abandoned(history_full, method_args=method_args))
+        self.assertFalse(free_const.was_abandoned(history, method_args=free_const.DEFAULT_LBFGS_OPTI_ARGS))
+
+        # Batched optimizer
+        func_batch = lambda params, rows: torch.stack([func_good([params[0][0, 0], params[0][0, 1]]),
+                                                       func_bad ([params[0][1, 0], params[0][1, 1]])])[rows]
+        params = torch.ones(2, 2).double()
+        history, opti_steps = free_const.optimize_free_const_batch(func=func_batch, params=[params], y_target=y_target,
+                                                                   method_args=method_args)
+        self.assertTrue(history[opti_steps[0]-1, 0] < 1e-6)
+        self.assertTrue(opti_steps[1] < len(history_full))
+        self.assertEqual(free_const.was_abandoned(history, method_args=method_args).tolist(), [False, True])
+
+        return None
+
+    # Testing multi-start optimization (escaping local minima of constants inside sin)
+    def test_multi_start (self):
+
+        seed = 42
+        np.random.seed(seed)
+        torch.manual_seed(seed)
+
+        x = torch.linspace(0., 6., 200).double()
+        y_target = 1.3*torch.sin(4.2*x)
+        func = lambda params: params[0]*torch.sin(params[1]*x)
+
+        # Single start is stuck in a local minimum
+        params = torch.ones(2).double()
+        history = free_const.optimize_free_const(func=func, params=params, y_target=y_target)
+        self.assertTrue(history[-1] > 1e-2)
+
+        # Multi-start escapes it (starts being stacked along first dimension)
+        func_starts = lambda params, rows: params[0][rows, :1]*torch.sin(params[0][rows, 1:]*x)  # (n_rows, ?)
+        params = torch.ones(1, 2).double()
+        history = free_const.optimize_free_const(func=lambda params: func(params[0][0]), params=[params],
+                                                 y_target=y_target, n_starts=64, func_starts=func_starts)
+        self.assertTrue(history[-1] < 1e-8)
+        self.assertFalse(np.isnan(history).any())
+        self.assertTrue(((func(params[0]) - y_target)**2).mean() < 1e-8)
+
+        # Batched optimizer : multi-start escapes it
+        func_batch = lambda params, rows: params[0][rows, :1]*torch.sin(params[0][rows, 1:]*x)   # (n_rows, ?)
+        params = torch.ones(1, 2).double()
+        free_const.optimize_free_const_batch(func=func_batch, params=[params], y_target=y_target, n_starts=64)
+        self.assertTrue(((func_batch([params], [0]) - y_target)**2).mean() < 1e-8)
+
+        # Best start is never worse than single start (first start being init values)
+        n_progs = 3
+        params_single = torch.ones(n_progs, 2).double()
+        free_const.optimize_free_const_batch(func=func_batch, params=[params_single], y_target=y_target)
+        params = torch.ones(n_progs, 2).double()
+        history, opti_steps = free_const.optimize_free_const_batch(func=func_batch, params=[params], y_target=y_target,
+                                                                   n_starts=16)
+        self.assertEqual(history.shape[1], n_progs)
+        self.assertEqual(opti_steps.shape, (n_progs,))
+        loss = lambda params: ((func_batch([params], np.arange(n_progs)) - y_target)**2).mean(dim=-1)
+        self.assertTrue((loss(params) <= loss(params_single)).all())
+        self.assertTrue((loss(params) < 1e-10).any())
+
+        return None
+
+    # Testing that LM optimizer converges on a least squares problem
+    def test_lm_optimizer (self):
+
+        seed = 42
+        np.random.seed(seed)
+        torch.manual_seed(seed)
+
+        DEVICE = 'cpu'
+        if torch.cuda.is_available():
+            DEVICE = 'cuda'
+
+        # ------ Test case ------
+        # Data
+        N = 100
+        r = data_conversion(np.linspace(-10, 10, N)).to(DEVICE)
+        v = data_conversion(np.linspace(-10, 10, N)).to(DEVICE)
+        X = torch.stack((r,v), axis=0)
+
+        func = lambda params, X: params[0] * X[1] ** 2 + (params[1] ** 2) * torch.log(X[0] ** 2 + params[2] ** 2)
+
+        ideal_params = [0.5, 1.14, 0.936]
+        func_params = lambda params: func(params, X)
+        y_target = func_params(params=ideal_params)
+
+        n_params = len(ideal_params)
+
+        # ------ Run ------
+        total_n_steps = 0
+        t0 = time.perf_counter()
+
+        N = 100
+        for _ in range (N):
+
+            params_init = 1. * torch.ones(n_params, ).to(DEVICE)
+            params = params_init
+
+            history = free_const.optimize_free_const (     func     = func_params,
+                                                           params   = params,
+                                                           y_target = y_target,
+                                                           loss        = "MSE",
+                                                           method      = "LM",
+                                                           method_args = None)
+            total_n_steps += history.shape[0]
+
+        t1 = time.perf_counter()
+        dt = ((t1-t0)*1e3)/total_n_steps
+        print("LM const opti: %f ms / step" %(dt))
+
+        # ------ Test ------
+        # Params 1 and 2 are only defined up to their sign
+        obs_params   = np.abs(params.detach().cpu().numpy())
+        ideal_params = np.array(ideal_params)
+        for i in range (n_params):
+            err = np.abs(obs_params[i] - ideal_params[i])
+            works_bool = (err < 1e-6)
+            self.assertEqual(works_bool, True)
+        self.assertTrue(history[-1] < free_const.DEFAULT_LM_OPTI_ARGS["tol"])
+
+        return None
+
+    # Testing that LM optimizer works on functions having a constant output (eg. exp(a))
+    def test_lm_optimizer_constant_output (self):
+
+        DEVICE = 'cpu'
+        if torch.cuda.is_available():
+            DEVICE = 'cuda'
+
+        # ------ Test case ------
+        N = 100
+        y_target = data_conversion(np.linspace(4., 5., N)).to(DEVICE)
+        func_params = lambda params: torch.exp(params[0])                                     # 0-dim output
+
+        # Residuals are broadcast to data points
+        params = torch.tensor([1.], dtype=torch.float64).to(DEVICE)
+        residuals = free_const.MSE_residuals(func = func_params, params = params, y_target = y_target)
+        self.assertEqual(residuals.shape, (N,))
+        expected_loss = free_const.MSE_loss(func = func_params, params = params, y_target = y_target)
+        self.assertTrue(torch.allclose((residuals**2).sum(), expected_loss))
+
+        # ------ Run ------
+        history = free_const.optimize_free_const (func     = func_params,
+                                                  params   = params,
+                                                  y_target = y_target,
+                                                  loss        = "MSE",
+                                                  method      = "LM",
+                                                  method_args = None)
+
+        # ------ Test ------
+        # Best constant output is the mean of target
+        ideal_param = np.log(y_target.mean().item())
+        self.assertTrue(np.abs(params[0].item() - ideal_param) < 1e-6)
+        self.assertTrue(history[-1] < history[0])
+
+        return None
+
+    # Testing that batched LBFGS optimizer optimizes independent problems at once
+    def test_lbfgs_batch_optimizer (self):
+
+        seed = 42
+        np.random.seed(seed)
+        torch.manual_seed(seed)
+
+        DEVICE = 'cpu'
+        if torch.cuda.is_available():
+            DEVICE = 'cuda'
+
+        # ------ Test case ------
+        # Data
+        N = 100
+        r = data_conversion(np.linspace(-10, 10, N)).to(DEVICE)
+        v = data_conversion(np.linspace(-10, 10, N)).to(DEVICE)
+        X = torch.stack((r,v), axis=0)
+
+        # Batch of 4 problems (last one always giving nan)
+        func = lambda params, X: params[:, 0:1] * X[1] ** 2 + (params[:, 1:2] ** 2) * torch.log(X[0] ** 2 + params[:, 2:3] ** 2)
+        def func_params (params, rows):
+            y = func(params[0], X)                                                       # (n_progs, N)
+            y = torch.cat((y[:3], y[3:]*torch.sqrt(params[0][3:, 0:1] - 10.)), dim=0)    # (n_progs, N)
+            return y[rows]                                                               # (n_rows, N)
+
+        ideal_params = [0.5, 1.14, 0.936]
+        y_target = func(torch.tensor([ideal_params]).to(DEVICE), X)[0]
+
+        n_progs  = 4
+        n_params = len(ideal_params)
+        params_init = torch.tensor([[1.,  1.,  1. ],
+                                    [0.5, 1.,  1.2],
+                                    [0.5, 1.14, 0.936],
+                                    [1.,  1.,  1. ]]).to(DEVICE)
+        params = params_init.clone()
+
+        # ------ Run ------
+        t0 = time.perf_counter()
+        history, opti_steps = free_const.optimize_free_const_batch (func     = func_params,
+                                                                    params   = [params],
+                                                                    y_target = y_target,
+                                                                    loss        = "MSE",
+                                                                    method      = "LBFGS",
+                                                                    method_args = None)
+        t1 = time.perf_counter()
+        dt = ((t1-t0)*1e3)/opti_steps.sum()
+        print("LBFGS batched const opti: %f ms / step" %(dt))
+
+        # ------ Test ------
+        self.assertEqual(history.shape[1], n_progs)
+        self.assertEqual(opti_steps.shape, (n_progs,))
+        obs_params = params.detach().cpu().numpy()
+        # All valid problems are solved
+        for i in range (3):
+            err = np.abs(obs_params[i, 0] - ideal_params[0])
+            self.assertTrue(err < 1e-6)
+        # Already solved problem stops right away
+        self.assertEqual(opti_steps[2], 1)
+        # Invalid problem stops right away and is left as is
+        self.assertEqual(opti_steps[3], 1)
+        self.assertTrue(np.array_equal(obs_params[3], params_init[3].cpu().numpy()))
+        # History is nan after problems stopped
+        self.assertTrue(np.isnan(history[1:, 2]).all())
+
+        return None
+
+    # Testing that batched LBFGS optimizer optimizes problems of different scales as per-program LBFGS does (each
+    # problem having its own line search and curvature history)
+    def test_lbfgs_batch_optimizer_parity (self):
+
+        DEVICE = 'cpu'
+        if torch.cuda.is_available():
+            DEVICE = 'cuda'
+
+        # ------ Test case ------
+        # Data
+        N = 200
+        x = torch.linspace(0, 2, N, dtype=torch.float64).to(DEVICE)
+
+        # Batch of 3 problems a*exp(b*x) of very different scales
+        ideal_a = torch.tensor([1e3, 1., 1e-2], dtype=torch.float64).to(DEVICE)
+        ideal_b = torch.tensor([0.7, -1.3, 2.1], dtype=torch.float64).to(DEVICE)
+        y_targets = ideal_a[:, None]*torch.exp(ideal_b[:, None]*x)                               # (n_progs, N)
+        # Targets being different for each problem, the function returns the difference to them
+        func_batch = lambda params, y_targets, rows: (params[0][:, 0:1]*torch.exp(params[0][:, 1:2]*x) - y_targets)[rows]
+        func       = lambda params: params[0]*torch.exp(params[1]*x)
+        zeros      = torch.zeros(N, dtype=torch.float64).to(DEVICE)
+
+        n_progs = 3
+        params_init = torch.stack((1.5*ideal_a, ideal_b + 0.3), dim=1)                            # (n_progs, 2)
+
+        # ------ Run ------
+        # Batched
+        params = params_init.clone()
+        free_const.optimize_free_const_batch (func     = lambda params, rows: func_batch(params, y_targets, rows),
+                                              params   = [params],
+                                              y_target = zeros,
+                                              **free_const.DEFAULT_OPTI_ARGS)
+        with torch.no_grad():
+            loss_batch = (func_batch([params], y_targets, np.arange(n_progs))**2).mean(dim=1).cpu().numpy() # (n_progs,)
+
+        for i in range (n_progs):
+            # Batched (problem alone)
+            params_alone = params_init[i:i+1].clone()
+            free_const.optimize_free_const_batch (func     = lambda params, rows: func_batch(params, y_targets[i:i+1], rows),
+                                                  params   = [params_alone],
+                                                  y_target = zeros,
+                                                  **free_const.DEFAULT_OPTI_ARGS)
+            # Per-program
+            params_single = params_init[i].clone()
+            free_const.optimize_free_const (func     = func,
+                                            params   = params_single,
+                                            y_target = y_targets[i],
+                                            **free_const.DEFAULT_OPTI_ARGS)
+            with torch.no_grad():
+                loss_single = ((func(params_single) - y_targets[i])**2).mean().item()
+
+            # ------ Test ------
+            # Problems are optimized independently from each other
+            self.assertTrue(torch.allclose(params[i], params_alone[0]))
+            # As well as per-program LBFGS
+            tol = free_const.DEFAULT_OPTI_ARGS["method_args"]["tol"]
+            self.assertTrue(loss_batch[i] <= 10*max(loss_single, tol),
+                            "Problem %i : batched loss = %e, per-program loss = %e"%(i, loss_batch[i], loss_single))
+
+        return None
+
+    # Testing batched LBFGS optimizer on ill-behaved problems (line search that can not satisfy strong Wolfe
+    # conditions, NaN losses at start or during line search, negative curvature, zero gradient) : each problem must
+    # keep finite params and a non-increasing loss without disturbing the others
+    def test_lbfgs_batch_optimizer_failure_modes (self):
+
+        # ------ Test case ------
+        # Problems of 1 param each
+        def losses_of (x):
+            return torch.stack([
+                (x[0] - 2.)**2 + 0.1*(x[0] - 2.)**4,       # 0 : well behaved
+                torch.abs(x[1] - 1.),                        # 1 : non smooth (curvature condition never met)
+                (x[2] + 1.)**2 + 0.*torch.sqrt(x[2]),        # 2 : NaN beyond x = 0 (reached by line search)
+                torch.log(x[3])**2,                          # 3 : NaN from start
+                x[4]**4 - x[4]**2 + 1.,                      # 4 : negative curvature at start
+                torch.cos(x[5]) + 1.,                        # 5 : zero gradient at start (maximum)
+            ])
+        n_progs = 6
+        params_init = torch.tensor([[0.], [3.], [1.], [-1.], [0.1], [0.]], dtype=torch.float64)  # (n_progs, 1)
+        method_args = free_const.DEFAULT_LBFGS_OPTI_ARGS
+
+        # ------ Run ------
+        params = params_init.clone()
+        history, opti_steps = free_const.LBFGS_batch_optimizer(params = [params],
+                                                               f      = lambda params, rows: losses_of(params[0][:, 0])[rows],
+                                                               **method_args)                    # (?, n_progs)
+        params = params.detach()
+        with torch.no_grad():
+            losses_init  = losses_of(params_init[:, 0]).numpy()                                  # (n_progs,)
+            losses_final = losses_of(params[:, 0]).numpy()                                       # (n_progs,)
+
+        # ------ Test ------
+        # Params of problems having a finite loss at start stay finite and their loss never increases
+        is_finite = np.isfinite(losses_init)                                                     # (n_progs,)
+        self.assertEqual(is_finite.tolist(), [True, True, True, False, True, True])
+        self.assertTrue(torch.isfinite(params).all())
+        self.assertTrue((losses_final[is_finite] <= losses_init[is_finite]).all())
+        for i in np.where(is_finite)[0]:
+            h = history[:opti_steps[i], i]
+            self.assertTrue(np.isfinite(h).all())
+            self.assertTrue((np.diff(h) <= 0.).all(), "Problem %i : loss increased %s"%(i, h))
+        # Well behaved problem converges, non smooth one reaches its minimum (using fallback steps of line search),
+        # NaN region is never entered, negative curvature problem reaches one of its minima
+        self.assertTrue(np.allclose(params[[0, 1, 4], 0].numpy(), [2., 1., np.sqrt(0.5)], atol=1e-3))
+        self.assertTrue(params[2, 0].item() >= 0.)
+        # Problem NaN from start is stopped right away with params kept as is, zero gradient problem is not moved
+        self.assertEqual(opti_steps[3], 1)
+        self.assertTrue(np.isnan(history[1:, 3]).all())
+        self.assertTrue(torch.equal(params[[3, 5]], params_init[[3, 5]]))
+
+        # Each problem is optimized as if it was alone
+        for i in range (n_progs):
+            params_alone = params_init[i:i+1].clone()
+            f_alone = lambda params, rows: losses_of(torch.cat((params_init[:i, 0], params[0][:, 0], params_init[i+1:, 0])))[i:i+1][rows]
+            history_alone, opti_steps_alone = free_const.LBFGS_batch_optimizer(params = [params_alone],
+                                                                               f      = f_alone,
+                                                                               **method_args)
+            self.assertTrue(torch.equal(params_alone.detach()[0], params[i]), "Problem %i"%(i))
+            self.assertEqual(opti_steps_alone[0], opti_steps[i])
+
+        return None
+
 class FreeConstantsTableTest(unittest.TestCase):
 
 
@@ -391,6 +772,140 @@ class FreeConstantsTableTest(unittest.TestCase):
 
         return None
 
+    # Testing that float32 free constants keep executions in float32
+    def test_dtype_policy (self):
+
+        k0_init = [9.,10.,11.] # np.full(n_realizations, 1.)
+        n_realizations = len(k0_init)
+        # LIBRARY CONFIG
+        args_make_tokens = {
+                        # operations
+                        "op_names"             : "all",
+                        "use_protected_ops"    : True,
+                        # input variables
+                        "input_var_ids"        : {"t" : 0         , "l" : 1          },
+                        "input_var_units"      : {"t" : [0, 0, 0] , "l" : [0, 0, 0]  },
+                        "input_var_complexity" : {"t" : 0.        , "l" : 1.         },
+                        # constants
+                        "constants"            : {"pi" : data_conversion (np.pi) },
+                        "constants_units"      : {"pi" : [0, 0, 0]               },
+                        "constants_complexity" : {"pi" : 1.                      },
+                        # free constants
+                        "class_free_constants"            : {"c0"              },
+                        "class_free_constants_init_val"   : {"c0" : 1.1        },
+                        "class_free_constants_units"      : {"c0" : [0, 0, 0]  },
+                        "class_free_constants_complexity" : {"c0" : 1.         },
+                        # free constants
+                        "spe_free_constants"            : {"k0"              , "k1"               },
+                        "spe_free_constants_init_val"   : {"k0" : k0_init    , "k1"  : 2.         },
+                        "spe_free_constants_units"      : {"k0" : [0, 0, 0]  , "k1"  : [0, 0, 0]  },
+                        "spe_free_constants_complexity" : {"k0" : 1.         , "k1"  : 1.         },
+                           }
+        my_lib = Lib.Library(args_make_tokens = args_make_tokens,
+                             superparent_units = [0, 0, 0], superparent_name = "y")
+
+        # Table dtype
+        batch_size = 4
+        table = free_const.FreeConstantsTable(batch_size, my_lib, n_realizations=n_realizations, dtype="float32")
+        self.assertEqual(table.class_values.dtype, torch.float32)
+        self.assertEqual(table.spe_values  .dtype, torch.float32)
+        self.assertEqual(table.get_const_of_prog(0).dtype, torch.float32)
+        self.assertEqual(table.df().shape, (batch_size, 1 + 2*n_realizations))
+        # Default is float64
+        table64 = free_const.FreeConstantsTable(batch_size, my_lib, n_realizations=n_realizations)
+        self.assertEqual(table64.class_values.dtype, torch.float64)
+        table64.to("cpu", dtype="float32")
+        self.assertEqual(table64.dtype, torch.float32)
+        self.assertEqual(table64.spe_values.dtype, torch.float32)
+        self.assertTrue(np.allclose(table64.spe_values[0, 0].numpy(), k0_init))
+
+        # Execution stays in float32 (using spe free consts and plateaus of protected functions)
+        n_samples_per_dataset = np.array([10, 20, 30])
+        X = torch.rand(2, n_samples_per_dataset.sum())                          # float32
+        progs_str = [["add", "mul", "k0", "t", "exp", "mul", "c0", "l"],
+                     ["mul", "pi", "exp", "exp", "exp", "exp", "k0"],]
+        progs_idx = np.array([[my_lib.lib_name_to_idx[name] for name in prog_str] + [my_lib.lib_name_to_idx["t"]]*(8-len(prog_str))
+                              for prog_str in progs_str])
+        for dtype in [torch.float32, torch.float64]:
+            programs = VProg.VectPrograms(batch_size=len(progs_str), max_time_step=8, library=my_lib, n_realizations=n_realizations)
+            programs.set_programs(progs_idx)
+            programs.free_consts.to(dtype=dtype)
+            for i in range (len(progs_str)):
+                y = programs.get_prog(i).execute(X.to(dtype), n_samples_per_dataset=n_samples_per_dataset)
+                self.assertEqual(y.dtype, dtype)
+            # Vectorized execution
+            y = programs.batch_evaluate(X.to(dtype), n_samples_per_dataset=n_samples_per_dataset, vectorized_mode=True)
+            self.assertEqual(y.dtype, dtype)
+
+        return None
+
+    def test_flatten_like_data (self):
+
+        k0_init = [9.,10.,11.]
+        n_realizations = len(k0_init)
+        # LIBRARY CONFIG
+        args_make_tokens = {
+                        # operations
+                        "op_names"             : ["mul", "add", "exp"],
+                        "use_protected_ops"    : True,
+                        # input variables
+                        "input_var_ids"        : {"t" : 0         },
+                        "input_var_units"      : {"t" : [0, 0, 0] },
+                        "input_var_complexity" : {"t" : 0.        },
+                        # free constants
+                        "class_free_constants"            : {"c0"              },
+                        "class_free_constants_init_val"   : {"c0" : 1.1        },
+                        "class_free_constants_units"      : {"c0" : [0, 0, 0]  },
+                        "class_free_constants_complexity" : {"c0" : 1.         },
+                        # free constants
+                        "spe_free_constants"            : {"k0"              , "k1"               },
+                        "spe_free_constants_init_val"   : {"k0" : k0_init    , "k1"  : 2.         },
+                        "spe_free_constants_units"      : {"k0" : [0, 0, 0]  , "k1"  : [0, 0, 0]  },
+                        "spe_free_constants_complexity" : {"k0" : 1.         , "k1"  : 1.         },
+                           }
+        my_lib = Lib.Library(args_make_tokens = args_make_tokens,
+                             superparent_units = [0, 0, 0], superparent_name = "y")
+
+        batch_size = 4
+        n_samples_per_dataset = np.array([10, 20, 30])
+        table = free_const.FreeConstantsTable(batch_size, my_lib, n_realizations=n_realizations)
+        table.spe_values = torch.rand(table.spe_values.shape, dtype=table.dtype)
+
+        # Same values as flattening by repeating values
+        class_flat, spe_flat = table.flatten_like_data(n_samples_per_dataset)
+        n_all_samples = n_samples_per_dataset.sum()
+        expected_spe   = table.spe_values.repeat_interleave(torch.tensor(n_samples_per_dataset), dim=-1)
+        expected_class = table.class_values[:, :, np.newaxis].repeat((1, 1, n_all_samples))
+        self.assertEqual(spe_flat  .shape, (batch_size, 2, n_all_samples))
+        self.assertEqual(class_flat.shape, (batch_size, 1, n_all_samples))
+        self.assertTrue(torch.equal(spe_flat,   expected_spe))
+        self.assertTrue(torch.equal(class_flat, expected_class))
+        # Class free constants are not copied
+        self.assertEqual(class_flat.data_ptr(), table.class_values.data_ptr())
+        # Realization index is only computed once
+        real_idx = dataset.realization_index(n_samples_per_dataset)
+        self.assertIs(dataset.realization_index(n_samples_per_dataset), real_idx)
+        # Realization index can be used in autograd computations even if first computed in inference mode
+        with torch.inference_mode():
+            dataset.realization_index(np.array([5, 6]))
+        spe_values = table.spe_values.clone().requires_grad_(True)
+        spe_values[:, :, dataset.realization_index(np.array([5, 6]))].sum().backward()
+        self.assertTrue(torch.equal(spe_values.grad[:, :, :2], torch.tensor([5., 6.]).double().expand(batch_size, 2, 2)))
+
+        # Execution on multiple datasets is the same as execution on each realization
+        progs_str = [["add", "mul", "k0", "t", "exp", "mul", "c0", "k1"]]
+        progs_idx = np.array([[my_lib.lib_name_to_idx[name] for name in prog_str] for prog_str in progs_str])
+        programs = VProg.VectPrograms(batch_size=1, max_time_step=8, library=my_lib, n_realizations=n_realizations)
+        programs.set_programs(progs_idx)
+        prog = programs.get_prog(0)
+        X = torch.rand(1, n_all_samples).double()
+        y = prog.execute(X, n_samples_per_dataset=n_samples_per_dataset)
+        expected_y = torch.cat([prog.execute(X_real, i_realization=i)
+                                for i, X_real in enumerate(dataset.unflatten_multi_data(X, n_samples_per_dataset))])
+        self.assertTrue(torch.allclose(y, expected_y))
+
+        return None
+
     def test_optimization_process (self):
 
         seed = 42
@@ -541,6 +1056,138 @@ class FreeConstantsTableTest(unittest.TestCase):
 
         return None
 
+    def test_vectorized_optimization_process (self):
+
+        seed = 42
+        np.random.seed(seed)
+        torch.manual_seed(seed)
+
+        DEVICE = 'cpu'
+        if torch.cuda.is_available():
+            DEVICE = 'cuda'
+
+        # Data
+        N = 100
+        r = data_conversion(np.linspace(-10, 10, N)).to(DEVICE)
+        v = data_conversion(np.linspace(-10, 10, N)).to(DEVICE)
+        X = torch.stack((r,v), axis=0)
+
+        # LIBRARY CONFIG
+        args_make_tokens = {
+                        # operations
+                        "op_names"             : "all",
+                        "use_protected_ops"    : False,
+                        # input variables
+                        "input_var_ids"        : {"r" : 0         , "v" : 1          },
+                        "input_var_units"      : {"r" : [1, 0, 0] , "v" : [1, -1, 0] },
+                        "input_var_complexity" : {"r" : 0.        , "v" : 1.         },
+                        # constants
+                        "constants"            : {"const1" : 1.        },
+                        "constants_units"      : {"const1" : [0, 0, 0] },
+                        "constants_complexity" : {"const1" : 1.        },
+                        # free constants
+                        "free_constants"            : {"c0"             , "vc"               , "rc"             },
+                        "free_constants_init_val"   : {"c0" : 1.        , "vc"  : 1.02       , "rc" : 1.03      },
+                        "free_constants_units"      : {"c0" : [0, 0, 0] , "vc"  : [1, -1, 0] , "rc" : [1, 0, 0] },
+                        "free_constants_complexity" : {"c0" : 1.        , "vc"  : 1.         , "rc" : 1.        },
+                           }
+        my_lib = Lib.Library(args_make_tokens = args_make_tokens,
+                             superparent_units = [2, -2, 0], superparent_name = "E")
+
+        # TEST PROGRAMS
+        test_prog_str_0 = ["add", "mul", "mul", "const1", "c0" , "n2", "v", "mul", "n2", "vc", "log", "div", "n2", "r", "n2", "rc"]
+        test_prog_str_1 = ["mul", "n2" , "vc" , "cos"   , "div", "r" , "rc", "-", "-", "-", "-", "-", "-", "-", "-", "-"]
+        # Program without free constants
+        test_prog_str_2 = ["mul", "n2" , "v"  , "const1", "-"  , "-" , "-" , "-", "-", "-", "-", "-", "-", "-", "-", "-"]
+        # Program giving nans
+        test_prog_str_3 = ["mul", "n2" , "vc" , "log"   , "neg", "n2", "rc", "-", "-", "-", "-", "-", "-", "-", "-", "-"]
+        test_programs_str = np.array([test_prog_str_0, test_prog_str_1, test_prog_str_2, test_prog_str_3, test_prog_str_0])
+        test_programs_str = np.char.replace(test_programs_str, '-', 'r')
+        test_programs_idx = np.array([[my_lib.lib_name_to_idx[tok_str] for tok_str in test_program_str]
+                                      for test_program_str in test_programs_str])
+        batch_size = test_programs_idx.shape[0]
+
+        def make_programs():
+            my_programs = VProg.VectPrograms(batch_size=batch_size, max_time_step=test_programs_idx.shape[1], library=my_lib, n_realizations=1)
+            my_programs.free_consts.to(DEVICE)
+            for i in range (test_programs_idx.shape[1]):
+                my_programs.append(test_programs_idx[:,i])
+            return my_programs
+
+        # MAKING SYNTHETIC y_target from ideal constants
+        ideal_const_array = np.array([0.5, 1.14, 0.936])
+        ideal_const = data_conversion(ideal_const_array).to(DEVICE)
+        y_target = Exec.ExecuteProgram(input_var_data = X, class_free_consts_vals = ideal_const,
+                                       program_tokens = make_programs().get_prog(0).tokens, )
+
+        # Last program is not optimized
+        mask = np.array([True, True, True, True, False])
+
+        # Vectorized optimization vs loop
+        progs_vect = make_programs()
+        progs_vect.batch_optimize_constants(X = X, y_target = y_target, mask = mask, vectorized_mode = True)
+        progs_loop = make_programs()
+        progs_loop.batch_optimize_constants(X = X, y_target = y_target, mask = mask, vectorized_mode = False)
+
+        # Logging of optimization process (programs without free consts are not optimized)
+        expected_is_opti = np.array([True, True, False, True, False])
+        self.assertTrue(np.array_equal(progs_vect.free_consts.is_opti.cpu().numpy(), expected_is_opti))
+        self.assertTrue(np.array_equal(progs_loop.free_consts.is_opti.cpu().numpy(), expected_is_opti))
+        self.assertTrue((progs_vect.free_consts.opti_steps[[0, 1, 3]] > 0).all())
+
+        # Constants recovery
+        exp_tol = 1e-4
+        obs_const0 = data_conversion_inv(progs_vect.free_consts.class_values[0])
+        self.assertTrue((np.abs(ideal_const_array - obs_const0) < exp_tol).all())
+        # Same results as loop on programs solvable independently of the others
+        obs_const1_vect = data_conversion_inv(progs_vect.free_consts.class_values[1])
+        obs_const1_loop = data_conversion_inv(progs_loop.free_consts.class_values[1])
+        self.assertTrue((np.abs(obs_const1_vect[1:] - obs_const1_loop[1:]) < exp_tol).all())
+        # Not optimized program is left untouched
+        self.assertTrue(np.array_equal(data_conversion_inv(progs_vect.free_consts.class_values[4]),
+                                       np.array(my_lib.class_free_constants_init_val, dtype=float)))
+
+        # Optimizer without batched version (LM) : falling back to optimization in a loop
+        lm_opti_args = {'loss' : "MSE", 'method' : 'LM', 'method_args' : free_const.DEFAULT_LM_OPTI_ARGS}
+        progs_lm_vect = make_programs()
+        progs_lm_vect.batch_optimize_constants(X = X, y_target = y_target, mask = mask, vectorized_mode = True,
+                                               free_const_opti_args = lm_opti_args)
+        progs_lm_loop = make_programs()
+        progs_lm_loop.batch_optimize_constants(X = X, y_target = y_target, mask = mask, vectorized_mode = False,
+                                               free_const_opti_args = lm_opti_args)
+        self.assertTrue(np.array_equal(progs_lm_vect.free_consts.is_opti.cpu().numpy(), expected_is_opti))
+        self.assertTrue(torch.equal(progs_lm_vect.free_consts.class_values, progs_lm_loop.free_consts.class_values))
+        obs_const0 = data_conversion_inv(progs_lm_vect.free_consts.class_values[0])
+        self.assertTrue((np.abs(ideal_const_array - obs_const0) < exp_tol).all())
+
+        # Multi-start (starts of all programs being optimized at once)
+        ms_opti_args = dict(free_const.DEFAULT_OPTI_ARGS, n_starts = 4)
+        torch.manual_seed(seed)
+        progs_ms = make_programs()
+        progs_ms.batch_optimize_constants(X = X, y_target = y_target, mask = mask, vectorized_mode = True,
+                                          free_const_opti_args = ms_opti_args)
+        # Multi-start in a loop (starts of each program being optimized at once)
+        progs_ms_loop = make_programs()
+        progs_ms_loop.batch_optimize_constants(X = X, y_target = y_target, mask = mask, vectorized_mode = False,
+                                               free_const_opti_args = ms_opti_args)
+        self.assertTrue(np.array_equal(progs_ms_loop.free_consts.is_opti.cpu().numpy(), expected_is_opti))
+        obs_const0 = data_conversion_inv(progs_ms_loop.free_consts.class_values[0])
+        self.assertTrue((np.abs(ideal_const_array - obs_const0) < exp_tol).all())
+        # Single start (with a warning) when not available
+        progs_lm = make_programs()
+        with self.assertWarns(UserWarning):
+            progs_lm.batch_optimize_constants(X = X, y_target = y_target, mask = mask, vectorized_mode = True,
+                                              free_const_opti_args = dict(lm_opti_args, n_starts = 4))
+        self.assertTrue(torch.equal(progs_lm.free_consts.class_values, progs_lm_loop.free_consts.class_values))
+        self.assertTrue(np.array_equal(progs_ms.free_consts.is_opti.cpu().numpy(), expected_is_opti))
+        self.assertTrue((progs_ms.free_consts.opti_steps[[0, 1, 3]] > progs_vect.free_consts.opti_steps[[0, 1, 3]]).all())
+        obs_const0 = data_conversion_inv(progs_ms.free_consts.class_values[0])
+        self.assertTrue((np.abs(ideal_const_array - obs_const0) < exp_tol).all())
+        self.assertTrue(np.array_equal(data_conversion_inv(progs_ms.free_consts.class_values[4]),
+                                       np.array(my_lib.class_free_constants_init_val, dtype=float)))
+
+        return None
+
     def test_optimization_process_with_spe_free_consts (self):
 
         seed = 42
@@ -708,5 +1355,16 @@ class FreeConstantsTableTest(unittest.TestCase):
 
         return None
 
+    def test_optimization_process_with_spe_free_consts_per_realization (self):
+        # Same problem as test_optimization_process_with_spe_free_consts with spe free constants optimized per
+        # realization (without closed form solve of linear free constants which would take precedence)
+        with mock.patch.object(Prog, "USE_PER_REALIZATION_FREE_CONSTS_OPTI", True), \
+             mock.patch.object(Prog, "USE_CLOSED_FORM_LINEAR_FREE_CONSTS",   False), \
+             mock.patch.object(Prog.Program, "optimize_constants_per_realization", autospec = True,
+                               side_effect = Prog.Program.optimize_constants_per_realization) as opti_per_realization:
+            self.test_optimization_process_with_spe_free_consts()
+            self.assertEqual(opti_per_realization.call_count, 1)
+        return None
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -0,0 +1,137 @@
+import unittest
+import numpy as np
+import torch as torch
+
+# Internal imports
+from physo.physym import interval
+from physo.physym import library as Lib
+from physo.physym import vect_programs as VProg
+from physo.physym.functions import data_conversion
+
+class IntervalTest(unittest.TestCase):
+
+    def make_lib (self, use_protected_ops):
+        args_make_tokens = {
+                        # operations
+                        "op_names"             : ["mul", "add", "sub", "div", "neg", "inv", "exp", "log", "sqrt", "n2",
+                                                  "cos", "sin", "tanh", "arcsin"],
+                        "use_protected_ops"    : use_protected_ops,
+                        # input variables
+                        "input_var_ids"        : {"x0" : 0         , "x1" : 1         },
+                        "input_var_units"      : {"x0" : [0, 0, 0] , "x1" : [0, 0, 0] },
+                        "input_var_complexity" : {"x0" : 1.        , "x1" : 1.        },
+                        # constants
+                        "constants"            : {"1" : data_conversion(1.) , "pi" : data_conversion(np.pi) },
+                        "constants_units"      : {"1" : [0, 0, 0]           , "pi" : [0, 0, 0]              },
+                        "constants_complexity" : {"1" : 1.                  , "pi" : 1.                     },
+                        # free constants
+                        "free_constants"            : {"c0"              },
+                        "free_constants_init_val"   : {"c0" : 1.         },
+                        "free_constants_units"      : {"c0" : [0, 0, 0]  },
+                        "free_constants_complexity" : {"c0" : 1.         },
+                           }
+        my_lib = Lib.Library(args_make_tokens = args_make_tokens,
+                             superparent_units = [0, 0, 0], superparent_name = "y")
+        return my_lib
+
+    def make_programs (self, my_lib, progs_str):
+        max_len = max([len(prog_str) for prog_str in progs_str])
+        progs_idx = np.full((len(progs_str), max_len), my_lib.lib_name_to_idx["x0"])
+        for i, prog_str in enumerate(progs_str):
+            progs_idx[i, :len(prog_str)] = [my_lib.lib_name_to_idx[name] for name in prog_str]
+        programs = VProg.VectPrograms(batch_size=len(progs_str), max_time_step=max_len, library=my_lib,
+                                      n_realizations=1)
+        programs.set_programs(progs_idx)
+        return programs
+
+    # Test flagging of programs certainly NaN, infinite or constant
+    def test_IntervalPrescreen (self):
+
+        # UNPROTECTED
+        my_lib = self.make_lib(use_protected_ops = False)
+        test_progs_str = [
+            ["log", "neg", "exp", "x0"],                       # 0 : NaN everywhere
+            ["exp", "exp", "exp", "x0"],                       # 1 : +inf everywhere
+            ["add", "sqrt", "sub", "x1", "pi", "c0"],          # 2 : NaN everywhere (x1 < pi)
+            ["mul", "c0", "log", "x0"],                        # 3 : valid
+            ["add", "sin", "mul", "c0", "x0", "x1"],           # 4 : valid
+            ["sqrt", "sub", "x0", "c0"],                       # 5 : valid depending on c0
+            ["arcsin", "add", "x0", "1"],                      # 6 : NaN everywhere (x0 + 1 > 1)
+            ["arcsin", "sub", "x0", "x0"],                     # 7 : valid (bounds [-8, 8] being loose but finite)
+            ["sqrt", "sub", "n2", "x0", "mul", "x0", "x0"],    # 8 : valid (bounds [-96, 96] being loose but finite)
+        ]
+        programs = self.make_programs(my_lib, test_progs_str)
+        # x0 in [2, 10], x1 in [-2, 2]
+        X = torch.stack([torch.linspace(2., 10., 100), torch.linspace(-2., 2., 100)]).double()
+        is_flagged = interval.IntervalPrescreen(programs, X)
+        self.assertEqual(is_flagged.tolist(), [True, True, True, False, False, False, True, False, False])
+        # Masked programs are not flagged
+        mask = np.array([False, True, True, True, True, True, True, True, True])
+        is_flagged = interval.IntervalPrescreen(programs, X, mask = mask)
+        self.assertEqual(is_flagged.tolist(), [False, True, True, False, False, False, True, False, False])
+
+        # PROTECTED
+        my_lib = self.make_lib(use_protected_ops = True)
+        test_progs_str = [
+            ["exp", "exp", "exp", "x0"],                       # 0 : constant (plateau of protected exp)
+            ["log", "neg", "exp", "x0"],                       # 1 : valid (log |x|)
+            ["div", "x0", "sub", "pi", "pi"],                  # 2 : constant (plateau of protected div)
+            ["mul", "c0", "exp", "x0"],                        # 3 : valid
+            ["add", "c0", "1"],                                # 4 : constant but without input variables
+        ]
+        programs = self.make_programs(my_lib, test_progs_str)
+        X = torch.stack([torch.linspace(5., 10., 100), torch.linspace(-2., 2., 100)]).double()
+        is_flagged = interval.IntervalPrescreen(programs, X)
+        self.assertEqual(is_flagged.tolist(), [False, False, False, False, False])
+        is_flagged = interval.IntervalPrescreen(programs, X, zero_out_constant = True)
+        self.assertEqual(is_flagged.tolist(), [True, False, True, False, False])
+
+        return None
+
+    # Test that computed bounds contain values of randomly generated programs
+    def test_ComputeIntervals_soundness (self):
+
+        seed = 42
+        rng = np.random.default_rng(seed)
+        torch.manual_seed(seed)
+
+        for use_protected_ops in [False, True]:
+            my_lib = self.make_lib(use_protected_ops = use_protected_ops)
+            ops       = [name for name in my_lib.lib_name[:my_lib.n_choices] if my_lib.arity[my_lib.lib_name_to_idx[name]] > 0]
+            terminals = ["x0", "x1", "1", "pi", "c0"]
+
+            def gen (depth):
+                if depth == 0 or rng.random() < 0.3:
+                    return [rng.choice(terminals)]
+                op = rng.choice(ops)
+                res = [op]
+                for _ in range (my_lib.arity[my_lib.lib_name_to_idx[op]]):
+                    res += gen(depth - 1)
+                return res
+
+            test_progs_str = [gen(4) for _ in range (200)]
+            programs = self.make_programs(my_lib, test_progs_str)
+            # x0 in [0.5, 3], x1 in [-1, 1]
+            X = torch.stack([torch.rand(1000)*2.5 + 0.5, torch.rand(1000)*2. - 1.]).double()
+            lo, hi, is_undefined, is_const = interval.ComputeIntervals(programs,
+                                                                       X_lo = X.amin(dim=1).numpy(),
+                                                                       X_hi = X.amax(dim=1).numpy())
+            for i in range (programs.batch_size):
+                # Random free constants values
+                programs.free_consts.class_values[i] = torch.randn(programs.free_consts.class_values[i].shape)*10.
+                y = programs.get_prog(i).execute_wo_wrapper(X).detach().numpy()
+                y = np.broadcast_to(y, (X.shape[1],))
+                is_nan = np.isnan(y)
+                if is_undefined[i]:
+                    self.assertTrue(is_nan.all(), test_progs_str[i])
+                y = y[~is_nan]
+                tol = 1e-9*np.abs(y)
+                self.assertTrue((y >= lo[i] - tol).all() and (y <= hi[i] + tol).all(),
+                                "%s : [%f, %f]"%(test_progs_str[i], lo[i], hi[i]))
+                if is_const[i] and len(y) > 0:
+                    self.assertTrue(np.all(y == y[0]), test_progs_str[i])
+
+        return None
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
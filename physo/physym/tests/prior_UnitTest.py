@@ -1326,5 +1326,74 @@ class PriorTest(unittest.TestCase):
 
         return None
 
+    def test_PriorCollection_static_dynamic_split(self):
+
+        # ------- TEST CASE -------
+        # Library
+        args_make_tokens = {
+                        # operations
+                        "op_names"             : ["mul", "add", "neg", "inv", "cos", "sin"],
+                        "use_protected_ops"    : False,
+                        # input variables
+                        "input_var_ids"        : {"x" : 0         , "v" : 1          , "t" : 2,        },
+                        "input_var_units"      : {"x" : [1, 0, 0] , "v" : [1, -1, 0] , "t" : [0, 1, 0] },
+                        "input_var_complexity" : {"x" : 0.        , "v" : 1.         , "t" : 0.,       },
+                        # constants
+                        "constants"            : {"pi" : np.pi     , "c" : 3e8       , "M" : 1e6       },
+                        "constants_units"      : {"pi" : [0, 0, 0] , "c" : [1, -1, 0], "M" : [0, 0, 1] },
+                        "constants_complexity" : {"pi" : 0.        , "c" : 0.        , "M" : 1.        },
+                            }
+        my_lib = Lib.Library(args_make_tokens = args_make_tokens,
+                             superparent_units = [1, -2, 1], superparent_name = "y")
+        n_progs, n_steps = 500, 12
+        my_programs = VProg.VectPrograms(batch_size = n_progs, max_time_step=n_steps, library=my_lib, n_realizations=1)
+
+        priors_config = [("UniformArityPrior", None),
+                         ("SymbolicPrior", {"expression": ["add", "-", "cos"]}),
+                         ("HardLengthPrior", {"min_length": 3,
+                                              "max_length": 10, }),
+                         ("SoftLengthPrior", {"length_loc": 6,
+                                              "scale": 5, }),
+                         ("NestedTrigonometryPrior", {"max_nesting" : 1}),
+                         ("NoUselessInversePrior", None),
+                         ("OccurrencesPrior", {"targets" : ["x",], "max" : [2,]}),
+                        ]
+        my_collection = Prior.make_PriorCollection(library = my_lib, programs = my_programs, priors_config = priors_config)
+
+        # ------- TEST SPLIT -------
+        # UniformArityPrior and SymbolicPrior are precomputed, NoUselessInversePrior is active (neg, inv)
+        self.assertEqual([prior.__class__.__name__ for prior in my_collection.dynamic_priors],
+                         ["HardLengthPrior", "SoftLengthPrior", "NestedTrigonometryPrior", "NoUselessInversePrior",
+                          "OccurrencesPrior"])
+        self.assertEqual(my_collection.step_table.shape, (n_steps, my_lib.n_choices))
+
+        # ------- TEST RETURNED ARRAYS -------
+        # Results of successive calls are independent arrays
+        prior_val_0 = my_collection()
+        prior_val_1 = my_collection()
+        self.assertFalse(np.shares_memory(prior_val_0, prior_val_1))
+        prior_val_0[:] = -1.
+        np.testing.assert_array_equal(my_collection(), prior_val_1)
+        # Unless a buffer is given
+        buffer = np.full((n_progs, my_lib.n_choices), -1.)
+        res = my_collection(out = buffer)
+        self.assertIs(res, buffer)
+        np.testing.assert_array_equal(buffer, prior_val_1)
+
+        # ------- TEST PRIOR -------
+        rng = np.random.default_rng(42)
+        for step in range (n_steps):
+            expected_prior_val = np.ones((n_progs, my_lib.n_choices))
+            for prior in my_collection.priors:
+                expected_prior_val = np.multiply(expected_prior_val, prior())
+            np.testing.assert_allclose(my_collection(), expected_prior_val, rtol=1e-12)
+            # NEXT STEP (sampling according to prior, complete programs have null prior)
+            prior_val = my_collection()
+            next_tokens_idx = np.array([rng.choice(my_lib.n_choices, p=p/p.sum()) if p.sum() > 0 else 0
+                                        for p in prior_val])
+            my_programs.append(next_tokens_idx)
+
+        return None
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
\ No newline at end of file
@@ -1,4 +1,5 @@
 import unittest
+from unittest import mock
 
 import matplotlib.pyplot as plt
 import numpy as np
@@ -15,6 +16,7 @@ from physo.physym import dimensional_analysis as phy
 from physo.physym.functions import data_conversion, data_conversion_inv
 import physo.physym.free_const as free_const
 from physo.physym import vect_programs as VProg
+from physo.physym import token as Tok
 
 def make_lib():
     # LIBRARY CONFIG
@@ -643,6 +645,155 @@ class ProgramTest(unittest.TestCase):
 
         return None
 
+    # Test evaluation in inference mode of program whose free constants require gradients
+    def test_evaluate (self):
+
+        seed = 42
+        np.random.seed(seed)
+        torch.manual_seed(seed)
+
+        ideal_class_params = torch.tensor([1.389, 1.005]) # (n_class_params, )
+
+        # Synthetic data
+        x0 = torch.linspace(0, 10, 1000)
+        x1 = torch.linspace(-5, 1 , 1000)
+        X = torch.stack((x0,x1),axis=0)
+        y_ideals = -ideal_class_params[0]*X[0] + ideal_class_params[1]
+
+        # consts
+        pi     = data_conversion (np.pi)
+        const1 = data_conversion (1.)
+
+        # LIBRARY CONFIG
+        args_make_tokens = {
+                        # operations
+                        "op_names"             : "all",  # or ["mul", "neg", "inv", "sin"]
+                        "use_protected_ops"    : False,
+                        # input variables
+                        "input_var_ids"        : {"x0" : 0         , "x1" : 1         },
+                        "input_var_units"      : {"x0" : [0, 0, 0] , "x1" : [0, 0, 0] },
+                        "input_var_complexity" : {"x0" : 0.        , "x1" : 1.        },
+                        # constants
+                        "constants"            : {"pi" : pi        , "1" : const1    },
+                        "constants_units"      : {"pi" : [0, 0, 0] , "1" : [0, 0, 0] },
+                        "constants_complexity" : {"pi" : 0.        , "1" : 1.        },
+                        # free constants
+                        "free_constants"            : {"a"             , "b"             },
+                        "free_constants_init_val"   : {"a" : 1.        , "b" : 1.        },
+                        "free_constants_units"      : {"a" : [0, 0, 0] , "b" : [0, 0, 0] },
+                        "free_constants_complexity" : {"a" : 0.        , "b" : 1.        },
+                           }
+        my_lib = Lib.Library(args_make_tokens = args_make_tokens,
+                             superparent_units = [0, 0, 0], superparent_name = "y")
+
+        # PROGRAM (containing a constant sub-tree cos(pi*1) folded at compilation)
+        test_program_str = ["add", "mul", "mul", "a", "cos", "mul", "pi", "1", "x0", "b"]
+        test_program     = [my_lib.lib_name_to_token[name] for name in test_program_str]
+        free_const_table = free_const.FreeConstantsTable(batch_size=1, library=my_lib, n_realizations=1)
+        prog = Prog.Program(tokens=test_program, library=my_lib, free_consts=free_const_table, n_realizations=1)
+
+        # Evaluation before optimization (program compiled in inference mode)
+        prog.free_consts.class_values.requires_grad_(True)
+        y_eval = prog.evaluate(X=X)
+        self.assertFalse(y_eval.requires_grad)
+        self.assertTrue(torch.is_inference(y_eval))
+        y_exe  = prog.execute(X=X)
+        self.assertTrue(y_exe.requires_grad)
+        self.assertTrue(torch.equal(y_eval, y_exe.detach()))
+
+        # Optimization still works after evaluation in inference mode
+        history = prog.optimize_constants(X=X, y_target=y_ideals,)
+        tol = 1e-4
+        works_bool = (torch.abs(prog.free_consts.class_values[0] - ideal_class_params)<tol).all()
+        self.assertTrue(works_bool)
+
+        # Evaluation after optimization
+        y_eval = prog.evaluate(X=X)
+        self.assertFalse(y_eval.requires_grad)
+        self.assertTrue(torch.allclose(y_eval, y_ideals, atol=1e-3))
+
+        return None
+
+    # Test detection of linearly appearing free constants and their closed form optimization
+    def test_optimize_linear_free_consts (self):
+
+        seed = 42
+        np.random.seed(seed)
+        torch.manual_seed(seed)
+
+        # LIBRARY CONFIG
+        args_make_tokens = {
+                        # operations
+                        "op_names"             : "all",
+                        "use_protected_ops"    : False,
+                        # input variables
+                        "input_var_ids"        : {"x0" : 0         , "x1" : 1         },
+                        "input_var_units"      : {"x0" : [0, 0, 0] , "x1" : [0, 0, 0] },
+                        "input_var_complexity" : {"x0" : 0.        , "x1" : 1.        },
+                        # free constants
+                        "free_constants"            : {"a"             , "b"             , "c"             },
+                        "free_constants_init_val"   : {"a" : 1.        , "b" : 1.        , "c" : 1.        },
+                        "free_constants_units"      : {"a" : [0, 0, 0] , "b" : [0, 0, 0] , "c" : [0, 0, 0] },
+                        "free_constants_complexity" : {"a" : 0.        , "b" : 1.        , "c" : 1.        },
+                           }
+        my_lib = Lib.Library(args_make_tokens = args_make_tokens,
+                             superparent_units = [0, 0, 0], superparent_name = "y")
+        a_id, b_id, c_id = [my_lib.lib_name_to_token[name].var_id for name in ["a", "b", "c"]]
+        CLASS = Tok.VAR_TYPE_CLASS_FREE_CONST
+
+        def make_prog (test_program_str):
+            test_program     = [my_lib.lib_name_to_token[name] for name in test_program_str]
+            free_const_table = free_const.FreeConstantsTable(batch_size=1, library=my_lib, n_realizations=1)
+            prog = Prog.Program(tokens=test_program, library=my_lib, free_consts=free_const_table, n_realizations=1)
+            return prog
+
+        # ------ Static analysis ------
+        # a*x0 - (-b) + x1
+        prog = make_prog(["add", "sub", "mul", "x0", "a", "neg", "b", "x1",])
+        linear_structure = prog.get_linear_free_consts()
+        self.assertEqual(sorted(linear_structure["linear_terms"]), sorted([(CLASS, a_id, 1, 3, 4), (CLASS, b_id, 1, 7, 7)]))
+        self.assertEqual(linear_structure["other_terms"], [(1, 7, 8)])
+        # a appearing twice : not linear, c nested in non additive op : not linear
+        prog = make_prog(["add", "mul", "a", "x0", "exp", "mul", "a", "c",])
+        self.assertEqual(prog.get_linear_free_consts(), None)
+        # c*x0 last child of mul is not c
+        prog = make_prog(["mul", "x0", "exp", "c",])
+        self.assertEqual(prog.get_linear_free_consts(), None)
+
+        # ------ Fully linear program ------
+        x0 = torch.linspace(0, 10, 1000)
+        x1 = torch.linspace(-5, 1 , 1000)
+        X = torch.stack((x0,x1),axis=0)
+        y_ideals = 1.389*X[0] + 1.005 + X[1]
+
+        # ------ Closed form disabled (default) ------
+        self.assertFalse(Prog.USE_CLOSED_FORM_LINEAR_FREE_CONSTS)
+        prog = make_prog(["add", "sub", "mul", "x0", "a", "neg", "b", "x1",])
+        history = prog.optimize_constants(X=X, y_target=y_ideals,)
+        self.assertTrue(len(history) > 1)
+
+        Prog.USE_CLOSED_FORM_LINEAR_FREE_CONSTS = True
+        try:
+            prog = make_prog(["add", "sub", "mul", "x0", "a", "neg", "b", "x1",])
+            history = prog.optimize_constants(X=X, y_target=y_ideals,)
+            # Solved in closed form in a single step
+            self.assertEqual(len(history), 1)
+            self.assertEqual(prog.free_consts.opti_steps[0], 1)
+            works_bool = np.allclose(prog.free_consts.class_values[0, [a_id, b_id]].detach().numpy(), [1.389, 1.005], atol=1e-6)
+            self.assertTrue(works_bool)
+
+            # ------ Linear and non-linear free constants ------
+            # a*exp(-c*x0) + b
+            y_ideals = 1.389*torch.exp(-0.5*X[0]) + 1.005
+            prog = make_prog(["add", "mul", "a", "exp", "neg", "mul", "c", "x0", "b",])
+            prog.optimize_constants(X=X, y_target=y_ideals,)
+            works_bool = np.allclose(prog.free_consts.class_values[0, [a_id, b_id, c_id]].detach().numpy(), [1.389, 1.005, 0.5], atol=1e-4)
+            self.assertTrue(works_bool)
+        finally:
+            Prog.USE_CLOSED_FORM_LINEAR_FREE_CONSTS = False
+
+        return None
+
     # Test program const optimization in Class SR scenario
     def test_optimize_with_spe_free_consts (self):
 
@@ -805,6 +956,39 @@ class ProgramTest(unittest.TestCase):
         above_tol = MSEs[MSEs>=mse_tol]
         self.assertTrue(works_bool, "above_tol = %s"%above_tol)
 
+        # ------- Test execution of several sets of free constants values at once -------
+        n_rows = 3
+        class_values = prog.free_consts.class_values.detach() + torch.rand(n_rows, 1).to(DEVICE)     # (n_rows, n_class_params,)
+        spe_values   = prog.free_consts.spe_values  .detach() + torch.rand(n_rows, 1, 1).to(DEVICE)  # (n_rows, n_spe_params, n_realizations,)
+        y_starts = prog.execute_starts(X = multi_X_flatten, class_values = class_values, spe_values = spe_values,
+                                       n_samples_per_dataset = n_samples_per_dataset)              # (n_rows, n_all_samples,)
+        self.assertEqual(y_starts.shape, (n_rows, n_all_samples))
+        y_starts_1 = prog.execute_starts(X = multi_X[1], class_values = class_values, spe_values = spe_values,
+                                         i_realization = 1)                                        # (n_rows, n_samples,)
+        for i in range (n_rows):
+            free_const_table = free_const.FreeConstantsTable(batch_size=1, library=my_lib, n_realizations=n_realizations)
+            prog_i = Prog.Program(tokens=test_tokens_0, library=my_lib, free_consts=free_const_table, n_realizations=n_realizations)
+            prog_i.free_consts.class_values[0] = class_values[i]
+            prog_i.free_consts.spe_values  [0] = spe_values  [i]
+            y_i = prog_i.execute(X = multi_X_flatten, n_samples_per_dataset = n_samples_per_dataset)
+            self.assertTrue(torch.allclose(y_starts[i], y_i))
+            y_i = prog_i.execute(X = multi_X[1], i_realization = 1)
+            self.assertTrue(torch.allclose(y_starts_1[i], y_i))
+
+        # ------- Test multi-start optimization (starts being executed at once) -------
+        prog.free_consts = free_const.FreeConstantsTable(batch_size=1, library=my_lib, n_realizations=n_realizations)
+        history = prog.optimize_constants(X                     = multi_X_flatten,
+                                          y_target              = y_ideals_flatten,
+                                          n_samples_per_dataset = n_samples_per_dataset,
+                                          args_opti             = dict(free_const.DEFAULT_OPTI_ARGS, n_starts = 4),
+                                        )
+        self.assertFalse(np.isnan(history).any())
+        self.assertEqual(prog.free_consts.opti_steps[0], len(history))
+        works_bool = (torch.abs(prog.free_consts.class_values[0] - ideal_class_params)<tol).all()
+        self.assertTrue(works_bool)
+        works_bool = (torch.abs(prog.free_consts.spe_values[0] - ideal_spe_params)<tol).all()
+        self.assertTrue(works_bool)
+
         # ------- Test optimization (one-by-one) -------
         # Actually this makes no sense to test this as this will optimize class free constants one time per realization
         # but they are supposed to be common to all realizations. There is no point in optimizing them one by one even
@@ -860,6 +1044,17 @@ class ProgramTest(unittest.TestCase):
         #      print("%i, mse = %f"%(i, mse))
         return None
 
+    # Test program const optimization in Class SR scenario with spe free constants optimized per realization (class
+    # free constants c0 and spe free constants k2 being coupled through cos(c0*t + k2))
+    def test_optimize_with_spe_free_consts_per_realization (self):
+        with mock.patch.object(Prog, "USE_PER_REALIZATION_FREE_CONSTS_OPTI", True), \
+             mock.patch.object(Prog, "USE_CLOSED_FORM_LINEAR_FREE_CONSTS",   False), \
+             mock.patch.object(Prog.Program, "optimize_constants_per_realization", autospec = True,
+                               side_effect = Prog.Program.optimize_constants_per_realization) as opti_per_realization:
+            self.test_optimize_with_spe_free_consts()
+            self.assertTrue(opti_per_realization.called)
+        return None
+
     # Test program const optimization in Class SR scenario
     def test_optimize_with_spe_free_consts_with_weights (self):
 
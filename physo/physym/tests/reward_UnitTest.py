@@ -5,8 +5,46 @@ import torch as torch
 
 # Internal imports
 from physo.physym import reward
+from physo.physym import library as Lib
+from physo.physym import vect_programs as VProg
 from physo.physym.functions import data_conversion, data_conversion_inv
 
+def make_lib(op_names = ("mul", "add", "neg", "exp", "inv"), use_protected_ops = True):
+    # LIBRARY CONFIG (single input variable t and free constants a and b)
+    args_make_tokens = {
+                    # operations
+                    "op_names"             : list(op_names),
+                    "use_protected_ops"    : use_protected_ops,
+                    # input variables
+                    "input_var_ids"        : {"t" : 0         ,},
+                    "input_var_units"      : {"t" : [0, 0, 0] ,},
+                    "input_var_complexity" : {"t" : 1.        ,},
+                    # constants
+                    "constants"            : {},
+                    # free constants
+                    "free_constants"            : {"a"              , "b"              },
+                    "free_constants_init_val"   : {"a" : 1.         , "b" : 1.         },
+                    "free_constants_units"      : {"a" : [0, 0, 0]  , "b" : [0, 0, 0]  },
+                    "free_constants_complexity" : {"a" : 1.         , "b" : 1.         },
+                       }
+    my_lib = Lib.Library(args_make_tokens = args_make_tokens,
+                         superparent_units = [0, 0, 0], superparent_name = "y")
+    return my_lib
+
+def make_programs(my_lib, progs_str, batch_size = None, n_realizations = 1, candidate_wrapper = None):
+    # PROGRAMS (each program appearing several times in batch if batch_size > nb of programs, completed with t)
+    if batch_size is None:
+        batch_size = len(progs_str)
+    max_len   = max([len(prog_str) for prog_str in progs_str])
+    progs_idx = np.full((batch_size, max_len), my_lib.lib_name_to_idx["t"])
+    for i in range (batch_size):
+        prog_str = progs_str[i%len(progs_str)]
+        progs_idx[i, :len(prog_str)] = [my_lib.lib_name_to_idx[name] for name in prog_str]
+    programs = VProg.VectPrograms(batch_size=batch_size, max_time_step=max_len, library=my_lib,
+                                  n_realizations=n_realizations, candidate_wrapper=candidate_wrapper)
+    programs.set_programs(progs_idx)
+    return programs
+
 class RewardTest(unittest.TestCase):
 
     # Test Squashed NRMSE reward
@@ -34,5 +72,366 @@ class RewardTest(unittest.TestCase):
         self.assertTrue(works_bool)
         return None
 
+    # Test rewards cache used across calls of RewardsComputer
+    def test_RewardsComputer_with_cache (self):
+
+        DEVICE = 'cpu'
+
+        # DATA
+        N = int(1e3)
+        t = data_conversion (np.linspace(0.06, 6, N)).to(DEVICE)
+        X = torch.stack((t,), axis=0)                                   # (n_dim, N)
+        y_target = 1.234*torch.exp(-0.5*t) + 0.1*t                      # (N,)
+        n_samples_per_dataset = np.array([N])
+
+        # LIBRARY
+        my_lib = make_lib()
+
+        # PROGRAMS (each program appearing several times in batch)
+        test_progs_str = [
+            ["add", "mul", "a", "exp", "mul", "neg", "b", "t", "mul", "a", "t"],
+            ["mul", "a", "exp", "mul", "neg", "b", "t"],
+            ["add", "a", "t"],
+        ]
+        batch_size = 12
+
+        free_const_opti_args = {'loss': "MSE", 'method': 'LBFGS', 'method_args': {'n_steps': 10, 'tol': 1e-8,
+                                'lbfgs_func_args': {'max_iter': 4, 'line_search_fn': "strong_wolfe",},},}
+        rewards_computer_args = {"X" : X, "y_target" : y_target, "y_weights" : 1.,
+                                 "n_samples_per_dataset" : n_samples_per_dataset,
+                                 "free_const_opti_args"  : free_const_opti_args,}
+
+        # Rewards without cache
+        programs_ref = make_programs(my_lib, test_progs_str, batch_size)
+        rewards_ref  = reward.make_RewardsComputer(use_rewards_cache=False, parallel_mode=False)(programs = programs_ref, **rewards_computer_args)
+
+        # Rewards with cache (first call fills cache, second call only uses cache)
+        rewards_computer = reward.make_RewardsComputer(use_rewards_cache=True, parallel_mode=False)
+        cache = rewards_computer.rewards_cache
+        rewards_0 = rewards_computer(programs = make_programs(my_lib, test_progs_str, batch_size), **rewards_computer_args)
+        self.assertEqual(len(cache), len(test_progs_str))
+        programs_1 = make_programs(my_lib, test_progs_str, batch_size)
+        rewards_1 = rewards_computer(programs = programs_1, **rewards_computer_args)
+
+        # TEST
+        self.assertTrue(np.allclose(rewards_0, rewards_ref))
+        self.assertTrue(np.array_equal(rewards_1, rewards_0))
+        self.assertTrue(torch.allclose(programs_1.free_consts.class_values, programs_ref.free_consts.class_values))
+        self.assertTrue(torch.equal(programs_1.free_consts.opti_steps, programs_ref.free_consts.opti_steps))
+        self.assertTrue(programs_1.free_consts.is_opti.all())
+        self.assertEqual(cache.misses, batch_size)
+        self.assertEqual(cache.hits,   batch_size)
+
+        # Different data -> no hits
+        hits = cache.hits
+        rewards_computer(programs = make_programs(my_lib, test_progs_str, batch_size), **{**rewards_computer_args, "y_target": 2.*y_target})
+        self.assertEqual(cache.hits, hits)
+
+        # Cache is disabled by default
+        self.assertIsNone(reward.make_RewardsComputer(parallel_mode=False).rewards_cache)
+
+        # Fingerprint of data is only computed once per dataset (including when using successive halving)
+        n_fingerprints = []
+        DatasetFingerprint = reward.DatasetFingerprint
+        def counting_DatasetFingerprint(**kwargs):
+            n_fingerprints.append(1)
+            return DatasetFingerprint(**kwargs)
+        reward.DatasetFingerprint = counting_DatasetFingerprint
+        try:
+            for sh_args in [{}, {"successive_halving_n_samples": [100,], "successive_halving_keep_fractions": [0.5,]}]:
+                n_fingerprints.clear()
+                rewards_computer = reward.make_RewardsComputer(use_rewards_cache=True, parallel_mode=False, **sh_args)
+                for _ in range(3):
+                    rewards_computer(programs = make_programs(my_lib, test_progs_str, batch_size), **rewards_computer_args)
+                self.assertEqual(len(n_fingerprints), 1)
+                self.assertTrue(rewards_computer.rewards_cache.hits > 0)
+        finally:
+            reward.DatasetFingerprint = DatasetFingerprint
+
+        # TEST EVICTION
+        cache = reward.RewardsCache(max_size = 2)
+        for i in range(3):
+            cache.put((tuple([i]), "fp"), reward=1., class_values=torch.zeros(2), spe_values=torch.zeros(0, 1), opti_steps=1)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.evictions, 1)
+        self.assertIsNone(cache.get((tuple([0]), "fp")))
+        self.assertIsNotNone(cache.get((tuple([2]), "fp")))
+        cache = reward.RewardsCache(max_size = 10, max_memory = 1.5*cache.memory/2)
+        for i in range(3):
+            cache.put((tuple([i]), "fp"), reward=1., class_values=torch.zeros(2), spe_values=torch.zeros(0, 1), opti_steps=1)
+        self.assertEqual(len(cache), 1)
+
+        return None
+
+    # Test early abandonment of free constants optimization of programs that can not reach elite threshold
+    def test_RewardsComputer_early_abandonment (self):
+
+        DEVICE = 'cpu'
+
+        # DATA
+        N = int(1e3)
+        t = data_conversion (np.linspace(0.06, 6, N)).to(DEVICE)
+        X = torch.stack((t,), axis=0)                                   # (n_dim, N)
+        y_target = 1.234*torch.exp(-0.5*t)                              # (N,)
+        n_samples_per_dataset = np.array([N])
+
+        # LIBRARY
+        my_lib = make_lib(op_names = ["mul", "add", "neg", "exp", "cos"])
+
+        # PROGRAMS (correct one and wrong one)
+        test_progs_str = [
+            ["exp", "add", "a", "mul", "neg", "b", "t"],
+            ["exp", "add", "a", "cos", "mul", "b", "t"],
+        ]
+
+        free_const_opti_args = {'loss': "MSE", 'method': 'LBFGS', 'method_args': {'n_steps': 30, 'tol': 1e-12,
+                                'lbfgs_func_args': {'max_iter': 4, 'line_search_fn': "strong_wolfe",},},}
+        rewards_computer_args = {"X" : X, "y_target" : y_target, "y_weights" : 1.,
+                                 "n_samples_per_dataset" : n_samples_per_dataset,
+                                 "free_const_opti_args"  : free_const_opti_args,
+                                 "parallel_mode"         : False}
+
+        # Without early abandonment
+        programs_ref = make_programs(my_lib, test_progs_str)
+        rewards_ref  = reward.RewardsComputer(programs = programs_ref, **rewards_computer_args)
+        # With early abandonment
+        programs = make_programs(my_lib, test_progs_str)
+        rewards  = reward.RewardsComputer(programs = programs, abandon_reward = 0.99, **rewards_computer_args)
+
+        # TEST
+        self.assertTrue(rewards_ref[0] > 0.99)
+        self.assertTrue(rewards_ref[1] < 0.99)
+        self.assertTrue(np.allclose(rewards[0], rewards_ref[0]))
+        self.assertTrue(rewards[1] < 0.99)
+        self.assertTrue(programs.free_consts.opti_steps[1] < programs_ref.free_consts.opti_steps[1])
+
+        # Abandoned programs are not cached : they are optimized again (to the same reward as without early
+        # abandonment) when met with a laxer threshold
+        cache    = reward.RewardsCache()
+        programs = make_programs(my_lib, test_progs_str)
+        rewards  = reward.RewardsComputer(programs = programs, abandon_reward = 0.99, rewards_cache = cache, **rewards_computer_args)
+        self.assertEqual(programs.free_consts.opti_abandoned.tolist(), [False, True])
+        self.assertEqual(len(cache), 1)
+        programs = make_programs(my_lib, test_progs_str)
+        rewards  = reward.RewardsComputer(programs = programs, abandon_reward = 1e-6, rewards_cache = cache, **rewards_computer_args)
+        self.assertEqual(programs.free_consts.opti_abandoned.tolist(), [False, False])
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(len(cache), 2)
+        self.assertTrue(np.allclose(rewards, rewards_ref))
+        self.assertTrue(torch.equal(programs.free_consts.opti_steps, programs_ref.free_consts.opti_steps))
+
+        # Threshold of next call is a quantile of rewards of previous call
+        rewards_computer = reward.make_RewardsComputer(use_rewards_cache=False, parallel_mode=False, early_abandon_quantile=0.5)
+        self.assertIsNone(rewards_computer.abandon_reward)
+        args = {key: rewards_computer_args[key] for key in ["X", "y_target", "y_weights", "n_samples_per_dataset", "free_const_opti_args"]}
+        rewards = rewards_computer(programs = make_programs(my_lib, test_progs_str), **args)
+        self.assertEqual(rewards_computer.abandon_reward, np.quantile(rewards, 0.5))
+
+        return None
+
+    # Test duplicates elimination using numeric fingerprints
+    def test_RewardsComputer_duplicates (self):
+
+        DEVICE = 'cpu'
+
+        # DATA (2 datasets)
+        n_samples_per_dataset = np.array([200, 300])
+        t = data_conversion (np.concatenate([np.linspace(0.06, 6, n) for n in n_samples_per_dataset])).to(DEVICE)
+        X = torch.stack((t,), axis=0)                                   # (n_dim, N)
+        y_target = 1.234*torch.exp(-0.5*t) + 0.1*t                      # (N,)
+
+        # LIBRARY CONFIG
+        args_make_tokens = {
+                        # operations
+                        "op_names"             : ["mul", "add", "neg", "exp", "inv"],
+                        "use_protected_ops"    : True,
+                        # input variables
+                        "input_var_ids"        : {"t" : 0         ,},
+                        "input_var_units"      : {"t" : [0, 0, 0] ,},
+                        "input_var_complexity" : {"t" : 1.        ,},
+                        # constants
+                        "constants"            : {"1" : data_conversion(1.) },
+                        "constants_units"      : {"1" : [0, 0, 0]           },
+                        "constants_complexity" : {"1" : 1.                  },
+                        # free constants
+                        "class_free_constants"            : {"a"              },
+                        "class_free_constants_init_val"   : {"a" : 1.         },
+                        "class_free_constants_units"      : {"a" : [0, 0, 0]  },
+                        "class_free_constants_complexity" : {"a" : 1.         },
+                        # free constants
+                        "spe_free_constants"            : {"k"              },
+                        "spe_free_constants_init_val"   : {"k" : 1.         },
+                        "spe_free_constants_units"      : {"k" : [0, 0, 0]  },
+                        "spe_free_constants_complexity" : {"k" : 1.         },
+                           }
+        my_lib = Lib.Library(args_make_tokens = args_make_tokens,
+                             superparent_units = [0, 0, 0], superparent_name = "y")
+
+        # PROGRAMS
+        test_progs_str = [
+            ["mul", "t", "add", "1", "1"],     # 0 : 2t (most complex)
+            ["add", "t", "t"],                 # 1 : 2t
+            ["mul", "a", "t"],                 # 2 : a*t
+            ["mul", "t", "a"],                 # 3 : a*t (different free const value)
+            ["add", "t", "k"],                 # 4 : t+k
+            ["add", "k", "t"],                 # 5 : t+k
+            ["exp", "t"],                      # 6 : unique
+            ["add", "t", "t"],                 # 7 : 2t (masked out)
+        ]
+        batch_size = len(test_progs_str)
+
+        def make_test_programs():
+            programs = make_programs(my_lib, test_progs_str, n_realizations=len(n_samples_per_dataset))
+            # Free consts values should not matter
+            programs.free_consts.class_values[3] = 2.
+            return programs
+        mask = np.array([True]*(batch_size-1) + [False])
+
+        # FINGERPRINTS
+        programs = make_test_programs()
+        fingerprints = reward.NumericFingerprints(programs = programs, X = X, y_target = y_target,
+                                                  n_samples_per_dataset = n_samples_per_dataset, mask = mask)
+        _, inverse = np.unique(fingerprints[mask], return_inverse=True)
+        self.assertTrue(np.array_equal(inverse[[0, 2, 4]], inverse[[1, 3, 5]]))
+        self.assertEqual(len(np.unique(inverse)), 4)
+        # Free consts values are restored
+        self.assertEqual(float(programs.free_consts.class_values[3, 0]), 2.)
+
+        # Programs only matching for special values of free constants (eg. initial values) are not duplicates
+        special_progs_str = [
+            ["mul", "a", "t"],                 # a*t
+            ["mul", "k", "t"],                 # k*t
+            ["t"],                             # t (a*t for a = 1)
+            ["add", "t", "a"],                 # t+a
+            ["add", "t", "1"],                 # t+1 (t+a for a = 1)
+            ["inv", "a"],                      # 1/a
+            ["a"],                             # a (1/a for a = 1)
+        ]
+        programs = make_programs(my_lib, special_progs_str, n_realizations=len(n_samples_per_dataset))
+        fingerprints = reward.NumericFingerprints(programs = programs, X = X, y_target = y_target,
+                                                  n_samples_per_dataset = n_samples_per_dataset)
+        self.assertEqual(len(np.unique(fingerprints)), len(special_progs_str))
+
+        # REWARDS
+        rewards_computer_args = {"X" : X, "y_target" : y_target, "y_weights" : 1.,
+                                 "n_samples_per_dataset" : n_samples_per_dataset, "mask" : mask,
+                                 "zero_out_duplicates" : True,}
+        rewards = reward.RewardsComputer(programs = make_test_programs(), keep_lowest_complexity_duplicate = False,
+                                         **rewards_computer_args)
+        self.assertTrue(np.array_equal(rewards > 0, [True, False, True, False, True, False, True, False]))
+        rewards = reward.RewardsComputer(programs = make_test_programs(), keep_lowest_complexity_duplicate = True,
+                                         **rewards_computer_args)
+        self.assertTrue(np.array_equal(rewards > 0, [False, True, True, False, True, False, True, False]))
+
+        return None
+
+    # Test that interval pre-screening (when enabled) only zeroes out programs certainly invalid using the default
+    # candidate wrapper
+    def test_RewardsComputer_interval_prescreen (self):
+
+        DEVICE = 'cpu'
+
+        # DATA
+        N = int(1e3)
+        t = data_conversion (np.linspace(0.06, 6, N)).to(DEVICE)
+        X = torch.stack((t,), axis=0)                                   # (n_dim, N)
+        y_target = 1.234*torch.exp(-0.5*t) + 0.1*t                      # (N,)
+        n_samples_per_dataset = np.array([N])
+
+        # LIBRARY
+        my_lib = make_lib(op_names = ["mul", "add", "neg", "exp", "log"], use_protected_ops = False)
+
+        # PROGRAMS (NaN everywhere, valid, valid with loose but finite bounds : argument of log being t*t - t*t + exp(t)
+        # (ie. exp(t) > 0) with bounds [-36, 440] containing negative values)
+        test_progs_str = [
+            ["log", "neg", "exp", "t"],
+            ["exp", "neg", "t"],
+            ["log", "add", "add", "mul", "t", "t", "neg", "mul", "t", "t", "exp", "t"],
+        ]
+
+        rewards_computer_args = {"X" : X, "y_target" : y_target, "n_samples_per_dataset" : n_samples_per_dataset,}
+
+        # Default wrapper : NaN program is zeroed out, valid programs get the same rewards as without pre-screening
+        rewards_ref = reward.RewardsComputer(programs = make_programs(my_lib, test_progs_str), **rewards_computer_args)
+        rewards     = reward.RewardsComputer(programs = make_programs(my_lib, test_progs_str), interval_prescreen = True,
+                                             **rewards_computer_args)
+        self.assertTrue(np.array_equal(rewards > 0, [False, True, True]))
+        self.assertTrue(np.array_equal(rewards, rewards_ref))
+
+        # Custom wrapper making NaN program valid : it must not be zeroed out by interval pre-screening
+        wrapper = lambda func, X: torch.nan_to_num(func(X))
+        rewards = reward.RewardsComputer(programs = make_programs(my_lib, test_progs_str, candidate_wrapper = wrapper),
+                                         interval_prescreen = True, **rewards_computer_args)
+        self.assertTrue(np.array_equal(rewards > 0, [True, True, True]))
+
+        return None
+
+    # Test successive halving evaluation (low fidelity rung on a subset of data, then best programs on full data)
+    def test_SuccessiveHalvingRewardsComputer (self):
+
+        DEVICE = 'cpu'
+
+        # DATA (2 datasets)
+        n_samples_per_dataset = np.array([2000, 3000])
+        t = data_conversion (np.concatenate([np.linspace(0.06, 6, n) for n in n_samples_per_dataset])).to(DEVICE)
+        X = torch.stack((t,), axis=0)                                   # (n_dim, N)
+        y_target = 1.234*torch.exp(-0.5*t) + 0.1*t                      # (N,)
+        y_weights = torch.rand(t.shape[0])                              # (N,)
+
+        # SUBSET
+        sub_X, sub_y_target, sub_n_samples_per_dataset, sub_y_weights = reward.DataSubset(
+            X = X, y_target = y_target, n_samples_per_dataset = n_samples_per_dataset, y_weights = y_weights, n_samples = 100)
+        self.assertTrue(np.array_equal(sub_n_samples_per_dataset, [100, 100]))
+        self.assertEqual(sub_X.shape, (1, 200))
+        self.assertEqual(sub_y_weights.shape, (200,))
+        # Samples of each dataset come from this dataset
+        self.assertTrue((sub_X[0, :100] == X[0, :2000][None, :].T).any(axis=0).all())
+        self.assertTrue((sub_X[0, 100:] == X[0, 2000:][None, :].T).any(axis=0).all())
+        # Same subset at each call
+        self.assertTrue(torch.equal(sub_y_target, reward.DataSubset(X = X, y_target = y_target,
+                                                                    n_samples_per_dataset = n_samples_per_dataset,
+                                                                    n_samples = 100)[1]))
+
+        # LIBRARY
+        my_lib = make_lib()
+
+        # PROGRAMS
+        test_progs_str = [
+            ["add", "mul", "a", "exp", "mul", "neg", "b", "t", "mul", "a", "t"],
+            ["mul", "a", "exp", "mul", "neg", "b", "t"],
+            ["add", "a", "t"],
+            ["inv", "t"],
+        ]
+        batch_size = 8
+        make_test_programs = lambda : make_programs(my_lib, test_progs_str, batch_size, n_realizations=2)
+
+        rewards_computer_args = {"X" : X, "y_target" : y_target, "y_weights" : y_weights,
+                                 "n_samples_per_dataset" : n_samples_per_dataset,
+                                 "free_const_opti_args"  : None,}
+
+        # Rewards on full data and on subset
+        rewards_full = reward.make_RewardsComputer(use_rewards_cache=False, parallel_mode=False)(programs = make_test_programs(), **rewards_computer_args)
+        rewards_sub  = reward.make_RewardsComputer(use_rewards_cache=False, parallel_mode=False)(programs = make_test_programs(),
+                            **{**rewards_computer_args, "X" : sub_X, "y_target" : sub_y_target, "y_weights" : sub_y_weights,
+                               "n_samples_per_dataset" : sub_n_samples_per_dataset})
+
+        # Successive halving rewards
+        rewards_computer = reward.make_RewardsComputer(use_rewards_cache=False, parallel_mode=False,
+                                                       successive_halving_n_samples      = [100,],
+                                                       successive_halving_keep_fractions = [0.5,])
+        self.assertIsNone(rewards_computer.successive_halving_n_evaluated)
+        rewards = rewards_computer(programs = make_test_programs(), **rewards_computer_args)
+
+        # TEST
+        # All programs evaluated on subset, half of them on full data
+        self.assertEqual(rewards_computer.successive_halving_n_evaluated, [batch_size, batch_size//2])
+        promoted = np.argsort(-rewards_sub, kind="stable")[:batch_size//2]
+        is_promoted = np.isin(np.arange(batch_size), promoted)
+        # Promoted programs have full data rewards, others keep their low fidelity rewards
+        self.assertTrue(np.allclose(rewards[ is_promoted], rewards_full[ is_promoted], atol=1e-6))
+        self.assertTrue(np.allclose(rewards[~is_promoted], rewards_sub [~is_promoted]))
+
+        return None
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
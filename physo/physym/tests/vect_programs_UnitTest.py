@@ -14,6 +14,7 @@ from physo.physym import dimensional_analysis as phy
 from physo.physym.functions import data_conversion, data_conversion_inv
 import physo.physym.free_const as free_const
 from physo.physym import vect_programs as VProg
+from physo.physym import token as Tok
 
 def make_lib():
     # LIBRARY CONFIG
@@ -58,6 +59,58 @@ class VectProgramsTest(unittest.TestCase):
         except:
             self.fail("VectPrograms creation failed.")
 
+    # Test that compact dtypes layout gives the same programs state as int64/float64 layout
+    def test_make_VectPrograms_compact_dtypes(self):
+        # BATCH CONFIG
+        batch_size = 1000
+        max_time_step = 32
+        my_lib = make_lib()
+        terminals_idx = np.arange(my_lib.n_choices)[my_lib.arity[:my_lib.n_choices] == 0]
+        # BATCHES
+        all_programs = []
+        for compact in [False, True]:
+            use_compact_dtypes = Tok.USE_COMPACT_DTYPES
+            Tok.USE_COMPACT_DTYPES = compact
+            try:
+                my_programs = VProg.VectPrograms(batch_size=batch_size, max_time_step=max_time_step, library=my_lib, n_realizations=1)
+            finally:
+                Tok.USE_COMPACT_DTYPES = use_compact_dtypes
+            # Same random programs for both layouts
+            rng = np.random.default_rng(42)
+            for _ in range (max_time_step):
+                next_tokens_idx = rng.integers(low=0, high=my_lib.n_choices, size=batch_size)
+                mask_must_end = (my_programs.n_dummies + my_programs.curr_step + Tok.MAX_ARITY) >= max_time_step
+                next_tokens_idx[mask_must_end] = rng.choice(terminals_idx, size=mask_must_end.sum())
+                my_programs.append(next_tokens_idx)
+            all_programs.append(my_programs)
+        wide, compact = all_programs
+        # Compact dtypes
+        self.assertEqual(compact.tokens.ancestors_pos .dtype, np.int8)
+        self.assertEqual(compact.tokens.children_pos  .dtype, np.int8)
+        self.assertEqual(compact.tokens.idx           .dtype, np.int8)
+        self.assertEqual(compact.tokens.pos_batch     .dtype, np.int16)
+        self.assertEqual(compact.tokens.phy_units     .dtype, np.float32)
+        self.assertEqual(wide   .tokens.ancestors_pos .dtype, int)
+        # Same state (invalid positions being encoded differently)
+        for attr, val in vars(wide.tokens).items():
+            if isinstance(val, np.ndarray):
+                val_compact = getattr(compact.tokens, attr)
+                if attr in ["depth", "parent_pos", "siblings_pos", "children_pos"]:
+                    is_invalid = val_compact == np.iinfo(val_compact.dtype).max
+                    np.testing.assert_array_equal(is_invalid, val == Tok.INVALID_POS, err_msg=attr)
+                    val, val_compact = val[~is_invalid], val_compact[~is_invalid]
+                np.testing.assert_array_equal(val_compact, val.astype(val_compact.dtype), err_msg=attr)
+        for attr in ["n_lengths", "n_dummies", "is_complete", "is_physical", "units_analysis_cases"]:
+            np.testing.assert_array_equal(getattr(compact, attr), getattr(wide, attr), err_msg=attr)
+        # Ancestors (computed on demand)
+        ancestors_pos, ancestors_pos_compact = wide.tokens.ancestors_pos, compact.tokens.ancestors_pos
+        is_invalid = ancestors_pos_compact == np.iinfo(ancestors_pos_compact.dtype).max
+        np.testing.assert_array_equal(is_invalid, ancestors_pos == Tok.INVALID_POS)
+        np.testing.assert_array_equal(ancestors_pos_compact[~is_invalid], ancestors_pos[~is_invalid])
+        # Library properties are not compacted
+        self.assertEqual(my_lib.properties.phy_units.dtype, float)
+        return None
+
     # Test VectPrograms init
     def test_make_VectPrograms_assertions(self):
         # BATCH CONFIG
@@ -217,6 +270,45 @@ class VectProgramsTest(unittest.TestCase):
         test = my_programs.get_infix_pretty(prog_idx=0)
         return None
 
+    # Test that running counters maintained by append match counts over whole programs
+    def test_running_counters(self):
+        # BATCH CONFIG
+        batch_size = 1000
+        max_time_step = 32
+        my_lib = make_lib()
+        terminals_idx = np.arange(my_lib.n_choices)[my_lib.arity[:my_lib.n_choices] == 0]
+        group_0 = np.array([my_lib.lib_name_to_idx[name] for name in ["cos", "sin", "exp"]])
+        group_1 = np.array([my_lib.lib_name_to_idx[name] for name in ["exp", "log"]])
+        # BATCH
+        my_programs = VProg.VectPrograms(batch_size=batch_size, max_time_step=max_time_step, library=my_lib, n_realizations=1)
+        counter_0 = my_programs.add_ancestors_counter(group_0)
+        # Identical groups share counters
+        self.assertEqual(my_programs.add_ancestors_counter(group_0[::-1]), counter_0)
+        rng = np.random.default_rng(42)
+        for epoch in range (2):
+            for step in range (max_time_step - 1):
+                # Counter registered after programs were started
+                if epoch == 0 and step == 10:
+                    counter_1 = my_programs.add_ancestors_counter(group_1)
+                # Expected counts
+                ancestors_idx = my_programs.get_ancestors_idx_of_step(no_ancestor_idx_filler = my_lib.invalid_idx)
+                expected_nesting_0 = np.isin(ancestors_idx, group_0).sum(axis=1)
+                expected_nesting_1 = np.isin(ancestors_idx, group_1).sum(axis=1)
+                expected_occurrences = my_programs.count_tokens_idx(my_programs.tokens.idx)[:, :my_lib.n_choices]
+                # Test
+                np.testing.assert_array_equal(my_programs.ancestors_counters[counter_0][:, my_programs.curr_step], expected_nesting_0)
+                if epoch == 1 or step >= 10:
+                    np.testing.assert_array_equal(my_programs.ancestors_counters[counter_1][:, my_programs.curr_step], expected_nesting_1)
+                np.testing.assert_array_equal(my_programs.n_occurrences[:, :my_lib.n_choices], expected_occurrences)
+                # Append
+                next_tokens_idx = rng.integers(low=0, high=my_lib.n_choices, size=batch_size)
+                mask_must_end = (my_programs.n_dummies + my_programs.curr_step + Tok.MAX_ARITY) >= max_time_step
+                next_tokens_idx[mask_must_end] = rng.choice(terminals_idx, size=mask_must_end.sum())
+                my_programs.append(next_tokens_idx)
+            # Counters are also reset
+            my_programs.reset()
+        return None
+
     def test_ancestors_relationships(self):
         # LIBRARY CONFIG
         args_make_tokens = {
@@ -30,6 +30,34 @@ INVALID_DEPTH = 9999999
 # Dummy tokens, n_lengths <= pos < (n_lengths + n_dangling)
 DUMMY_TOKEN_NAME = "dummy"
 
+# --------------------- VECTORIZED TOKENS DTYPES ---------------------
+# Should VectTokens store positional properties (positions, depths, numbers of relatives) and library indices using
+# the smallest int dtype able to hold them (given max_time_step and the library size) and physical units in float32
+# rather than int64 and float64. This divides memory footprint and bandwidth of state arrays by up to 8 and speeds up
+# VectPrograms.append.
+# Invalid positions / depths are then encoded by the max value of the compact dtype (see VectTokens.default_pos).
+USE_COMPACT_DTYPES = True
+# Dtype of physical units in compact layout (units are small rationals and are compared with a float32 tolerance in
+# priors).
+COMPACT_UNITS_DTYPE = np.float32
+
+def compact_int_dtype (max_value):
+    """
+    Returns the smallest signed int dtype able to hold values in [-1, max_value] with max_value < max of dtype, so that
+    the max of the dtype can be used as an invalid value.
+    Parameters
+    ----------
+    max_value : int
+        Max valid value to hold.
+    Returns
+    -------
+    dtype : numpy.dtype
+    """
+    for dtype in [np.int8, np.int16, np.int32,]:
+        if max_value < np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
 # --------------------- TOKEN VAR TYPES IDs ---------------------
 # Token representing an operation / function
 VAR_TYPE_OP = 0
@@ -786,6 +814,8 @@ class VectTokens:
     ancestors_pos              : numpy.array of shape (shape[1],) of int`
         Ancestors positions in the program ie in time dim counting the token itself as itw own ancestor.
         (eg. [0, 1, 4, 5, INVALID_POS, INVALID_POS] for x1 in program = [mul, add, sin, x0, log, x1]).
+        This is not stored (which would take (shape[0], shape[1], shape[1]) memory) but computed on demand from the
+        chain of parents and depths (see get_ancestors_pos).
     n_siblings                : int
         Number of siblings.
     n_children                : int
@@ -794,15 +824,17 @@ class VectTokens:
         Number of ancestors. This is equal to depth+1 as the token itself counts as its own ancestor.
     """
 
-    def __init__(self, shape, invalid_token_idx):
+    def __init__(self, shape, invalid_token_idx, compact = None):
         """
         Parameters
         ----------
         shape : (int, int)
             Shape of the matrix.
         invalid_token_idx : int
-            Index of the invalid token in the library of tokens.
-
+            Index of the invalid token in the library of tokens (ie. largest index in the library).
+        compact : bool or None, optional
+            Should properties be stored using compact dtypes selected from shape and invalid_token_idx (see
+            USE_COMPACT_DTYPES). By default (None), uses USE_COMPACT_DTYPES.
         """
 
         # -------------------------------------------------------------------------------------------------------
@@ -814,11 +846,34 @@ class VectTokens:
         self.shape = shape                          # (int, int)
         self.invalid_token_idx = invalid_token_idx  # int
 
+        # ---- Dtypes ----
+        if compact is None:
+            compact = USE_COMPACT_DTYPES
+        self.compact = compact
+        if self.compact:
+            self.idx_dtype       = compact_int_dtype(self.invalid_token_idx)  # library indices
+            self.arity_dtype     = compact_int_dtype(MAX_ARITY)               # arities
+            self.var_type_dtype  = compact_int_dtype(max(VAR_TYPES))          # var types
+            self.pos_dtype       = compact_int_dtype(self.shape[1])           # positions, depths and nb of relatives
+            self.pos_batch_dtype = compact_int_dtype(self.shape[0])           # positions in batch dim
+            self.units_dtype     = np.dtype(COMPACT_UNITS_DTYPE)              # physical units
+        else:
+            self.idx_dtype       = np.dtype(int)
+            self.arity_dtype     = np.dtype(int)
+            self.var_type_dtype  = np.dtype(int)
+            self.pos_dtype       = np.dtype(int)
+            self.pos_batch_dtype = np.dtype(int)
+            self.units_dtype     = np.dtype(float)
+        # Invalid values that can be held in dtypes
+        invalid_pos       = min(INVALID_POS,   np.iinfo(self.pos_dtype)      .max)
+        invalid_pos_batch = min(INVALID_POS,   np.iinfo(self.pos_batch_dtype).max)
+        invalid_depth     = min(INVALID_DEPTH, np.iinfo(self.pos_dtype)      .max)
+
         # ---- Index in library ----
         # Default value
         self.default_idx = self.invalid_token_idx
         # Property
-        self.idx = np.full(shape=self.shape, fill_value=self.default_idx, dtype=int )
+        self.idx = np.full(shape=self.shape, fill_value=self.default_idx, dtype=self.idx_dtype )
 
         # -------------------------------------------------------------------------------------------------------
         # -------------------------------------- non_positional properties --------------------------------------
@@ -837,9 +892,9 @@ class VectTokens:
         self.default_var_type     = 0
         self.default_var_id       = INVALID_VAR_ID
         # Properties
-        self.arity        = np.full(shape=self.shape, fill_value=self.default_arity        , dtype=int)
+        self.arity        = np.full(shape=self.shape, fill_value=self.default_arity        , dtype=self.arity_dtype)
         self.complexity   = np.full(shape=self.shape, fill_value=self.default_complexity   , dtype=float)
-        self.var_type     = np.full(shape=self.shape, fill_value=self.default_var_type     , dtype=int)
+        self.var_type     = np.full(shape=self.shape, fill_value=self.default_var_type     , dtype=self.var_type_dtype)
         # ( function                :  callable or None              )
         # ( init_val                :  float or array_like of floats )
         self.var_id       = np.full(shape=self.shape, fill_value=self.default_var_id       , dtype=int)
@@ -869,7 +924,7 @@ class VectTokens:
         self.default_phy_units                 = np.NAN
         # Properties
         self.is_constraining_phy_units = np.full(shape=self.shape,                        fill_value=self.default_is_constraining_phy_units  ,  dtype=bool)
-        self.phy_units                 = np.full(shape=self.shape + (UNITS_VECTOR_SIZE,), fill_value=self.default_phy_units                  ,  dtype=float)
+        self.phy_units                 = np.full(shape=self.shape + (UNITS_VECTOR_SIZE,), fill_value=self.default_phy_units                  ,  dtype=self.units_dtype)
 
         # -------------------------------------------------------------------------------------------------------
         # ---------------------------------------- Positional properties ----------------------------------------
@@ -877,17 +932,17 @@ class VectTokens:
 
         # ---- Position ----
         # Default values
-        self.default_pos       = INVALID_POS
-        self.default_pos_batch = INVALID_POS
+        self.default_pos       = invalid_pos
+        self.default_pos_batch = invalid_pos_batch
         # Properties : position is the same in all elements of batch
-        self.pos               = np.tile(np.arange(0, self.shape[1]), (self.shape[0], 1)).astype(int)
-        self.pos_batch         = np.tile(np.arange(0, self.shape[0]), (self.shape[1], 1)).transpose().astype(int)
+        self.pos               = np.tile(np.arange(0, self.shape[1]), (self.shape[0], 1)).astype(self.pos_dtype)
+        self.pos_batch         = np.tile(np.arange(0, self.shape[0]), (self.shape[1], 1)).transpose().astype(self.pos_batch_dtype)
 
         # ---- Depth ----
         # Default value
-        self.default_depth = INVALID_DEPTH
+        self.default_depth = invalid_depth
         # Property
-        self.depth = np.full(shape=self.shape, fill_value=self.default_depth, dtype=int )
+        self.depth = np.full(shape=self.shape, fill_value=self.default_depth, dtype=self.pos_dtype )
 
         # ---- Family relationships ----
 
@@ -905,15 +960,14 @@ class VectTokens:
 
         # Token family relationships: pos
         # Default values
-        self.default_parent_pos    = INVALID_POS
-        self.default_siblings_pos  = INVALID_POS
-        self.default_children_pos  = INVALID_POS
-        self.default_ancestors_pos = INVALID_POS
+        self.default_parent_pos    = invalid_pos
+        self.default_siblings_pos  = invalid_pos
+        self.default_children_pos  = invalid_pos
+        self.default_ancestors_pos = invalid_pos
         # Properties
-        self.parent_pos         = np.full(shape=self.shape,                      fill_value=self.default_parent_pos   , dtype=int)
-        self.siblings_pos       = np.full(shape=self.shape + (MAX_NB_SIBLINGS,), fill_value=self.default_siblings_pos , dtype=int)
-        self.children_pos       = np.full(shape=self.shape + (MAX_NB_CHILDREN,), fill_value=self.default_children_pos , dtype=int)
-        self.ancestors_pos      = np.full(shape=self.shape + (self.shape[1], ),  fill_value=self.default_ancestors_pos, dtype=int)
+        self.parent_pos         = np.full(shape=self.shape,                      fill_value=self.default_parent_pos   , dtype=self.pos_dtype)
+        self.siblings_pos       = np.full(shape=self.shape + (MAX_NB_SIBLINGS,), fill_value=self.default_siblings_pos , dtype=self.pos_dtype)
+        self.children_pos       = np.full(shape=self.shape + (MAX_NB_CHILDREN,), fill_value=self.default_children_pos , dtype=self.pos_dtype)
 
         # Token family relationships: numbers
         # Default values
@@ -921,7 +975,83 @@ class VectTokens:
         self.default_n_children  = 0
         self.default_n_ancestors = 0
         # Properties
-        self.n_siblings         = np.full(shape=self.shape,  fill_value=self.default_n_siblings , dtype=int)
-        self.n_children         = np.full(shape=self.shape,  fill_value=self.default_n_children , dtype=int)
-        self.n_ancestors        = np.full(shape=self.shape,  fill_value=self.default_n_ancestors, dtype=int)
+        self.n_siblings         = np.full(shape=self.shape,  fill_value=self.default_n_siblings , dtype=self.pos_dtype)
+        self.n_children         = np.full(shape=self.shape,  fill_value=self.default_n_children , dtype=self.pos_dtype)
+        self.n_ancestors        = np.full(shape=self.shape,  fill_value=self.default_n_ancestors, dtype=self.pos_dtype)
+
+
+    def reset(self):
+        """
+        Resets all (non-constant) properties to their default values in place ie. without re-allocating arrays.
+        Position properties (pos, pos_batch) only depend on shape and are left untouched.
+        """
+        # ---- Index in library ----
+        self.idx                      .fill(self.default_idx)
+        # ---- Token main properties ----
+        self.arity                    .fill(self.default_arity)
+        self.complexity               .fill(self.default_complexity)
+        self.var_type                 .fill(self.default_var_type)
+        self.var_id                   .fill(self.default_var_id)
+        # ---- Physical units ----
+        self.behavior_id              .fill(self.default_behavior_id)
+        self.is_power                 .fill(self.default_is_power)
+        self.power                    .fill(self.default_power)
+        self.is_constraining_phy_units.fill(self.default_is_constraining_phy_units)
+        self.phy_units                .fill(self.default_phy_units)
+        # ---- Depth ----
+        self.depth                    .fill(self.default_depth)
+        # ---- Family relationships ----
+        self.has_parent_mask          .fill(self.default_has_parent_mask)
+        self.has_siblings_mask        .fill(self.default_has_siblings_mask)
+        self.has_children_mask        .fill(self.default_has_children_mask)
+        self.has_ancestors_mask       .fill(self.default_has_ancestors_mask)
+        self.parent_pos               .fill(self.default_parent_pos)
+        self.siblings_pos             .fill(self.default_siblings_pos)
+        self.children_pos             .fill(self.default_children_pos)
+        self.n_siblings               .fill(self.default_n_siblings)
+        self.n_children               .fill(self.default_n_children)
+        self.n_ancestors              .fill(self.default_n_ancestors)
+        return None
+
+    def get_ancestors_pos(self, coords):
+        """
+        Computes ancestors positions of tokens at coords by walking up their chain of parents (each token being
+        registered at its own depth in its family line).
+        Parameters
+        ----------
+        coords : numpy.array of shape (2, ?) of int
+            Coords of tokens, 0th array in batch dim and 1th array in time dim.
+        Returns
+        -------
+        ancestors_pos : numpy.array of shape (?, shape[1]) of int
+            Ancestors positions in time dim counting the token itself as its own ancestor, family lines are padded with
+            default_ancestors_pos (as are family lines of tokens having has_ancestors_mask = False).
+        """
+        n_tokens = coords.shape[1]
+        ancestors_pos = np.full(shape=(n_tokens, self.shape[1]), fill_value=self.default_ancestors_pos, dtype=self.pos_dtype) # (?, shape[1]) of int
+        # Tokens having ancestors
+        has_ancestors = self.has_ancestors_mask[tuple(coords)]                                                  # (?,) of bool
+        i_token = np.arange(n_tokens)                     [has_ancestors]                                       # (?0,) of int
+        batch   = coords[0]                               [has_ancestors]                                       # (?0,) of int
+        pos     = coords[1]                               [has_ancestors]                                       # (?0,) of int
+        depth   = self.depth[tuple(coords)].astype(int)   [has_ancestors]                                       # (?0,) of int
+        # Walking up family lines (at most max depth + 1 iterations)
+        while i_token.size > 0:
+            # Registering current ancestor at its depth
+            ancestors_pos[i_token, depth] = pos
+            # Jumping to parent where there is one
+            has_parent = depth > 0
+            i_token, batch, pos, depth = i_token[has_parent], batch[has_parent], pos[has_parent], depth[has_parent] - 1
+            pos = self.parent_pos[batch, pos]
+        return ancestors_pos
 
+    @property
+    def ancestors_pos(self):
+        """
+        Ancestors positions of all tokens (see get_ancestors_pos), computed on demand.
+        Returns
+        -------
+        ancestors_pos : numpy.array of shape (shape[0], shape[1], shape[1]) of int
+        """
+        coords = np.stack((self.pos_batch.ravel(), self.pos.ravel()), axis=0).astype(int)                       # (2, shape[0]*shape[1]) of int
+        return self.get_ancestors_pos(coords).reshape(self.shape + (self.shape[1],))
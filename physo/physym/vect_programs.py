@@ -1,5 +1,6 @@
 import warnings as warnings
 import numpy as np
+import torch as torch
 
 # For tree image (optional)
 import os
@@ -162,8 +163,37 @@ class VectPrograms:
         # mask : dimensional analysis assignment case code (Token management) -> time dim
         self.units_analysis_cases = np.full(shape = self.shape, fill_value = phy.UNITS_ANALYSIS_NOT_PERFORMED_CASE_CODE, dtype = int)  # (batch_size, max_time_step,) of bool
 
+        # ---------------------------- RUNNING COUNTERS ----------------------------
+        # Number of occurrences of each token of the library in each program, maintained by append so priors do not
+        # have to recount tokens over the whole programs at each step.
+        self.n_occurrences = np.zeros(shape=(self.batch_size, self.n_library), dtype=self.tokens.pos_dtype)   # (batch_size, n_library,) of int
+        # Ancestors counters (see add_ancestors_counter): groups of tokens and for each token, number of its ancestors
+        # (counting itself) that are part of the group, maintained by append.
+        self.ancestors_counters_groups = []                                   # list of (n_library,) of bool
+        self.ancestors_counters        = []                                   # list of (batch_size, max_time_step,) of int
+
         # ---------------------------- INIT 0TH DUMMY ----------------------------
+        self.init_0th_dummy()
+
+        # ---------------------------- FREE CONSTANTS REGISTER ----------------------------
+        if n_realizations is None:
+            n_realizations = 1
+            warnings.warn("n_realizations was not specified when initializing VectPrograms, using n_realizations = 1 by default.")
+        self.n_realizations = n_realizations
+        self.free_consts    = free_const.FreeConstantsTable(batch_size = self.batch_size, library = self.library, n_realizations = self.n_realizations)
 
+        # ---------------------------- EXECUTION RELATED ----------------------------
+        # Wrapper to apply to candidate programs when executing
+        if candidate_wrapper is None:
+            candidate_wrapper = Prog.DEFAULT_WRAPPER
+        self.candidate_wrapper = candidate_wrapper
+
+        return None
+
+    def init_0th_dummy (self):
+        """
+        Affects a dummy having the superparent's units as 0th token of each program (programs must be empty).
+        """
         self.total_arities = self.compute_sum_arities(step=self.curr_step)    # (batch_size,) of int
         self.n_dummies     = self.total_arities - self.n_lengths              # (batch_size,) of int
 
@@ -186,19 +216,35 @@ class VectPrograms:
         # Affect 0th token' ancestors record
         self.register_ancestor (coords_dest = coords_initial_dummies)
 
-        # ---------------------------- FREE CONSTANTS REGISTER ----------------------------
-        if n_realizations is None:
-            n_realizations = 1
-            warnings.warn("n_realizations was not specified when initializing VectPrograms, using n_realizations = 1 by default.")
-        self.n_realizations = n_realizations
-        self.free_consts    = free_const.FreeConstantsTable(batch_size = self.batch_size, library = self.library, n_realizations = self.n_realizations)
-
-        # ---------------------------- EXECUTION RELATED ----------------------------
-        # Wrapper to apply to candidate programs when executing
-        if candidate_wrapper is None:
-            candidate_wrapper = Prog.DEFAULT_WRAPPER
-        self.candidate_wrapper = candidate_wrapper
+        return None
 
+    def reset (self):
+        """
+        Resets programs to their initial state (a single dummy per program) in place : program and token management
+        arrays are re-filled with their default values instead of being re-allocated, library related attributes are
+        kept as is. Free constants are reset to their initial values on the same device and dtype.
+        """
+        # Step counter
+        self.curr_step = 0
+        # Program management
+        self.n_lengths     .fill(0)
+        self.n_dummies     .fill(0)
+        self.total_arities .fill(0)
+        self.is_complete   .fill(False)
+        # Token management
+        self.n_dummies_history.fill(0)
+        self.tokens.reset()
+        # Units related management
+        self.is_physical         .fill(True)
+        self.units_analysis_cases.fill(phy.UNITS_ANALYSIS_NOT_PERFORMED_CASE_CODE)
+        # Running counters (groups of ancestors counters are kept)
+        self.n_occurrences.fill(0)
+        for counter in self.ancestors_counters:
+            counter.fill(0)
+        # 0th dummy
+        self.init_0th_dummy()
+        # Free constants
+        self.free_consts.reset()
         return None
 
     def lib (self, attr):
@@ -298,7 +344,8 @@ class VectPrograms:
         # Legacy units (from dummies)
         units_from_dummies = self.tokens.phy_units [:, self.curr_step]                                  # (batch_size, UNITS_VECTOR_SIZE,) of float
         # Units from new tokens
-        units_from_new_tokens = self.lib("phy_units") [new_tokens_idx]                                  # (batch_size, UNITS_VECTOR_SIZE,) of float
+        # (in the dtype units are stored in programs so units that were stored can be compared exactly)
+        units_from_new_tokens = self.lib("phy_units") [new_tokens_idx].astype(self.tokens.units_dtype)  # (batch_size, UNITS_VECTOR_SIZE,) of float
 
         # Do new tokens contain constraining units: mask
         mask_is_constraining_new_tokens = self.lib("is_constraining_phy_units") [new_tokens_idx]        # (batch_size,) of bool
@@ -356,6 +403,14 @@ class VectPrograms:
         # --- POSITIONAL INFO ---
         # Inheriting positional info from legacy dummy: OK
 
+        # --- RUNNING COUNTERS ---
+        # Occurrences (new tokens of complete programs are void tokens which are not counted)
+        progs_incomplete = np.arange(self.batch_size)[~self.is_complete]                                   # (n_incomplete,) of int
+        self.n_occurrences[progs_incomplete, new_tokens_idx[progs_incomplete]] += 1                        # (n_incomplete,) of int
+        # Ancestors counters : new token inherits legacy dummy's count (ie. count of its parent) + itself
+        for group, counter in zip(self.ancestors_counters_groups, self.ancestors_counters):
+            counter[:, self.curr_step] += group[new_tokens_idx]                                            # (batch_size,) of int
+
         # --- UNITS INFO ---
         # Number of units constraining new tokens
         n_constraining_new_tokens = mask_is_constraining_new_tokens.sum()  # int
@@ -485,7 +540,7 @@ class VectPrograms:
 
         # -------- CHILDREN INFO --------
         # CHILDREN of new dummies : No children
-        self.set_children(coords_dest = coords_new_dummies, has_mask = False, pos_val = Tok.INVALID_POS, nb = 0,)
+        self.set_children(coords_dest = coords_new_dummies, has_mask = False, pos_val = self.tokens.default_children_pos, nb = 0,)
 
         # -------- SIBLINGS INFO --------
         # SIBLINGS of new dummies
@@ -497,7 +552,7 @@ class VectPrograms:
                                                         )
         n_new_dummies_wo_sibling, coords_new_dummies_wo_sibling = self.mask_to_coords(       # int, (2, n_new_dummies_wo_sibling) of int
             mask = mask_new_dummies_wo_siblings)
-        self.set_siblings(coords_dest = coords_new_dummies_wo_sibling, has_mask = False, pos_val = Tok.INVALID_POS, nb = 0)
+        self.set_siblings(coords_dest = coords_new_dummies_wo_sibling, has_mask = False, pos_val = self.tokens.default_siblings_pos, nb = 0)
 
         # -> Siblings where n_new_dummies = 2
         # 0th sibling
@@ -540,9 +595,11 @@ class VectPrograms:
         self.tokens.depth[tuple(coords_new_dummies)] = self.tokens.depth[tuple(coords_new_dummies_parents)] + 1
 
         # -------- ANCESTORS INFO --------
-        # Copy ancestor register from parents
-        self.tokens.ancestors_pos[tuple(coords_new_dummies)] = self.tokens.ancestors_pos[tuple(coords_new_dummies_parents)]
+        # (ancestors positions are given by the chain of parents, only registering number of ancestors)
         self.register_ancestor(coords_new_dummies)
+        # Ancestors counters : dummies are not part of groups, they inherit their parent's count
+        for counter in self.ancestors_counters:
+            counter[tuple(coords_new_dummies)] = counter[tuple(coords_new_dummies_parents)]
 
         # --------------------------------------------------------------------------------------------------------------
         # --------------------------------- COMPLETING WITH DUMMIES : INFORMING PARENT ---------------------------------
@@ -565,7 +622,7 @@ class VectPrograms:
         # Positions of lonely children in time dim
         pos_lonely_children = np.stack((                                           # (n_new_tokens_w_lonely_child, 1,) of int
             coords_new_dummies_wo_sibling[1],                             # position of child 0 in time dim
-            np.full(n_new_tokens_w_lonely_child, Tok.INVALID_POS, int)),  # no 2nd child
+            np.full(n_new_tokens_w_lonely_child, self.tokens.default_children_pos, int)),  # no 2nd child
             axis=1,)
         # Setting children
         self.set_children(coords_dest = tuple(coords_new_tokens_w_lonely_child),  # (2, n_new_tokens_w_lonely_child,) of int
@@ -815,7 +872,7 @@ class VectPrograms:
             2th array in time dim (2nd ancestor)...
             Use max_time_step[:,[0,1]] to access 1st ancestor, max_time_step[:,[0,2]] for 2nd ancestor etc.
         """
-        ancestors_pos = self.tokens.ancestors_pos[tuple(coords)]  # (?, max_time_step,) of int
+        ancestors_pos = self.tokens.get_ancestors_pos(coords)     # (?, max_time_step,) of int
 
         ancestors_coords = np.concatenate((                                      # (1 + max_time_step, ?) of int
             coords[0][:, np.newaxis],   # same batch coords   # batch dim coord  # (?, 1) of int
@@ -1066,6 +1123,37 @@ class VectPrograms:
         counts = eye[tokens_idx].sum(axis=1)
         return counts
 
+    def add_ancestors_counter (self, tokens_idx):
+        """
+        Registers a running counter giving for each token of programs, its number of ancestors (counting itself) that
+        are part of a group of tokens. Counters are maintained by append so that eg. the nesting level of a group at
+        the current step can be read in O(batch_size) instead of recounting ancestors.
+        Parameters
+        ----------
+        tokens_idx : array_like of shape (?,) of int
+            Idx in the library of tokens making up the group.
+        Returns
+        -------
+        counter_id : int
+            Index of the counter in ancestors_counters (groups containing the same tokens share the same counter).
+        """
+        group = np.full(self.n_library, False)                                                          # (n_library,) of bool
+        group[np.array(tokens_idx, dtype=int)] = True
+        # Re-using counter of identical group if any
+        for counter_id, other_group in enumerate(self.ancestors_counters_groups):
+            if np.array_equal(group, other_group):
+                return counter_id
+        counter = np.zeros(shape=self.shape, dtype=self.tokens.pos_dtype)                               # (batch_size, max_time_step,) of int
+        # Counting ancestors of existing tokens (if counter is registered after tokens were appended)
+        if self.curr_step > 0:
+            coords = np.stack((self.tokens.pos_batch.ravel(), self.tokens.pos.ravel()), axis=0).astype(int)  # (2, batch_size*max_time_step) of int
+            ancestors_idx = self.get_ancestors_idx(coords)                                              # (batch_size*max_time_step, max_time_step) of int
+            counter[:] = group[ancestors_idx].sum(axis=1).reshape(self.shape)                           # (batch_size, max_time_step,) of int
+        self.ancestors_counters_groups .append(group)
+        self.ancestors_counters        .append(counter)
+        counter_id = len(self.ancestors_counters) - 1
+        return counter_id
+
     # -------- GET INFO : FAMILY RELATIVES' PROPERTIES --------
 
     def get_property_of_relative(self, coords, relative, attr):
@@ -1169,51 +1257,32 @@ class VectPrograms:
         self.tokens.siblings_pos      [coords_dest[0], coords_dest[1]] = pos_val      # (?, Tok.MAX_NB_SIBLINGS) of int
         self.tokens.n_siblings        [coords_dest[0], coords_dest[1]] = nb           # (?,) of int
 
-    def set_ancestors(self, coords_dest, has_mask, pos_val, nb):
+    def set_ancestors(self, coords_dest, has_mask, nb):
         """
         Sets ancestors properties of tokens of coordinates coords_dest with new values given in args.
+        Ancestors positions are not stored but given by the chain of parents (see token.VectTokens.get_ancestors_pos).
         Parameters
         ----------
         coords_dest : numpy.array of shape (2, ?) of int
             Coords where to set property, 0th array in batch dim and 1th array in time dim.
         has_mask : numpy.array of shape (?,) of bool
             New value to set for has_property_mask.
-        pos_val : numpy.array of shape (?, max_time_step) of int
-            New value to set.
         nb : numpy.array of shape (?,) of int
             Number of ancestors counting the token itself as its own ancestor.
         """
         self.tokens.has_ancestors_mask [coords_dest[0], coords_dest[1]] = has_mask     # (?,) of bool
-        self.tokens.ancestors_pos      [coords_dest[0], coords_dest[1]] = pos_val      # (?, max_time_step) of int
         self.tokens.n_ancestors        [coords_dest[0], coords_dest[1]] = nb           # (?,) of int
 
     def register_ancestor(self, coords_dest, ):
         """
-        Registers tokens located at coords_dest in their own ancestor records (as a token counts as its own ancestor)
-        and updates the number of ancestors. Depths must be up-to-date for this function to perform correctly.
+        Registers tokens located at coords_dest as having ancestors (as a token counts as its own ancestor) and updates
+        the number of ancestors. Depths must be up-to-date for this function to perform correctly.
+        Ancestors positions are not stored but given by the chain of parents (see token.VectTokens.get_ancestors_pos).
         Parameters
         ----------
         coords_dest : numpy.array of shape (2, ?) of int
             Coords of tokens which's ancestors records should be updated, 0th array in batch dim and 1th array in time dim.
         """
-        # ? = number of tokens which need their ancestor to be updated
-        n_tokens = coords_dest.shape[1]
-
-        # Records of ancestors positions for token at coords_dest (ie vectors of size ? of family lines)
-        records_ancestors_pos = self.tokens.ancestors_pos[tuple(coords_dest)]  # (?, max_time_step) of int
-
-        # Coords of locations in records_ancestors_pos where the new ancestors should be placed. Since we are
-        # registering token as their own ancestors, this is performed at their own depth in the family line.
-        coords_new_ancestors = np.stack((  # (2, ?,) of int
-            np.arange(n_tokens),
-            # token dim coord (always = [1,2,3..] because records_ancestors_pos is already the subset of interest)
-            self.tokens.depth[tuple(coords_dest)],  # ancestor line dim coord ie own depth of tokens to affect
-        ), axis=0)
-
-        # Registering tokens as their own ancestors ie. adding own token positions (time dim) in their records
-        records_ancestors_pos[tuple(coords_new_ancestors)] = coords_dest[1]
-        self.tokens.ancestors_pos[tuple(coords_dest)] = records_ancestors_pos
-
         # Update number of ancestors
         self.tokens.n_ancestors[tuple(coords_dest)] = self.tokens.depth[tuple(coords_dest)] + 1
 
@@ -1346,11 +1415,13 @@ class VectPrograms:
         self.tokens.parent_pos                [tuple(coords_dest)] = self.tokens.parent_pos                [tuple(coords_src)]
         self.tokens.siblings_pos              [tuple(coords_dest)] = self.tokens.siblings_pos              [tuple(coords_src)]
         self.tokens.children_pos              [tuple(coords_dest)] = self.tokens.children_pos              [tuple(coords_src)]
-        self.tokens.ancestors_pos             [tuple(coords_dest)] = self.tokens.ancestors_pos             [tuple(coords_src)]
         # Token family relationships: numbers
         self.tokens.n_siblings                [tuple(coords_dest)] = self.tokens.n_siblings                [tuple(coords_src)]
         self.tokens.n_children                [tuple(coords_dest)] = self.tokens.n_children                [tuple(coords_src)]
         self.tokens.n_ancestors               [tuple(coords_dest)] = self.tokens.n_ancestors               [tuple(coords_src)]
+        # ---- Ancestors counters ----
+        for counter in self.ancestors_counters:
+            counter                           [tuple(coords_dest)] = counter                               [tuple(coords_src)]
 
         # ----------------------------------------------------------------
         # -------------------- UPDATING RELATIONSHIPS --------------------
@@ -1373,10 +1444,6 @@ class VectPrograms:
                 Coords of tokens after move, 0th array in batch dim and 1th array in time dim.
             """
 
-            # ------------ Updating ancestors pos ------------
-            # (as the dummy token counts as its own ancestor, and it was just moved)
-            self.register_ancestor(coords_dest = coords_a_move)
-
             # ------------ Informing parent ------------
 
             # Do moved tokens have parents : mask
@@ -1484,7 +1551,7 @@ class VectPrograms:
         # self.tokens.pos
         # self.tokens.pos_batch
         # ---- Depth ----
-        self.tokens.depth                     [tuple(coords_dest)] = Tok.INVALID_DEPTH  # (?,) of int
+        self.tokens.depth                     [tuple(coords_dest)] = self.tokens.default_depth          # (?,) of int
         # ---- Family relationships ----
         # Token family relationships: family mask
         self.tokens.has_parent_mask           [tuple(coords_dest)] = False              # (?,) of bool
@@ -1492,14 +1559,16 @@ class VectPrograms:
         self.tokens.has_children_mask         [tuple(coords_dest)] = False              # (?,) of bool
         self.tokens.has_ancestors_mask        [tuple(coords_dest)] = False              # (?,) of bool
         # Token family relationships: pos
-        self.tokens.parent_pos                [tuple(coords_dest)] = Tok.INVALID_POS    # (?,) of int
-        self.tokens.siblings_pos              [tuple(coords_dest)] = Tok.INVALID_POS    # (?,) of int
-        self.tokens.children_pos              [tuple(coords_dest)] = Tok.INVALID_POS    # (?,) of int
-        self.tokens.ancestors_pos             [tuple(coords_dest)] = Tok.INVALID_POS    # (?,) of int
+        self.tokens.parent_pos                [tuple(coords_dest)] = self.tokens.default_parent_pos     # (?,) of int
+        self.tokens.siblings_pos              [tuple(coords_dest)] = self.tokens.default_siblings_pos   # (?,) of int
+        self.tokens.children_pos              [tuple(coords_dest)] = self.tokens.default_children_pos   # (?,) of int
         # Token family relationships: numbers
         self.tokens.n_siblings                [tuple(coords_dest)] = 0                  # (?,) of int
         self.tokens.n_children                [tuple(coords_dest)] = 0                  # (?,) of int
         self.tokens.n_ancestors               [tuple(coords_dest)] = 0                  # (?,) of int
+        # ---- Ancestors counters ----
+        for counter in self.ancestors_counters:
+            counter                           [tuple(coords_dest)] = 0                  # (?,) of int
 
         return None
 
@@ -1690,7 +1759,8 @@ class VectPrograms:
                                 pad_with = np.NaN,
                                 # Parallel mode related
                                 n_cpus        = 1,
-                                parallel_mode = False
+                                parallel_mode = False,
+                                executor      = None,
                                 ):
         """
         Executes prog(X) for each prog in progs and gathers reduce_wrapper(prog(X)) as a result.
@@ -1718,25 +1788,107 @@ class VectPrograms:
             Number of CPUs to use when running in parallel mode.
         parallel_mode : bool
             Parallel execution if True, execution in a loop else.
+        executor : batch_execute.ParallelExecutor or None
+            Persistent pool of workers having the dataset registered to use in parallel mode. By default, a new pool
+            of processes is opened at each call.
         Returns
         -------
         results : numpy.array of shape (progs.batch_size,) of float
             Returns reduce_wrapper(prog(X)) for each program in progs. Returns NaNs for programs that are not executed
             (where mask is False).
         """
-        results = BExec.BatchExecutionReduceGather(progs=self, X=X, reduce_wrapper=reduce_wrapper,
-                                                    # Realization related
-                                                    i_realization         = i_realization,
-                                                    n_samples_per_dataset = n_samples_per_dataset,
-                                                    # Mask
-                                                    mask     = mask,
-                                                    pad_with = pad_with,
-                                                    # Parallel mode related
-                                                    n_cpus        = n_cpus,
-                                                    parallel_mode = parallel_mode
-                                                  )
+        with torch.inference_mode():
+            results = BExec.BatchExecutionReduceGather(progs=self, X=X, reduce_wrapper=reduce_wrapper,
+                                                        # Realization related
+                                                        i_realization         = i_realization,
+                                                        n_samples_per_dataset = n_samples_per_dataset,
+                                                        # Mask
+                                                        mask     = mask,
+                                                        pad_with = pad_with,
+                                                        # Parallel mode related
+                                                        n_cpus        = n_cpus,
+                                                        parallel_mode = parallel_mode,
+                                                        executor      = executor,
+                                                      )
         return results
 
+    def batch_evaluate (self, X,
+                        # Realization related
+                        i_realization         = 0,
+                        n_samples_per_dataset = None,
+                        # Mask
+                        mask     = None,
+                        pad_with = np.NaN,
+                        # Parallel mode related
+                        n_cpus        = 1,
+                        parallel_mode = False,
+                        executor      = None,
+                        # Vectorized mode related
+                        vectorized_mode = False,
+                        ):
+        """
+        Executes prog(X) for each prog in progs in inference mode (see torch.inference_mode) : no autograd graph is
+        recorded even if free constants require gradients (eg. after their optimization). Evaluation entry point for
+        duplicates or logging evaluations.
+        Parameters
+        ----------
+        X : torch.tensor of shape (n_dim, n_samples,) of float
+            Values of the input variables of the problem with n_dim = nb of input variables.
+        i_realization : int, optional
+            Index of realization to use for dataset specific free constants (0 by default).
+        n_samples_per_dataset : array_like of shape (n_realizations,) of int or None, optional
+            Overrides i_realization if given. If given assumes that X contains multiple datasets with samples of each
+            dataset following each other and each portion of X corresponding to a dataset should be treated with its
+            corresponding dataset specific free constants values. n_samples_per_dataset is the number of samples for
+            each dataset. Eg. [90, 100, 110] for 3 datasets, this will assume that the first 90 samples of X are for
+            the first dataset, the next 100 for the second and the last 110 for the third.
+        mask : array_like of shape (progs.batch_size) of bool
+            Only programs where mask is True are executed. By default, all programs are executed.
+        pad_with : float
+            Value to pad with where mask is False. (Default = nan).
+        n_cpus : int
+            Number of CPUs to use when running in parallel mode.
+        parallel_mode : bool
+            Parallel execution if True, execution in a loop else.
+        executor : batch_execute.ParallelExecutor or None
+            Persistent pool of workers having the dataset registered to use in parallel mode. By default, a new pool
+            of processes is opened at each call.
+        vectorized_mode : bool
+            Executes all programs at once in a single vectorized pass over the batch (see
+            batch_execute.VectBatchExecution) if True and parallel_mode is False. Only used if programs use the
+            default candidate wrapper, falling back to execution in a loop else.
+        Returns
+        -------
+        y_batch : torch.tensor of shape (progs.batch_size, n_samples,) of float
+            Returns result of execution for each program in progs. Returns NaNs for programs that are not executed
+            (where mask is False).
+        """
+        with torch.inference_mode():
+            # Vectorized execution (only available for default candidate wrapper)
+            if vectorized_mode and not parallel_mode and self.candidate_wrapper is Prog.DEFAULT_WRAPPER:
+                y_batch = BExec.VectBatchExecution(progs=self, X=X,
+                                                   # Realization related
+                                                   i_realization         = i_realization,
+                                                   n_samples_per_dataset = n_samples_per_dataset,
+                                                   # Mask
+                                                   mask     = mask,
+                                                   pad_with = pad_with,
+                                                   )
+            else:
+                y_batch = BExec.BatchExecution(progs=self, X=X,
+                                               # Realization related
+                                               i_realization         = i_realization,
+                                               n_samples_per_dataset = n_samples_per_dataset,
+                                               # Mask
+                                               mask     = mask,
+                                               pad_with = pad_with,
+                                               # Parallel mode related
+                                               n_cpus        = n_cpus,
+                                               parallel_mode = parallel_mode,
+                                               executor      = executor,
+                                               )
+        return y_batch
+
 
     def batch_exe_reward (self, X, y_target, reward_function, y_weights = 1.,
                                 # Realization related
@@ -1747,7 +1899,11 @@ class VectPrograms:
                                 pad_with = np.NaN,
                                 # Parallel mode related
                                 n_cpus        = 1,
-                                parallel_mode = False
+                                parallel_mode = False,
+                                executor      = None,
+                                # Vectorized mode related
+                                vectorized_mode  = False,
+                                streaming_reward = None,
                         ):
         """
         Executes prog(X) for each prog in progs and gathers reward_function(y_target, prog(X), y_weights) as a result.
@@ -1781,24 +1937,63 @@ class VectPrograms:
             Number of CPUs to use when running in parallel mode.
         parallel_mode : bool
             Parallel execution if True, execution in a loop else.
+        executor : batch_execute.ParallelExecutor or None
+            Persistent pool of workers having the dataset registered to use in parallel mode. By default, a new pool
+            of processes is opened at each call.
+        vectorized_mode : bool
+            Executes all programs at once in a single vectorized pass over the batch (see
+            batch_execute.VectBatchExecutionReward) if True and parallel_mode is False. Only used if programs use the
+            default candidate wrapper, falling back to execution in a loop else.
+        streaming_reward : (callable, callable) or None
+            Functions (reward_stats_function, reward_from_stats_function) computing reward_function from statistics
+            accumulated over blocks of samples. If given and in vectorized mode, rewards are streamed over blocks of
+            samples (see batch_execute.VectBatchExecutionStreamingReward). Not used if None.
         Returns
         -------
         results : numpy.array of shape (progs.batch_size,) of float
             Returns reduce_wrapper(prog(X)) for each program in progs. Returns NaNs for programs that are not executed
             (where mask is False).
         """
-        results = BExec.BatchExecutionReward(progs=self, X=X, y_target=y_target, reward_function=reward_function, y_weights = y_weights,
-                                             # Realization related
-                                             i_realization         = i_realization,
-                                             n_samples_per_dataset = n_samples_per_dataset,
-                                             # Mask
-                                             mask     = mask,
-                                             pad_with = pad_with,
-                                             # Parallel mode related
-                                             n_cpus        = n_cpus,
-                                             parallel_mode = parallel_mode
-                                             )
-        return results
+        # Inference mode : no autograd graph is recorded even if free constants require gradients
+        with torch.inference_mode():
+            # Vectorized execution (only available for default candidate wrapper)
+            if vectorized_mode and not parallel_mode and self.candidate_wrapper is Prog.DEFAULT_WRAPPER:
+                # Streaming rewards over blocks of samples
+                if streaming_reward is not None:
+                    reward_stats_function, reward_from_stats_function = streaming_reward
+                    results = BExec.VectBatchExecutionStreamingReward(progs=self, X=X, y_target=y_target, y_weights = y_weights,
+                                                                      reward_stats_function      = reward_stats_function,
+                                                                      reward_from_stats_function = reward_from_stats_function,
+                                                                      # Realization related
+                                                                      i_realization         = i_realization,
+                                                                      n_samples_per_dataset = n_samples_per_dataset,
+                                                                      # Mask
+                                                                      mask     = mask,
+                                                                      pad_with = pad_with,
+                                                                      )
+                    return results
+                results = BExec.VectBatchExecutionReward(progs=self, X=X, y_target=y_target, reward_function=reward_function, y_weights = y_weights,
+                                                         # Realization related
+                                                         i_realization         = i_realization,
+                                                         n_samples_per_dataset = n_samples_per_dataset,
+                                                         # Mask
+                                                         mask     = mask,
+                                                         pad_with = pad_with,
+                                                         )
+                return results
+            results = BExec.BatchExecutionReward(progs=self, X=X, y_target=y_target, reward_function=reward_function, y_weights = y_weights,
+                                                 # Realization related
+                                                 i_realization         = i_realization,
+                                                 n_samples_per_dataset = n_samples_per_dataset,
+                                                 # Mask
+                                                 mask     = mask,
+                                                 pad_with = pad_with,
+                                                 # Parallel mode related
+                                                 n_cpus        = n_cpus,
+                                                 parallel_mode = parallel_mode,
+                                                 executor      = executor,
+                                                 )
+            return results
 
     def batch_optimize_constants (self, X, y_target, free_const_opti_args=None, y_weights = 1.,
                                 # Realization related
@@ -1808,7 +2003,10 @@ class VectPrograms:
                                 mask     = None,
                                 # Parallel mode related
                                 n_cpus        = 1,
-                                parallel_mode = False
+                                parallel_mode = False,
+                                executor      = None,
+                                # Vectorized mode related
+                                vectorized_mode = False,
                                   ):
         """
         Optimizes the free constants of each program in progs.
@@ -1821,7 +2019,9 @@ class VectPrograms:
             Values of target output.
         free_const_opti_args : dict or None, optional
             Arguments to pass to free_const.optimize_free_const. By default, free_const.DEFAULT_OPTI_ARGS
-            arguments are used.
+            arguments are used. Multi-start optimization (n_starts > 1, see free_const.optimize_free_const) is only
+            available for programs using the default candidate wrapper and optimizers having a batched version (see
+            free_const.BATCH_OPTIMIZERS), a single start being used else.
         y_weights : torch.tensor of shape (?,) of float, optional
             Weights for each data point.
         i_realization : int, optional
@@ -1838,7 +2038,38 @@ class VectPrograms:
             Number of CPUs to use when running in parallel mode.
         parallel_mode : bool
             Parallel execution if True, execution in a loop else.
-        """
+        executor : batch_execute.ParallelExecutor or None
+            Persistent pool of workers having the dataset registered to use in parallel mode. By default, a new pool
+            of processes is opened at each call.
+        vectorized_mode : bool
+            Optimizes the free constants of all programs at once as a single set of parameters (see
+            batch_execute.VectBatchFreeConstOpti) if True and parallel_mode is False. Only used if programs use the
+            default candidate wrapper and if the optimization method has a batched version (see
+            free_const.BATCH_OPTIMIZERS), falling back to optimization in a loop else.
+        """
+        if free_const_opti_args is None:
+            free_const_opti_args = free_const.DEFAULT_OPTI_ARGS
+        method   = free_const_opti_args.get("method", "LBFGS")
+        n_starts = free_const_opti_args.get("n_starts", 1)
+        # Vectorized optimization (only available for default candidate wrapper and batched optimizers)
+        is_vectorizable = (self.candidate_wrapper is Prog.DEFAULT_WRAPPER) and (method in free_const.BATCH_OPTIMIZERS)
+        # Multi-start needing the same
+        if n_starts > 1 and not is_vectorizable:
+            warnings.warn("Multi-start free constants optimization is only available for programs using the default "
+                          "candidate wrapper and optimizers having a batched version (%s), using a single start."
+                          % (list(free_const.BATCH_OPTIMIZERS)))
+            free_const_opti_args = {key: val for key, val in free_const_opti_args.items()
+                                    if key not in ["n_starts", "starts_spread"]}
+        if is_vectorizable and vectorized_mode and not parallel_mode:
+            BExec.VectBatchFreeConstOpti(progs=self, X=X, y_target=y_target, free_const_opti_args=free_const_opti_args, y_weights=y_weights,
+                                         # Realization related
+                                         i_realization         = i_realization,
+                                         n_samples_per_dataset = n_samples_per_dataset,
+                                         # Mask
+                                         mask     = mask,
+                                         )
+            return None
+        # Optimization in a loop or in parallel
         BExec.BatchFreeConstOpti(progs=self, X=X, y_target=y_target, free_const_opti_args=free_const_opti_args, y_weights=y_weights,
                                  # Realization related
                                  i_realization         = i_realization,
@@ -1847,7 +2078,8 @@ class VectPrograms:
                                  mask     = mask,
                                  # Parallel mode related
                                  n_cpus        = n_cpus,
-                                 parallel_mode = parallel_mode
+                                 parallel_mode = parallel_mode,
+                                 executor      = executor,
                                 )
         return None
     # ------------------------------------------------------------------------------------------------------------------
@@ -286,6 +286,11 @@ def check_args_and_build_run_config(multi_X, multi_y, multi_y_weights,
         raise ValueError("risk_factor should be castable to a float.")
     assert isinstance(risk_factor, float), "risk_factor should be a float."
     assert 0 <= risk_factor <= 1, "risk_factor should be >= 0 and <= 1."
+    # Successive halving should evaluate (at least) all elite programs on full data
+    keep_fractions = run_config["reward_config"].get("successive_halving_keep_fractions", None)
+    if run_config["reward_config"].get("successive_halving_n_samples", None) is not None and keep_fractions is not None:
+        assert np.prod(keep_fractions) >= risk_factor, "Product of successive_halving_keep_fractions should be >= " \
+                                                       "risk_factor so elite programs are evaluated on full data."
 
     # gamma_decay should be a float
     gamma_decay = run_config["learning_config"]["gamma_decay"]
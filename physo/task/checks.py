@@ -52,6 +52,7 @@ def dummy_epoch_ClassSR (multi_X, multi_y, run_config, multi_y_weights=1.):
                             multi_X         = multi_X,
                             multi_y         = multi_y,
                             multi_y_weights = multi_y_weights,
+                            dtype           = run_config["learning_config"].get("dtype", None),
                             )
 
     batch = batch_reseter()
@@ -195,7 +196,7 @@ def sanity_check_ClassSR (multi_X, multi_y, run_config, multi_y_weights = 1., ca
                             multi_X         = multi_X,
                             multi_y         = multi_y,
                             multi_y_weights = multi_y_weights,
-
+                            dtype           = run_config["learning_config"].get("dtype", None),
                             )
 
     batch = batch_reseter()
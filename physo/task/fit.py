@@ -46,7 +46,7 @@ def fit(multi_X, multi_y, run_config, multi_y_weights = 1., candidate_wrapper =
         Use hall_of_fame[-1] to access best model found.
     """
 
-    def batch_reseter():
+    def batch_maker():
         return  Batch.Batch (library_args          = run_config["library_config"],
                              priors_config         = run_config["priors_config"],
                              batch_size            = run_config["learning_config"]["batch_size"],
@@ -58,9 +58,15 @@ def fit(multi_X, multi_y, run_config, multi_y_weights = 1., candidate_wrapper =
                              multi_y_weights = multi_y_weights,
                              candidate_wrapper = candidate_wrapper,
                              observe_units     = run_config["learning_config"]["observe_units"],
+                             dtype             = run_config["learning_config"].get("dtype", None),
                              )
 
-    batch = batch_reseter()
+    batch = batch_maker()
+
+    # Re-using the same batch from one epoch to another : library, dataset and priors static tables are kept and only
+    # programs state is re-initialized in place.
+    def batch_reseter():
+        return batch.reset()
 
     def cell_reseter ():
         input_size  = batch.obs_size
@@ -76,20 +82,27 @@ def fit(multi_X, multi_y, run_config, multi_y_weights = 1., candidate_wrapper =
     optimizer = run_config["learning_config"]["get_optimizer"](cell)
 
 
-    hall_of_fame_R, hall_of_fame = learn.learner (
-                                                    model               = cell,
-                                                    optimizer           = optimizer,
-                                                    n_epochs            = run_config["learning_config"]["n_epochs"],
-                                                    batch_reseter       = batch_reseter,
-                                                    risk_factor         = run_config["learning_config"]["risk_factor"],
-                                                    gamma_decay         = run_config["learning_config"]["gamma_decay"],
-                                                    entropy_weight      = run_config["learning_config"]["entropy_weight"],
-                                                    verbose             = False,
-                                                    stop_reward         = stop_reward,
-                                                    stop_after_n_epochs = stop_after_n_epochs,
-                                                    max_n_evaluations   = max_n_evaluations,
-                                                    run_logger          = run_config["run_logger"],
-                                                    run_visualiser      = run_config["run_visualiser"],
-                                                   )
+    try:
+        hall_of_fame_R, hall_of_fame = learn.learner (
+                                                        model               = cell,
+                                                        optimizer           = optimizer,
+                                                        n_epochs            = run_config["learning_config"]["n_epochs"],
+                                                        batch_reseter       = batch_reseter,
+                                                        risk_factor         = run_config["learning_config"]["risk_factor"],
+                                                        gamma_decay         = run_config["learning_config"]["gamma_decay"],
+                                                        entropy_weight      = run_config["learning_config"]["entropy_weight"],
+                                                        verbose             = False,
+                                                        stop_reward         = stop_reward,
+                                                        stop_after_n_epochs = stop_after_n_epochs,
+                                                        max_n_evaluations   = max_n_evaluations,
+                                                        run_logger          = run_config["run_logger"],
+                                                        run_visualiser      = run_config["run_visualiser"],
+                                                       )
+    finally:
+        # Closing pool of worker processes of parallel executor (if any) so it does not outlive the run (it is
+        # restarted if the rewards computer is used again)
+        executor = getattr(run_config["learning_config"]["rewards_computer"], "executor", None)
+        if executor is not None:
+            executor.close()
 
     return hall_of_fame_R, hall_of_fame
\ No newline at end of file